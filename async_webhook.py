@@ -0,0 +1,779 @@
+#!/usr/bin/env python3
+"""
+Async Webhook Service (asyncio / aiohttp)
+
+Asyncio variant van script.py met dezelfde routes voor de drukke paden:
+
+    • POST/GET /webhook   → alarm verwerking (zelfde acties als handle_alarm_actions)
+    • GET  /health        → status
+    • GET  /photos/api    → foto metadata
+    • POST /upload        → streamende foto upload met SHA-256
+
+Waar script.py per request een thread blokkeert op uitgaande I/O, draait hier
+alles op één event loop:
+
+    • pcReceiver HTTP push → gedeelde aiohttp ClientSession (connection pool)
+    • SMTP                 → aiosmtplib (fallback: smtplib in een thread)
+    • Loxone UDP           → script.loxone_sender (één socket, eigen sender thread)
+    • SIP dialer           → asyncio subprocess, exit code via een task
+    • Bestand I/O          → kleine thread pool (ASYNC_CONFIG["offload_threads"])
+
+Zo blijven honderden gelijktijdige alarm afleveringen mogelijk op een Pi met
+maar een handvol threads. Configuratie, parsing, opslag (SQLite activity
+store, statistieken, capture) en helpers komen uit script.py, dus beide
+varianten gedragen zich hetzelfde.
+
+Vereisten:
+    pip install aiohttp            (verplicht)
+    pip install aiosmtplib         (optioneel, anders smtplib in een thread)
+
+Gebruik:
+    python3 async_webhook.py --port 5000
+    python3 benchmark_webhook.py --server both --concurrency 200 --display-delay-ms 200
+"""
+
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, SCRIPT_DIR)
+
+import script
+from script import logger
+
+try:
+    import aiohttp
+    from aiohttp import web
+except ImportError:
+    aiohttp = None
+    web = None
+
+try:
+    import aiosmtplib
+except ImportError:
+    aiosmtplib = None
+
+# =============================================================================
+# CONFIGURATIE
+# =============================================================================
+
+ASYNC_CONFIG = {
+    "host": "0.0.0.0",              # Luister op alle interfaces
+    "port": 5000,                   # Zelfde poort als script.py (draai er één tegelijk)
+    "offload_threads": 4,           # Threads voor blocking bestand I/O
+    "http_pool_size": 32,           # Max gelijktijdige HTTP verbindingen (pcReceiver)
+    "max_concurrent_alarms": 256    # Daarboven wachten alarms op een vrije plek
+}
+
+# =============================================================================
+# ASYNC ACTIES
+# =============================================================================
+
+async def send_photo_to_pc_display_async(session, thumbnail, message="UniFi Protect Alarm", detected_name=None,
+                                        idempotency_key=None):
+    """
+    🖥️ PC DISPLAY SENDER (async)
+
+    Zelfde payload en gedrag als script.send_photo_to_pc_display, maar via de
+    gedeelde ClientSession zodat verbindingen hergebruikt worden.
+
+    Returns:
+        bool: True als succesvol verstuurd, False bij fout
+    """
+    config = script.current_config("pc_display")
+    if not config["enabled"]:
+        logger.info("🖥️ PC Display is uitgeschakeld in configuratie")
+        return False
+
+    if not thumbnail:
+        logger.info("🖥️ Geen foto beschikbaar voor PC display")
+        return False
+
+    thumbnail = script.image_text(thumbnail)
+    payload = {
+        "image": thumbnail if thumbnail.startswith('data:image') else f"data:image/jpeg;base64,{thumbnail}",
+        "source": "UniFi_Protect_Webhook",
+        "message": message,
+        "detected_name": detected_name,
+        "timestamp": datetime.now().isoformat()
+    }
+
+    trace = script.current_trace.get()
+    headers = script.display_headers(idempotency_key)
+    try:
+        timeout = aiohttp.ClientTimeout(total=config["timeout"])
+        with script.trace_span("display_post") as span:
+            async with session.post(config["receiver_url"], json=payload, headers=headers,
+                                    timeout=timeout) as response:
+                span.attrs["status"] = response.status
+                if response.status == 200:
+                    result = await response.json(content_type=None)
+                else:
+                    result = None
+                    text = await response.text()
+        if result is not None:
+            script.add_remote_spans(trace, "pc", span.started, result.get("trace"))
+            logger.info(f"🖥️ Foto succesvol verstuurd naar PC display: {result.get('message', 'OK')}")
+            return True
+        logger.warning(f"🖥️ PC Display antwoordde met status {span.attrs['status']}: {text}")
+        return False
+    except Exception as e:
+        logger.error(f"🖥️ Fout bij versturen naar PC display: {e}")
+        return False
+
+async def send_email_async(subject, message, thumbnail=None, message_id=None):
+    """
+    📧 EMAIL VERSTUREN (async)
+
+    Gebruikt aiosmtplib als die geïnstalleerd is; anders draait
+    script.send_email_with_thumbnail in de offload thread pool.
+
+    Returns:
+        bool: True als email succesvol verstuurd
+    """
+    config = script.current_config("email")
+    if not config["enabled"]:
+        logger.info("📧 Email is uitgeschakeld in configuratie")
+        return False
+
+    if aiosmtplib is None:
+        return await asyncio.to_thread(script.send_email_with_thumbnail, subject, message, thumbnail, message_id)
+
+    try:
+        # Base64 decoderen van de bijlage is CPU werk: niet op de event loop
+        msg = await asyncio.to_thread(script.build_alarm_email, subject, message, thumbnail, config, message_id)
+        await aiosmtplib.send(
+            msg,
+            sender=config["from_email"],
+            recipients=config["to_emails"],
+            hostname=config["smtp_server"],
+            port=config["smtp_port"],
+            username=config["username"],
+            password=config["password"],
+            start_tls=config["use_tls"],
+            timeout=30
+        )
+        logger.info(f"📧 Email verstuurd naar: {', '.join(config['to_emails'])}")
+        return True
+    except Exception as e:
+        logger.error(f"Fout bij versturen email: {e}")
+        return False
+
+async def start_sip_call_async(destination, duration=15, background_tasks=None):
+    """
+    📞 SIP CALL STARTEN (async)
+
+    Zelfde commando en omgeving als script.start_sip_call (of via de SIP
+    dialer als sip.dialer ingesteld is), maar gestart als asyncio
+    subprocess. Het einde van de call wordt door een task gelogd in plaats
+    van door een monitor thread per call.
+
+    Returns:
+        bool: True als het call proces gestart is
+    """
+    try:
+        result = await asyncio.to_thread(script.call_via_dialer, destination)
+        if result is not None:
+            return result
+
+        # find_python27() start zelf subprocessen: in de thread pool
+        cmd = await asyncio.to_thread(script.build_sip_command, destination, duration)
+        if not cmd:
+            return False
+
+        sip_log_path = os.path.join(SCRIPT_DIR, "sip_calls.log")
+        trace = script.current_trace.get()
+        trace_id = trace.trace_id if trace is not None else None
+
+        def open_sip_log():
+            sip_log = open(sip_log_path, 'a', encoding='utf-8')
+            sip_log.write(f"\n=== SIP Call gestart op {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
+                          f"{f' (trace {trace_id})' if trace_id else ''} ===\n")
+            sip_log.write(f"Commando: {' '.join(cmd)}\n")
+            sip_log.flush()
+            return sip_log
+
+        sip_log = await asyncio.to_thread(open_sip_log)
+        spawn_started = time.perf_counter()
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=sip_log,
+                stderr=subprocess.STDOUT,
+                start_new_session=os.name != 'nt',  # Linux: nieuwe proces groep
+                env=script.sip_environment(trace_id),
+                cwd=SCRIPT_DIR
+            )
+        finally:
+            sip_log.close()
+        if trace is not None:
+            trace.add_span("sip_spawn", spawn_started, pid=process.pid)
+
+        logger.info(f"📞 SIP call proces gestart (PID: {process.pid}) naar: {destination}")
+
+        async def monitor_sip_process():
+            return_code = await process.wait()
+            if trace is not None:
+                trace.add_span("sip_call", spawn_started, exit_code=return_code)
+
+            def write_footer():
+                with open(sip_log_path, 'a', encoding='utf-8') as log:
+                    log.write(f"=== SIP Call beëindigd op {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} "
+                              f"(exit code: {return_code}) ===\n\n")
+            await asyncio.to_thread(write_footer)
+
+            if return_code == 0:
+                logger.info(f"✅ SIP call naar {destination} succesvol beëindigd")
+            else:
+                logger.warning(f"⚠️ SIP call naar {destination} beëindigd met foutcode: {return_code}")
+
+        task = asyncio.create_task(monitor_sip_process())
+        if background_tasks is not None:
+            # Referentie bewaren, anders kan de task voortijdig opgeruimd worden
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        return True
+
+    except Exception as e:
+        logger.error(f"Fout bij starten SIP call proces: {e}")
+        return False
+
+# =============================================================================
+# ALARM VERWERKING
+# =============================================================================
+
+def run_alarm_action_async(app, action, context):
+    """
+    Coroutine voor één routable actie (zie script.run_alarm_action)
+
+    Acties die niet hoeven te wachten (Loxone: alleen in de queue zetten)
+    geven direct hun resultaat terug in plaats van een awaitable.
+    """
+    action_type = action["type"]
+    if action_type == "display":
+        if context["trigger_name"]:
+            logger.info(f"📝 Trigger naam gevonden: {context['trigger_name']}")
+        return send_photo_to_pc_display_async(app["http_session"], script.context_thumbnail(context),
+                                              detected_name=context["trigger_name"],
+                                              idempotency_key=action.get("idempotency_key"))
+    if action_type == "email":
+        subject = script.format_action_text(action.get("subject", "{alarm_name}"), context)
+        return send_email_async(subject, script.alarm_message(context), script.context_thumbnail(context),
+                                message_id=action.get("idempotency_key"))
+    if action_type == "sip":
+        return start_sip_call_async(action.get("number", script.current_config("sip")["alarm_number"]),
+                                    action.get("duration", 15), background_tasks=app["background_tasks"])
+    if action_type == "loxone":
+        message = script.format_action_text(
+            action.get("message", "{alarm_type}:{alarm_name}|DEVICES:{devices}|TIME:{time}"), context)
+        # Alleen in de queue zetten; script.loxone_sender voegt samen en verstuurt
+        return script.send_udp_to_loxone(message, action.get("ip"), action.get("port"))
+    if action_type == "mqtt":
+        # Foto referentie schrijven en outbox insert in de thread pool
+        return asyncio.to_thread(script.publish_alarm_to_mqtt, context, action)
+    if action_type == "notify":
+        # De NotifierHub levert af op zijn eigen loop (gedeelde pool, retries); met een outbox
+        # sleutel wacht notify_alarm op de aflevering, dus in de thread pool
+        return asyncio.to_thread(script.notify_alarm, context, action)
+    if action_type == "disk" and context["payload"]:
+        # Decode + schrijven in de thread pool
+        return asyncio.to_thread(script.save_alarm_photo, context["alarm_info"], context["payload"])
+    return None
+
+async def timed_action(action_type, started, awaitable, key=None):
+    """Await een actie, registreer duur en uitkomst in script.metrics en meld hem af in de outbox"""
+    ok = False
+    error = None
+    try:
+        result = await awaitable
+        ok = result is not False
+        return result
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        script.record_action(action_type, started, ok)
+        if key is not None:
+            await asyncio.to_thread(script.action_outbox.finish, [(key, ok, error)])
+
+def record_and_start(actions, alarm_info, triggers, context, recorded=None):
+    """Outbox insert (of vastgelegde acties samenvoegen), WAN acties uitstellen en de rest op running"""
+    if recorded is None:
+        entries = script.action_outbox.record(alarm_info, triggers, actions, context)
+    else:
+        entries = script.merge_recorded_actions(recorded)
+    entries = script.defer_wan_actions(entries)
+    script.action_outbox.mark_running([key for key, _ in entries])
+    script.action_outbox.maybe_cleanup()
+    return entries
+
+async def handle_alarm_actions_async(app, alarm_info, triggers, full_payload=None, recorded=None):
+    """
+    ⚡ ACTIE HANDLER (async)
+
+    Dezelfde regels en acties als script.handle_alarm_actions, maar de
+    acties (PC display, foto opslag, SIP call, ...) lopen gelijktijdig in
+    plaats van na elkaar. recorded: zie script.handle_alarm_actions.
+    """
+    # Apparaat activiteit (alleen een queue put, blokkeert niet)
+    for trigger in triggers:
+        device_id = trigger.get('device')
+        if device_id:
+            script.log_device_activity(device_id, alarm_info, trigger.get('key'))
+
+    try:
+        actions = None
+        if recorded is None:
+            with script.trace_span("match_rules"):
+                actions = script.match_alarm_rules(alarm_info, triggers)
+        context = script.build_action_context(alarm_info, triggers, full_payload)
+
+        # Eerst vastleggen in de outbox (SQLite, in de thread pool), dan uitvoeren en afmelden
+        with script.trace_span("outbox_record"):
+            entries = await asyncio.to_thread(record_and_start, actions, alarm_info, triggers, context, recorded)
+        if any(action["type"] in ("display", "email") for _, action in entries):
+            logger.info("🚨 Alarm gedetecteerd! Verstuur notificatie...")
+
+        pending = []
+        finished = []
+        for key, action in entries:
+            started = time.perf_counter()
+            target = script.unreachable_target(action)
+            if target is not None:
+                # Target down volgens wifi_monitor: niet op de timeout wachten
+                logger.warning(f"⏭️ Actie '{action['type']}' overgeslagen: {target} onbereikbaar (wifi_monitor)")
+                script.record_action(action["type"], started, False)
+                finished.append((key, False, f"{target} onbereikbaar"))
+                continue
+            awaitable = run_alarm_action_async(app, script.with_idempotency_key(action, key), context)
+            if not asyncio.isfuture(awaitable) and not asyncio.iscoroutine(awaitable):
+                script.record_action(action["type"], started, awaitable is not False)
+                finished.append((key, awaitable is not False, None))
+            else:
+                pending.append(timed_action(action["type"], started, awaitable, key))
+        if finished:
+            pending.append(asyncio.to_thread(script.action_outbox.finish, finished))
+        for result in await asyncio.gather(*pending, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Fout bij uitvoeren van alarm acties: {result}")
+
+    except Exception as e:
+        logger.error(f"Fout bij uitvoeren van alarm acties: {e}")
+
+async def process_alarm_async(app, alarm_data, sanitized_for_logging=None):
+    """
+    🚨 ALARM PROCESSOR (async, POST payloads)
+
+    Logt en verwerkt een alarm zoals script.process_alarm. De payload wordt
+    alleen bij DEBUG level volledig gelogd: de JSON dump van grote payloads
+    zou de event loop onnodig bezet houden.
+    """
+    logger.info("=== UniFi Protect Alarm Ontvangen (POST, async) ===")
+    if sanitized_for_logging and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(script.json_dumps(sanitized_for_logging, indent=True))
+
+    alarm_info = alarm_data.get('alarm', {})
+    triggers = alarm_info.get('triggers', [])
+    alarm_name = alarm_info.get('name', 'Onbekend alarm')
+    logger.info(f"Alarm naam: {alarm_name}")
+
+    for trigger in triggers:
+        logger.info(f"Trigger: {trigger.get('key', 'Onbekend type')} op apparaat "
+                    f"{trigger.get('device', 'Onbekend apparaat')}")
+
+    script.record_alarm_received(triggers)
+
+    deduplicator = script.alarm_deduplicator
+    # Dedup database (SQLite) in de thread pool
+    triggers, duplicate = await asyncio.to_thread(deduplicator.filter_triggers, alarm_info, triggers,
+                                                  alarm_data.get('timestamp'))
+    if duplicate:
+        script.metrics.inc("webhook_alarms_duplicate_total")
+        logger.info("🔁 Dubbel alarm overgeslagen (al verwerkt binnen de dedup TTL)")
+        return
+
+    script.activity_stats.record(alarm_name, [trigger.get('device') for trigger in triggers])
+
+    if deduplicator.coalescing():
+        # Het venster sluit op een timer thread: acties terug naar de event loop
+        loop = asyncio.get_running_loop()
+
+        trace = script.current_trace.get()
+
+        def schedule_actions(info, merged_triggers, payload, recorded=None):
+            asyncio.run_coroutine_threadsafe(
+                run_alarm_actions(app, info, merged_triggers, payload, trace, recorded), loop)
+
+        # Acties vastleggen voordat de webhook antwoord krijgt
+        recorded = await asyncio.to_thread(script.record_alarm_actions, alarm_info, triggers, alarm_data)
+        result = deduplicator.dispatch(alarm_info, triggers, alarm_data, schedule_actions, recorded)
+        logger.info(f"🔗 Alarm {'samengevoegd' if result == 'merged' else 'in coalescing venster'}")
+        return
+
+    deduplicator.count_dispatched()
+    await run_alarm_actions(app, alarm_info, triggers, alarm_data)
+    logger.info("=== Einde Alarm Verwerking ===")
+
+async def run_alarm_actions(app, alarm_info, triggers, full_payload, trace=None, recorded=None):
+    """
+    Acties uitvoeren binnen de max_concurrent_alarms limiet
+
+    trace: de trace van de webhook als de acties in een eigen task lopen
+    (coalescing timer), anders wordt de trace van de huidige task gebruikt.
+    recorded: al vastgelegde outbox acties van het coalescing venster.
+    """
+    if trace is not None:
+        script.current_trace.set(trace)
+    async with app["alarm_slots"]:
+        await handle_alarm_actions_async(app, alarm_info, triggers, full_payload, recorded)
+
+# =============================================================================
+# ROUTES
+# =============================================================================
+
+def json_response(data, status=200):
+    """JSON response via de JSON backend van script.py (orjson/ujson/json)"""
+    return web.json_response(data, status=status, dumps=script.json_dumps)
+
+def json_error(message, status, **extra):
+    return json_response(dict({"status": "error", "message": message}, **extra), status=status)
+
+async def webhook(request):
+    """🎯 WEBHOOK ENDPOINT (zie script.webhook) - de trace volgt de task en to_thread calls"""
+    trace = script.tracer.start("webhook", request.headers.get(script.TRACE_CONFIG["header"]))
+    token = script.current_trace.set(trace)
+    if trace is not None:
+        trace.attrs["method"] = request.method
+        request["trace_id"] = trace.trace_id
+    try:
+        if request.method == 'POST':
+            if not script.is_json_content_type(request.content_type):
+                return json_error("Content-Type moet application/json zijn", 415)
+            body = await request.read()
+            try:
+                alarm_data = script.parse_alarm_body(body) if body else None
+            except ValueError:
+                return json_error("Ongeldige JSON", 400)
+
+            if not alarm_data:
+                logger.warning("POST request ontvangen zonder JSON data")
+                return json_error("Geen JSON data", 400)
+
+            if script.request_recorder.config["enabled"]:
+                await asyncio.to_thread(script.request_recorder.capture_raw, "POST", request.path,
+                                        dict(request.query), request.content_type, alarm_data)
+
+            with script.trace_span("sanitize"):
+                sanitized_for_logging = script.sanitize_payload(alarm_data)
+            with script.trace_span("process_alarm"):
+                await process_alarm_async(request.app, alarm_data, sanitized_for_logging)
+            return json_response({"status": "success", "message": "Alarm verwerkt"})
+
+        script.request_recorder.capture_raw("GET", request.path, dict(request.query), request.content_type)
+        script.process_alarm(dict(request.query), "GET")
+        return web.Response(text="Webhook ontvangen")
+
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Fout bij verwerken webhook: {e}")
+        return json_error(str(e), 500)
+    finally:
+        script.current_trace.reset(token)
+
+async def health_check(request):
+    """💚 HEALTH CHECK"""
+    return json_response({
+        "status": "healthy",
+        "service": "UniFi Protect Webhook (async)",
+        "network": script.network_state.get_status(),
+        "timestamp": datetime.now().isoformat()
+    })
+
+async def recent_traces(request):
+    """🔍 RECENTE TRACES (zie script.recent_traces)"""
+    try:
+        limit = int(request.query.get('limit', 20))
+        min_ms = float(request.query['min_ms']) if 'min_ms' in request.query else None
+    except ValueError:
+        return json_error("limit/min_ms moeten getallen zijn", 400)
+    return json_response({
+        "enabled": script.TRACE_CONFIG["enabled"],
+        "buffered": len(script.tracer.traces),
+        "started": script.tracer.started,
+        "traces": script.tracer.recent(limit, request.query.get('trace_id'), min_ms)
+    })
+
+async def metrics_endpoint(request):
+    """📈 PROMETHEUS METRICS (zie script.metrics_endpoint) - collectors nemen locks: in de thread pool"""
+    text = await asyncio.to_thread(script.metrics.render)
+    return web.Response(text=text, content_type="text/plain", charset="utf-8")
+
+def profile_response(profile, output_format):
+    body, content_type, headers = script.profile_output(profile, output_format)
+    return web.Response(body=body.encode('utf-8'), headers={"Content-Type": content_type, **headers})
+
+async def profile_endpoint(request):
+    """🔬 CPU PROFIEL (zie script.profile_endpoint) - wacht zonder de event loop te blokkeren"""
+    try:
+        seconds, interval = script.profile_request_args(request.query, script.PROFILER_CONFIG["max_request_seconds"])
+    except ValueError:
+        return json_error("seconds/interval_ms moeten getallen zijn", 400)
+    if not script.profiler.start(duration=seconds, interval=interval):
+        return json_error("Er loopt al een profiel", 409, **script.profiler.get_status())
+    await asyncio.sleep(seconds)
+    profile = await asyncio.to_thread(script.profiler.stop)
+    return profile_response(profile, request.query.get('format'))
+
+async def profile_start(request):
+    try:
+        seconds, interval = script.profile_request_args(request.query)
+    except ValueError:
+        return json_error("seconds/interval_ms moeten getallen zijn", 400)
+    if 'seconds' not in request.query:
+        seconds = None
+    if not script.profiler.start(duration=seconds, interval=interval):
+        return json_error("Er loopt al een profiel", 409, **script.profiler.get_status())
+    return json_response({"status": "started", **script.profiler.get_status()}, status=202)
+
+async def profile_stop(request):
+    profile = await asyncio.to_thread(script.profiler.stop)
+    if profile is None:
+        return json_error("Nog geen profiel opgenomen", 404)
+    return profile_response(profile, request.query.get('format'))
+
+async def profile_status(request):
+    return json_response(script.profiler.get_status())
+
+async def photos_api(request):
+    """📊 FOTO API ENDPOINT - directory scan in de thread pool"""
+    try:
+        return json_response(await asyncio.to_thread(script.collect_photos_info))
+    except Exception as e:
+        logger.error(f"Fout bij ophalen foto API: {e}")
+        return json_response({"error": str(e)}, status=500)
+
+async def save_field_to_file(field, filepath, max_size):
+    """
+    Async tegenhanger van script.save_stream_to_file
+
+    Chunks worden van de socket gelezen op de event loop en in de thread pool
+    naar disk geschreven ('<filepath>.part', daarna atomisch hernoemd).
+
+    Returns:
+        tuple: (aantal bytes, sha256 hex digest)
+    """
+    chunk_size = script.UPLOAD_CONFIG["chunk_size"]
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = filepath + ".part"
+    f = await asyncio.to_thread(open, tmp_path, 'wb')
+
+    try:
+        try:
+            while True:
+                chunk = await field.read_chunk(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise web.HTTPRequestEntityTooLarge(max_size=max_size, actual_size=size)
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        finally:
+            await asyncio.to_thread(f.close)
+        await asyncio.to_thread(os.replace, tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return size, digest.hexdigest()
+
+async def upload_photo(request):
+    """📤 FOTO UPLOAD ENDPOINT (multipart, streamend - zie script.upload_photo)"""
+    try:
+        file_field = None
+        reader = await request.multipart()
+        while True:
+            field = await reader.next()
+            if field is None:
+                break
+            if field.name == 'file':
+                file_field = field
+                break
+
+        if file_field is None:
+            return json_response({'error': 'Geen bestand gevonden'}, status=400)
+
+        original_filename = file_field.filename or ''
+        if original_filename == '':
+            return json_response({'error': 'Geen bestandsnaam'}, status=400)
+
+        if not script.is_allowed_upload(original_filename):
+            return json_response({'error': 'Ongeldig bestandstype'}, status=400)
+
+        new_filename, filepath = await asyncio.to_thread(script.upload_target_path, original_filename)
+        file_size, sha256 = await save_field_to_file(file_field, filepath,
+                                                     script.UPLOAD_CONFIG["max_content_length"])
+
+        logger.info(f"📸 Foto geupload van Raspberry Pi: {new_filename}")
+        script.metrics.inc("webhook_photo_bytes_written_total", ("upload",), file_size)
+        logger.info(f"   Grootte: {file_size} bytes, SHA-256: {sha256}")
+
+        return json_response({
+            'success': True,
+            'message': 'Foto succesvol geupload',
+            'filename': new_filename,
+            'original_filename': original_filename,
+            'size': file_size,
+            'sha256': sha256,
+            'path': filepath,
+            'view_url': f'/photo/uploaded_photos/{new_filename}'
+        })
+
+    except web.HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Fout bij uploaden foto: {e}")
+        return json_response({'error': f'Server fout: {str(e)}'}, status=500)
+
+# =============================================================================
+# APPLICATIE
+# =============================================================================
+
+def create_app(config=None):
+    """
+    🏗️ AIOHTTP APPLICATIE
+
+    Maakt de applicatie met gedeelde resources die bij het starten aangemaakt
+    en bij het stoppen netjes gesloten worden.
+
+    Args:
+        config (dict, optional): Overrides voor ASYNC_CONFIG
+
+    Returns:
+        aiohttp.web.Application
+    """
+    if web is None:
+        raise RuntimeError("aiohttp niet gevonden. Installeer met: pip install aiohttp")
+
+    config = dict(ASYNC_CONFIG, **(config or {}))
+    max_size = script.UPLOAD_CONFIG["max_content_length"]
+
+    @web.middleware
+    async def record_request_metrics(request, handler):
+        # Route template als label (begrensd), zelfde metrics als de Flask variant
+        started = time.perf_counter()
+        route = request.match_info.route.resource
+        endpoint = route.canonical if route is not None else "unmatched"
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status
+            if "trace_id" in request:
+                response.headers[script.TRACE_CONFIG["header"]] = request["trace_id"]
+            return response
+        except web.HTTPException as e:
+            status = e.status
+            raise
+        finally:
+            script.metrics.inc("webhook_http_requests_total", (request.method, endpoint, str(status)))
+            script.metrics.observe("webhook_http_request_duration_seconds",
+                                   time.perf_counter() - started, (endpoint,))
+
+    @web.middleware
+    async def limit_body_size(request, handler):
+        # Vroege 413 op Content-Length, zelfde JSON als de Flask variant
+        if request.content_length and request.content_length > max_size:
+            logger.warning(f"🚧 Request te groot geweigerd: {request.content_length} bytes "
+                           f"(max {max_size}) op {request.path}")
+            return json_error("Request te groot", 413, max_content_length=max_size)
+        try:
+            return await handler(request)
+        except web.HTTPRequestEntityTooLarge:
+            return json_error("Request te groot", 413, max_content_length=max_size)
+
+    app = web.Application(client_max_size=max_size, middlewares=[record_request_metrics, limit_body_size])
+    app["config"] = config
+
+    def new_http_session():
+        return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=config["http_pool_size"]))
+
+    async def close_later(session, delay):
+        # Lopende display requests op de oude pool laten afronden
+        await asyncio.sleep(delay)
+        await session.close()
+
+    def replace_http_session(grace):
+        old_session, app["http_session"] = app["http_session"], new_http_session()
+        task = asyncio.ensure_future(close_later(old_session, grace))
+        app["background_tasks"].add(task)
+        task.add_done_callback(app["background_tasks"].discard)
+        logger.info("🖥️ PC display connection pool vernieuwd na config wijziging")
+
+    async def on_startup(app):
+        loop = asyncio.get_running_loop()
+        # asyncio.to_thread gebruikt de default executor: klein en begrensd houden
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=config["offload_threads"],
+                                                     thread_name_prefix="offload"))
+        app["http_session"] = new_http_session()
+        app["alarm_slots"] = asyncio.Semaphore(config["max_concurrent_alarms"])
+        app["background_tasks"] = set()
+
+        def on_pc_display_change(old, new):
+            # Config watcher thread → event loop; alleen een ander adres vraagt een nieuwe pool
+            if old["receiver_url"] != new["receiver_url"]:
+                loop.call_soon_threadsafe(replace_http_session, new["timeout"])
+
+        app["config_subscription"] = on_pc_display_change
+        script.config_manager.subscribe("pc_display", on_pc_display_change)
+        script.start_background_services(display_session=False)
+        logger.info(f"⚡ Async service gestart (offload threads={config['offload_threads']}, "
+                    f"http pool={config['http_pool_size']})")
+
+    async def on_cleanup(app):
+        script.config_manager.unsubscribe("pc_display", app["config_subscription"])
+        if app["background_tasks"]:
+            # Lopende SIP monitors niet afbreken; het SIP proces zelf draait los door
+            await asyncio.wait(app["background_tasks"], timeout=5)
+        await app["http_session"].close()
+        await asyncio.to_thread(script.device_activity_store.flush)
+
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+
+    app.router.add_route('GET', '/webhook', webhook)
+    app.router.add_route('POST', '/webhook', webhook)
+    app.router.add_get('/health', health_check)
+    app.router.add_get('/metrics', metrics_endpoint)
+    app.router.add_get('/traces/recent', recent_traces)
+    app.router.add_get('/admin/profile', profile_endpoint)
+    app.router.add_post('/admin/profile/start', profile_start)
+    app.router.add_post('/admin/profile/stop', profile_stop)
+    app.router.add_get('/admin/profile/status', profile_status)
+    app.router.add_get('/photos/api', photos_api)
+    app.router.add_post('/upload', upload_photo)
+    return app
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="UniFi Protect Webhook Service (asyncio)")
+    parser.add_argument("--host", default=ASYNC_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=ASYNC_CONFIG["port"])
+    parser.add_argument("--offload-threads", type=int, default=ASYNC_CONFIG["offload_threads"])
+    args = parser.parse_args(argv)
+
+    print("🚀 UniFi Protect Webhook Service (async) wordt gestart...")
+    web.run_app(create_app({"offload_threads": args.offload_threads}),
+                host=args.host, port=args.port, access_log=None)
+
+if __name__ == '__main__':
+    main()
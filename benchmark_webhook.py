@@ -0,0 +1,1088 @@
+#!/usr/bin/env python3
+"""
+Webhook Load-test & Latency Benchmark
+
+Vuurt (opgenomen of synthetische) UniFi Protect alarm payloads af op /webhook
+van script.py en meet hoe snel de service antwoordt en hoe lang elke stap van
+de alarm afhandeling duurt. Alles draait lokaal:
+
+    • script.py draait in-process op een willekeurige poort (eigen temp map)
+    • pcReceiver   → lokale HTTP stand-in (/photo, optionele vertraging)
+    • SMTP         → lokale SMTP stand-in (accepteert alles)
+    • Loxone UDP   → lokale UDP listener
+    • MQTT broker  → lokale MQTT 3.1.1 stand-in (CONNECT/PUBLISH/PUBACK),
+                     alleen gebruikt met --mqtt
+    • SIP dialer   → stand-in die alleen de aanroep registreert
+                     (of met --sip-spawn een leeg Python proces start;
+                     met --cold-start een UDP dialer die {"ok": true} antwoordt)
+
+Rapporteert:
+    • ack latency p50/p95/p99/max van /webhook
+    • latency per stap (sanitize, thumbnail, display, foto opslag, SIP, ...)
+    • throughput (requests/s), RSS groei en piek aantal threads
+    • met --server async/both: dezelfde meting tegen async_webhook.py
+    • met --cold-start N: tijd van een nieuw proces tot de eerste /webhook 200
+      en een -X importtime audit (duurste imports, eager geladen lazy modules)
+
+Gebruik:
+    python3 benchmark_webhook.py --requests 200 --concurrency 8
+    python3 benchmark_webhook.py --payloads captures/ --save-baseline bench_baseline.json
+    python3 benchmark_webhook.py --compare bench_baseline.json --max-regression 20
+    python3 benchmark_webhook.py --server both --concurrency 200 --display-delay-ms 200
+    python3 benchmark_webhook.py --json-backend json --save-baseline json_stdlib.json
+    python3 benchmark_webhook.py --json-backend orjson --compare json_stdlib.json
+    python3 benchmark_webhook.py --mqtt --requests 100
+    python3 benchmark_webhook.py --cold-start 5 --save-baseline cold_baseline.json
+"""
+
+import argparse
+import asyncio
+import base64
+import http.client
+import inspect
+import json
+import os
+import random
+import socket
+import socketserver
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Functies in script.py die per stap getimed worden
+TIMED_STAGES = [
+    "parse_alarm_body",
+    "json_loads",
+    "json_dumps",
+    "process_alarm",
+    "match_alarm_rules",
+    "sanitize_payload",
+    "extract_thumbnail_from_payload",
+    "send_photo_to_pc_display",
+    "log_device_activity",
+    "save_alarm_photo",
+    "send_email_with_thumbnail",
+    "send_udp_to_loxone",
+    "start_sip_call",
+]
+
+# Coroutines in async_webhook.py die per stap getimed worden (--server async)
+ASYNC_TIMED_STAGES = [
+    "process_alarm_async",
+    "send_photo_to_pc_display_async",
+    "start_sip_call_async",
+]
+
+# =============================================================================
+# METING HELPERS
+# =============================================================================
+
+def percentile(values, pct):
+    """Percentiel (nearest-rank) van een lijst, None bij lege lijst"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+def summarize(values_ms):
+    """p50/p95/p99/max/mean samenvatting in milliseconden"""
+    if not values_ms:
+        return {"count": 0}
+    return {
+        "count": len(values_ms),
+        "p50": round(percentile(values_ms, 50), 3),
+        "p95": round(percentile(values_ms, 95), 3),
+        "p99": round(percentile(values_ms, 99), 3),
+        "max": round(max(values_ms), 3),
+        "mean": round(statistics.mean(values_ms), 3)
+    }
+
+def read_rss_kb():
+    """Huidige en piek RSS uit /proc (Linux), fallback naar getrusage"""
+    try:
+        values = {}
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    key, value = line.split(':', 1)
+                    values[key] = int(value.split()[0])
+        return values.get('VmRSS', 0), values.get('VmHWM', 0)
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak, peak
+
+class ThreadSampler:
+    """Houdt het piek aantal threads in het proces bij tijdens een meting"""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.running = False
+        self.thread = None
+
+    def _run(self):
+        while self.running:
+            self.peak = max(self.peak, threading.active_count())
+            time.sleep(self.interval)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return self.peak
+
+class StageTimer:
+    """Verzamelt durations per stap (thread-safe)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.active = threading.local()
+
+    def record(self, stage, seconds):
+        with self.lock:
+            self.durations.setdefault(stage, []).append(seconds * 1000.0)
+
+    def wrap(self, stage, func):
+        if inspect.iscoroutinefunction(func):
+            async def timed_async(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+            timed_async.__name__ = func.__name__
+            timed_async.__doc__ = func.__doc__
+            return timed_async
+
+        def timed(*args, **kwargs):
+            # Recursieve functies (sanitize_payload) alleen op het buitenste niveau meten
+            depth = getattr(self.active, stage, 0)
+            setattr(self.active, stage, depth + 1)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                setattr(self.active, stage, depth)
+                if depth == 0:
+                    self.record(stage, time.perf_counter() - start)
+        timed.__name__ = func.__name__
+        timed.__doc__ = func.__doc__
+        return timed
+
+# =============================================================================
+# PAYLOADS
+# =============================================================================
+
+def make_thumbnail(rng, size_bytes):
+    """Synthetische JPEG-achtige thumbnail als data:image URI van ongeveer size_bytes"""
+    raw = b'\xff\xd8\xff\xe0' + rng.randbytes(max(0, size_bytes - 6)) + b'\xff\xd9'
+    return "data:image/jpeg;base64," + base64.b64encode(raw).decode('ascii')
+
+def make_payload(rng, index, min_kb, max_kb, devices):
+    """Synthetische UniFi Protect alarm payload (structuur zoals Protect hem POST)"""
+    now_ms = int(time.time() * 1000)
+    device = rng.choice(devices)
+    key = rng.choice(["motion", "motion", "person", "vehicle", "licensePlate"])
+    return {
+        "alarm": {
+            "name": f"Benchmark {key}",
+            "sources": [{"device": device, "type": "include"}],
+            "conditions": [{"condition": {"type": "is", "source": key}}],
+            "triggers": [{
+                "key": key,
+                "device": device,
+                "eventId": f"bench-{index:06d}",
+                "timestamp": now_ms,
+                "group": {"name": f"Groep {device[-4:]}"}
+            }],
+            "thumbnail": make_thumbnail(rng, rng.randint(min_kb, max_kb) * 1024)
+        },
+        "timestamp": now_ms
+    }
+
+def load_payloads(path):
+    """
+    Laad opgenomen payloads
+
+    Accepteert een capture map / capture JSONL van de RequestRecorder (blobs
+    worden hersteld via replay_captures.py) of een JSONL bestand met op elke
+    regel een platte webhook body.
+    """
+    sys.path.insert(0, SCRIPT_DIR)
+    from replay_captures import load_captures
+
+    payloads = []
+    for record in load_captures(path):
+        if "method" in record and "body" in record:
+            if record.get("method") != "POST" or not isinstance(record["body"], dict):
+                continue
+            record = record["body"]
+        payloads.append(json.dumps(record).encode('utf-8'))
+    return payloads
+
+# =============================================================================
+# LOKALE STAND-INS
+# =============================================================================
+
+class DisplayStandIn(ThreadingHTTPServer):
+    """pcReceiver stand-in: antwoordt 200 op POST /photo na optionele vertraging"""
+    daemon_threads = True
+
+    def __init__(self, delay_ms=0):
+        self.delay = delay_ms / 1000.0
+        self.received = 0
+        self.bytes_received = 0
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), self._handler())
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                remaining = length
+                while remaining > 0:
+                    chunk = self.rfile.read(min(65536, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                if server.delay:
+                    time.sleep(server.delay)
+                with server.lock:
+                    server.received += 1
+                    server.bytes_received += length
+                body = b'{"status": "success", "message": "Foto ontvangen en getoond"}'
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+class SMTPStandIn(socketserver.ThreadingTCPServer):
+    """Minimale SMTP stand-in: accepteert EHLO/AUTH/MAIL/RCPT/DATA en telt berichten"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.messages = 0
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), self._handler())
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode('ascii') + b'\r\n')
+
+            def handle(self):
+                self.reply('220 benchmark ESMTP')
+                in_data = False
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    if in_data:
+                        if line in (b'.\r\n', b'.\n'):
+                            in_data = False
+                            with server.lock:
+                                server.messages += 1
+                            self.reply('250 OK')
+                        continue
+                    cmd = line.strip().split(b' ', 1)[0].upper()
+                    if cmd == b'EHLO':
+                        self.reply('250-benchmark')
+                        self.reply('250 AUTH PLAIN LOGIN')
+                    elif cmd == b'AUTH':
+                        self.reply('235 Authentication successful')
+                    elif cmd == b'DATA':
+                        in_data = True
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                    elif cmd == b'QUIT':
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        self.reply('250 OK')
+
+        return Handler
+
+class UDPStandIn:
+    """Loxone stand-in: telt ontvangen UDP datagrams (met reply ook SIP dialer stand-in)"""
+
+    def __init__(self, reply=None):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.settimeout(0.5)
+        self.reply = reply
+        self.datagrams = 0
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    @property
+    def port(self):
+        return self.sock.getsockname()[1]
+
+    def _run(self):
+        while self.running:
+            try:
+                _, sender = self.sock.recvfrom(65535)
+                self.datagrams += 1
+                if self.reply is not None:
+                    self.sock.sendto(self.reply, sender)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.sock.close()
+
+def serve_in_background(server):
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return thread
+
+# =============================================================================
+# BENCHMARK
+# =============================================================================
+
+def load_service(workdir, verbose=False):
+    """Importeer script.py met de temp map als working directory"""
+    os.chdir(workdir)
+    sys.path.insert(0, SCRIPT_DIR)
+    import logging
+    import script
+    if not verbose:
+        # Alleen het logbestand houden, geen console output tijdens de meting
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+                root.removeHandler(handler)
+    return script
+
+class MQTTBrokerStandIn(socketserver.ThreadingTCPServer):
+    """
+    Minimale MQTT 3.1.1 broker stand-in
+
+    Beantwoordt CONNECT (met session present zodra een client id terugkomt),
+    PUBLISH QoS 1 met PUBACK en PINGREQ; telt berichten per topic. Geen
+    abonnementen of doorsturen: genoeg om de publisher en zijn outbox te testen.
+    Met stop_acking() komen er geen PUBACKs meer (broker die hangt).
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        self.messages = 0
+        self.topics = {}
+        self.sessions = set()
+        self.acking = True
+        self.lock = threading.Lock()
+        super().__init__(('127.0.0.1', 0), self._handler())
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def stop_acking(self):
+        self.acking = False
+
+    def _handler(self):
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def read_packet(self):
+                header = self.rfile.read(1)
+                if not header:
+                    return None, None
+                length, multiplier = 0, 1
+                while True:
+                    byte = self.rfile.read(1)[0]
+                    length += (byte & 0x7F) * multiplier
+                    multiplier *= 128
+                    if not byte & 0x80:
+                        break
+                return header[0], self.rfile.read(length)
+
+            def handle(self):
+                while True:
+                    try:
+                        header, body = self.read_packet()
+                    except (IndexError, OSError):
+                        return
+                    if header is None:
+                        return
+                    kind = header >> 4
+                    if kind == 1:  # CONNECT
+                        name_len = struct.unpack('!H', body[:2])[0]
+                        payload = body[2 + name_len + 4:]
+                        client_id = payload[2:2 + struct.unpack('!H', payload[:2])[0]].decode('utf-8')
+                        clean = bool(body[2 + name_len + 1] & 0x02)
+                        with server.lock:
+                            present = client_id in server.sessions and not clean
+                            server.sessions.add(client_id)
+                        self.wfile.write(bytes([0x20, 2, int(present), 0]))
+                    elif kind == 3:  # PUBLISH
+                        qos = (header >> 1) & 0x03
+                        topic_len = struct.unpack('!H', body[:2])[0]
+                        topic = body[2:2 + topic_len].decode('utf-8')
+                        with server.lock:
+                            server.messages += 1
+                            server.topics[topic] = server.topics.get(topic, 0) + 1
+                        if qos and server.acking:
+                            self.wfile.write(bytes([0x40, 2]) + body[2 + topic_len:4 + topic_len])
+                    elif kind == 12:  # PINGREQ
+                        self.wfile.write(bytes([0xD0, 0]))
+                    elif kind == 14:  # DISCONNECT
+                        return
+
+        return Handler
+
+def configure_stand_ins(script, args, timer):
+    """Start de stand-ins en wijs script.py er naartoe"""
+    display = DisplayStandIn(args.display_delay_ms)
+    smtp = SMTPStandIn()
+    udp = UDPStandIn()
+    broker = MQTTBrokerStandIn()
+    serve_in_background(display)
+    serve_in_background(smtp)
+    serve_in_background(broker)
+    udp.start()
+
+    script.config_manager.override({
+        "pc_display": {
+            "enabled": True,
+            "receiver_url": f"http://127.0.0.1:{display.server_address[1]}/photo",
+        },
+        "email": {
+            "smtp_server": "127.0.0.1",
+            "smtp_port": smtp.server_address[1],
+            "use_tls": False,
+        },
+        "loxone": {"ip": "127.0.0.1", "port": udp.port},
+        "mqtt": {"enabled": getattr(args, "mqtt", False), "host": "127.0.0.1", "port": broker.port},
+    })
+
+    def sip_stand_in(destination, duration=15):
+        if args.sip_spawn:
+            subprocess.Popen([sys.executable, '-c', 'pass']).wait()
+        return True
+    script.start_sip_call = sip_stand_in
+
+    # Timing wrappers om elke stap (module globals, dus ook interne aanroepen)
+    for stage in TIMED_STAGES:
+        if hasattr(script, stage):
+            setattr(script, stage, timer.wrap(stage, getattr(script, stage)))
+
+    return display, smtp, udp, broker
+
+def fire_requests(url, bodies, concurrency, total):
+    """Stuur total requests met concurrency parallelle clients, return ack latencies (ms)"""
+    import requests
+
+    local = threading.local()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def one(i):
+        session = getattr(local, 'session', None)
+        if session is None:
+            session = local.session = requests.Session()
+        body = bodies[i % len(bodies)]
+        start = time.perf_counter()
+        try:
+            response = session.post(url, data=body, headers={'Content-Type': 'application/json'}, timeout=60)
+            elapsed = (time.perf_counter() - start) * 1000.0
+            with lock:
+                if response.status_code == 200:
+                    latencies.append(elapsed)
+                else:
+                    errors.append(response.status_code)
+        except Exception as e:
+            with lock:
+                errors.append(str(e))
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+
+    return latencies, errors
+
+def configure_async_service(args, timer):
+    """Importeer async_webhook.py met dezelfde stand-ins en timers als script.py"""
+    import async_webhook
+
+    async def sip_stand_in(destination, duration=15, background_tasks=None):
+        if args.sip_spawn:
+            process = await asyncio.create_subprocess_exec(sys.executable, '-c', 'pass')
+            await process.wait()
+        return True
+    async_webhook.start_sip_call_async = sip_stand_in
+
+    for stage in ASYNC_TIMED_STAGES:
+        setattr(async_webhook, stage, timer.wrap(stage, getattr(async_webhook, stage)))
+    return async_webhook
+
+def start_flask_server(script):
+    """script.app op een threaded Werkzeug server, returns (url, stop functie)"""
+    from werkzeug.serving import make_server
+    server = make_server('127.0.0.1', 0, script.app, threaded=True)
+    serve_in_background(server)
+    return f"http://127.0.0.1:{server.server_port}/webhook", server.shutdown
+
+def start_async_server(async_webhook):
+    """async_webhook app op een eigen event loop thread, returns (url, stop functie)"""
+    from aiohttp import web
+
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(async_webhook.create_app(), access_log=None)
+    started = threading.Event()
+    address = {}
+
+    def run():
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(runner.setup())
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        loop.run_until_complete(site.start())
+        address["port"] = runner.addresses[0][1]
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+
+    def stop():
+        asyncio.run_coroutine_threadsafe(runner.cleanup(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+
+    return f"http://127.0.0.1:{address['port']}/webhook", stop
+
+def prepare_benchmark(args):
+    """Temp map, script.py, stand-ins, timers en payloads (gedeeld door alle servers)"""
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix="webhook_bench_")
+    script = load_service(workdir, verbose=args.verbose)
+    if args.json_backend:
+        args.json_backend = script.set_json_backend(args.json_backend)
+    if args.parsing:
+        script.PAYLOAD_CONFIG["lazy_parsing"] = args.parsing == "lazy"
+    # De payloads worden hergebruikt: zonder --dedup zou de dedup cache de
+    # meeste requests overslaan en meet je de acties niet meer
+    script.DEDUP_CONFIG["enabled"] = args.dedup
+    script.DEDUP_CONFIG["coalesce_window"] = args.coalesce_window
+    timer = StageTimer()
+    display, smtp, udp, broker = configure_stand_ins(script, args, timer)
+    async_webhook = configure_async_service(args, timer) if args.server in ("async", "both") else None
+
+    if args.payloads:
+        bodies = load_payloads(args.payloads)
+        source = args.payloads
+        if not bodies:
+            raise SystemExit(f"❌ Geen POST payloads gevonden in {args.payloads}")
+    else:
+        devices = [f"28704E{rng.randrange(16**6):06X}" for _ in range(args.devices)]
+        bodies = [json.dumps(make_payload(rng, i, args.min_kb, args.max_kb, devices)).encode('utf-8')
+                  for i in range(min(args.requests, args.unique_payloads))]
+        source = "synthetic"
+
+    return {
+        "workdir": workdir,
+        "script": script,
+        "async_webhook": async_webhook,
+        "timer": timer,
+        "stand_ins": (display, smtp, udp, broker),
+        "bodies": bodies,
+        "source": source
+    }
+
+def measure(ctx, args, server_kind):
+    """Eén meting tegen de Flask of async server"""
+    timer = ctx["timer"]
+    bodies = ctx["bodies"]
+    display, smtp, udp, broker = ctx["stand_ins"]
+
+    if server_kind == "async":
+        url, stop_server = start_async_server(ctx["async_webhook"])
+    else:
+        url, stop_server = start_flask_server(ctx["script"])
+
+    # Warmup (imports, connection pools) telt niet mee
+    fire_requests(url, bodies, 1, min(args.warmup, len(bodies)))
+    timer.durations.clear()
+    display_before, smtp_before, udp_before = display.received, smtp.messages, udp.datagrams
+    mqtt_before = broker.messages
+    display_bytes_before = display.bytes_received
+
+    sampler = ThreadSampler()
+    rss_start, _ = read_rss_kb()
+    sampler.start()
+    wall_start = time.perf_counter()
+    latencies, errors = fire_requests(url, bodies, args.concurrency, args.requests)
+    wall = time.perf_counter() - wall_start
+    threads_peak = sampler.stop()
+    rss_end, rss_peak = read_rss_kb()
+
+    stop_server()
+
+    return {
+        "config": {
+            "server": server_kind,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "payload_source": ctx["source"],
+            "payload_kb": [args.min_kb, args.max_kb],
+            "avg_body_bytes": int(sum(len(b) for b in bodies) / len(bodies)),
+            "display_delay_ms": args.display_delay_ms,
+            "sip_spawn": args.sip_spawn,
+            "seed": args.seed,
+            "json_backend": ctx["script"].JSON_BACKEND_NAME,
+            "lazy_parsing": ctx["script"].PAYLOAD_CONFIG["lazy_parsing"],
+            "dedup": ctx["script"].DEDUP_CONFIG["enabled"],
+            "python": sys.version.split()[0]
+        },
+        "ack_latency_ms": summarize(latencies),
+        "stages_ms": {stage: summarize(values) for stage, values in sorted(timer.durations.items())},
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "wall_seconds": round(wall, 3),
+        "errors": len(errors),
+        "error_samples": [str(e) for e in errors[:5]],
+        "rss_kb": {"start": rss_start, "end": rss_end, "growth": rss_end - rss_start, "peak": rss_peak},
+        # Inclusief de load generator threads (concurrency) en de stand-ins
+        "threads_peak": threads_peak,
+        "dedup": ctx["script"].alarm_deduplicator.get_status(),
+        "stand_ins": {
+            "display_posts": display.received - display_before,
+            "display_bytes": display.bytes_received - display_bytes_before,
+            "smtp_messages": smtp.messages - smtp_before,
+            "loxone_datagrams": udp.datagrams - udp_before,
+            "mqtt_messages": broker.messages - mqtt_before
+        },
+        "workdir": ctx["workdir"]
+    }
+
+def stop_stand_ins(ctx):
+    display, smtp, udp, broker = ctx["stand_ins"]
+    display.shutdown()
+    smtp.shutdown()
+    broker.shutdown()
+    udp.stop()
+
+def run_benchmark(args):
+    """
+    Draai de benchmark voor args.server
+
+    Returns:
+        dict: Resultaat van één server, of {"flask": ..., "async": ...} bij --server both
+    """
+    ctx = prepare_benchmark(args)
+    try:
+        if args.server == "both":
+            return {kind: measure(ctx, args, kind) for kind in ("flask", "async")}
+        return measure(ctx, args, args.server)
+    finally:
+        stop_stand_ins(ctx)
+
+# =============================================================================
+# COLD START & IMPORT AUDIT
+# =============================================================================
+
+# Modules die de service pas bij het eerste gebruik (of in warm_up) laadt;
+# staan ze toch in de -X importtime output, dan is er een eager import bijgekomen
+LAZY_MODULES = {
+    "flask": ["smtplib", "email.mime.multipart", "requests", "aiohttp", "paho.mqtt.client", "tkinter", "pygame"],
+    "async": ["smtplib", "email.mime.multipart", "requests", "paho.mqtt.client", "tkinter", "pygame"],
+}
+
+COLD_START_ENTRY = {
+    "flask": ["script.py", "--backend", "werkzeug"],
+    "async": ["async_webhook.py"],
+}
+
+def entry_module(server_kind):
+    return os.path.splitext(COLD_START_ENTRY[server_kind][0])[0]
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def parse_importtime(text):
+    """
+    Lees de -X importtime regels van stderr
+
+    Returns:
+        list: (module, self_us, cumulative_us, diepte) in importvolgorde
+    """
+    imports = []
+    for line in text.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+            imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return imports
+
+def import_audit(imports, module, lazy_modules, top=12):
+    """
+    Samenvatting van een importtime run: totaal, duurste imports en eager lazy modules
+
+    Alleen wat module (diepte 0) zelf binnenhaalt telt; de imports op diepte
+    1 en 2 (voor script.py onder async_webhook.py) staan in de top lijst.
+    """
+    # importtime schrijft een module ná zijn eigen imports: de subtree van
+    # module is het aaneengesloten blok met diepte > 0 vlak voor zijn regel
+    # (wat site e.d. bij het opstarten van de interpreter laden valt erbuiten)
+    end = next((i for i, (name, _, _, depth) in enumerate(imports) if depth == 0 and name == module), None)
+    if end is None:
+        return {"total_ms": None, "modules": 0, "top_ms": [], "eager_lazy_modules": []}
+    start = end
+    while start > 0 and imports[start - 1][3] > 0:
+        start -= 1
+    subtree = imports[start:end + 1]
+    names = {name for name, _, _, _ in subtree}
+    direct = [(name, cumulative, depth) for name, _, cumulative, depth in subtree if 1 <= depth <= 2]
+    direct.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "total_ms": round(imports[end][2] / 1000.0, 1),
+        "modules": len(subtree),
+        "top_ms": [{"module": name, "depth": depth - 1, "cumulative_ms": round(cumulative / 1000.0, 1)}
+                   for name, cumulative, depth in direct[:top]],
+        "eager_lazy_modules": [module for module in lazy_modules if module in names],
+    }
+
+def wait_for_first_200(port, body, process, started, timeout=60.0):
+    """POST /webhook tot er een 200 komt; ms sinds started (het spawnen)"""
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"service stopte tijdens het opstarten (exit code {process.returncode})")
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        try:
+            conn.request("POST", "/webhook", body=body, headers={"Content-Type": "application/json"})
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                return (time.perf_counter() - started) * 1000.0
+        except OSError:
+            pass
+        finally:
+            conn.close()
+        time.sleep(0.005)
+    raise RuntimeError(f"geen 200 op /webhook binnen {timeout:.0f}s")
+
+def cold_start_env(display, smtp, udp, dialer):
+    """Env overrides (WEBHOOK_<SECTIE>__<SLEUTEL>) die het nieuwe proces naar de stand-ins wijzen"""
+    env = dict(os.environ)
+    env.update({
+        "WEBHOOK_PC_DISPLAY__ENABLED": "true",
+        "WEBHOOK_PC_DISPLAY__RECEIVER_URL": f"http://127.0.0.1:{display.server_address[1]}/photo",
+        "WEBHOOK_EMAIL__SMTP_SERVER": "127.0.0.1",
+        "WEBHOOK_EMAIL__SMTP_PORT": str(smtp.server_address[1]),
+        "WEBHOOK_EMAIL__USE_TLS": "false",
+        "WEBHOOK_LOXONE__IP": "127.0.0.1",
+        "WEBHOOK_LOXONE__PORT": str(udp.port),
+        "WEBHOOK_MQTT__ENABLED": "false",
+        "WEBHOOK_SIP__DIALER": f"127.0.0.1:{dialer.port}",
+    })
+    return env
+
+def spawn_until_first_200(server_kind, env, body, timeout=60.0):
+    """
+    Start de service als nieuw proces in een eigen temp map
+
+    Returns:
+        float: ms van spawnen tot de eerste /webhook 200
+    """
+    workdir = tempfile.mkdtemp(prefix="webhook_cold_")
+    port = free_port()
+    entry, *entry_args = COLD_START_ENTRY[server_kind]
+    cmd = [sys.executable, os.path.join(SCRIPT_DIR, entry)] + entry_args + \
+        ["--host", "127.0.0.1", "--port", str(port)]
+    with open(os.path.join(workdir, "stderr.txt"), 'wb') as stderr:
+        started = time.perf_counter()
+        # Config bestand in de lege temp map bestaat niet: alleen defaults + env
+        process = subprocess.Popen(cmd, cwd=workdir, stdout=subprocess.DEVNULL, stderr=stderr,
+                                   env=dict(env, WEBHOOK_CONFIG=os.path.join(workdir, "webhook_config.toml")))
+        try:
+            elapsed_ms = wait_for_first_200(port, body, process, started, timeout)
+        finally:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+    return elapsed_ms
+
+def import_time_run(server_kind, env):
+    """
+    Importeer de service module met -X importtime in een nieuw proces
+
+    Los van de cold start runs: daar laadt warm_up() na het opstarten
+    bewust requests en de email modules, wat de audit zou vervuilen.
+    """
+    module = entry_module(server_kind)
+    env = dict(env, PYTHONPATH=SCRIPT_DIR,
+               WEBHOOK_CONFIG=os.path.join(tempfile.mkdtemp(prefix="webhook_imports_"), "webhook_config.toml"))
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=os.path.dirname(env["WEBHOOK_CONFIG"]), env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=120)
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} faalde:\n{result.stderr[-2000:]}")
+    return import_audit(parse_importtime(result.stderr), module, LAZY_MODULES[server_kind])
+
+def measure_cold_start(args, server_kind):
+    """
+    Cold start → eerste /webhook 200, args.cold_start keer gemeten
+
+    Elke run is een nieuw Python proces in een lege temp map, dus zonder
+    bestaande stores en zonder geïmporteerde modules. Een aparte import van
+    de module met -X importtime levert de import audit.
+    """
+    display = DisplayStandIn(args.display_delay_ms)
+    smtp = SMTPStandIn()
+    udp = UDPStandIn()
+    dialer = UDPStandIn(reply=b'{"ok": true}')
+    serve_in_background(display)
+    serve_in_background(smtp)
+    udp.start()
+    dialer.start()
+    rng = random.Random(args.seed)
+    body = json.dumps(make_payload(rng, 0, args.min_kb, args.max_kb, ["28704E000001"])).encode('utf-8')
+    env = cold_start_env(display, smtp, udp, dialer)
+    try:
+        timings = []
+        for _ in range(args.cold_start):
+            timings.append(spawn_until_first_200(server_kind, env, body))
+        imports = import_time_run(server_kind, env)
+    finally:
+        display.shutdown()
+        smtp.shutdown()
+        udp.stop()
+        dialer.stop()
+
+    return {
+        "config": {
+            "server": server_kind,
+            "mode": "cold_start",
+            "runs": args.cold_start,
+            "python": sys.version.split()[0],
+        },
+        "cold_start_ms": summarize(timings),
+        "imports": imports,
+    }
+
+def run_cold_start(args):
+    if args.server == "both":
+        return {kind: measure_cold_start(args, kind) for kind in ("flask", "async")}
+    return measure_cold_start(args, args.server)
+
+# =============================================================================
+# RAPPORTAGE & BASELINE
+# =============================================================================
+
+def print_report(result):
+    ack = result["ack_latency_ms"]
+    print()
+    print(f"📊 Webhook benchmark ({result['config'].get('server', 'flask')})")
+    print(f"   Requests: {result['config']['requests']} (concurrency {result['config']['concurrency']}), "
+          f"bron: {result['config']['payload_source']}, gem. body {result['config']['avg_body_bytes'] // 1024} KB")
+    print(f"   Throughput: {result['throughput_rps']} req/s, fouten: {result['errors']}, "
+          f"JSON backend: {result['config'].get('json_backend', 'json')}"
+          f"{' (lazy parsing)' if result['config'].get('lazy_parsing') else ''}")
+    if ack.get("count"):
+        print(f"   Ack latency (ms): p50 {ack['p50']}  p95 {ack['p95']}  p99 {ack['p99']}  max {ack['max']}")
+    print(f"   RSS: {result['rss_kb']['start']} → {result['rss_kb']['end']} KB "
+          f"(groei {result['rss_kb']['growth']} KB, piek {result['rss_kb']['peak']} KB), "
+          f"piek threads: {result.get('threads_peak')}")
+    print()
+    print(f"   {'Stap':<32}{'n':>6}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for stage, s in result["stages_ms"].items():
+        if s.get("count"):
+            print(f"   {stage:<32}{s['count']:>6}{s['p50']:>10}{s['p95']:>10}{s['p99']:>10}{s['max']:>10}")
+    print()
+
+def print_cold_start_report(result):
+    cold, imports = result["cold_start_ms"], result["imports"]
+    print()
+    print(f"🧊 Cold start ({result['config']['server']}, {result['config']['runs']} runs, "
+          f"Python {result['config']['python']})")
+    if cold.get("count"):
+        print(f"   Start → eerste /webhook 200 (ms): p50 {cold['p50']}  p95 {cold['p95']}  max {cold['max']}")
+    print(f"   import {entry_module(result['config']['server'])}: {imports['total_ms']} ms, "
+          f"{imports['modules']} modules (-X importtime)")
+    print()
+    print(f"   {'Module':<40}{'cumulatief (ms)':>18}")
+    for entry in imports["top_ms"]:
+        name = "  " * entry["depth"] + entry["module"]
+        print(f"   {name:<40}{entry['cumulative_ms']:>18}")
+    print()
+    if imports["eager_lazy_modules"]:
+        print(f"   ⚠️  Bij het opstarten geladen (horen lazy te zijn): {', '.join(imports['eager_lazy_modules'])}")
+    else:
+        print("   ✅ Geen lazy modules bij het opstarten geladen")
+    print()
+
+def print_server_comparison(results):
+    """Flask en async naast elkaar (--server both)"""
+    flask, async_ = results["flask"], results["async"]
+    rows = [
+        ("ack p50 (ms)", flask["ack_latency_ms"].get("p50"), async_["ack_latency_ms"].get("p50")),
+        ("ack p95 (ms)", flask["ack_latency_ms"].get("p95"), async_["ack_latency_ms"].get("p95")),
+        ("ack p99 (ms)", flask["ack_latency_ms"].get("p99"), async_["ack_latency_ms"].get("p99")),
+        ("throughput (req/s)", flask["throughput_rps"], async_["throughput_rps"]),
+        ("fouten", flask["errors"], async_["errors"]),
+        ("piek threads", flask["threads_peak"], async_["threads_peak"]),
+        ("RSS groei (KB)", flask["rss_kb"]["growth"], async_["rss_kb"]["growth"]),
+    ]
+    print("⚖️  Flask vs async")
+    print(f"   {'':<24}{'flask':>14}{'async':>14}")
+    for name, old, new in rows:
+        print(f"   {name:<24}{str(old):>14}{str(new):>14}")
+    print()
+
+def compare_to_baseline(result, baseline, max_regression_pct, min_delta_ms=1.0):
+    """
+    Vergelijk met een opgeslagen baseline
+
+    Een stap telt pas als regressie als hij zowel procentueel als absoluut
+    (min_delta_ms) trager is; zo geven stappen van microseconden geen ruis.
+
+    Returns:
+        list: Beschrijvingen van regressies groter dan max_regression_pct
+    """
+    regressions = []
+    checks = []
+    for metric in ("ack_latency_ms", "cold_start_ms"):
+        label = "ack" if metric == "ack_latency_ms" else "cold start"
+        old, new = baseline.get(metric, {}), result.get(metric, {})
+        checks += [(f"{label} {pct}", old.get(pct), new.get(pct)) for pct in ("p50", "p95", "p99")]
+    if "imports" in baseline and "imports" in result:
+        checks.append(("imports totaal", baseline["imports"]["total_ms"], result["imports"]["total_ms"]))
+    for stage, s in baseline.get("stages_ms", {}).items():
+        checks.append((f"{stage} p95", s.get("p95"), result["stages_ms"].get(stage, {}).get("p95")))
+
+    print(f"📏 Vergelijking met baseline (max regressie {max_regression_pct}%):")
+    for name, old, new in checks:
+        if not old or new is None:
+            continue
+        delta = (new - old) / old * 100.0
+        regressed = delta > max_regression_pct and (new - old) > min_delta_ms
+        marker = "❌" if regressed else "✅"
+        print(f"   {marker} {name:<40} {old:>10} → {new:>10} ms ({delta:+.1f}%)")
+        if regressed:
+            regressions.append(f"{name}: {old} → {new} ms ({delta:+.1f}%)")
+
+    old_rps, new_rps = baseline.get("throughput_rps"), result.get("throughput_rps")
+    if old_rps and new_rps:
+        delta = (old_rps - new_rps) / old_rps * 100.0
+        marker = "❌" if delta > max_regression_pct else "✅"
+        print(f"   {marker} {'throughput':<40} {old_rps:>10} → {new_rps:>10} req/s ({-delta:+.1f}%)")
+        if delta > max_regression_pct:
+            regressions.append(f"throughput: {old_rps} → {new_rps} req/s")
+    return regressions
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Load-test en latency benchmark voor /webhook")
+    parser.add_argument("--server", choices=["flask", "async", "both"], default="flask",
+                        help="Flask (script.py), async (async_webhook.py) of beide vergelijken")
+    parser.add_argument("--requests", type=int, default=200, help="Aantal gemeten requests")
+    parser.add_argument("--concurrency", type=int, default=4, help="Aantal parallelle clients")
+    parser.add_argument("--warmup", type=int, default=10, help="Aantal warmup requests (niet gemeten)")
+    parser.add_argument("--payloads", help="Capture map of JSONL bestand met opgenomen payloads (anders synthetisch)")
+    parser.add_argument("--min-kb", type=int, default=50, help="Min thumbnail grootte (KB, synthetisch)")
+    parser.add_argument("--max-kb", type=int, default=300, help="Max thumbnail grootte (KB, synthetisch)")
+    parser.add_argument("--devices", type=int, default=6, help="Aantal verschillende camera's (synthetisch)")
+    parser.add_argument("--unique-payloads", type=int, default=50, help="Aantal unieke synthetische payloads")
+    parser.add_argument("--display-delay-ms", type=int, default=0, help="Gesimuleerde vertraging van pcReceiver")
+    parser.add_argument("--sip-spawn", action="store_true", help="Start per SIP call een leeg Python proces")
+    parser.add_argument("--mqtt", action="store_true", help="MQTT actie aan (naar de lokale broker stand-in)")
+    parser.add_argument("--json-backend", choices=["auto", "orjson", "ujson", "json"],
+                        help="JSON backend van script.py (default: JSON_CONFIG)")
+    parser.add_argument("--parsing", choices=["lazy", "full"],
+                        help="Webhook body parsing van script.py (default: PAYLOAD_CONFIG)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Dedup cache aan laten (herhaalde payloads worden dan overgeslagen)")
+    parser.add_argument("--coalesce-window", type=float, default=0.0,
+                        help="Coalescing venster in seconden (met --dedup)")
+    parser.add_argument("--cold-start", type=int, default=0, metavar="N",
+                        help="Meet N keer nieuw proces → eerste /webhook 200 plus een -X importtime audit "
+                             "(in plaats van de load-test)")
+    parser.add_argument("--seed", type=int, default=1234, help="Random seed (reproduceerbare payloads)")
+    parser.add_argument("--output", help="Schrijf resultaat als JSON naar dit bestand")
+    parser.add_argument("--save-baseline", help="Sla resultaat op als baseline JSON")
+    parser.add_argument("--compare", help="Vergelijk met baseline JSON")
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Toegestane regressie in procent")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="Min absolute vertraging voor een regressie")
+    parser.add_argument("--verbose", action="store_true", help="Toon ook de service logs op de console")
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.payloads:
+        # De benchmark draait in een temp map, dus paden vooraf absoluut maken
+        args.payloads = os.path.abspath(args.payloads)
+    if args.server == "both" and (args.save_baseline or args.compare):
+        raise SystemExit("❌ --save-baseline/--compare werken per server, niet met --server both")
+    if args.cold_start:
+        result = run_cold_start(args)
+        for single in (result.values() if args.server == "both" else [result]):
+            print_cold_start_report(single)
+    else:
+        cwd = os.getcwd()
+        result = run_benchmark(args)
+        os.chdir(cwd)
+
+        if args.server == "both":
+            print_report(result["flask"])
+            print_report(result["async"])
+            print_server_comparison(result)
+        else:
+            print_report(result)
+
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, indent=2)
+            print(f"💾 Resultaat opgeslagen: {path}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(result, baseline, args.max_regression, args.min_delta_ms)
+        if regressions:
+            print(f"❌ {len(regressions)} regressie(s) t.o.v. baseline")
+            return 1
+        print("✅ Geen regressies t.o.v. baseline")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,525 @@
+#!/usr/bin/env python3
+"""
+Configuratie Loader
+
+Gedeelde configuratie voor script.py, async_webhook.py en wifi_monitor.py:
+
+    • Standaardwaarden uit de code (de bestaande *_CONFIG dicts)
+    • Overschreven door een TOML, YAML of JSON bestand
+    • Overschreven door environment variabelen: <PREFIX>_<SECTIE>__<SLEUTEL>
+      bijv. WEBHOOK_EMAIL__SMTP_PORT=465 of WEBHOOK_LOXONE__IP=192.168.1.50
+
+Het resultaat is een onveranderlijke snapshot (MappingProxyType, lijsten als
+tuples) die in één toewijzing wordt gewisseld: een request die een snapshot
+vasthoudt ziet nooit een half geladen configuratie. Het bestand wordt bewaakt
+met inotify (Linux) of mtime polling; na een wijziging krijgen alleen de
+subscribers van secties die echt veranderd zijn een callback, zodat enkel de
+betrokken connection pools / workers opnieuw opgebouwd worden.
+
+Gebruik:
+    config = ConfigManager({"email": {...}}, path="webhook_config.toml", env_prefix="WEBHOOK")
+    config.load()
+    config.subscribe("email", lambda old, new: ...)
+    config.start_watching()
+    smtp_port = config.section("email")["smtp_port"]
+"""
+
+import ctypes
+import ctypes.util
+import json
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from types import MappingProxyType
+
+logger = logging.getLogger(__name__)
+
+# =============================================================================
+# SNAPSHOT HULPFUNCTIES
+# =============================================================================
+
+def freeze(value):
+    """Maak een onveranderlijke kopie: dicts → MappingProxyType, lijsten → tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({k: freeze(v) for k, v in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    return value
+
+def thaw(value):
+    """Inverse van freeze: een gewone (aanpasbare) dict/list kopie"""
+    if isinstance(value, (dict, MappingProxyType)):
+        return {k: thaw(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [thaw(v) for v in value]
+    return value
+
+def deep_merge(base, override):
+    """
+    Voeg override recursief samen met base (geen van beide wordt aangepast)
+
+    Dicts worden per sleutel samengevoegd, alle andere waarden (ook lijsten)
+    vervangen de waarde uit base volledig.
+    """
+    merged = thaw(base)
+    for key, value in override.items():
+        if isinstance(value, (dict, MappingProxyType)) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = thaw(value)
+    return merged
+
+def check_types(defaults, config, path=""):
+    """
+    Controleer dat waarden hetzelfde type hebben als hun standaardwaarde
+
+    int mag waar een float verwacht wordt; sleutels zonder standaardwaarde
+    worden niet gecontroleerd.
+
+    Raises:
+        ValueError: Bij het eerste type dat niet klopt
+    """
+    for key, default in defaults.items():
+        if key not in config or default is None:
+            continue
+        value = config[key]
+        name = f"{path}{key}"
+        if isinstance(default, dict):
+            if not isinstance(value, dict):
+                raise ValueError(f"{name}: sectie verwacht, kreeg {type(value).__name__}")
+            check_types(default, value, name + ".")
+        elif isinstance(default, bool):
+            if not isinstance(value, bool):
+                raise ValueError(f"{name}: bool verwacht, kreeg {value!r}")
+        elif isinstance(default, (int, float)):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                raise ValueError(f"{name}: getal verwacht, kreeg {value!r}")
+            if isinstance(default, int) and not isinstance(value, int):
+                raise ValueError(f"{name}: geheel getal verwacht, kreeg {value!r}")
+        elif isinstance(default, (list, tuple)):
+            if not isinstance(value, (list, tuple)):
+                raise ValueError(f"{name}: lijst verwacht, kreeg {value!r}")
+        elif not isinstance(value, type(default)):
+            raise ValueError(f"{name}: {type(default).__name__} verwacht, kreeg {value!r}")
+
+# =============================================================================
+# BRONNEN - bestand en environment
+# =============================================================================
+
+def load_config_file(path):
+    """
+    Lees een configuratie bestand op basis van de extensie
+
+    .toml: tomllib (Python 3.11+) of tomli
+    .yaml/.yml: PyYAML (optioneel)
+    .json: stdlib json
+
+    Returns:
+        dict: Inhoud van het bestand ({} als het bestand leeg is)
+
+    Raises:
+        OSError: Bestand niet leesbaar
+        ValueError: Ongeldige inhoud of onbekende extensie
+        RuntimeError: Parser library niet geïnstalleerd
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, 'rb') as f:
+        raw = f.read()
+
+    if extension == ".toml":
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise RuntimeError("TOML config vereist Python 3.11+ of: pip install tomli")
+        try:
+            data = tomllib.loads(raw.decode('utf-8'))
+        except tomllib.TOMLDecodeError as e:
+            raise ValueError(f"Ongeldige TOML: {e}")
+    elif extension in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("YAML config vereist: pip install pyyaml")
+        try:
+            data = yaml.safe_load(raw) or {}
+        except yaml.YAMLError as e:
+            raise ValueError(f"Ongeldige YAML: {e}")
+    elif extension == ".json":
+        data = json.loads(raw or b"{}")
+    else:
+        raise ValueError(f"Onbekend config formaat: {extension} (gebruik .toml, .yaml of .json)")
+
+    if not isinstance(data, dict):
+        raise ValueError("Config bestand moet een mapping (secties) bevatten")
+    return data
+
+def parse_env_value(text, default=None):
+    """
+    Zet een environment string om naar het type van de standaardwaarde
+
+    Zonder (bruikbare) standaardwaarde wordt JSON geprobeerd, zodat
+    '["a@x.be", "b@x.be"]' een lijst en '465' een getal wordt.
+    """
+    if isinstance(default, bool):
+        if text.strip().lower() in ("1", "true", "yes", "on", "ja"):
+            return True
+        if text.strip().lower() in ("0", "false", "no", "off", "nee", ""):
+            return False
+        raise ValueError(f"Ongeldige bool waarde: {text!r}")
+    if isinstance(default, int):
+        return int(text)
+    if isinstance(default, float):
+        return float(text)
+    if isinstance(default, str):
+        return text
+    if isinstance(default, (list, tuple)) and not text.lstrip().startswith("["):
+        # Komma gescheiden lijst: WEBHOOK_EMAIL__TO_EMAILS=a@x.be,b@x.be
+        return [item.strip() for item in text.split(",") if item.strip()]
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+def env_overrides(prefix, defaults, environ=None):
+    """
+    Verzamel overrides uit environment variabelen
+
+    <PREFIX>_<SECTIE>__<SLEUTEL>[__<SUBSLEUTEL>...], niet hoofdlettergevoelig.
+    Alleen secties die in de standaardwaarden bestaan worden overgenomen,
+    zodat bijv. WEBHOOK_CONFIG (het pad naar het bestand) niet meetelt.
+
+    Returns:
+        dict: Geneste overrides
+    """
+    environ = os.environ if environ is None else environ
+    marker = prefix.upper() + "_"
+    overrides = {}
+    for name, text in environ.items():
+        if not name.upper().startswith(marker):
+            continue
+        parts = name[len(marker):].lower().split("__")
+        if len(parts) < 2 or parts[0] not in defaults:
+            continue
+
+        target, default = overrides, defaults
+        for part in parts[:-1]:
+            target = target.setdefault(part, {})
+            default = default.get(part) if isinstance(default, dict) else None
+        default = default.get(parts[-1]) if isinstance(default, dict) else None
+        target[parts[-1]] = parse_env_value(text, default)
+    return overrides
+
+# =============================================================================
+# BESTAND BEWAKEN - inotify met polling fallback
+# =============================================================================
+
+class FileWatcher:
+    """
+    Roep callback() aan als een bestand gewijzigd, vervangen of verwijderd wordt
+
+    Bewaakt de map (niet het bestand zelf): editors en deploy tools schrijven
+    vaak een temp bestand en hernoemen dat, waardoor een watch op het oude
+    inode niets meer ziet. Meerdere events binnen debounce seconden geven één
+    callback. Zonder inotify (niet-Linux, ontbrekende map) wordt elke
+    poll_interval seconden de mtime/grootte/inode vergeleken.
+    """
+
+    IN_MODIFY = 0x002
+    IN_CLOSE_WRITE = 0x008
+    IN_MOVED_FROM = 0x040
+    IN_MOVED_TO = 0x080
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, path, callback, poll_interval=2.0, debounce=0.2):
+        self.path = os.path.abspath(path)
+        self.callback = callback
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.backend = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.stop_event.clear()
+        fd = self._open_inotify()
+        self.backend = "inotify" if fd is not None else "polling"
+        self.thread = threading.Thread(target=self._run, args=(fd,), daemon=True,
+                                       name=f"config-watch-{os.path.basename(self.path)}")
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=2)
+            self.thread = None
+
+    def _open_inotify(self):
+        directory = os.path.dirname(self.path)
+        if not hasattr(os, "O_CLOEXEC") or not os.path.isdir(directory):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+            if fd < 0:
+                return None
+            if libc.inotify_add_watch(fd, os.fsencode(directory), self.WATCH_MASK) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _matches(self, data):
+        """True als een event in de buffer over ons bestand gaat"""
+        filename = os.fsencode(os.path.basename(self.path))
+        offset = 0
+        while offset + self.EVENT_HEADER.size <= len(data):
+            _wd, _mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name == filename:
+                return True
+        return False
+
+    def _drain(self, fd):
+        try:
+            while True:
+                if not os.read(fd, 65536):
+                    return
+        except BlockingIOError:
+            return
+
+    def _run(self, fd):
+        if fd is None:
+            self._poll()
+            return
+        try:
+            while not self.stop_event.is_set():
+                readable, _, _ = select.select([fd], [], [], 1.0)
+                if not readable:
+                    continue
+                try:
+                    data = os.read(fd, 65536)
+                except BlockingIOError:
+                    continue
+                if not self._matches(data):
+                    continue
+                # Even wachten zodat een reeks writes/renames één reload geeft
+                self.stop_event.wait(self.debounce)
+                self._drain(fd)
+                self._notify()
+        finally:
+            os.close(fd)
+
+    def _signature(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size, st.st_ino)
+        except OSError:
+            return None
+
+    def _poll(self):
+        last = self._signature()
+        while not self.stop_event.wait(self.poll_interval):
+            current = self._signature()
+            if current != last:
+                last = current
+                self._notify()
+
+    def _notify(self):
+        try:
+            self.callback()
+        except Exception as e:
+            logger.error(f"⚙️  Fout in config watcher callback: {e}")
+
+# =============================================================================
+# CONFIG MANAGER
+# =============================================================================
+
+class ConfigManager:
+    """
+    ⚙️ CONFIG MANAGER
+
+    Houdt de actieve configuratie als onveranderlijke snapshot bij.
+
+    Lezen is lock-vrij: section() geeft de sectie uit de huidige snapshot
+    terug. Neem die één keer per functie en gebruik de lokale referentie,
+    dan zijn alle waarden binnen één alarm afhandeling consistent.
+
+    Een (her)laad die faalt (parse fout, verkeerd type) laat de vorige
+    snapshot actief en wordt gelogd en geteld in get_status().
+    """
+
+    def __init__(self, defaults, path=None, env_prefix=None, environ=None, poll_interval=2.0):
+        self.defaults = thaw(defaults)
+        self.path = path
+        self.env_prefix = env_prefix
+        self.environ = environ
+        self.poll_interval = poll_interval
+        self.lock = threading.RLock()
+        self.overrides = {}
+        self.subscribers = {}
+        self.watcher = None
+        self.watch_pid = None
+
+        self._snapshot = freeze(self.defaults)
+        self.version = 0
+        self.loaded_at = None
+        self.sources = ["defaults"]
+        self.reloads = 0
+        self.errors = 0
+        self.last_error = None
+
+    @property
+    def snapshot(self):
+        """De volledige actieve configuratie (onveranderlijk)"""
+        return self._snapshot
+
+    def section(self, name):
+        """Eén sectie uit de actieve snapshot (onveranderlijk)"""
+        return self._snapshot[name]
+
+    def subscribe(self, section, callback):
+        """
+        Registreer callback(old, new) voor wijzigingen in een sectie
+
+        Wordt aangeroepen na de swap, in de thread die de reload deed.
+        """
+        with self.lock:
+            self.subscribers.setdefault(section, []).append(callback)
+
+    def unsubscribe(self, section, callback):
+        with self.lock:
+            callbacks = self.subscribers.get(section, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def build(self):
+        """
+        Bouw de samengevoegde configuratie (zonder te activeren)
+
+        Returns:
+            tuple: (config dict, lijst met gebruikte bronnen)
+        """
+        config = thaw(self.defaults)
+        sources = ["defaults"]
+        if self.path and os.path.exists(self.path):
+            file_data = {k: v for k, v in load_config_file(self.path).items() if k in self.defaults}
+            config = deep_merge(config, file_data)
+            sources.append(self.path)
+        if self.env_prefix:
+            env_data = env_overrides(self.env_prefix, self.defaults, self.environ)
+            if env_data:
+                config = deep_merge(config, env_data)
+                sources.append(f"env {self.env_prefix}_*")
+        if self.overrides:
+            config = deep_merge(config, self.overrides)
+            sources.append("runtime overrides")
+        check_types(self.defaults, config)
+        return config, sources
+
+    def load(self):
+        """
+        (Her)laad de configuratie en activeer ze atomair
+
+        Returns:
+            bool: True als de nieuwe configuratie actief is
+        """
+        with self.lock:
+            try:
+                config, sources = self.build()
+            except (OSError, ValueError, RuntimeError) as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logger.error(f"⚙️  Configuratie niet geladen, vorige blijft actief: {e}")
+                return False
+
+            new = freeze(config)
+            old = self._snapshot
+            changed = [name for name in new if old.get(name) != new.get(name)]
+
+            self._snapshot = new
+            if self.loaded_at is not None:
+                self.reloads += 1
+            self.version += 1
+            self.loaded_at = time.time()
+            self.sources = sources
+            self.last_error = None
+            callbacks = [(name, cb) for name in changed for cb in self.subscribers.get(name, ())]
+
+        if changed and self.reloads:
+            logger.info(f"⚙️  Configuratie v{self.version} actief, gewijzigd: {', '.join(changed)}")
+        for name, callback in callbacks:
+            try:
+                callback(old[name], new[name])
+            except Exception as e:
+                logger.error(f"⚙️  Fout bij toepassen config sectie '{name}': {e}")
+        return True
+
+    def override(self, values):
+        """
+        Runtime overrides (bijv. benchmark stand-ins) bovenop bestand en env
+
+        Args:
+            values (dict): Geneste waarden per sectie
+
+        Returns:
+            bool: True als de nieuwe configuratie actief is
+        """
+        with self.lock:
+            previous = self.overrides
+            self.overrides = deep_merge(self.overrides, values)
+            if self.load():
+                return True
+            self.overrides = previous
+            return False
+
+    def start_watching(self):
+        """
+        Start hot reload (idempotent, ook na een fork)
+
+        Threads overleven een fork niet, dus een gunicorn worker start hier
+        zijn eigen watcher.
+        """
+        if not self.path:
+            return None
+        with self.lock:
+            if self.watcher is not None and self.watch_pid == os.getpid():
+                return self.watcher.backend
+            self.watcher = FileWatcher(self.path, self.load, poll_interval=self.poll_interval)
+            self.watch_pid = os.getpid()
+            self.watcher.start()
+            logger.info(f"⚙️  Config hot reload actief voor {self.path} ({self.watcher.backend})")
+            return self.watcher.backend
+
+    def stop_watching(self):
+        with self.lock:
+            watcher, self.watcher = self.watcher, None
+        if watcher is not None:
+            watcher.stop()
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "path": self.path,
+                "path_exists": bool(self.path) and os.path.exists(self.path),
+                "version": self.version,
+                "loaded_at": self.loaded_at,
+                "sources": list(self.sources),
+                "reloads": self.reloads,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "watcher": self.watcher.backend if self.watcher is not None else None
+            }
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+"""
+Notifiers
+
+Registry van notificatie backends voor script.py en async_webhook.py:
+
+    • generic webhook, Slack, Discord, Pushover en Telegram (uitbreidbaar
+      met @register_notifier("type"))
+    • één gedeelde aiohttp connection pool voor alle backends, op een eigen
+      event loop thread - de Flask service en de async service gebruiken
+      dezelfde pool
+    • per backend een rate limit (token bucket), retries met exponentiële
+      backoff + jitter (Retry-After van 429 wordt gerespecteerd) en een
+      dead-letter bestand (JSONL) voor wat definitief niet afgeleverd kon worden
+    • fan-out naar N backends loopt gelijktijdig: de totale duur is die van
+      de traagste backend, niet de som
+
+Configuratie (sectie "notify" in webhook_config.toml):
+
+    [notify]
+    enabled = true
+
+    [notify.backends.telefoon]
+    type = "pushover"
+    token = "..."
+    user = "..."
+    rate_per_minute = 10
+
+    [notify.backends.huis]
+    type = "slack"
+    url = "https://hooks.slack.com/services/..."
+
+Gebruik:
+    hub = NotifierHub(config)
+    future = hub.submit(Notification("Beweging bij voordeur", title="UniFi Protect"))
+    results = future.result()   # {"telefoon": True, "huis": True}
+"""
+
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import importlib.util
+import threading
+import time
+from datetime import datetime
+
+# aiohttp kost ~150ms om te importeren: pas laden bij de eerste notificatie
+aiohttp = None
+AIOHTTP_AVAILABLE = importlib.util.find_spec("aiohttp") is not None
+_aiohttp_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def load_aiohttp():
+    """Importeer aiohttp bij het eerste gebruik (thread-safe)"""
+    global aiohttp
+    with _aiohttp_lock:
+        if aiohttp is None:
+            import aiohttp as module
+            aiohttp = module
+    return aiohttp
+
+# type naam → Notifier subclass
+NOTIFIER_TYPES = {}
+
+def register_notifier(type_name):
+    """Class decorator: maak een backend beschikbaar onder type = type_name"""
+    def decorator(cls):
+        cls.type_name = type_name
+        NOTIFIER_TYPES[type_name] = cls
+        return cls
+    return decorator
+
+class Notification:
+    """Eén notificatie, voor alle backends hetzelfde"""
+
+    __slots__ = ("message", "title", "priority", "image", "image_name", "url", "extra")
+
+    def __init__(self, message, title=None, priority=0, image=None, image_name="alarm.jpg", url=None, extra=None):
+        self.message = message
+        self.title = title
+        self.priority = priority
+        self.image = image          # Ruwe JPEG bytes (optioneel)
+        self.image_name = image_name
+        self.url = url              # Link naar meer info (optioneel)
+        self.extra = extra or {}
+
+    def to_dict(self, include_image=False):
+        data = {"title": self.title, "message": self.message, "priority": self.priority,
+                "url": self.url, **self.extra}
+        if self.image is not None:
+            data["image_bytes"] = len(self.image)
+            if include_image:
+                data["image_base64"] = base64.b64encode(self.image).decode('ascii')
+        return data
+
+class NotifierError(Exception):
+    """Mislukte aflevering; retryable bepaalt of het opnieuw geprobeerd wordt"""
+
+    def __init__(self, message, retryable=True, retry_after=None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+class RateLimiter:
+    """
+    Token bucket: rate_per_minute gemiddeld, burst berichten direct achter elkaar
+
+    acquire() wacht (asyncio.sleep) tot er een token is; draait alleen op de
+    notifier loop, dus zonder lock.
+    """
+
+    def __init__(self, rate_per_minute, burst):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        """Returns: seconden gewacht"""
+        waited = 0.0
+        self._refill()
+        while self.tokens < 1:
+            delay = (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+            await asyncio.sleep(delay)
+            waited += delay
+            self._refill()
+        self.tokens -= 1
+        return waited
+
+class Notifier:
+    """
+    Basis voor een backend
+
+    Een subclass implementeert build_request(notification) en geeft een dict
+    terug met method, url en json, data of form (multipart velden; bytes
+    waarden worden bestanden). Versturen, retries en rate limiting zitten
+    hier en in NotifierHub.
+    """
+
+    type_name = None
+    required = ()
+
+    def __init__(self, name, options):
+        missing = [key for key in self.required if not options.get(key)]
+        if missing:
+            raise ValueError(f"Notifier '{name}' ({self.type_name}): ontbrekende opties {missing}")
+        self.name = name
+        self.options = options
+        self.limiter = RateLimiter(options.get("rate_per_minute", 30), options.get("burst", 5))
+        self.stats = {"sent": 0, "failed": 0, "retries": 0, "dead_lettered": 0, "rate_limited_seconds": 0.0}
+
+    def build_request(self, notification):
+        raise NotImplementedError
+
+    def text(self, notification):
+        if notification.title:
+            return f"{notification.title}\n{notification.message}"
+        return notification.message
+
+    async def send(self, session, notification, timeout):
+        request = self.build_request(notification)
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)}
+        if "json" in request:
+            kwargs["json"] = request["json"]
+        elif "form" in request:
+            form = aiohttp.FormData()
+            for key, value in request["form"].items():
+                if isinstance(value, (bytes, bytearray)):
+                    form.add_field(key, value, filename=notification.image_name, content_type="image/jpeg")
+                elif value is not None:
+                    form.add_field(key, str(value))
+            kwargs["data"] = form
+        elif "data" in request:
+            kwargs["data"] = {k: str(v) for k, v in request["data"].items() if v is not None}
+        if request.get("headers"):
+            kwargs["headers"] = request["headers"]
+
+        try:
+            async with session.request(request.get("method", "POST"), request["url"], **kwargs) as response:
+                if response.status < 300:
+                    return
+                body = (await response.text())[:200]
+                if response.status == 429:
+                    retry_after = response.headers.get("Retry-After")
+                    raise NotifierError(f"HTTP 429: {body}", retry_after=float(retry_after) if retry_after else None)
+                raise NotifierError(f"HTTP {response.status}: {body}", retryable=response.status >= 500)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise NotifierError(f"{type(e).__name__}: {e}")
+
+@register_notifier("webhook")
+class WebhookNotifier(Notifier):
+    """Generieke JSON POST (Home Assistant, Node-RED, ntfy, eigen service)"""
+    required = ("url",)
+
+    def build_request(self, notification):
+        return {"url": self.options["url"], "headers": self.options.get("headers"),
+                "json": notification.to_dict(include_image=self.options.get("include_image", False))}
+
+@register_notifier("slack")
+class SlackNotifier(Notifier):
+    """Slack incoming webhook (geen bestanden, wel een link)"""
+    required = ("url",)
+
+    def build_request(self, notification):
+        text = f"*{notification.title}*\n{notification.message}" if notification.title else notification.message
+        if notification.url:
+            text += f"\n<{notification.url}|Bekijk>"
+        return {"url": self.options["url"], "json": {"text": text}}
+
+@register_notifier("discord")
+class DiscordNotifier(Notifier):
+    """Discord webhook; met foto als bijlage (multipart)"""
+    required = ("url",)
+
+    def build_request(self, notification):
+        payload = {"content": self.text(notification)[:2000]}
+        if notification.image is None:
+            return {"url": self.options["url"], "json": payload}
+        return {"url": self.options["url"],
+                "form": {"payload_json": json.dumps(payload), "files[0]": notification.image}}
+
+@register_notifier("pushover")
+class PushoverNotifier(Notifier):
+    """Pushover; foto als attachment"""
+    required = ("token", "user")
+
+    def build_request(self, notification):
+        fields = {"token": self.options["token"], "user": self.options["user"],
+                  "message": notification.message, "title": notification.title,
+                  "priority": notification.priority, "url": notification.url,
+                  "device": self.options.get("device")}
+        url = self.options.get("api_url", "https://api.pushover.net/1/messages.json")
+        if notification.image is None:
+            return {"url": url, "data": fields}
+        return {"url": url, "form": dict(fields, attachment=notification.image)}
+
+@register_notifier("telegram")
+class TelegramNotifier(Notifier):
+    """Telegram bot: sendPhoto met bijschrift, of sendMessage zonder foto"""
+    required = ("token", "chat_id")
+
+    def build_request(self, notification):
+        base = f"{self.options.get('api_url', 'https://api.telegram.org').rstrip('/')}/bot{self.options['token']}"
+        text = self.text(notification)
+        if notification.image is None:
+            return {"url": f"{base}/sendMessage",
+                    "json": {"chat_id": self.options["chat_id"], "text": text[:4096]}}
+        return {"url": f"{base}/sendPhoto",
+                "form": {"chat_id": self.options["chat_id"], "caption": text[:1024], "photo": notification.image}}
+
+class NotifierHub:
+    """
+    🔔 NOTIFIER HUB
+
+    Bouwt de backends uit de config, houdt één aiohttp ClientSession op een
+    eigen event loop thread en levert notificaties gelijktijdig af.
+
+    submit() mag vanuit elke thread (Flask request, actie thread, andere
+    event loop) aangeroepen worden en geeft een concurrent.futures.Future
+    terug met {backend naam: True/False}. Na een fork (gunicorn worker)
+    start de worker zijn eigen loop en pool.
+    """
+
+    def __init__(self, config):
+        self.lock = threading.Lock()
+        self.dead_letter_lock = threading.Lock()
+        self.loop = None
+        self.thread = None
+        self.pid = None
+        self.session = None
+        self.notifiers = {}
+        self.config = {}
+        self.configure(config)
+
+    def configure(self, config):
+        """
+        (Her)bouw de backends; een backend met dezelfde instellingen houdt zijn
+        rate limit en tellers
+
+        Raises:
+            ValueError: Onbekend type of ontbrekende opties (huidige backends blijven actief)
+        """
+        notifiers = {}
+        for name, options in (config.get("backends") or {}).items():
+            options = dict(options)
+            existing = self.notifiers.get(name)
+            if existing is not None and existing.options == options:
+                notifiers[name] = existing
+                continue
+            cls = NOTIFIER_TYPES.get(options.get("type"))
+            if cls is None:
+                raise ValueError(f"Notifier '{name}': onbekend type {options.get('type')!r} "
+                                 f"(beschikbaar: {', '.join(sorted(NOTIFIER_TYPES))})")
+            notifiers[name] = cls(name, options)
+        with self.lock:
+            pool_changed = self.config.get("pool_size") != config.get("pool_size")
+            self.notifiers = notifiers
+            self.config = dict(config)
+        if pool_changed and self.loop is not None and self.pid == os.getpid():
+            asyncio.run_coroutine_threadsafe(self._close_session(), self.loop)
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.pid != os.getpid() or self.thread is None or not self.thread.is_alive():
+                self.loop = asyncio.new_event_loop()
+                self.session = None
+                self.pid = os.getpid()
+                self.thread = threading.Thread(target=self.loop.run_forever, name="NotifierLoop", daemon=True)
+                self.thread.start()
+            return self.loop
+
+    def _get_session(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.config.get("pool_size", 10), ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(connector=connector)
+        return self.session
+
+    async def _close_session(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def submit(self, notification, backends=None):
+        """
+        Lever een notificatie af bij alle (of de genoemde) backends
+
+        Returns:
+            concurrent.futures.Future met {naam: bool}, of None als er niets te doen is
+        """
+        if not AIOHTTP_AVAILABLE:
+            logger.warning("🔔 Notificaties vereisen aiohttp: pip install aiohttp")
+            return None
+        with self.lock:
+            targets = [n for name, n in self.notifiers.items() if backends is None or name in backends]
+        if not targets:
+            return None
+        load_aiohttp()
+        return asyncio.run_coroutine_threadsafe(self._fan_out(targets, notification), self._ensure_loop())
+
+    async def _fan_out(self, targets, notification):
+        results = await asyncio.gather(*(self._deliver(notifier, notification) for notifier in targets))
+        return {notifier.name: ok for notifier, ok in zip(targets, results)}
+
+    async def _deliver(self, notifier, notification):
+        """Eén backend: rate limit, versturen, backoff bij tijdelijke fouten, dead-letter als het opgeeft"""
+        config = self.config
+        max_retries = config.get("max_retries", 3)
+        for attempt in range(max_retries + 1):
+            notifier.stats["rate_limited_seconds"] += await notifier.limiter.acquire()
+            try:
+                await notifier.send(self._get_session(), notification, config.get("timeout", 10))
+                notifier.stats["sent"] += 1
+                if attempt:
+                    logger.info(f"🔔 {notifier.name}: afgeleverd na {attempt} retries")
+                return True
+            except NotifierError as e:
+                if not e.retryable or attempt == max_retries:
+                    notifier.stats["failed"] += 1
+                    logger.error(f"🔔 {notifier.name}: notificatie mislukt ({e})")
+                    await asyncio.to_thread(self._dead_letter, notifier, notification, str(e), attempt + 1)
+                    return False
+                delay = min(config.get("backoff_max", 30.0), config.get("backoff_base", 1.0) * 2 ** attempt)
+                delay = e.retry_after if e.retry_after is not None else delay * random.uniform(0.5, 1.0)
+                notifier.stats["retries"] += 1
+                logger.warning(f"🔔 {notifier.name}: {e} - nieuwe poging over {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                # Fout in de backend zelf (bijv. build_request): niet opnieuw proberen
+                notifier.stats["failed"] += 1
+                logger.error(f"🔔 {notifier.name}: onverwachte fout: {e}")
+                await asyncio.to_thread(self._dead_letter, notifier, notification, repr(e), attempt + 1)
+                return False
+
+    def _dead_letter(self, notifier, notification, error, attempts):
+        """Definitief mislukte notificatie als JSON regel bewaren (zonder foto bytes)"""
+        path = self.config.get("dead_letter_file")
+        notifier.stats["dead_lettered"] += 1
+        if not path:
+            return
+        record = {"ts": datetime.now().isoformat(timespec="seconds"), "backend": notifier.name,
+                  "type": notifier.type_name, "attempts": attempts, "error": error,
+                  "notification": notification.to_dict()}
+        try:
+            with self.dead_letter_lock, open(path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            logger.error(f"🔔 Dead-letter bestand niet schrijfbaar ({path}): {e}")
+
+    def stop(self, timeout=5):
+        """Sluit de pool en stop de loop thread"""
+        if self.loop is None or self.pid != os.getpid() or not self.thread.is_alive():
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._close_session(), self.loop).result(timeout)
+        except Exception:
+            pass
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout)
+
+    def get_status(self):
+        with self.lock:
+            notifiers = dict(self.notifiers)
+        return {
+            "available": AIOHTTP_AVAILABLE,
+            "backends": {name: {"type": n.type_name, **{k: round(v, 3) if isinstance(v, float) else v
+                                                          for k, v in n.stats.items()}}
+                         for name, n in notifiers.items()}
+        }
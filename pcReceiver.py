@@ -4,6 +4,15 @@ PC Photo Receiver - Ontvang en toon foto's via POST requests
 Voor Windows - toont foto's direct op het beeldscherm
 """
 
+# Optionele sampling profiler (sampling_profiler.py naast dit script zetten).
+# Eerst importeren zodat PC_RECEIVER_PROFILE_STARTUP=<seconden> ook de imports meeneemt
+try:
+    from sampling_profiler import SamplingProfiler
+    profiler = SamplingProfiler()
+    profiler.start_from_env("PC_RECEIVER_PROFILE_STARTUP")
+except ImportError:
+    profiler = None
+
 from flask import Flask, request, jsonify, render_template_string
 import base64
 import io
@@ -11,22 +20,31 @@ import os
 import logging
 from datetime import datetime
 import threading
-import webbrowser
-import tkinter as tk
-from tkinter import Label
-from PIL import Image, ImageTk, ImageDraw, ImageFont
-import requests
+import importlib.util
+from PIL import Image, ImageDraw, ImageFont
 import tempfile
+import hashlib
+import binascii
+import json
+import mmap
+import shutil
 import sys
+import time
+import queue
+import atexit
+import re
+import contextvars
+from collections import OrderedDict, deque
+from werkzeug.exceptions import HTTPException, RequestEntityTooLarge
 
-# Audio imports voor MP3 afspelen
-try:
-    import pygame
-    AUDIO_AVAILABLE = True
-    logger_audio = logging.getLogger(__name__ + '.audio')
-except ImportError:
-    AUDIO_AVAILABLE = False
-    logger_audio = None
+# Audio voor MP3 afspelen: tkinter, PIL.ImageTk en pygame worden pas geladen
+# als ze nodig zijn (eerste foto / audio init), niet bij het opstarten.
+# pygame print bij de import een banner: die onderdrukken.
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+pygame = None
+AUDIO_AVAILABLE = importlib.util.find_spec("pygame") is not None
+audio_initialized = False
+audio_lock = threading.Lock()
 
 # Setup logging
 logging.basicConfig(
@@ -58,25 +76,73 @@ AUDIO_CONFIG = {
     "max_duration": 10                  # Max afspeel tijd in seconden
 }
 
+# Request body limieten en streaming configuratie
+UPLOAD_CONFIG = {
+    "max_content_length": 16 * 1024 * 1024,  # Max grootte request body (bytes), groter => 413
+    "spool_threshold": 512 * 1024,           # Boven deze grootte wordt een body naar een temp bestand gespooled
+    "chunk_size": 64 * 1024,                 # Chunk grootte bij streamend lezen (bytes)
+    "display_max_size": (3840, 2160)         # Foto's worden voor het scherm max zo groot gedecodeerd
+}
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_CONFIG["max_content_length"]
+
+# Achtergrond writer voor received_photos
+PHOTO_WRITER_CONFIG = {
+    "queue_size": 32,             # Max aantal foto's in de schrijf-queue
+    "full_policy": "drop_oldest", # "block", "drop_newest" of "drop_oldest" bij volle queue
+    "block_timeout": 2.0,         # Max wachttijd (s) bij "block" policy
+    "fsync_batch": 8,             # fsync na max dit aantal bestanden...
+    "fsync_interval": 1.0         # ...of na dit aantal seconden
+}
+
+# Trace ids van de webhook service (zie /traces/recent)
+TRACE_CONFIG = {
+    "enabled": True,
+    "buffer_size": 200,           # Aantal recente traces in het geheugen
+    "header": "X-Trace-Id"        # HTTP header met de trace id van script.py
+}
+
+# Herhaalde foto's van de webhook outbox (zelfde Idempotency-Key) maar één keer tonen
+IDEMPOTENCY_CONFIG = {
+    "header": "Idempotency-Key",
+    "remember": 1000              # Aantal recente sleutels in het geheugen
+}
+
+# Sampling profiler op /admin/profile (alleen als sampling_profiler.py aanwezig is)
+PROFILER_CONFIG = {
+    "default_seconds": 10,        # Duur als ?seconds= ontbreekt
+    "max_request_seconds": 60,    # Max duur van een blokkerende GET /admin/profile
+    "interval_ms": 5              # Sample interval (200 Hz)
+}
+
+# Magic bytes van ondersteunde afbeeldingsformaten (JPEG, PNG, GIF) - gebruikt
+# om base64 afbeeldingen te herkennen; BMP en WEBP zie has_image_magic()
+IMAGE_MAGIC_BYTES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')
+
 # Maak foto directory aan
 if save_photos and not os.path.exists(photos_dir):
     os.makedirs(photos_dir)
 
 def initialize_audio():
-    """Initialiseer pygame audio systeem"""
-    global AUDIO_AVAILABLE
+    """Initialiseer pygame audio systeem (pygame wordt pas hier geïmporteerd)"""
+    global AUDIO_AVAILABLE, pygame, audio_initialized
     
     if not AUDIO_AVAILABLE or not AUDIO_CONFIG["enabled"]:
         return False
-        
-    try:
-        pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
-        logger.info("🔊 Audio systeem geïnitialiseerd")
-        return True
-    except Exception as e:
-        logger.error(f"🔊 Kon audio systeem niet initialiseren: {e}")
-        AUDIO_AVAILABLE = False
-        return False
+    
+    with audio_lock:
+        if audio_initialized:
+            return True
+        try:
+            import pygame as pygame_module
+            pygame_module.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
+            pygame = pygame_module
+            audio_initialized = True
+            logger.info("🔊 Audio systeem geïnitialiseerd")
+            return True
+        except Exception as e:
+            logger.error(f"🔊 Kon audio systeem niet initialiseren: {e}")
+            AUDIO_AVAILABLE = False
+            return False
 
 def play_notification_sound():
     """Speel notificatie geluid af"""
@@ -85,6 +151,10 @@ def play_notification_sound():
     if not AUDIO_AVAILABLE or not AUDIO_CONFIG["enabled"]:
         logger.debug("🔊 Audio is uitgeschakeld of niet beschikbaar")
         return False
+    
+    # Normaal al gedaan door de AudioInit thread bij het opstarten
+    if not initialize_audio():
+        return False
         
     try:
         # Zoek naar het geluidsbestand
@@ -133,6 +203,301 @@ def play_notification_sound():
         logger.error(f"🔊 Fout bij afspelen notificatie geluid: {e}")
         return False
 
+def has_image_magic(head):
+    """True als de eerste bytes die van een JPEG/PNG/GIF/BMP/WEBP bestand zijn"""
+    if head.startswith(IMAGE_MAGIC_BYTES):
+        return True
+    if head[:2] == b'BM' and head[6:10] == b'\0\0\0\0':
+        # BMP: 'BM', bestandsgrootte, 4 gereserveerde nul bytes
+        return True
+    return head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+
+def looks_like_base64_image(value):
+    """
+    Check of een string een (base64) afbeelding is zonder hem te decoderen
+
+    Kijkt alleen naar het begin van de string: een data:image URI, of de
+    eerste 16 base64 tekens (12 bytes) gedecodeerd met de magic bytes van
+    JPEG/PNG/GIF/BMP/WEBP. Gewone tekst die toevallig met dezelfde letters
+    begint (bijv. "Qk..." voor BMP) valt daardoor af.
+
+    Args:
+        value: Te controleren waarde
+
+    Returns:
+        bool: True als het een afbeelding lijkt
+    """
+    if not isinstance(value, str):
+        return False
+    if value.startswith('data:image'):
+        return True
+    if len(value) < 16:
+        return False
+    try:
+        head = base64.b64decode(value[:16], validate=True)
+    except (binascii.Error, ValueError):
+        return False
+    return has_image_magic(head)
+
+def decode_image_data(image_data):
+    """
+    Zet afbeelding data om naar ruwe bytes
+
+    Args:
+        image_data: Ruwe bytes, base64 string of data:image URI
+
+    Returns:
+        bytes: Ruwe afbeelding bytes
+    """
+    if isinstance(image_data, (bytes, bytearray)):
+        return bytes(image_data)
+    if image_data.startswith('data:image'):
+        # Verwijder data:image prefix
+        image_data = image_data.split(',', 1)[1]
+    return base64.b64decode(image_data)
+
+def spool_stream(stream, max_size=None):
+    """
+    Lees een request stream in chunks naar een SpooledTemporaryFile
+
+    Kleine bodies blijven in het geheugen, grotere dan
+    UPLOAD_CONFIG["spool_threshold"] gaan naar een temp bestand. De SHA-256
+    hash wordt tijdens het lezen berekend, zodat de data maar één keer
+    doorlopen wordt.
+
+    Args:
+        stream: File-achtig object met read(n)
+        max_size: Max aantal bytes (default: UPLOAD_CONFIG["max_content_length"])
+
+    Returns:
+        tuple: (spool file teruggespoeld naar begin, grootte in bytes, sha256 hex)
+
+    Raises:
+        RequestEntityTooLarge: Als de stream groter is dan max_size
+    """
+    max_size = max_size or UPLOAD_CONFIG["max_content_length"]
+    chunk_size = UPLOAD_CONFIG["chunk_size"]
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CONFIG["spool_threshold"])
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_size:
+                raise RequestEntityTooLarge()
+            digest.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+
+    spool.seek(0)
+    return spool, size, digest.hexdigest()
+
+def spool_buffer(spool, size):
+    """
+    Inhoud van een spool als bytes-achtig object
+
+    Kleine bodies (in het geheugen) als bytes, een naar disk gespoolde body
+    als read-only mmap: de inhoud wordt dan niet naar het geheugen gekopieerd.
+    """
+    if size <= UPLOAD_CONFIG["spool_threshold"]:
+        spool.seek(0)
+        return spool.read()
+    return mmap.mmap(spool.fileno(), 0, access=mmap.ACCESS_READ)
+
+def decode_base64_stream(buffer, start, end):
+    """
+    Base64 (of data:image URI) uit buffer[start:end] in chunks decoderen
+
+    Schrijft de ruwe bytes naar een nieuwe spool en hasht ze onderweg, zodat
+    er nooit meer dan één chunk base64 en één chunk afbeelding tegelijk in
+    het geheugen staat. Witruimte (MIME regeleinden) wordt overgeslagen.
+
+    Returns:
+        ReceivedPhoto: De gedecodeerde afbeelding
+
+    Raises:
+        ValueError: Bij ongeldige base64 data
+    """
+    if buffer[start:start + 5] == b'data:':
+        comma = buffer.find(b',', start, min(end, start + 100))
+        if comma != -1:
+            start = comma + 1
+    chunk_size = UPLOAD_CONFIG["chunk_size"]
+    spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CONFIG["spool_threshold"])
+    digest = hashlib.sha256()
+    size = 0
+    carry = b''
+    try:
+        for offset in range(start, end, chunk_size):
+            chunk = carry + bytes(buffer[offset:min(offset + chunk_size, end)]).translate(None, b' \t\r\n')
+            usable = len(chunk) - len(chunk) % 4
+            carry = chunk[usable:]
+            data = base64.b64decode(chunk[:usable], validate=True)
+            size += len(data)
+            digest.update(data)
+            spool.write(data)
+        if carry:
+            raise ValueError("Base64 data heeft een ongeldige lengte")
+    except (binascii.Error, ValueError) as e:
+        spool.close()
+        raise ValueError(f"Ongeldige base64 data: {e}")
+    spool.seek(0)
+    return ReceivedPhoto(spool, size, digest.hexdigest())
+
+def json_string_end(buffer, start):
+    """Positie van het sluitquote van een JSON string die op start begint (na het openingsquote)"""
+    end = buffer.find(b'"', start)
+    # Quotes met een oneven aantal backslashes ervoor zijn escaped
+    while end != -1:
+        backslashes = 0
+        while buffer[end - 1 - backslashes] == 0x5C:
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return end
+        end = buffer.find(b'"', end + 1)
+    raise ValueError("Onafgesloten string in JSON")
+
+def parse_json_photo(buffer, min_image_length=1024):
+    """
+    Parse een JSON body zonder de base64 afbeeldingen te kopiëren
+
+    Elke string token wordt met bytes.find overgeslagen; lange strings die op
+    een afbeelding lijken worden in de te parsen tekst vervangen door een
+    marker. De rest (detected_name, message, ...) is klein en gaat gewoon
+    door json.loads.
+
+    Returns:
+        tuple: (geparste data met markers, {marker: (start, end) in buffer})
+
+    Raises:
+        ValueError: Bij ongeldige JSON
+    """
+    pieces = []
+    images = {}
+    last = pos = 0
+    while True:
+        quote = buffer.find(b'"', pos)
+        if quote == -1:
+            break
+        start = quote + 1
+        end = json_string_end(buffer, start)
+        pos = end + 1
+        if end - start < min_image_length or buffer.find(b'\\', start, end) != -1:
+            continue
+        head = bytes(buffer[start:start + 32]).decode('ascii', 'replace')
+        if looks_like_base64_image(head):
+            marker = f"__image_{len(images)}__"
+            images[marker] = (start, end)
+            pieces.append(buffer[last:quote])
+            pieces.append(json.dumps(marker).encode('ascii'))
+            last = pos
+    pieces.append(buffer[last:])
+    return json.loads(b''.join(pieces)), images
+
+def find_json_image(data, images):
+    """
+    Zoek de afbeelding in een geparste JSON payload (zie parse_json_photo)
+
+    Eerst de bekende velden op het hoogste niveau, daarna recursief - dan
+    alleen strings die echt als afbeelding herkend worden (of een marker van
+    een lange afbeelding), niet elke lange string.
+
+    Returns:
+        tuple: (detected_name of None, afbeelding string / marker of None)
+    """
+    detected_name = data.get('detected_name')
+    if detected_name:
+        logger.info(f"📝 Gedetecteerde naam: {detected_name}")
+
+    # Zoek naar afbeelding in verschillende mogelijke velden
+    for field in ('image', 'photo', 'thumbnail', 'data', 'base64'):
+        if field in data:
+            if data[field]:
+                logger.info(f"📷 Afbeelding gevonden in veld: {field}")
+                return detected_name, data[field]
+            break
+
+    def find_image_data(obj):
+        if isinstance(obj, dict):
+            for v in obj.values():
+                if (isinstance(v, str) and v in images) or looks_like_base64_image(v):
+                    return v
+                result = find_image_data(v)
+                if result:
+                    return result
+        elif isinstance(obj, list):
+            for item in obj:
+                result = find_image_data(item)
+                if result:
+                    return result
+        return None
+
+    image_data = find_image_data(data)
+    if image_data:
+        logger.info("📷 Afbeelding gevonden via recursieve zoektocht")
+    return detected_name, image_data
+
+class ReceivedPhoto:
+    """
+    Ontvangen afbeelding als gespoold bestand in plaats van bytes
+
+    Tot UPLOAD_CONFIG["spool_threshold"] in het geheugen, daarboven een temp
+    bestand. Grootte en SHA-256 zijn tijdens het streamen bepaald. Validatie
+    en display lezen uit het bestand; de PhotoWriter kopieert het in chunks
+    naar received_photos en sluit het daarna.
+    """
+    def __init__(self, file, size, sha256):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+
+    @classmethod
+    def from_bytes(cls, img_bytes):
+        spool = tempfile.SpooledTemporaryFile(max_size=UPLOAD_CONFIG["spool_threshold"])
+        spool.write(img_bytes)
+        spool.seek(0)
+        return cls(spool, len(img_bytes), hashlib.sha256(img_bytes).hexdigest())
+
+    def validate(self):
+        """Controleer of het een afbeelding is (leest alleen de header)"""
+        self.file.seek(0)
+        try:
+            Image.open(self.file)
+        finally:
+            self.file.seek(0)
+
+    def load_display_image(self, max_size=None):
+        """
+        PIL Image voor het scherm, begrensd tot max_size
+
+        JPEG's worden via draft() direct op een lagere schaal gedecodeerd,
+        zodat het geheugen niet met de resolutie van de upload meegroeit.
+        """
+        max_size = max_size or UPLOAD_CONFIG["display_max_size"]
+        self.file.seek(0)
+        try:
+            image = Image.open(self.file)
+            image.draft('RGB', max_size)
+            image.load()
+        finally:
+            self.file.seek(0)
+        image.thumbnail(max_size)
+        return image
+
+    def copy_to(self, f):
+        """Schrijf de afbeelding in chunks naar een open bestand"""
+        self.file.seek(0)
+        shutil.copyfileobj(self.file, f, UPLOAD_CONFIG["chunk_size"])
+
+    def close(self):
+        self.file.close()
+
 class PhotoDisplayWindow:
     """
     Tkinter window om foto's full-screen weer te geven
@@ -145,6 +510,10 @@ class PhotoDisplayWindow:
         
     def create_window(self):
         """Maak het display window aan"""
+        # Pas bij de eerste foto: tkinter (en Tcl/Tk) laden kost bij het opstarten alleen tijd
+        import tkinter as tk
+        from tkinter import Label
+
         self.root = tk.Tk()
         self.root.title("UniFi Protect Photo Viewer")
         
@@ -314,23 +683,21 @@ class PhotoDisplayWindow:
             self.root.destroy()
             self.root = None
         
-    def display_image(self, image_data, detected_name=None):
+    def display_image(self, image_data, detected_name=None, trace=None):
         """
         Toon afbeelding in het window
         
         Args:
-            image_data: Base64 encoded afbeelding of PIL Image object
+            image_data: Ruwe bytes, base64 encoded afbeelding of PIL Image object
             detected_name: Optionele naam om als overlay te tonen
+            trace: Optionele PhotoTrace waar de render span aan toegevoegd wordt
         """
+        token = current_trace.set(trace)
+        started = time.perf_counter()
         try:
-            if isinstance(image_data, str):
-                # Base64 string -> PIL Image
-                if image_data.startswith('data:image'):
-                    # Verwijder data:image prefix
-                    image_data = image_data.split(',', 1)[1]
-                
-                # Decodeer base64
-                img_bytes = base64.b64decode(image_data)
+            if isinstance(image_data, (str, bytes, bytearray)):
+                # Bytes / base64 string -> PIL Image
+                img_bytes = decode_image_data(image_data)
                 image = Image.open(io.BytesIO(img_bytes))
             else:
                 # Al een PIL Image
@@ -369,6 +736,7 @@ class PhotoDisplayWindow:
             image_resized = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
             
             # Converteer naar Tkinter format
+            from PIL import ImageTk
             self.current_image = ImageTk.PhotoImage(image_resized)
             
             # Update label
@@ -384,21 +752,60 @@ class PhotoDisplayWindow:
             self.bring_to_foreground()
             
             logger.info(f"📺 Afbeelding getoond: {img_width}x{img_height} -> {new_width}x{new_height}")
+            if trace is not None:
+                trace.add_span("render", started, width=new_width, height=new_height)
             
         except Exception as e:
             logger.error(f"Fout bij tonen afbeelding: {e}")
+            if trace is not None:
+                trace.add_span("render", started, error=str(e))
+        finally:
+            current_trace.reset(token)
     
     def run(self):
         """Start de display loop"""
         if self.root:
             self.root.mainloop()
 
+def open_unique_photo_file(source, sha256):
+    """
+    Open een nieuw foto bestand met een gegarandeerd unieke naam
+
+    De naam bevat timestamp (met microseconden) en een stukje van de SHA-256
+    hash. Het bestand wordt met O_EXCL aangemaakt; bestaat de naam toch al
+    (zelfde foto in dezelfde microseconde), dan wordt er een teller achter gezet.
+
+    Args:
+        source: Bron van de foto (voor bestandsnaam)
+        sha256: SHA-256 hex digest van de afbeelding
+
+    Returns:
+        tuple: (open binair file object, pad)
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+    short_hash = sha256[:8]
+    base = f"{source}_{timestamp}_{short_hash}"
+    flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0)
+
+    counter = 0
+    while True:
+        suffix = f"_{counter}" if counter else ""
+        filepath = os.path.join(photos_dir, f"{base}{suffix}.jpg")
+        try:
+            fd = os.open(filepath, flags, 0o644)
+            return os.fdopen(fd, 'wb'), filepath
+        except FileExistsError:
+            counter += 1
+
 def save_received_photo(image_data, source="webhook"):
     """
-    Sla ontvangen foto op naar bestand
+    Sla ontvangen foto synchroon op naar bestand
+
+    Voor de display flow wordt de PhotoWriter gebruikt (asynchroon), deze
+    functie blijft beschikbaar voor callers die direct het pad nodig hebben.
     
     Args:
-        image_data: Base64 encoded afbeelding
+        image_data: Ruwe bytes of base64 encoded afbeelding
         source: Bron van de foto (voor bestandsnaam)
         
     Returns:
@@ -408,21 +815,14 @@ def save_received_photo(image_data, source="webhook"):
         return None
         
     try:
-        # Verwijder data:image prefix als aanwezig
-        if isinstance(image_data, str) and image_data.startswith('data:image'):
-            image_data = image_data.split(',', 1)[1]
+        img_bytes = decode_image_data(image_data)
         
-        # Decodeer base64
-        img_bytes = base64.b64decode(image_data)
-        
-        # Genereer bestandsnaam
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{source}_{timestamp}.jpg"
-        filepath = os.path.join(photos_dir, filename)
-        
-        # Sla op
-        with open(filepath, 'wb') as f:
+        # Sla op onder een unieke naam
+        f, filepath = open_unique_photo_file(source, hashlib.sha256(img_bytes).hexdigest())
+        with f:
             f.write(img_bytes)
+            f.flush()
+            os.fsync(f.fileno())
         
         logger.info(f"📁 Foto opgeslagen: {filepath}")
         return filepath
@@ -431,6 +831,305 @@ def save_received_photo(image_data, source="webhook"):
         logger.error(f"Fout bij opslaan foto: {e}")
         return None
 
+class PhotoWriter:
+    """
+    Achtergrond thread die ontvangen foto's naar disk schrijft
+
+    display_photo() zet foto's in een begrensde queue en gaat direct door met
+    het updaten van het scherm; een trage SD-kaart houdt de display dus niet
+    meer op. De writer schrijft elke foto onder een unieke naam en doet de
+    fsync per batch (max fsync_batch bestanden of fsync_interval seconden).
+
+    Bij een volle queue bepaalt PHOTO_WRITER_CONFIG["full_policy"] wat er
+    gebeurt:
+        - "block":       wacht max block_timeout seconden op ruimte (backpressure),
+                         daarna wordt de foto alsnog gedropt
+        - "drop_newest": de nieuwe foto wordt niet opgeslagen
+        - "drop_oldest": de oudste foto in de queue maakt plaats voor de nieuwe
+    """
+    def __init__(self, config):
+        self.config = config
+        self.queue = queue.Queue(maxsize=config["queue_size"])
+        self.thread = None
+        self.lock = threading.Lock()
+        self.started_at = None
+        self.stats = {
+            "queued": 0,
+            "written": 0,
+            "dropped": 0,
+            "errors": 0,
+            "bytes_written": 0,
+            "fsync_batches": 0,
+            "last_lag_seconds": 0.0,
+            "max_lag_seconds": 0.0,
+            "last_write_path": None
+        }
+
+    def _ensure_started(self):
+        """Start de writer thread bij de eerste foto"""
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.started_at = time.time()
+                self.thread = threading.Thread(target=self._run, name="PhotoWriter", daemon=True)
+                self.thread.start()
+
+    def _count(self, key, amount=1):
+        with self.lock:
+            self.stats[key] += amount
+
+    def submit(self, photo, source="received"):
+        """
+        Zet een foto in de schrijf-queue
+
+        Args:
+            photo: ReceivedPhoto (de writer sluit hem na het schrijven) of ruwe bytes
+            source: Bron van de foto (voor bestandsnaam)
+
+        Returns:
+            bool: True als de foto in de queue staat, False als hij gedropt is
+        """
+        self._ensure_started()
+        if not isinstance(photo, ReceivedPhoto):
+            photo = ReceivedPhoto.from_bytes(photo)
+        item = (time.time(), source, photo)
+        policy = self.config["full_policy"]
+
+        try:
+            if policy == "block":
+                self.queue.put(item, timeout=self.config["block_timeout"])
+            else:
+                self.queue.put_nowait(item)
+        except queue.Full:
+            if policy == "drop_oldest":
+                try:
+                    dropped = self.queue.get_nowait()
+                    self.queue.task_done()
+                    if dropped[2] is not None:
+                        dropped[2].close()
+                    self._count("dropped")
+                    logger.warning("📁 Schrijf-queue vol - oudste foto gedropt")
+                    self.queue.put_nowait(item)
+                except (queue.Empty, queue.Full):
+                    self._count("dropped")
+                    photo.close()
+                    return False
+            else:
+                self._count("dropped")
+                photo.close()
+                logger.warning(f"📁 Schrijf-queue vol ({self.queue.maxsize}) - foto niet opgeslagen")
+                return False
+
+        self._count("queued")
+        return True
+
+    def _run(self):
+        """Writer loop: schrijf foto's en fsync per batch"""
+        pending = []  # Geschreven maar nog niet gefsyncte bestanden
+        last_sync = time.time()
+
+        while True:
+            timeout = max(0.0, self.config["fsync_interval"] - (time.time() - last_sync)) if pending else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                if item[2] is None:
+                    # Stop marker
+                    self._sync(pending)
+                    self.queue.task_done()
+                    return
+                self._write(item, pending)
+                self.queue.task_done()
+
+            if pending and (len(pending) >= self.config["fsync_batch"]
+                            or self.queue.empty()
+                            or time.time() - last_sync >= self.config["fsync_interval"]):
+                self._sync(pending)
+                pending = []
+                last_sync = time.time()
+
+    def _write(self, item, pending):
+        enqueued_at, source, photo = item
+        lag = time.time() - enqueued_at
+        try:
+            f, filepath = open_unique_photo_file(source, photo.sha256)
+            photo.copy_to(f)
+            f.flush()
+            pending.append((f, filepath))
+            with self.lock:
+                self.stats["written"] += 1
+                self.stats["bytes_written"] += photo.size
+                self.stats["last_lag_seconds"] = round(lag, 4)
+                self.stats["max_lag_seconds"] = round(max(self.stats["max_lag_seconds"], lag), 4)
+                self.stats["last_write_path"] = filepath
+            logger.info(f"📁 Foto opgeslagen: {filepath} (wachttijd {lag:.3f}s)")
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Fout bij opslaan foto: {e}")
+        finally:
+            photo.close()
+
+    def _sync(self, pending):
+        """fsync en sluit een batch bestanden, plus één fsync van de directory"""
+        if not pending:
+            return
+        for f, filepath in pending:
+            try:
+                os.fsync(f.fileno())
+            except OSError as e:
+                self._count("errors")
+                logger.error(f"Fout bij fsync {filepath}: {e}")
+            finally:
+                f.close()
+
+        # Directory entries ook duurzaam maken (niet mogelijk op Windows)
+        if os.name != 'nt':
+            try:
+                dir_fd = os.open(photos_dir, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            except OSError:
+                pass
+        self._count("fsync_batches")
+
+    def flush(self, timeout=None):
+        """Wacht tot alle foto's in de queue geschreven zijn"""
+        deadline = time.time() + timeout if timeout else None
+        while self.queue.unfinished_tasks:
+            if deadline and time.time() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout=5):
+        """Schrijf de queue leeg en stop de thread (bij afsluiten)"""
+        if self.thread and self.thread.is_alive():
+            try:
+                self.queue.put((time.time(), None, None), timeout=timeout)
+            except queue.Full:
+                logger.warning("📁 Writer queue vol bij afsluiten - niet alle foto's opgeslagen")
+                return
+            self.thread.join(timeout)
+
+    def get_status(self):
+        """Statistieken voor /status: queue diepte/lag en schrijf throughput"""
+        with self.queue.mutex:
+            oldest = self.queue.queue[0][0] if self.queue.queue else None
+            depth = len(self.queue.queue)
+        with self.lock:
+            stats = dict(self.stats)
+            started_at = self.started_at
+
+        uptime = time.time() - started_at if started_at else 0.0
+        stats.update({
+            "running": bool(self.thread and self.thread.is_alive()),
+            "queue_depth": depth,
+            "queue_size": self.queue.maxsize,
+            "full_policy": self.config["full_policy"],
+            "queue_lag_seconds": round(time.time() - oldest, 4) if oldest else 0.0,
+            "throughput_bytes_per_sec": round(stats["bytes_written"] / uptime, 1) if uptime else 0.0,
+            "throughput_photos_per_min": round(stats["written"] * 60 / uptime, 2) if uptime else 0.0
+        })
+        return stats
+
+photo_writer = PhotoWriter(PHOTO_WRITER_CONFIG)
+atexit.register(photo_writer.stop)
+
+# Trace van de foto die nu verwerkt wordt (request thread of Tk thread)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+class PhotoTrace:
+    """
+    Timing spans van één ontvangen foto onder de trace id van script.py
+
+    Spans tot en met display_queue gaan mee terug in het antwoord, zodat de
+    webhook service ze in zijn eigen trace kan opnemen. De render span komt
+    later uit de Tk thread en is alleen via /traces/recent te zien.
+    """
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+
+    def add_span(self, name, started, **attrs):
+        """Span vanaf started (time.perf_counter()) tot nu"""
+        span = {"name": name,
+                "start_ms": round((started - self.started) * 1000, 3),
+                "duration_ms": round((time.perf_counter() - started) * 1000, 3)}
+        span.update(attrs)
+        self.spans.append(span)
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "received_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+            "spans": list(self.spans)
+        }
+
+class TraceBuffer:
+    """Ring buffer met de laatste TRACE_CONFIG["buffer_size"] foto traces"""
+
+    def __init__(self, config):
+        self.config = config
+        self.traces = deque(maxlen=config["buffer_size"])
+
+    def start(self, trace_id=None):
+        """Nieuwe trace met de meegestuurde trace id (of een eigen id), None als tracing uit staat"""
+        if not self.config["enabled"]:
+            return None
+        if not trace_id or not TRACE_ID_PATTERN.fullmatch(trace_id):
+            trace_id = os.urandom(8).hex()
+        trace = PhotoTrace(trace_id)
+        self.traces.append(trace)
+        return trace
+
+    def recent(self, limit=20, trace_id=None):
+        """Nieuwste traces eerst, optioneel alleen die met trace_id"""
+        traces = [trace for trace in reversed(list(self.traces))
+                  if not trace_id or trace.trace_id == trace_id]
+        return [trace.to_dict() for trace in traces[:limit]]
+
+class TraceLogFilter(logging.Filter):
+    """Zet [trace_id] voor elke log regel die binnen een trace gelogd wordt"""
+
+    def filter(self, record):
+        trace = current_trace.get()
+        if trace is not None:
+            record.msg = f"[{trace.trace_id}] {record.msg}"
+        return True
+
+trace_buffer = TraceBuffer(TRACE_CONFIG)
+logger.addFilter(TraceLogFilter())
+
+class RecentKeys:
+    """Laatste N idempotency sleutels die al getoond zijn (oudste vallen eruit)"""
+
+    def __init__(self, size):
+        self.size = size
+        self.keys = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.keys
+
+    def add(self, key):
+        with self.lock:
+            self.keys[key] = True
+            self.keys.move_to_end(key)
+            while len(self.keys) > self.size:
+                self.keys.popitem(last=False)
+
+shown_keys = RecentKeys(IDEMPOTENCY_CONFIG["remember"])
+
 def start_display_window():
     """Start het display window in een aparte thread"""
     global current_window
@@ -459,25 +1158,43 @@ def start_display_window():
         logger.info("📺 Display window thread beëindigd")
         current_window = None
 
-def display_photo(image_data, detected_name=None):
+def display_photo(image_data, detected_name=None, trace=None):
     """
     Toon foto op het scherm
     
     Args:
-        image_data: Base64 encoded afbeelding
+        image_data: ReceivedPhoto, ruwe bytes of base64 encoded afbeelding
         detected_name: Optionele naam om als overlay te tonen
+        trace: Optionele PhotoTrace, wordt aan de Tk thread doorgegeven
     """
     global current_window, display_thread, latest_image
     
+    photo = image_data
+    if not isinstance(photo, ReceivedPhoto):
+        photo = ReceivedPhoto.from_bytes(decode_image_data(image_data))
+    # Het scherm krijgt een begrensde PIL Image, niet de (mogelijk enorme) upload
+    try:
+        image_data = photo.load_display_image()
+    except BaseException:
+        photo.close()
+        raise
+    
     # Sla afbeelding op
     latest_image = (image_data, detected_name)  # Sla beide op
     
     # Speel notificatie geluid af
     logger.info("🔊 Foto ontvangen - speel notificatie geluid af")
+    started = time.perf_counter()
     play_notification_sound()
+    if trace is not None:
+        trace.add_span("sound", started)
     
-    # Sla foto op naar bestand
-    save_received_photo(image_data, "received")
+    # Sla foto op naar bestand (asynchroon, blokkeert de display niet; de
+    # writer kopieert de spool in chunks en sluit hem daarna)
+    if save_photos:
+        photo_writer.submit(photo, "received")
+    else:
+        photo.close()
     
     if not auto_display:
         logger.info("📺 Auto-display uitgeschakeld")
@@ -506,7 +1223,6 @@ def display_photo(image_data, detected_name=None):
         display_thread.start()
         
         # Wacht even tot window is aangemaakt
-        import time
         time.sleep(1.5)  # Iets langer wachten voor stabiliteit
     
     # Toon afbeelding in window (nieuw of bestaand)
@@ -515,7 +1231,7 @@ def display_photo(image_data, detected_name=None):
             # Check nogmaals of window nog bestaat voordat we proberen te updaten
             if current_window.root.winfo_exists():
                 # Update in main thread (Tkinter vereist dit)
-                current_window.root.after(0, lambda: current_window.display_image(image_data, detected_name=detected_name))
+                current_window.root.after(0, lambda: current_window.display_image(image_data, detected_name=detected_name, trace=trace))
                 logger.info(f"📺 Foto succesvol doorgestuurd naar display window (naam: {detected_name})")
             else:
                 logger.warning("📺 Display window niet meer beschikbaar")
@@ -523,130 +1239,179 @@ def display_photo(image_data, detected_name=None):
             logger.error(f"Fout bij updaten display: {e}")
             logger.info("📺 Will attempt to create new window for next photo")
 
+@app.before_request
+def reject_oversized_request():
+    """Weiger te grote requests op basis van Content-Length, nog voor de body gelezen wordt"""
+    max_size = app.config.get('MAX_CONTENT_LENGTH')
+    if max_size and request.content_length and request.content_length > max_size:
+        logger.warning(f"🚧 Request te groot geweigerd: {request.content_length} bytes (max {max_size})")
+        return jsonify({"error": "Request te groot", "max_content_length": max_size}), 413
+
+@app.errorhandler(413)
+def request_too_large(e):
+    """JSON antwoord wanneer een (chunked) body tijdens het lezen te groot blijkt"""
+    return jsonify({"error": "Request te groot",
+                    "max_content_length": app.config.get('MAX_CONTENT_LENGTH')}), 413
+
 @app.route('/photo', methods=['POST'])
 def receive_photo():
     """
     Ontvang foto via POST request en toon op scherm
+
+    Elke body (JSON, bestand of raw) wordt in chunks naar een
+    SpooledTemporaryFile gelezen en onderweg gehasht, in plaats van in één
+    keer met request.get_data() / file.read(). Een base64 afbeelding in JSON
+    wordt via een mmap van de spool (parse_json_photo) gevonden en in chunks
+    naar een tweede spool gedecodeerd. Validatie, display en opslag lezen
+    uit die spool (ReceivedPhoto): het geheugen groeit niet mee met de
+    grootte van de afbeelding.
+
+    De X-Trace-Id van de webhook service wordt in elke log regel en in het
+    antwoord meegenomen, samen met de timing spans van deze request.
     """
+    trace = trace_buffer.start(request.headers.get(TRACE_CONFIG["header"]))
+    token = current_trace.set(trace)
+    if trace is not None:
+        request.environ["photo.trace_id"] = trace.trace_id
+    started = time.perf_counter()
+    photo = None
     try:
-        content_type = request.content_type
+        content_type = request.content_type or ''
         logger.info(f"📷 POST request ontvangen, content-type: {content_type}")
+
+        # Herhaling van een actie die al getoond is (webhook outbox replay)
+        idempotency_key = request.headers.get(IDEMPOTENCY_CONFIG["header"])
+        if idempotency_key and idempotency_key in shown_keys:
+            logger.info(f"🔁 Foto met sleutel {idempotency_key} is al getoond - overgeslagen")
+            return jsonify({"status": "duplicate", "message": "Foto was al getoond",
+                            "timestamp": datetime.now().isoformat()}), 200
         
-        image_data = None
         detected_name = None  # Naam uit trigger
         
         if 'application/json' in content_type:
-            # JSON payload met base64 afbeelding
-            data = request.get_json()
-            
-            if not data:
-                return jsonify({"error": "Geen JSON data"}), 400
-            
-            # Haal detected_name op indien aanwezig
-            if 'detected_name' in data:
-                detected_name = data['detected_name']
-                logger.info(f"📝 Gedetecteerde naam: {detected_name}")
-            
-            # Zoek naar afbeelding in verschillende mogelijke velden
-            possible_fields = ['image', 'photo', 'thumbnail', 'data', 'base64']
-            
-            for field in possible_fields:
-                if field in data:
-                    image_data = data[field]
-                    logger.info(f"📷 Afbeelding gevonden in veld: {field}")
-                    break
-            
-            if not image_data:
-                # Zoek recursief in geneste objecten
-                def find_image_data(obj):
-                    if isinstance(obj, dict):
-                        for k, v in obj.items():
-                            if isinstance(v, str) and (v.startswith('data:image') or len(v) > 1000):
-                                return v
-                            result = find_image_data(v)
-                            if result:
-                                return result
-                    elif isinstance(obj, list):
-                        for item in obj:
-                            result = find_image_data(item)
-                            if result:
-                                return result
-                    return None
-                
-                image_data = find_image_data(data)
-                if image_data:
-                    logger.info("📷 Afbeelding gevonden via recursieve zoektocht")
-        
+            # JSON payload met base64 afbeelding: spoolen en scannen zonder kopieën
+            spool, size, _ = spool_stream(request.stream)
+            with spool:
+                buffer = spool_buffer(spool, size) if size else b''
+                try:
+                    try:
+                        data, images = parse_json_photo(buffer)
+                    except ValueError:
+                        return jsonify({"error": "Ongeldige JSON"}), 400
+                    if not data or not isinstance(data, dict):
+                        return jsonify({"error": "Geen JSON data"}), 400
+                    detected_name, image_data = find_json_image(data, images)
+                    if image_data:
+                        try:
+                            if image_data in images:
+                                photo = decode_base64_stream(buffer, *images[image_data])
+                            else:
+                                photo = ReceivedPhoto.from_bytes(decode_image_data(image_data))
+                        except Exception as e:
+                            logger.error(f"Ongeldige base64 data: {e}")
+                            return jsonify({"error": "Ongeldige afbeelding data"}), 400
+                finally:
+                    if isinstance(buffer, mmap.mmap):
+                        buffer.close()
+
         elif 'multipart/form-data' in content_type:
-            # Multipart form met bestand
+            # Multipart form met bestand (Werkzeug spoolt grote bestanden al naar disk)
             if 'file' in request.files:
                 file = request.files['file']
                 if file.filename != '':
-                    # Lees bestand en converteer naar base64
-                    file_data = file.read()
-                    image_data = base64.b64encode(file_data).decode('utf-8')
-                    logger.info(f"📷 Bestand ontvangen: {file.filename}")
+                    photo = ReceivedPhoto(*spool_stream(file.stream))
+                    logger.info(f"📷 Bestand ontvangen: {file.filename} ({photo.size} bytes)")
             
             # Ook checken voor base64 velden in form data
-            for field in request.form:
-                if len(request.form[field]) > 1000:  # Waarschijnlijk base64 afbeelding
-                    image_data = request.form[field]
-                    logger.info(f"📷 Base64 data gevonden in form veld: {field}")
-                    break
-        
-        elif 'image/' in content_type:
-            # Raw image data
-            raw_data = request.get_data()
-            image_data = base64.b64encode(raw_data).decode('utf-8')
-            logger.info("📷 Raw image data ontvangen")
+            if photo is None:
+                for field in request.form:
+                    if looks_like_base64_image(request.form[field]):
+                        photo = ReceivedPhoto.from_bytes(decode_image_data(request.form[field]))
+                        logger.info(f"📷 Base64 data gevonden in form veld: {field}")
+                        break
         
         else:
-            # Probeer als raw data
-            raw_data = request.get_data()
-            if raw_data:
-                try:
-                    # Probeer als base64
-                    if raw_data.startswith(b'data:image'):
-                        image_data = raw_data.decode('utf-8')
-                    else:
-                        # Probeer als raw image bytes
-                        image_data = base64.b64encode(raw_data).decode('utf-8')
+            # Raw image data (image/*) of onbekend content-type: streamend inlezen
+            spool, size, sha256 = spool_stream(request.stream)
+            if size and spool.read(len(b'data:image')) == b'data:image':
+                # data:image URI als platte tekst: in chunks decoderen naar een nieuwe spool
+                with spool:
+                    buffer = spool_buffer(spool, size)
+                    try:
+                        photo = decode_base64_stream(buffer, 0, size)
+                    except ValueError as e:
+                        logger.error(f"Ongeldige base64 data: {e}")
+                        return jsonify({"error": "Ongeldige afbeelding data"}), 400
+                    finally:
+                        if isinstance(buffer, mmap.mmap):
+                            buffer.close()
+            elif size:
+                spool.seek(0)
+                photo = ReceivedPhoto(spool, size, sha256)
+            else:
+                spool.close()
+            if photo is not None:
+                if 'image/' in content_type:
+                    logger.info(f"📷 Raw image data ontvangen ({size} bytes)")
+                else:
                     logger.info("📷 Data geïnterpreteerd als afbeelding")
-                except:
-                    pass
         
-        if not image_data:
+        if photo is None or not photo.size:
             logger.warning("⚠️ Geen afbeelding gevonden in request")
             return jsonify({"error": "Geen afbeelding gevonden"}), 400
         
-        # Valideer dat het een geldige afbeelding is
+        if trace is not None:
+            trace.add_span("decode", started, bytes=photo.size)
+        
+        # Valideer dat het een geldige afbeelding is (leest alleen de header)
+        started = time.perf_counter()
         try:
-            test_data = image_data
-            if test_data.startswith('data:image'):
-                test_data = test_data.split(',', 1)[1]
-            
-            img_bytes = base64.b64decode(test_data)
-            # Probeer afbeelding te openen
-            Image.open(io.BytesIO(img_bytes))
-            
+            photo.validate()
         except Exception as e:
             logger.error(f"Ongeldige afbeelding data: {e}")
             return jsonify({"error": "Ongeldige afbeelding data"}), 400
-        
-        # Toon afbeelding op scherm
-        logger.info(f"📷 Afbeelding ontvangen ({len(image_data)} karakters) - Naam: {detected_name}")
-        display_photo(image_data, detected_name=detected_name)
-        
-        return jsonify({
+        if trace is not None:
+            trace.add_span("validate", started)
+        
+        # Toon afbeelding op scherm (display_photo neemt de spool over)
+        logger.info(f"📷 Afbeelding ontvangen ({photo.size} bytes, sha256 {photo.sha256[:12]}) - Naam: {detected_name}")
+        started = time.perf_counter()
+        received, photo = photo, None
+        display_photo(received, detected_name=detected_name, trace=trace)
+        if idempotency_key:
+            shown_keys.add(idempotency_key)
+        
+        result = {
             "status": "success", 
             "message": "Foto ontvangen en getoond",
             "timestamp": datetime.now().isoformat(),
-            "size": len(image_data)
-        }), 200
-        
+            "size": received.size,
+            "sha256": received.sha256
+        }
+        if trace is not None:
+            trace.add_span("display_queue", started)
+            result["trace"] = trace.to_dict()
+        return jsonify(result), 200
+        
+    except HTTPException:
+        # 413/400 van Werkzeug doorgeven aan de Flask error handlers
+        raise
     except Exception as e:
         logger.error(f"Fout bij verwerken foto: {e}")
         return jsonify({"error": str(e)}), 500
+    finally:
+        if photo is not None:
+            # Niet aan display_photo overgedragen (fout of ongeldige afbeelding)
+            photo.close()
+        current_trace.reset(token)
+
+@app.after_request
+def add_trace_header(response):
+    """Echo de trace id terug naar de webhook service"""
+    trace_id = request.environ.get("photo.trace_id")
+    if trace_id:
+        response.headers[TRACE_CONFIG["header"]] = trace_id
+    return response
 
 @app.route('/status', methods=['GET'])
 def status():
@@ -664,6 +1429,7 @@ def status():
         "bring_to_foreground": bring_to_foreground_enabled,
         "save_photos": save_photos,
         "photos_directory": photos_dir if save_photos else None,
+        "photo_writer": photo_writer.get_status(),
         "audio_enabled": AUDIO_CONFIG["enabled"],
         "audio_available": AUDIO_AVAILABLE,
         "audio_volume": AUDIO_CONFIG["volume"],
@@ -955,6 +1721,68 @@ def display_status():
     
     return jsonify(status)
 
+@app.route('/traces/recent', methods=['GET'])
+def recent_traces():
+    """Recente foto traces (nieuwste eerst), ?trace_id= voor één alarm"""
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({
+        "enabled": TRACE_CONFIG["enabled"],
+        "buffered": len(trace_buffer.traces),
+        "traces": trace_buffer.recent(limit=max(1, limit), trace_id=request.args.get('trace_id'))
+    })
+
+def profile_response(profile):
+    """Profiel als collapsed-stack bestand, of ?format=json voor een samenvatting"""
+    if request.args.get('format') == 'json':
+        return jsonify(profile.to_dict())
+    filename = f"pcreceiver-{os.getpid()}-{profile.started_at.strftime('%Y%m%d-%H%M%S')}.folded"
+    return app.response_class(profile.collapsed(), content_type="text/plain; charset=utf-8",
+                              headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_endpoint():
+    """
+    CPU profiel van ?seconds= (max 60) als collapsed stacks voor flamegraph.pl / speedscope
+
+    Voor langere metingen: POST /admin/profile/start en /admin/profile/stop
+    """
+    if profiler is None:
+        return jsonify({"error": "Profiler niet beschikbaar - zet sampling_profiler.py naast dit script"}), 501
+    try:
+        seconds = min(float(request.args.get('seconds', PROFILER_CONFIG["default_seconds"])),
+                      PROFILER_CONFIG["max_request_seconds"])
+        interval = float(request.args.get('interval_ms', PROFILER_CONFIG["interval_ms"])) / 1000
+    except ValueError:
+        return jsonify({"error": "seconds/interval_ms moeten getallen zijn"}), 400
+    if not profiler.start(duration=seconds, interval=interval):
+        return jsonify({"error": "Er loopt al een profiel", **profiler.get_status()}), 409
+    time.sleep(max(seconds, 0.1))
+    return profile_response(profiler.stop())
+
+@app.route('/admin/profile/start', methods=['POST'])
+def profile_start():
+    """Start een profiel op de achtergrond (?seconds=, standaard tot /admin/profile/stop)"""
+    if profiler is None:
+        return jsonify({"error": "Profiler niet beschikbaar - zet sampling_profiler.py naast dit script"}), 501
+    try:
+        seconds = float(request.args['seconds']) if 'seconds' in request.args else None
+        interval = float(request.args.get('interval_ms', PROFILER_CONFIG["interval_ms"])) / 1000
+    except ValueError:
+        return jsonify({"error": "seconds/interval_ms moeten getallen zijn"}), 400
+    if not profiler.start(duration=seconds, interval=interval):
+        return jsonify({"error": "Er loopt al een profiel", **profiler.get_status()}), 409
+    return jsonify({"status": "started", **profiler.get_status()}), 202
+
+@app.route('/admin/profile/stop', methods=['POST'])
+def profile_stop():
+    """Stop het lopende profiel en geef het (of het laatste afgelopen profiel) terug"""
+    if profiler is None:
+        return jsonify({"error": "Profiler niet beschikbaar - zet sampling_profiler.py naast dit script"}), 501
+    profile = profiler.stop()
+    if profile is None:
+        return jsonify({"error": "Nog geen profiel opgenomen"}), 404
+    return profile_response(profile)
+
 @app.route('/reset-display', methods=['POST'])
 def reset_display():
     """Reset het display systeem"""
@@ -986,9 +1814,11 @@ def web_interface():
 if __name__ == '__main__':
     print("🖥️ PC Photo Receiver wordt gestart...")
     
-    # Initialiseer audio systeem
-    if initialize_audio():
-        print("🔊 Audio systeem geïnitialiseerd")
+    # Initialiseer audio systeem op de achtergrond (pygame import + mixer init),
+    # zodat de server niet op de audio hardware hoeft te wachten
+    if AUDIO_AVAILABLE and AUDIO_CONFIG["enabled"]:
+        threading.Thread(target=initialize_audio, name="AudioInit", daemon=True).start()
+        print("🔊 Audio systeem wordt geïnitialiseerd")
         if os.path.exists(AUDIO_CONFIG["notification_sound"]):
             print(f"🎵 Geluid bestand gevonden: {AUDIO_CONFIG['notification_sound']}")
         else:
@@ -1005,6 +1835,8 @@ if __name__ == '__main__':
     print("   - Status: http://localhost:5001/status")
     print("   - Configuratie: http://localhost:5001/config")
     print("   - Test foto: http://localhost:5001/test")
+    print("   - Recente traces: http://localhost:5001/traces/recent")
+    print("   - CPU profiel: http://localhost:5001/admin/profile?seconds=10")
     print("   - Web interface: http://localhost:5001/")
     print()
     print("💡 Gebruik:")
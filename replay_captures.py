@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Webhook Capture Replay
+
+Speelt webhooks die met CAPTURE_CONFIG["enabled"] in script.py opgenomen zijn
+opnieuw af, in dezelfde volgorde en met de originele timing (of N× sneller).
+Zo kan een alarm-storm uit productie offline gereproduceerd en geprofiled
+worden.
+
+Blob placeholders ({"$blob": ...}) worden terug omgezet naar de originele
+base64 data:image strings, zodat de service exact dezelfde body krijgt.
+
+Doelen:
+    • --url http://host:5000/webhook   → via HTTP naar een draaiende service
+    • --in-process                      → direct in script.py via de Flask
+                                          test client (geen netwerk nodig),
+                                          acties gaan naar lokale stand-ins
+                                          tenzij --live-actions
+
+Gebruik:
+    python3 replay_captures.py captures/ --url http://localhost:5000/webhook
+    python3 replay_captures.py captures/requests.jsonl --in-process --speed 10
+    python3 replay_captures.py captures/ --in-process --speed 0   # zo snel mogelijk
+    python3 replay_captures.py captures/ --export storm.jsonl     # platte bodies
+"""
+
+import argparse
+import base64
+import glob
+import json
+import os
+import sys
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# =============================================================================
+# CAPTURES LADEN
+# =============================================================================
+
+def capture_files(path):
+    """
+    Capture bestanden in chronologische volgorde
+
+    Een map geeft requests.jsonl.N (oudste eerst) ... requests.jsonl.1, requests.jsonl
+    terug, zoals de RotatingFileHandler ze achterlaat.
+    """
+    if os.path.isfile(path):
+        return [path]
+
+    def rotation_index(filename):
+        suffix = filename.rsplit('.', 1)[-1]
+        return int(suffix) if suffix.isdigit() else 0
+
+    files = glob.glob(os.path.join(path, '*.jsonl')) + glob.glob(os.path.join(path, '*.jsonl.*'))
+    return sorted(files, key=rotation_index, reverse=True)
+
+def restore_blobs(obj, blob_dir, cache=None):
+    """Vervang {"$blob": ...} placeholders recursief door de originele base64 strings"""
+    cache = {} if cache is None else cache
+    if isinstance(obj, dict):
+        if "$blob" in obj:
+            key = (obj["$blob"], obj.get("$ext", "bin"))
+            if key not in cache:
+                with open(os.path.join(blob_dir, f"{key[0]}.{key[1]}"), 'rb') as f:
+                    cache[key] = base64.b64encode(f.read()).decode('ascii')
+            return obj.get("$prefix", "") + cache[key]
+        return {k: restore_blobs(v, blob_dir, cache) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [restore_blobs(i, blob_dir, cache) for i in obj]
+    return obj
+
+def load_captures(path):
+    """
+    Laad alle capture records (met herstelde blobs)
+
+    Returns:
+        list: Records met ts, method, path, query, content_type en body
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Capture pad niet gevonden: {path}")
+    files = capture_files(path)
+    blob_dir = os.path.join(path if os.path.isdir(path) else os.path.dirname(path), "blobs")
+    cache = {}
+    records = []
+    for filename in files:
+        with open(filename, 'r', encoding='utf-8') as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    print(f"⚠️  Ongeldige regel overgeslagen: {filename}:{line_no}")
+                    continue
+                if record.get("body") is not None:
+                    record["body"] = restore_blobs(record["body"], blob_dir, cache)
+                records.append(record)
+    records.sort(key=lambda r: r.get("ts", 0))
+    return records
+
+# =============================================================================
+# AFSPELEN
+# =============================================================================
+
+def http_sender(url, timeout):
+    import requests
+    session = requests.Session()
+
+    def send(record):
+        if record.get("method") == "GET":
+            response = session.get(url, params=record.get("query"), timeout=timeout)
+        else:
+            response = session.post(url, params=record.get("query"),
+                                    data=json.dumps(record.get("body")).encode('utf-8'),
+                                    headers={'Content-Type': record.get("content_type") or 'application/json'},
+                                    timeout=timeout)
+        return response.status_code
+    return send
+
+def in_process_sender(live_actions=False):
+    """
+    Sender die direct in script.py afspeelt
+
+    Standaard worden pcReceiver, SMTP, Loxone en de SIP dialer vervangen door
+    de lokale stand-ins uit benchmark_webhook.py, zodat een replay geen TV
+    aanzet of telefoon laat rinkelen. Met live_actions=True gaan de acties
+    naar de echte geconfigureerde doelen.
+    """
+    sys.path.insert(0, SCRIPT_DIR)
+    import script
+    if not live_actions:
+        from benchmark_webhook import StageTimer, configure_stand_ins
+        configure_stand_ins(script, argparse.Namespace(display_delay_ms=0, sip_spawn=False), StageTimer())
+    client = script.app.test_client()
+
+    def send(record):
+        path = record.get("path") or "/webhook"
+        if record.get("method") == "GET":
+            response = client.get(path, query_string=record.get("query"))
+        else:
+            response = client.post(path, query_string=record.get("query"),
+                                   data=json.dumps(record.get("body")),
+                                   content_type=record.get("content_type") or 'application/json')
+        return response.status_code
+    return send
+
+def replay(records, send, speed=1.0, limit=None):
+    """
+    Speel records af met de originele onderlinge timing gedeeld door speed
+
+    De planning is absoluut t.o.v. de start (geen opgetelde sleep-drift), dus
+    een trage request schuift de rest niet op. speed=0 = zo snel mogelijk.
+
+    Returns:
+        dict: Samenvatting (aantal, status codes, lag, duur)
+    """
+    records = records[:limit] if limit else records
+    if not records:
+        return {"sent": 0}
+
+    first_ts = records[0].get("ts", 0)
+    start = time.monotonic()
+    statuses = {}
+    max_lag = 0.0
+
+    for record in records:
+        if speed > 0:
+            target = (record.get("ts", first_ts) - first_ts) / speed
+            delay = target - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                max_lag = max(max_lag, -delay)
+        try:
+            status = send(record)
+        except Exception as e:
+            status = f"error: {e}"
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    return {
+        "sent": len(records),
+        "statuses": statuses,
+        "original_span_seconds": round(records[-1].get("ts", first_ts) - first_ts, 3),
+        "replay_seconds": round(time.monotonic() - start, 3),
+        "max_schedule_lag_seconds": round(max_lag, 3)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Speel opgenomen webhooks opnieuw af")
+    parser.add_argument("captures", help="Capture map (met blobs/) of een enkel .jsonl bestand")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--url", help="Webhook URL van een draaiende service")
+    target.add_argument("--in-process", action="store_true", help="Afspelen in script.py zelf (Flask test client)")
+    target.add_argument("--export", help="Schrijf de herstelde bodies als JSONL (voor benchmark_webhook.py)")
+    parser.add_argument("--speed", type=float, default=1.0, help="Snelheid (1 = origineel, 10 = 10x, 0 = zo snel mogelijk)")
+    parser.add_argument("--limit", type=int, help="Max aantal requests")
+    parser.add_argument("--timeout", type=float, default=30.0, help="HTTP timeout (s)")
+    parser.add_argument("--live-actions", action="store_true",
+                        help="Bij --in-process de echte display/SIP/email/Loxone gebruiken i.p.v. stand-ins")
+    args = parser.parse_args(argv)
+
+    records = load_captures(args.captures)
+    print(f"🎞️  {len(records)} opgenomen requests geladen uit {args.captures}")
+
+    if args.export:
+        with open(args.export, 'w', encoding='utf-8') as f:
+            for record in records[:args.limit] if args.limit else records:
+                if record.get("body") is not None:
+                    f.write(json.dumps(record["body"], ensure_ascii=False) + "\n")
+        print(f"💾 Bodies geëxporteerd naar {args.export}")
+        return 0
+
+    send = in_process_sender(args.live_actions) if args.in_process else http_sender(args.url, args.timeout)
+    summary = replay(records, send, speed=args.speed, limit=args.limit)
+    print(json.dumps(summary, indent=2))
+    return 0 if all(k == "200" for k in summary.get("statuses", {})) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Sampling Profiler
+
+Lichte profiler voor script.py, async_webhook.py en pcReceiver.py die tijdens
+runtime aan en uit gezet kan worden (zie /admin/profile):
+
+    • Een achtergrond thread neemt elke interval een snapshot van de stacks
+      van alle threads (sys._current_frames) - er wordt niets in de code van
+      de service zelf gehaakt
+    • Op Linux telt een sample alleen als de thread sinds de vorige sample
+      echt CPU tijd gebruikt heeft (per-thread CPU klok), zodat wachtende
+      threads (select, queue.get, sleep) niet in de flamegraph komen. Zonder
+      per-thread klok (Windows) wordt op wall-clock gesampled; bekende
+      wacht-functies (IDLE_FRAMES) worden in beide gevallen overgeslagen.
+    • Resultaat in collapsed-stack formaat ("thread;module:functie;... N"),
+      direct bruikbaar met flamegraph.pl, speedscope of inferno
+
+Staat de profiler uit, dan draait er geen thread en kost hij niets.
+
+Let op: de sampler thread heeft de GIL nodig en krijgt die vooral op de
+momenten dat andere threads hem loslaten (I/O, os.urandom, zlib). Korte
+C-calls die de GIL vrijgeven komen daardoor wat te zwaar in beeld; vergelijk
+altijd met een tweede profiel voor conclusies over kleine functies.
+
+Gebruik:
+    profiler = SamplingProfiler()
+    profiler.start(duration=10)
+    ...
+    profile = profiler.stop()
+    open("burst.folded", "w").write(profile.collapsed())
+
+    # Startup profilen: WEBHOOK_PROFILE_STARTUP=30 python3 script.py
+    profiler.start_from_env("WEBHOOK_PROFILE_STARTUP")
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Standaard sample interval (s) - 200 Hz is ruim genoeg voor een alarm burst
+DEFAULT_INTERVAL = 0.005
+
+# Langste profiel dat gestart kan worden (s)
+MAX_DURATION = 300
+
+# Diepste stack die per sample opgeslagen wordt (recursie, Flask middleware)
+MAX_STACK_DEPTH = 128
+
+# Blad frames van threads die op iets wachten: zo'n sample is geen CPU werk,
+# ook niet als de thread net daarvoor even gedraaid heeft
+IDLE_FRAMES = frozenset({
+    "threading:wait",
+    "threading:_wait_for_tstate_lock",
+    "queue:get",
+    "selectors:select",
+    "socket:accept",
+    "socketserver:serve_forever",
+})
+
+def thread_cpu_clock(ident):
+    """
+    Per-thread CPU klok (Linux/Unix), of None als die er niet is
+
+    Returns:
+        callable: Functie die de CPU tijd (s) van die thread teruggeeft
+    """
+    if not hasattr(time, "pthread_getcpuclockid"):
+        return None
+    try:
+        clock_id = time.pthread_getcpuclockid(ident)
+        time.clock_gettime(clock_id)
+    except (OSError, OverflowError):
+        return None
+    return lambda: time.clock_gettime(clock_id)
+
+def frame_label(frame):
+    """module:functie voor één stack frame"""
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+class Profile:
+    """Resultaat van één profiel run"""
+
+    def __init__(self, started_at, duration, interval, mode, stacks, samples, reason):
+        self.started_at = started_at
+        self.duration = duration
+        self.interval = interval
+        self.mode = mode
+        self.stacks = stacks
+        self.samples = samples
+        self.reason = reason
+
+    def collapsed(self):
+        """Collapsed stacks, één "frame;frame;frame count" per regel"""
+        header = (f"# {self.reason} profiel van {self.started_at.isoformat(timespec='seconds')}, "
+                  f"{self.duration:.1f}s, {self.mode}, interval {self.interval * 1000:.1f}ms, "
+                  f"{self.samples} samples\n")
+        lines = [f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()]
+        return header + "\n".join(lines) + ("\n" if lines else "")
+
+    def top_functions(self, limit=20):
+        """Functies met de meeste eigen samples (het blad van de stack)"""
+        own = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+        total = sum(own.values()) or 1
+        return [{"function": name, "samples": count, "percent": round(100 * count / total, 1)}
+                for name, count in own.most_common(limit)]
+
+    def to_dict(self, limit=20):
+        return {
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "duration_seconds": round(self.duration, 3),
+            "interval_ms": round(self.interval * 1000, 3),
+            "mode": self.mode,
+            "reason": self.reason,
+            "samples": self.samples,
+            "unique_stacks": len(self.stacks),
+            "top_functions": self.top_functions(limit)
+        }
+
+class SamplingProfiler:
+    """
+    Eén profiler per proces; er kan maar één profiel tegelijk lopen
+
+    Na een fork (gunicorn worker) draait de thread van de parent niet meer;
+    de profiler ziet dat aan de pid en kan dan gewoon opnieuw starten.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop_event = threading.Event()
+        self._stacks = Counter()
+        self._samples = 0
+        self._started = None
+        self._started_at = None
+        self._interval = DEFAULT_INTERVAL
+        self._reason = None
+        self._on_done = None
+        self._last_profile = None
+
+    @property
+    def running(self):
+        return (self._thread is not None and self._pid == os.getpid()
+                and self._thread.is_alive())
+
+    def start(self, duration=None, interval=DEFAULT_INTERVAL, reason="runtime", on_done=None):
+        """
+        Start een profiel van max duration seconden (None = tot stop())
+
+        Args:
+            on_done: Optionele callback(profile) als het profiel afgelopen of gestopt is
+
+        Returns:
+            bool: False als er al een profiel loopt
+        """
+        duration = MAX_DURATION if duration is None else min(max(float(duration), 0.1), MAX_DURATION)
+        interval = min(max(float(interval), 0.001), 1.0)
+        with self._lock:
+            if self.running:
+                return False
+            self._stop_event = threading.Event()
+            self._stacks = Counter()
+            self._samples = 0
+            self._interval = interval
+            self._reason = reason
+            self._on_done = on_done
+            self._started = time.perf_counter()
+            self._started_at = datetime.now()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, args=(self._stop_event, duration),
+                                            name="sampling-profiler", daemon=True)
+            self._thread.start()
+        logger.info(f"🔬 Profiler gestart ({reason}, max {duration:.0f}s, interval {interval * 1000:.1f}ms)")
+        return True
+
+    def stop(self, timeout=2):
+        """
+        Stop het lopende profiel
+
+        Returns:
+            Profile, of het laatste afgelopen profiel als er niets liep
+        """
+        with self._lock:
+            thread = self._thread if self.running else None
+            self._stop_event.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        return self._last_profile
+
+    def _run(self, stop_event, duration):
+        own_ident = threading.get_ident()
+        deadline = time.perf_counter() + duration
+        clocks = {}
+        cpu_seen = {}
+        cpu_mode = thread_cpu_clock(own_ident) is not None
+        names = {}
+
+        while not stop_event.wait(self._interval) and time.perf_counter() < deadline:
+            frames = sys._current_frames()
+            if len(names) != len(frames) or any(ident not in names for ident in frames):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in frames.items():
+                if ident == own_ident:
+                    continue
+                if cpu_mode:
+                    if ident not in clocks:
+                        clocks[ident] = thread_cpu_clock(ident)
+                    clock = clocks[ident]
+                    if clock is not None:
+                        try:
+                            cpu = clock()
+                        except OSError:
+                            continue
+                        previous = cpu_seen.get(ident)
+                        cpu_seen[ident] = cpu
+                        if previous is None or cpu <= previous:
+                            continue
+                if frame_label(frame) in IDLE_FRAMES:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(frame_label(frame))
+                    frame = frame.f_back
+                stack.append(names.get(ident, f"thread-{ident}"))
+                stack.reverse()
+                self._stacks[tuple(stack)] += 1
+                self._samples += 1
+            del frames
+
+        profile = Profile(self._started_at, time.perf_counter() - self._started, self._interval,
+                          "cpu" if cpu_mode else "wall", self._stacks, self._samples, self._reason)
+        self._last_profile = profile
+        logger.info(f"🔬 Profiler gestopt: {profile.samples} samples, {len(profile.stacks)} unieke stacks "
+                    f"in {profile.duration:.1f}s")
+        if self._on_done is not None:
+            try:
+                self._on_done(profile)
+            except Exception as e:
+                logger.error(f"❌ Profiler callback fout: {e}")
+
+    def start_from_env(self, env_var, output_dir=".", environ=None):
+        """
+        Profileer het opstarten als env_var gezet is (waarde = seconden)
+
+        Het profiel wordt na afloop weggeschreven als
+        <output_dir>/profile-startup-<pid>.folded.
+
+        Returns:
+            bool: True als er een startup profiel gestart is
+        """
+        environ = os.environ if environ is None else environ
+        value = environ.get(env_var, "").strip()
+        if not value or value.lower() in ("0", "false", "no", "off"):
+            return False
+        try:
+            duration = float(value)
+        except ValueError:
+            duration = 30.0
+        if value.lower() in ("1", "true", "yes", "on"):
+            duration = 30.0
+
+        def write_profile(profile):
+            path = os.path.join(output_dir, f"profile-startup-{os.getpid()}.folded")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(profile.collapsed())
+            logger.info(f"🔬 Startup profiel opgeslagen: {path}")
+
+        return self.start(duration=duration, reason="startup", on_done=write_profile)
+
+    def get_status(self):
+        status = {"running": self.running, "max_duration_seconds": MAX_DURATION,
+                  "cpu_clock": thread_cpu_clock(threading.get_ident()) is not None}
+        if self.running:
+            status.update({"reason": self._reason,
+                           "elapsed_seconds": round(time.perf_counter() - self._started, 3),
+                           "samples": self._samples})
+        if self._last_profile is not None:
+            status["last_profile"] = self._last_profile.to_dict(limit=5)
+        return status
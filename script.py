@@ -12,7 +12,7 @@
 ║  • SIP call integratie                                                       ║
 ║  • Email notificaties met foto                                               ║
 ║  • Loxone integratie via UDP                                                 ║
-║  • Apparaat logging                                                          ║
+║  • Apparaat logging (SQLite, opvraagbaar via /devices/activity)              ║
 ║                                                                              ║
 ║  Auteur: [Van Baelen Rob]                                                    ║
 ║  Datum: November 2025                                                        ║
@@ -23,22 +23,59 @@
 # IMPORTS
 # =============================================================================
 
+# De profiler eerst: met WEBHOOK_PROFILE_STARTUP=<seconden> zitten de imports
+# hieronder ook in het startup profiel (profile-startup-<pid>.folded)
+from sampling_profiler import SamplingProfiler
+profiler = SamplingProfiler()
+profiler.start_from_env("WEBHOOK_PROFILE_STARTUP")
+
 from flask import Flask, request, jsonify, send_from_directory, render_template_string, send_file
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import BadRequest, HTTPException, RequestEntityTooLarge, UnsupportedMediaType
 import json
 import logging
 import glob
+import fnmatch
+import re
 import mimetypes
+from collections import OrderedDict, deque
+import contextvars
 from datetime import datetime
 import os
 import socket
 import subprocess
 import sys
 import threading
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.image import MIMEImage
+import queue
+import sqlite3
+import time
+import bisect
+import heapq
+import random
+import atexit
+import signal
+import shutil
+import hashlib
 import base64
+import importlib.util
+
+from config_loader import ConfigManager
+from notifiers import NotifierHub, Notification
+
+# MQTT (optioneel): pip install paho-mqtt
+# MQTT staat standaard uit: paho pas laden bij de eerste start van de MQTTPublisher
+mqtt = None
+MQTT_AVAILABLE = importlib.util.find_spec("paho") is not None
+_mqtt_lock = threading.Lock()
+
+def load_mqtt():
+    """Importeer paho.mqtt.client bij het eerste gebruik (thread-safe)"""
+    global mqtt
+    with _mqtt_lock:
+        if mqtt is None:
+            import paho.mqtt.client as module
+            mqtt = module
+    return mqtt
 
 # =============================================================================
 # LOGGING SETUP
@@ -64,17 +101,64 @@ app = Flask(__name__)
 # CONFIGURATIE - Pas deze waarden aan naar jouw setup
 # =============================================================================
 
+# Loxone, SIP, email en PC display zijn standaardwaarden: webhook_config.toml
+# (of $WEBHOOK_CONFIG) en WEBHOOK_<SECTIE>__<SLEUTEL> env variabelen overschrijven
+# ze zonder herstart, zie EXTERNE CONFIGURATIE hieronder.
+
 # Loxone configuratie
 LOXONE_IP = "192.168.1.100"  # IP adres van je Loxone Miniserver
 LOXONE_PORT = 1234           # UDP poort
 
+# Loxone UDP sender (één socket + sender thread, zie LoxoneUDPSender)
+LOXONE_UDP_CONFIG = {
+    "coalesce_window": 0.005,     # Berichten binnen dit venster (s) samen in één datagram
+    "max_datagram": 1400,         # Max bytes per datagram (onder de MTU blijven)
+    "separator": "\n",            # Scheiding tussen samengevoegde berichten
+    "redundancy": 1,              # Elk datagram N keer versturen (UDP heeft geen ontvangstbevestiging)
+    "redundancy_jitter": (0.01, 0.05),  # Willekeurige wachttijd (s) tussen herhalingen
+    "queue_size": 1000            # Max berichten in de verzend-queue
+}
+
+# MQTT offline queue op disk (zie MQTTPublisher)
+MQTT_OUTBOX_CONFIG = {
+    "db_path": "mqtt_outbox.db",  # SQLite outbox, berichten blijven hier tot de broker ze bevestigt
+    "max_queued": 10000,          # Max berichten in de outbox (daarboven vallen de oudste weg)
+    "max_inflight": 20,           # Max onbevestigde QoS 1 berichten tegelijk
+    "image_dir": "mqtt_images"    # Foto's die als referentie gepubliceerd worden
+}
+
+# Outbox voor alarm acties: vastgelegd vóór uitvoering, na een herstart opnieuw (zie ActionOutbox)
+ACTION_OUTBOX_CONFIG = {
+    "enabled": True,
+    "db_path": "action_outbox.db",  # SQLite (WAL) met alarms + acties en hun status
+    "synchronous": "NORMAL",      # NORMAL overleeft een kill van het proces, FULL ook stroomuitval (trager)
+    "max_replay_age": 900,        # Acties ouder dan dit (s) worden na een herstart niet meer uitgevoerd
+    "max_attempts": 3,            # Mislukte acties max zo vaak proberen (over herstarts heen)
+    "no_replay_if_interrupted": ("sip",),  # Halverwege afgebroken: niet opnieuw (het gesprek liep al)
+    "replay_delay": 5.0,          # Seconden na het starten voordat de outbox opnieuw uitgevoerd wordt
+    "max_deferred_age": 6 * 3600, # Uitgestelde acties (WAN weg) zo lang bewaren (s)
+    "retention_hours": 24         # Afgeronde acties zo lang bewaren (dubbele webhooks herkennen)
+}
+
+# LAN-only modus: wifi_monitor.py schrijft de WAN/LAN status naar state_file (zie NetworkState)
+NETWORK_CONFIG = {
+    "state_file": "network_state.json",  # Geschreven door wifi_monitor.py (ontbreekt = alles bereikbaar)
+    "check_interval": 2.0,        # Seconden tussen stat() checks van het status bestand
+    "max_age": 300,               # Ouder status bestand (wifi_monitor draait niet meer) = WAN bereikbaar
+    "wan_actions": ("email", "notify"),  # Acties die internet nodig hebben: uitgesteld als WAN weg is
+    # Actie → target naam in wifi_monitor [targets]: is dat target down, dan wordt de actie
+    # uitgesteld (wan_actions) of direct overgeslagen in plaats van op een timeout te wachten
+    "action_targets": {"display": "pc_receiver", "email": "smtp", "sip": "sip"}
+}
+
 # SIP configuratie (optioneel)
 SIP_CONFIG = {
     "server": "192.168.036",    # IP van je SIP server/PBX
     "user": "1014",               # SIP gebruikersnaam/extensie  
     "password": "Bloemenland2431a",       # SIP wachtwoord
     "domain": "192.168.036",      # SIP domein
-    "alarm_number": "6200"        # Telefoonnummer om te bellen bij alarm
+    "alarm_number": "6200",       # Telefoonnummer om te bellen bij alarm
+    "dialer": ""                  # "host:poort" van sippy.py --serve (supervisor.py); leeg = één proces per call
 }
 
 # Email configuratie
@@ -98,6 +182,911 @@ PC_DISPLAY_CONFIG = {
     "send_all_alarms": True       # True = alle alarms naar PC, False = alleen bewegingsdetectie
 }
 
+# MQTT configuratie (optioneel, vereist paho-mqtt)
+MQTT_CONFIG = {
+    "enabled": False,             # Zet op True om alarms naar MQTT te publiceren
+    "host": "192.168.1.10",       # MQTT broker
+    "port": 1883,
+    "username": "",
+    "password": "",
+    "client_id": "unifi-webhook", # Vaste client id: persistente sessie bij de broker
+    "keepalive": 30,              # Seconden
+    "qos": 1,                     # 0 of 1 (1 = broker bevestigt elk bericht)
+    "retain": False,
+    "topic_template": "unifi/alarm/{device}/{trigger_key}",  # Per apparaat, zie format_mqtt_topic
+    "inline_image_max_bytes": 8192,  # Grotere foto's als referentie (pad/URL) i.p.v. inline base64
+    "image_base_url": ""          # Bijv. "http://192.168.1.20:5000" → image.url in het bericht
+}
+
+# Push notificaties via Slack/Discord/Pushover/Telegram/webhook (zie notifiers.py)
+NOTIFY_CONFIG = {
+    "enabled": False,             # Zet op True om alarms als notificatie te versturen
+    "timeout": 10,                # Timeout per HTTP request (seconden)
+    "max_retries": 3,             # Nieuwe pogingen bij timeouts, 429 en 5xx
+    "backoff_base": 1.0,          # Eerste wachttijd (s), daarna x2 per poging
+    "backoff_max": 30.0,          # Langste wachttijd tussen pogingen (s)
+    "pool_size": 10,              # Max gelijktijdige HTTP verbindingen (gedeeld door alle backends)
+    "dead_letter_file": "notifications_failed.jsonl",  # Definitief mislukte notificaties
+    "backends": {}                # Naam → {"type": "slack", "url": ..., "rate_per_minute": 30}, zie webhook_config.example.toml
+}
+
+# Upload / request body limieten
+UPLOAD_CONFIG = {
+    "max_content_length": 16 * 1024 * 1024,  # Max grootte request body (bytes), groter => 413
+    "chunk_size": 64 * 1024                  # Chunk grootte bij streamend wegschrijven (bytes)
+}
+
+# Flask/Werkzeug weigert grotere bodies bij het parsen, multipart bestanden
+# groter dan 500 KB worden door Werkzeug al naar een temp bestand gespooled
+app.config['MAX_CONTENT_LENGTH'] = UPLOAD_CONFIG["max_content_length"]
+
+# Device activity opslag (SQLite WAL, group commit)
+ACTIVITY_STORE_CONFIG = {
+    "db_path": "device_activity.db",  # SQLite database bestand
+    "commit_batch": 100,              # Max records per commit
+    "commit_interval": 0.5,           # Verzamel records max zo lang (s) voor één commit
+    "queue_size": 10000               # Max records in de schrijf-queue
+}
+
+# Rolling window statistieken per apparaat / alarm (zie /stats/devices)
+STATS_CONFIG = {
+    "state_file": "activity_stats.json",  # Hier worden de tellers periodiek bewaard
+    "persist_interval": 60,               # Opslaan elke X seconden (alleen bij wijzigingen)
+    "windows": {                          # Venster naam: (bucket seconden, aantal buckets)
+        "1m": (5, 12),
+        "1h": (60, 60),
+        "24h": (900, 96)
+    }
+}
+
+# Request capture voor offline replay (zie replay_captures.py)
+CAPTURE_CONFIG = {
+    "enabled": False,             # Zet op True om alle webhooks op te nemen
+    "dir": "captures",            # Map voor capture bestanden en blobs/
+    "file": "requests.jsonl",     # Capture bestand (roteert naar requests.jsonl.1, .2, ...)
+    "max_bytes": 50 * 1024 * 1024,  # Roteer na zoveel bytes
+    "backup_count": 5             # Aantal oude capture bestanden bewaren
+}
+
+# Productie WSGI server (zie serve_production)
+SERVER_CONFIG = {
+    "backend": "auto",            # "auto", "gunicorn", "waitress" of "werkzeug"
+    "host": "0.0.0.0",            # Luister op alle interfaces
+    "port": 5000,                 # Standaard poort
+    "workers": 1,                 # Altijd 1 proces: caches, rate limits en metrics zijn per proces
+    "threads": 8,                 # Threads per proces
+    "timeout": 30,                # Request/worker timeout (seconden)
+    "graceful_timeout": 10,       # Max tijd om lopende requests af te ronden bij reload/stop
+    "keepalive": 5                # HTTP keep-alive (seconden, gunicorn)
+}
+
+# JSON backend voor request parsing, logging en alle jsonify responses
+JSON_CONFIG = {
+    "backend": "auto"             # "auto" (orjson → json), "orjson", "ujson" of "json"
+}
+
+# Dedup van dubbele webhooks en samenvoegen van alarm bursts (zie AlarmDeduplicator)
+DEDUP_CONFIG = {
+    "enabled": True,
+    "ttl_seconds": 60,            # Zo lang wordt een event onthouden
+    "db_path": "alarm_dedup.db",  # SQLite (WAL) met gezien events, gedeeld door alle processen
+    "timestamp_tolerance_ms": 2000,  # Zelfde alarm + apparaat met timestamps zo dicht bij elkaar = zelfde event
+    "coalesce_window": 0.0,       # Seconden om triggers samen te voegen voor de acties (0 = uit)
+    "max_entries": 10000          # Max aantal events in de dedup database
+}
+
+# Alarm → actie regels (zie AlarmRuleEngine)
+RULES_CONFIG = {
+    "file": "alarm_rules.json",   # JSON regels bestand (ontbreekt = standaard regels)
+    "reload_check_interval": 2.0  # Seconden tussen mtime checks voor hot reload
+}
+
+# Webhook body parsing (zie LazyPayloadParser)
+PAYLOAD_CONFIG = {
+    "lazy_parsing": True,         # Thumbnails niet als str materialiseren maar als ImageSlice
+    "lazy_min_length": 1024       # Image strings vanaf deze lengte (bytes) lazy houden
+}
+
+# Metrics op /metrics (Prometheus text formaat, zie MetricsRegistry)
+METRICS_CONFIG = {
+    "latency_buckets": (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0),
+    "max_label_values": 500       # Max label combinaties per metric (nieuwe apparaten daarna → "other")
+}
+
+# Tracing van webhook → acties → pcReceiver / SIP (zie /traces/recent)
+TRACE_CONFIG = {
+    "enabled": True,
+    "buffer_size": 200,           # Aantal recente traces in het geheugen (ring buffer)
+    "header": "X-Trace-Id"        # HTTP header voor het doorgeven van de trace id
+}
+
+# Sampling profiler op /admin/profile (draait alleen als hij aangezet wordt)
+PROFILER_CONFIG = {
+    "default_seconds": 10,        # Duur als ?seconds= ontbreekt
+    "max_request_seconds": 60,    # Max duur van een blokkerende GET /admin/profile
+    "interval_ms": 5              # Sample interval (200 Hz)
+}
+
+# Extern config bestand (.toml, .yaml of .json) - wordt bewaakt voor hot reload
+CONFIG_FILE = os.environ.get("WEBHOOK_CONFIG", "webhook_config.toml")
+
+# =============================================================================
+# EXTERNE CONFIGURATIE - bestand + env overrides met hot reload
+# =============================================================================
+
+# Secties die tijdens runtime herladen kunnen worden. Volgorde van voorrang:
+# runtime overrides > WEBHOOK_<SECTIE>__<SLEUTEL> env > CONFIG_FILE > deze defaults
+config_manager = ConfigManager(
+    {
+        "loxone": {"ip": LOXONE_IP, "port": LOXONE_PORT},
+        "sip": SIP_CONFIG,
+        "email": EMAIL_CONFIG,
+        "pc_display": PC_DISPLAY_CONFIG,
+        "mqtt": MQTT_CONFIG,
+        "notify": NOTIFY_CONFIG
+    },
+    path=CONFIG_FILE,
+    env_prefix="WEBHOOK"
+)
+config_manager.load()
+
+def current_config(section):
+    """
+    Actieve config sectie (onveranderlijke snapshot)
+
+    Haal een sectie één keer op per afhandeling en werk met die referentie:
+    een hot reload halverwege wisselt dan niet van server of wachtwoord.
+    """
+    return config_manager.section(section)
+
+# =============================================================================
+# JSON BACKEND - orjson / ujson met stdlib fallback
+# =============================================================================
+
+def load_json_backend(name="auto"):
+    """
+    Kies de JSON backend
+
+    "auto" slaat ujson bewust over: die parst de lange base64 thumbnail
+    strings trager dan stdlib json (zie benchmark_webhook.py --json-backend).
+
+    Args:
+        name (str): "auto", "orjson", "ujson" of "json"
+
+    Returns:
+        tuple: (backend naam, module) - stdlib json als de gevraagde
+               backend niet geïnstalleerd is
+    """
+    candidates = ("orjson",) if name == "auto" else (name,)
+    for candidate in candidates:
+        if candidate == "json":
+            break
+        try:
+            return candidate, __import__(candidate)
+        except ImportError:
+            if name != "auto":
+                logger.warning(f"⚠️  JSON backend '{name}' niet gevonden - gebruik stdlib json")
+    return "json", json
+
+JSON_BACKEND_NAME, JSON_BACKEND = load_json_backend(JSON_CONFIG["backend"])
+
+def set_json_backend(name):
+    """Wissel de JSON backend tijdens runtime (bijv. voor benchmark_webhook.py --json-backend)"""
+    global JSON_BACKEND_NAME, JSON_BACKEND
+    JSON_BACKEND_NAME, JSON_BACKEND = load_json_backend(name)
+    return JSON_BACKEND_NAME
+
+def json_loads(data):
+    """Parse JSON (str of bytes) met de actieve backend"""
+    if JSON_BACKEND_NAME == "json":
+        return json.loads(data)
+    return JSON_BACKEND.loads(data)
+
+def json_dumps(obj, indent=False, sort_keys=False, default=None):
+    """
+    Serialiseer naar een str (UTF-8, geen \\uXXXX escapes) met de actieve backend
+
+    Wat orjson/ujson niet aankunnen (bijv. integers groter dan 64 bit) valt
+    terug op stdlib json, zodat het resultaat nooit van de backend afhangt.
+    """
+    if JSON_BACKEND_NAME == "orjson":
+        option = JSON_BACKEND.OPT_NON_STR_KEYS
+        if indent:
+            option |= JSON_BACKEND.OPT_INDENT_2
+        if sort_keys:
+            option |= JSON_BACKEND.OPT_SORT_KEYS
+        try:
+            return JSON_BACKEND.dumps(obj, default=default, option=option).decode('utf-8')
+        except TypeError:
+            pass
+    elif JSON_BACKEND_NAME == "ujson":
+        try:
+            return JSON_BACKEND.dumps(obj, ensure_ascii=False, escape_forward_slashes=False,
+                                      indent=2 if indent else 0, sort_keys=sort_keys, default=default)
+        except (TypeError, OverflowError):
+            pass
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None,
+                      separators=None if indent else (',', ':'), sort_keys=sort_keys, default=default)
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider op de actieve backend: request.get_json() en jsonify()"""
+
+    def dumps(self, obj, **kwargs):
+        return json_dumps(obj, indent=bool(kwargs.get("indent")),
+                          sort_keys=kwargs.get("sort_keys", self.sort_keys),
+                          default=kwargs.get("default", self.default))
+
+    def loads(self, s, **kwargs):
+        return json_loads(s)
+
+app.json = FastJSONProvider(app)
+
+# =============================================================================
+# METRICS - Prometheus tellers en histogrammen (zie /metrics)
+# =============================================================================
+
+class MetricsRegistry:
+    """
+    📈 METRICS REGISTRY
+
+    Tellers en histogrammen in Prometheus text formaat, zonder externe
+    dependencies.
+
+    Het hot path neemt geen lock: elke thread schrijft in zijn eigen shard
+    (een gewone dict, alleen door die thread aangepast). Pas bij een scrape
+    worden de shards samengeteld. Shards van gestopte threads (de werkzeug
+    fallback start een thread per request) worden in één 'retired' shard
+    gevouwen zodat de lijst niet blijft groeien.
+
+    Waarden zijn per proces; de productie server draait daarom met één
+    worker (zie create_gunicorn_server).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.definitions = {}        # naam → (type, help, labelnames, buckets)
+        self.collectors = []         # callbacks voor waarden die pas bij een scrape bepaald worden
+        self.label_values = {}       # naam → set van gekende label combinaties
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.shards = []             # (thread, shard)
+        self.retired = {}
+
+    def counter(self, name, help_text, labelnames=()):
+        self.definitions[name] = ("counter", help_text, tuple(labelnames), None)
+
+    def histogram(self, name, help_text, labelnames=(), buckets=None):
+        buckets = tuple(sorted(buckets or self.config["latency_buckets"]))
+        self.definitions[name] = ("histogram", help_text, tuple(labelnames), buckets)
+
+    def collector(self, callback):
+        """callback() → lijst van (naam, type, help, {labels tuple: waarde})"""
+        self.collectors.append(callback)
+
+    def _shard(self):
+        try:
+            return self.local.shard
+        except AttributeError:
+            shard = self.local.shard = {}
+            with self.lock:
+                if len(self.shards) >= 64:
+                    self._retire_dead_shards()
+                self.shards.append((threading.current_thread(), shard))
+            return shard
+
+    def _retire_dead_shards(self):
+        alive = []
+        for thread, shard in self.shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                self._merge(self.retired, shard)
+        self.shards = alive
+
+    def labels(self, name, values):
+        """
+        Begrens het aantal label combinaties (device ids komen uit de payload)
+
+        Boven max_label_values krijgen nieuwe combinaties het label "other".
+        """
+        values = tuple(str(v) for v in values)
+        known = self.label_values.get(name)
+        if known is not None and values in known:
+            return values
+        with self.lock:
+            known = self.label_values.setdefault(name, set())
+            if values not in known:
+                if len(known) >= self.config["max_label_values"]:
+                    return ("other",) * len(values)
+                known.add(values)
+        return values
+
+    def inc(self, name, labels=(), amount=1):
+        shard = self._shard()
+        key = (name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def observe(self, name, value, labels=()):
+        buckets = self.definitions[name][3]
+        shard = self._shard()
+        key = (name, labels)
+        entry = shard.get(key)
+        if entry is None:
+            # Per bucket (niet cumulatief) + overflow bucket, laatste plaats = som
+            entry = shard[key] = [0] * (len(buckets) + 2)
+        entry[bisect.bisect_left(buckets, value)] += 1
+        entry[-1] += value
+
+    @staticmethod
+    def _merge(target, shard):
+        for key, value in shard.copy().items():
+            if isinstance(value, list):
+                current = target.get(key)
+                target[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = target.get(key, 0) + value
+
+    def snapshot(self):
+        """Alle shards samengeteld: {(naam, labels): waarde of bucket lijst}"""
+        with self.lock:
+            self._retire_dead_shards()
+            totals = {}
+            self._merge(totals, self.retired)
+            for _, shard in self.shards:
+                self._merge(totals, shard)
+        return totals
+
+    def render(self):
+        """Prometheus text exposition formaat (version 0.0.4)"""
+        totals = self.snapshot()
+        by_name = {}
+        for (name, labels), value in totals.items():
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name, (metric_type, help_text, labelnames, buckets) in self.definitions.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(by_name.get(name, ()), key=lambda item: item[0]):
+                pairs = list(zip(labelnames, labels))
+                if metric_type == "counter":
+                    lines.append(f"{name}{format_metric_labels(pairs)} {format_metric_value(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets + (float("inf"),), value[:-1]):
+                    cumulative += count
+                    bucket_labels = format_metric_labels(pairs + [("le", format_metric_value(bound))])
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{format_metric_labels(pairs)} {format_metric_value(value[-1])}")
+                lines.append(f"{name}_count{format_metric_labels(pairs)} {cumulative}")
+
+        for callback in self.collectors:
+            try:
+                collected = callback()
+            except Exception as e:
+                logger.error(f"📈 Fout in metrics collector: {e}")
+                continue
+            for name, metric_type, help_text, samples in collected:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for pairs, value in samples.items():
+                    lines.append(f"{name}{format_metric_labels(pairs)} {format_metric_value(value)}")
+        return "\n".join(lines) + "\n"
+
+def format_metric_labels(pairs):
+    if not pairs:
+        return ""
+
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in pairs) + "}"
+
+def format_metric_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def process_metrics():
+    """RSS, CPU tijd, open file descriptors en threads van dit proces"""
+    times = os.times()
+    samples = [
+        ("process_cpu_seconds_total", "counter", "User + system CPU tijd (s)",
+         {(): round(times.user + times.system, 3)}),
+        ("process_start_time_seconds", "gauge", "Start tijd van het proces (unix)",
+         {(): PROCESS_START_TIME}),
+        ("process_threads", "gauge", "Aantal Python threads", {(): threading.active_count()}),
+        ("webhook_process_info", "gauge", "Proces dat deze scrape beantwoordde",
+         {(("pid", os.getpid()),): 1}),
+    ]
+    try:
+        with open("/proc/self/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        samples.append(("process_resident_memory_bytes", "gauge", "Resident memory (bytes)",
+                        {(): rss_pages * os.sysconf("SC_PAGE_SIZE")}))
+        samples.append(("process_open_fds", "gauge", "Open file descriptors",
+                        {(): len(os.listdir("/proc/self/fd"))}))
+    except (OSError, ValueError, AttributeError):
+        # Geen /proc (macOS/Windows): piek RSS als benadering
+        try:
+            import resource
+            samples.append(("process_resident_memory_bytes", "gauge", "Piek resident memory (bytes)",
+                            {(): resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024}))
+        except ImportError:
+            pass
+    return samples
+
+
+PROCESS_START_TIME = time.time()
+
+metrics = MetricsRegistry(METRICS_CONFIG)
+metrics.counter("webhook_http_requests_total", "HTTP requests per endpoint en status code",
+                ("method", "endpoint", "status"))
+metrics.histogram("webhook_http_request_duration_seconds", "Verwerkingstijd van HTTP requests",
+                  ("endpoint",))
+metrics.counter("webhook_alarms_received_total", "Ontvangen alarm triggers per type en apparaat",
+                ("alarm_type", "device"))
+metrics.counter("webhook_alarms_duplicate_total", "Dubbele webhooks overgeslagen door de dedup cache")
+metrics.histogram("webhook_parse_duration_seconds", "Parse tijd van webhook bodies")
+metrics.counter("webhook_parse_errors_total", "Webhook bodies met ongeldige JSON")
+metrics.histogram("webhook_action_duration_seconds", "Duur van alarm acties", ("action",))
+metrics.counter("webhook_action_failures_total",
+                "Alarm acties die faalden of niets deden (uitgeschakeld, geen foto)", ("action",))
+metrics.counter("webhook_photo_bytes_written_total", "Naar disk geschreven foto bytes", ("source",))
+metrics.counter("webhook_actions_deferred_total", "Alarm acties uitgesteld omdat internet weg was")
+metrics.collector(process_metrics)
+
+def record_alarm_received(triggers):
+    """Tel ontvangen triggers per type en apparaat"""
+    for trigger in triggers:
+        metrics.inc("webhook_alarms_received_total",
+                    metrics.labels("webhook_alarms_received_total",
+                                   (trigger.get('key') or "unknown", trigger.get('device') or "unknown")))
+
+# =============================================================================
+# TRACING - Trace id per webhook met timing spans per stap (zie /traces/recent)
+# =============================================================================
+
+# Actieve trace van de huidige request/task (asyncio tasks en to_thread nemen hem mee)
+current_trace = contextvars.ContextVar("current_trace", default=None)
+
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+class Trace:
+    """
+    Eén alarm van webhook tot acties
+
+    Spans worden na elkaar toegevoegd, ook nadat de webhook al beantwoord
+    is (coalescing, SIP call die later eindigt); list.append is atomisch,
+    dus threads voegen zonder lock toe.
+    """
+
+    __slots__ = ("trace_id", "name", "started_at", "started", "spans", "attrs")
+
+    def __init__(self, trace_id, name):
+        self.trace_id = trace_id
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self.attrs = {}
+
+    def add_span(self, name, started, ended=None, **attrs):
+        """Span met start en einde als time.perf_counter() waarden"""
+        ended = time.perf_counter() if ended is None else ended
+        span = {"name": name,
+                "start_ms": round((started - self.started) * 1000, 3),
+                "duration_ms": round((ended - started) * 1000, 3)}
+        if attrs:
+            span.update(attrs)
+        self.spans.append(span)
+
+    def to_dict(self):
+        spans = sorted(self.spans, key=lambda span: span["start_ms"])
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(timespec="milliseconds"),
+            "duration_ms": max((span["start_ms"] + span["duration_ms"] for span in spans), default=0),
+            "spans": spans,
+            **self.attrs
+        }
+
+class TraceBuffer:
+    """Ring buffer met de laatste TRACE_CONFIG["buffer_size"] traces (per proces)"""
+
+    def __init__(self, config):
+        self.config = config
+        self.traces = deque(maxlen=config["buffer_size"])
+        self.started = 0
+
+    def start(self, name, trace_id=None):
+        """
+        Nieuwe trace; een geldige trace_id van de caller (X-Trace-Id) wordt overgenomen
+
+        Returns:
+            Trace, of None als tracing uit staat
+        """
+        if not self.config["enabled"]:
+            return None
+        if not trace_id or not TRACE_ID_PATTERN.fullmatch(trace_id):
+            trace_id = os.urandom(8).hex()
+        trace = Trace(trace_id, name)
+        self.traces.append(trace)
+        self.started += 1
+        return trace
+
+    def recent(self, limit=20, trace_id=None, min_duration_ms=None):
+        """Nieuwste traces eerst, optioneel gefilterd op id of minimale duur"""
+        result = []
+        for trace in reversed(list(self.traces)):
+            if trace_id and trace.trace_id != trace_id:
+                continue
+            data = trace.to_dict()
+            if min_duration_ms is not None and data["duration_ms"] < min_duration_ms:
+                continue
+            result.append(data)
+            if len(result) >= limit:
+                break
+        return result
+
+
+class trace_span:
+    """
+    with trace_span("sanitize"): ...
+
+    Doet niets buiten een trace. Een exception wordt als error attribuut
+    op de span gezet en gewoon doorgegeven.
+    """
+
+    __slots__ = ("name", "attrs", "trace", "started")
+
+    def __init__(self, name, **attrs):
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.trace = current_trace.get()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.trace is not None:
+            if exc is not None:
+                self.attrs["error"] = str(exc)
+            self.trace.add_span(self.name, self.started, **self.attrs)
+        return False
+
+def current_trace_id():
+    trace = current_trace.get()
+    return trace.trace_id if trace is not None else None
+
+def bind_trace(func):
+    """Voer func later (timer/monitor thread) uit binnen de huidige trace"""
+    trace = current_trace.get()
+    if trace is None:
+        return func
+
+    def traced(*args, **kwargs):
+        token = current_trace.set(trace)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            current_trace.reset(token)
+    return traced
+
+def add_remote_spans(trace, prefix, started, remote):
+    """
+    Spans die een andere service (pcReceiver) in zijn antwoord meestuurt
+
+    Hun start_ms is relatief t.o.v. het begin van de remote request en wordt
+    hier verschoven naar het moment waarop wij de request verstuurden.
+    """
+    if trace is None or not isinstance(remote, dict):
+        return
+    offset_ms = (started - trace.started) * 1000
+    for span in remote.get("spans", []):
+        if isinstance(span, dict) and "name" in span:
+            trace.spans.append(dict(span, name=f"{prefix}.{span['name']}",
+                                    start_ms=round(offset_ms + span.get("start_ms", 0), 3)))
+
+class TraceLogFilter(logging.Filter):
+    """Zet [trace_id] voor elke log regel die binnen een trace gelogd wordt"""
+
+    def filter(self, record):
+        trace = current_trace.get()
+        if trace is not None:
+            record.msg = f"[{trace.trace_id}] {record.msg}"
+        return True
+
+
+tracer = TraceBuffer(TRACE_CONFIG)
+logger.addFilter(TraceLogFilter())
+
+def record_action(action_type, started, ok):
+    """Duur en uitkomst van één alarm actie (sync en async pad), ook als span"""
+    metrics.observe("webhook_action_duration_seconds", time.perf_counter() - started, (action_type,))
+    if not ok:
+        metrics.inc("webhook_action_failures_total", (action_type,))
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add_span(f"action.{action_type}", started, ok=ok)
+
+# =============================================================================
+# PROFILING - Sampling profiler aan/uit tijdens runtime (zie /admin/profile)
+# =============================================================================
+
+def profile_request_args(args, max_seconds=None):
+    """
+    seconds en interval_ms uit de query string (Flask en aiohttp)
+
+    Returns:
+        tuple: (seconds, interval in s)
+
+    Raises:
+        ValueError: Bij niet-numerieke waarden
+    """
+    seconds = float(args.get('seconds', PROFILER_CONFIG["default_seconds"]))
+    if max_seconds is not None:
+        seconds = min(seconds, max_seconds)
+    interval_ms = float(args.get('interval_ms', PROFILER_CONFIG["interval_ms"]))
+    return max(seconds, 0.1), interval_ms / 1000
+
+def profile_output(profile, output_format):
+    """
+    Profiel als collapsed stacks bestand (standaard) of JSON samenvatting
+
+    Returns:
+        tuple: (body, content_type, extra headers)
+    """
+    if output_format == 'json':
+        return json.dumps(profile.to_dict()), "application/json", {}
+    filename = f"webhook-{os.getpid()}-{profile.started_at.strftime('%Y%m%d-%H%M%S')}.folded"
+    return (profile.collapsed(), "text/plain; charset=utf-8",
+            {"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# =============================================================================
+# LAZY PAYLOAD PARSING - Thumbnails niet als Python str materialiseren
+# =============================================================================
+
+class ImageSlice:
+    """
+    🖼️ AFBEELDING IN DE REQUEST BUFFER
+
+    Staat in de geparste payload op de plek van een grote (base64) image
+    string. Bewaart alleen de byte offsets in de originele request body; de
+    base64 data wordt pas gekopieerd of gedecodeerd wanneer een actie hem
+    echt nodig heeft, en dan rechtstreeks uit de buffer.
+    """
+    __slots__ = ("buffer", "start", "end")
+
+    def __init__(self, buffer, start, end):
+        self.buffer = buffer
+        self.start = start      # Eerste byte na het openingsquote
+        self.end = end          # Positie van het sluitquote
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return f"<ImageSlice {self.start}:{self.end} ({len(self)} bytes)>"
+
+    @property
+    def data_start(self):
+        """Offset van de base64 data (na een eventuele 'data:image/...;base64,' prefix)"""
+        if self.buffer.startswith(b'data:', self.start):
+            comma = self.buffer.find(b',', self.start, min(self.end, self.start + 100))
+            if comma != -1:
+                return comma + 1
+        return self.start
+
+    @property
+    def prefix(self):
+        """Data URI prefix als str, bijv. 'data:image/jpeg;base64,' ('' zonder prefix)"""
+        return self.buffer[self.start:self.data_start].decode('ascii')
+
+    def text(self):
+        """De volledige string (materialiseert wél een kopie)"""
+        return self.buffer[self.start:self.end].decode('utf-8')
+
+    def decode(self):
+        """Base64 decoderen direct vanuit de request buffer (zonder str kopie)"""
+        return base64.b64decode(memoryview(self.buffer)[self.data_start:self.end])
+
+def image_text(value):
+    """Afbeelding als str (ImageSlice of gewone base64 / data URI string)"""
+    return value.text() if isinstance(value, ImageSlice) else value
+
+def image_bytes(value):
+    """Gedecodeerde afbeelding bytes uit een ImageSlice of base64 / data URI string"""
+    if isinstance(value, ImageSlice):
+        return value.decode()
+    if value.startswith('data:image'):
+        # Split op komma: data:image/jpeg;base64,ACTUALDATA
+        value = value.split(',', 1)[1]
+    return base64.b64decode(value)
+
+class LazyPayloadParser:
+    """
+    ⚡ PARTIËLE JSON PARSER
+
+    Tokenizer over de ruwe request bytes die dezelfde structuur oplevert als
+    json.loads, behalve dat lange strings onder thumbnail/snapshot keys (of
+    die met 'data:image' beginnen) een ImageSlice worden. Het einde van zo'n
+    string wordt met bytes.find gezocht, dus de base64 data wordt nooit per
+    teken doorlopen of naar een str gekopieerd.
+
+    De rest van een UniFi Protect payload (alarm.name, triggers, conditions,
+    timestamp) is klein en wordt gewoon geparsed.
+
+    Raises:
+        ValueError: Bij ongeldige JSON
+    """
+    NUMBER_RE = re.compile(rb'-?(?:0|[1-9]\d*)(\.\d+)?([eE][-+]?\d+)?')
+    WHITESPACE = b' \t\n\r'
+
+    def __init__(self, buffer, min_lazy_length=None):
+        self.buffer = bytes(buffer)
+        self.pos = 0
+        self.min_lazy_length = min_lazy_length or PAYLOAD_CONFIG["lazy_min_length"]
+        self.image_slices = []
+
+    def parse(self):
+        value = self._value(False)
+        self._skip_whitespace()
+        if self.pos != len(self.buffer):
+            raise ValueError(f"Extra data na JSON op byte {self.pos}")
+        return value
+
+    def _skip_whitespace(self):
+        buffer, pos, size = self.buffer, self.pos, len(self.buffer)
+        while pos < size and buffer[pos] in self.WHITESPACE:
+            pos += 1
+        self.pos = pos
+
+    def _expect(self, char):
+        self._skip_whitespace()
+        if self.buffer[self.pos:self.pos + 1] != char:
+            raise ValueError(f"Verwacht {char!r} op byte {self.pos}")
+        self.pos += 1
+
+    def _value(self, image_key):
+        self._skip_whitespace()
+        buffer, pos = self.buffer, self.pos
+        char = buffer[pos:pos + 1]
+        if char == b'{':
+            return self._object()
+        if char == b'[':
+            return self._array(image_key)
+        if char == b'"':
+            return self._string(image_key)
+        for literal, value in ((b'true', True), (b'false', False), (b'null', None)):
+            if buffer.startswith(literal, pos):
+                self.pos = pos + len(literal)
+                return value
+        match = self.NUMBER_RE.match(buffer, pos)
+        if not match:
+            raise ValueError(f"Onverwacht teken op byte {pos}")
+        self.pos = match.end()
+        if match.group(1) or match.group(2):
+            return float(match.group(0))
+        return int(match.group(0))
+
+    def _object(self):
+        self.pos += 1
+        result = {}
+        self._skip_whitespace()
+        if self.buffer[self.pos:self.pos + 1] == b'}':
+            self.pos += 1
+            return result
+        while True:
+            self._skip_whitespace()
+            if self.buffer[self.pos:self.pos + 1] != b'"':
+                raise ValueError(f"Verwacht object key op byte {self.pos}")
+            key = self._string(False)
+            self._expect(b':')
+            lowered = key.lower()
+            result[key] = self._value('thumb' in lowered or 'snapshot' in lowered)
+            self._skip_whitespace()
+            char = self.buffer[self.pos:self.pos + 1]
+            self.pos += 1
+            if char == b'}':
+                return result
+            if char != b',':
+                raise ValueError(f"Verwacht ',' of '}}' op byte {self.pos - 1}")
+
+    def _array(self, image_key):
+        self.pos += 1
+        result = []
+        self._skip_whitespace()
+        if self.buffer[self.pos:self.pos + 1] == b']':
+            self.pos += 1
+            return result
+        while True:
+            result.append(self._value(image_key))
+            self._skip_whitespace()
+            char = self.buffer[self.pos:self.pos + 1]
+            self.pos += 1
+            if char == b']':
+                return result
+            if char != b',':
+                raise ValueError(f"Verwacht ',' of ']' op byte {self.pos - 1}")
+
+    def _string(self, image_key):
+        buffer = self.buffer
+        start = self.pos + 1
+        end = buffer.find(b'"', start)
+        # Quotes met een oneven aantal backslashes ervoor zijn escaped
+        while end != -1:
+            backslashes = 0
+            while buffer[end - 1 - backslashes] == 0x5C:
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            end = buffer.find(b'"', end + 1)
+        if end == -1:
+            raise ValueError(f"Onafgesloten string op byte {self.pos}")
+        self.pos = end + 1
+
+        has_escapes = buffer.find(b'\\', start, end) != -1
+        if (end - start >= self.min_lazy_length and not has_escapes
+                and (image_key or buffer.startswith(b'data:image', start))):
+            image = ImageSlice(buffer, start, end)
+            self.image_slices.append(image)
+            return image
+        if has_escapes:
+            return json.loads(buffer[start - 1:end + 1])
+        return buffer[start:end].decode('utf-8')
+
+def parse_alarm_body(body):
+    """
+    Parse een webhook body (bytes)
+
+    Met PAYLOAD_CONFIG["lazy_parsing"] via LazyPayloadParser (thumbnails
+    als ImageSlice), anders volledig via de JSON backend.
+
+    Raises:
+        ValueError: Bij ongeldige JSON
+    """
+    started = time.perf_counter()
+    try:
+        if PAYLOAD_CONFIG["lazy_parsing"]:
+            return LazyPayloadParser(body).parse()
+        return json_loads(body)
+    except ValueError:
+        metrics.inc("webhook_parse_errors_total")
+        raise
+    finally:
+        metrics.observe("webhook_parse_duration_seconds", time.perf_counter() - started)
+        trace = current_trace.get()
+        if trace is not None:
+            trace.add_span("parse", started, bytes=len(body))
+
+def is_json_content_type(mimetype):
+    """Zelfde regel als Flask request.is_json (ook gebruikt door async_webhook.py)"""
+    return mimetype == 'application/json' or (
+        mimetype.startswith('application/') and mimetype.endswith('+json'))
+
+def parse_webhook_body(req):
+    """
+    JSON body van een Flask webhook request (None als er geen body is)
+
+    Raises:
+        UnsupportedMediaType: Content type is geen JSON
+        BadRequest: Bij ongeldige JSON
+    """
+    if not is_json_content_type(req.mimetype):
+        raise UnsupportedMediaType()
+    body = req.get_data()
+    if not body:
+        return None
+    try:
+        return parse_alarm_body(body)
+    except ValueError as e:
+        raise BadRequest(f"Ongeldige JSON: {e}")
+
 # =============================================================================
 # HELPER FUNCTIES - Payload Sanitization & Verwerking
 # =============================================================================
@@ -126,7 +1115,7 @@ def sanitize_payload(obj):
             key = k.lower()
             # Detect likely thumbnail/image fields by key name
             if 'thumb' in key or 'thumbnail' in key or 'snapshot' in key:
-                if isinstance(v, str):
+                if isinstance(v, (str, ImageSlice)):
                     # Replace long image/base64 strings with a short placeholder
                     cleaned[k] = f"<filtered image, len={len(v)}: redacted>"
                 else:
@@ -137,11 +1126,38 @@ def sanitize_payload(obj):
     elif isinstance(obj, list):
         return [sanitize_payload(i) for i in obj]
     else:
+        if isinstance(obj, ImageSlice):
+            return f"<filtered image, len={len(obj)}: redacted>"
         # Strings that look like data URIs (common for inline thumbnails)
         if isinstance(obj, str) and obj.startswith('data:image') and len(obj) > 100:
             return f"<filtered data:image, len={len(obj)}: redacted>"
         return obj
 
+def strip_images(obj):
+    """
+    Payload zonder afbeeldingen, voor opslag naast een losse thumbnail
+
+    Anders dan sanitize_payload vallen thumbnail/snapshot velden en
+    data:image waarden helemaal weg (geen placeholder die later voor een
+    foto aangezien kan worden). ImageSlice waarden zijn niet serialiseerbaar
+    en verdwijnen dus ook.
+    """
+    def is_image(key, value):
+        if isinstance(value, ImageSlice):
+            return True
+        if not isinstance(value, str):
+            return False
+        if value.startswith('data:image'):
+            return True
+        key = key.lower() if key else ''
+        return ('thumb' in key or 'snapshot' in key) and len(value) > 100
+
+    if isinstance(obj, dict):
+        return {k: strip_images(v) for k, v in obj.items() if not is_image(k, v)}
+    if isinstance(obj, list):
+        return [strip_images(item) for item in obj if not is_image(None, item)]
+    return obj
+
 # =============================================================================
 # CORE FUNCTIE - Alarm Verwerking
 # =============================================================================
@@ -164,7 +1180,10 @@ def process_alarm(alarm_data, request_type="GET", sanitized_for_logging=None):
     Workflow:
         1. Log alarm informatie (gesaniteerd)
         2. Extract triggers, conditions, timestamps
-        3. Roep handle_alarm_actions() aan voor verwerking
+        3. Sla dubbele webhooks over (alarm_deduplicator)
+        4. Update rolling statistieken (activity_stats)
+        5. Roep handle_alarm_actions() aan voor verwerking (direct of na
+           het coalescing venster)
     """
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
@@ -177,7 +1196,7 @@ def process_alarm(alarm_data, request_type="GET", sanitized_for_logging=None):
     # Log volledige JSON (gesaniteerd) voor debugging
     if log_data:
         logger.info("📋 Volledige payload (gesaniteerd):")
-        logger.info(json.dumps(log_data, indent=2, ensure_ascii=False))
+        logger.info(json_dumps(log_data, indent=True))
     
     if request_type == "POST" and alarm_data:
         # Voor POST requests hebben we volledige alarm informatie
@@ -209,94 +1228,1052 @@ def process_alarm(alarm_data, request_type="GET", sanitized_for_logging=None):
             condition_type = cond_info.get('type', 'Onbekend type')
             logger.info(f"Conditie: {source} ({condition_type})")
         
-        # Verwerk acties met originele data (inclusief foto's!)
-        handle_alarm_actions(alarm_info, triggers, alarm_data)
+        record_alarm_received(triggers)
+        
+        # Dubbele webhooks (retries, herhaalde triggers) niet opnieuw verwerken
+        triggers, duplicate = alarm_deduplicator.filter_triggers(alarm_info, triggers, webhook_timestamp)
+        if duplicate:
+            metrics.inc("webhook_alarms_duplicate_total")
+            logger.info("🔁 Dubbel alarm overgeslagen (al verwerkt binnen de dedup TTL)")
+            logger.info("=== Einde Alarm Verwerking ===")
+            return
+        
+        # Update rolling statistieken per apparaat en alarm naam
+        activity_stats.record(alarm_name, [trigger.get('device') for trigger in triggers])
+        
+        # Verwerk acties met originele data (inclusief foto's!), eventueel
+        # samengevoegd met andere webhooks binnen het coalescing venster. In
+        # dat geval liggen de acties vast in de outbox voordat de 200 terug gaat.
+        recorded = None
+        if alarm_deduplicator.coalescing():
+            recorded = record_alarm_actions(alarm_info, triggers, alarm_data)
+        result = alarm_deduplicator.dispatch(alarm_info, triggers, alarm_data, bind_trace(handle_alarm_actions),
+                                             recorded)
+        if result != "dispatched":
+            logger.info(f"🔗 Alarm {'samengevoegd' if result == 'merged' else 'in coalescing venster'}: "
+                        f"acties volgen na {DEDUP_CONFIG['coalesce_window']}s")
         
     else:
-        # Voor GET requests hebben we beperkte informatie
-        logger.info(f"GET request parameters: {dict(request.args)}")
+        # Voor GET requests hebben we beperkte informatie (query parameters)
+        logger.info(f"GET request parameters: {dict(alarm_data)}")
     
     logger.info("=== Einde Alarm Verwerking ===")
 
 # =============================================================================
-# ACTIE HANDLER - Custom Alarm Acties
+# ALARM REGELS - Declaratieve routing van alarms naar acties
 # =============================================================================
 
-def handle_alarm_actions(alarm_info, triggers, full_payload=None):
+# Standaard regels als er geen regels bestand is (zelfde gedrag als voorheen)
+DEFAULT_ALARM_RULES = [
+    {"name": "Beweging naar PC display", "match": {"trigger_key": "*motion*"}, "actions": ["display"]},
+    {"name": "Beweging (alarm naam) naar PC display", "match": {"alarm_name": "*motion*"}, "actions": ["display"]},
+    {"name": "Foto opslaan", "actions": ["disk"]},
+    {"name": "SIP call", "actions": ["sip"]},
+]
+
+# Velden waarop een regel kan matchen
+ALARM_RULE_FIELDS = ("alarm_name", "device", "trigger_key", "group_name", "time")
+# Velden die per trigger gelden (alle trigger velden van een regel moeten op dezelfde trigger passen)
+TRIGGER_RULE_FIELDS = ("device", "trigger_key", "group_name")
+# Routable acties
+ALARM_ACTION_TYPES = ("display", "email", "sip", "loxone", "disk", "mqtt", "notify")
+
+class ValueMatcher:
     """
-    ⚡ ACTIE HANDLER
-    
-    Voert custom acties uit op basis van het ontvangen alarm.
-    Dit is waar je bepaalt wat er gebeurt bij elk type alarm.
-    
-    Args:
-        alarm_info (dict): Alarm informatie met naam, type, etc.
-        triggers (list): Lijst van triggers die het alarm activeerden
-                        Bevat: device ID, trigger type, zones, timestamps
-        full_payload (dict): Volledige originele payload inclusief foto's
-    
-    Acties die uitgevoerd worden:
-        1. ✅ Verstuur foto naar PC Display (indien beweging of configured)
-        2. ✅ Log apparaat activiteit per camera
-        3. ✅ Sla alarm foto op naar disk
-        4. ✅ Start SIP call (indien geconfigureerd)
-        
-    Configureerbaar via:
-        - PC_DISPLAY_CONFIG["send_all_alarms"]
-        - SIP_CONFIG
+    Vooraf gecompileerde matcher voor één regel veld
+
+    Exacte waarden (hoofdletter ongevoelig) komen in een set en zijn via de
+    index op te zoeken; waarden met * of ? worden één gecompileerde regex.
+    """
+    __slots__ = ("exact", "pattern")
+
+    def __init__(self, values):
+        values = values if isinstance(values, list) else [values]
+        self.exact = {str(v).lower() for v in values if not any(c in str(v) for c in '*?')}
+        globs = [fnmatch.translate(str(v).lower()) for v in values if any(c in str(v) for c in '*?')]
+        self.pattern = re.compile('|'.join(globs)) if globs else None
+
+    def __call__(self, value):
+        if value is None:
+            return False
+        value = str(value).lower()
+        return value in self.exact or bool(self.pattern and self.pattern.match(value))
+
+TIME_RANGE_PATTERN = re.compile(r'^\s*(\d{1,2}):(\d{2})\s*-\s*(\d{1,2}):(\d{2})\s*$')
+
+def parse_time_range(value):
+    """
+    '22:00-06:00' → (1320, 360) in minuten na middernacht (mag over middernacht heen)
+
+    Raises:
+        ValueError: Als de waarde geen geldige "HH:MM-HH:MM" is
+    """
+    match = TIME_RANGE_PATTERN.match(str(value))
+    if not match:
+        raise ValueError(f"Ongeldige tijd {value!r}, verwacht \"HH:MM-HH:MM\"")
+    start_hour, start_minute, end_hour, end_minute = (int(part) for part in match.groups())
+    if max(start_hour, end_hour) > 23 or max(start_minute, end_minute) > 59:
+        raise ValueError(f"Ongeldige tijd {value!r}, uren 0-23 en minuten 0-59")
+    return start_hour * 60 + start_minute, end_hour * 60 + end_minute
+
+class CompiledRule:
+    """Eén regel uit het regels bestand, gecompileerd bij het laden"""
+
+    def __init__(self, position, spec):
+        self.position = position
+        self.name = spec.get("name", f"regel {position + 1}")
+        self.stop = bool(spec.get("stop", False))
+        match = spec.get("match", {}) or {}
+
+        unknown = set(match) - set(ALARM_RULE_FIELDS)
+        if unknown:
+            raise ValueError(f"Regel '{self.name}': onbekende match velden {sorted(unknown)}")
+
+        self.matchers = {field: ValueMatcher(match[field]) for field in ALARM_RULE_FIELDS
+                         if field in match and field != "time"}
+        times = match.get("time", [])
+        self.time_ranges = [parse_time_range(t) for t in (times if isinstance(times, list) else [times])]
+
+        self.actions = []
+        for action in spec.get("actions", []):
+            action = {"type": action} if isinstance(action, str) else dict(action)
+            if action.get("type") not in ALARM_ACTION_TYPES:
+                raise ValueError(f"Regel '{self.name}': onbekende actie {action.get('type')!r}")
+            self.actions.append(action)
+
+    def index_keys(self):
+        """
+        Index sleutels voor deze regel: de exacte waarden van het meest
+        selectieve veld. Zonder exacte waarden (alleen patronen of geen
+        voorwaarden) komt de regel in de wildcard lijst.
+        """
+        for field in ("device", "trigger_key", "alarm_name", "group_name"):
+            matcher = self.matchers.get(field)
+            if matcher and matcher.exact and not matcher.pattern:
+                return [(field, value) for value in matcher.exact]
+        return []
+
+    def matches(self, alarm_name, triggers, minute_of_day):
+        if "alarm_name" in self.matchers and not self.matchers["alarm_name"](alarm_name):
+            return False
+
+        if self.time_ranges and not any(
+                (start <= minute_of_day < end) if start <= end else (minute_of_day >= start or minute_of_day < end)
+                for start, end in self.time_ranges):
+            return False
+
+        trigger_matchers = [(field, self.matchers[field]) for field in TRIGGER_RULE_FIELDS if field in self.matchers]
+        if not trigger_matchers:
+            return True
+        return any(all(matcher(trigger_field(trigger, field)) for field, matcher in trigger_matchers)
+                   for trigger in triggers)
+
+def trigger_field(trigger, field):
+    """Waarde van een regel veld in een UniFi Protect trigger"""
+    if field == "device":
+        return trigger.get('device')
+    if field == "trigger_key":
+        return trigger.get('key')
+    if field == "group_name":
+        return (trigger.get('group') or {}).get('name')
+    return None
+
+class CompiledRuleSet:
+    """
+    Onveranderlijke, geïndexeerde set regels
+
+    index: (veld, waarde) → regels met die exacte waarde. Bij een alarm
+    worden alleen de regels uit de index voor de waarden van dát alarm plus
+    de wildcard regels bekeken, dus de kosten groeien niet mee met het
+    aantal regels voor andere camera's / trigger types.
     """
-    alarm_name = alarm_info.get('name', '').lower()
-    
-    # Voorbeeld acties - pas deze aan naar je behoeften
-    try:
-        # Actie 1: Verstuur notificatie voor specifieke alarms (met foto!)
-        if PC_DISPLAY_CONFIG["send_all_alarms"] or 'motion' in alarm_name or any('motion' in str(trigger.get('key', '')) for trigger in triggers):
-            logger.info("🚨 Alarm gedetecteerd! Verstuur notificatie...")
-            
-            # Haal thumbnail uit de originele payload
-            thumbnail = extract_thumbnail_from_payload(full_payload)
-            
-            # Bepaal bericht gebaseerd op alarm type
-            if 'motion' in alarm_name or any('motion' in str(trigger.get('key', '')) for trigger in triggers):
-                message = f"Beweging gedetecteerd: {alarm_info.get('name')}"
-            else:
-                message = f"Alarm geactiveerd: {alarm_info.get('name')}"
-            #send_notification_with_photo(message, thumbnail)
-            
-            # Extract name from triggers -> group -> name
-            trigger_name = None
-            if triggers and len(triggers) > 0:
-                trigger = triggers[0]
-                if 'group' in trigger and 'name' in trigger['group']:   
-                    trigger_name = trigger['group']['name']
-                    logger.info(f"📝 Trigger naam gevonden: {trigger_name}")
-    
-            send_photo_to_pc_display(thumbnail, detected_name=trigger_name)
 
-        # Actie 2: Log naar specifiek bestand voor bepaalde camera's
+    def __init__(self, specs):
+        self.rules = [CompiledRule(position, spec) for position, spec in enumerate(specs)]
+        self.index = {}
+        self.wildcard = []
+        for rule in self.rules:
+            keys = rule.index_keys()
+            if not keys:
+                self.wildcard.append(rule)
+            for key in keys:
+                self.index.setdefault(key, []).append(rule)
+
+    def candidates(self, alarm_name, triggers):
+        found = {rule.position: rule for rule in self.wildcard}
+        lookups = [("alarm_name", str(alarm_name).lower())]
         for trigger in triggers:
-            device_id = trigger.get('device')
-            if device_id:
-                log_device_activity(device_id, alarm_info)
-        
-        # Actie 3: Sla foto op voor later gebruik
-        if full_payload:
-            save_alarm_photo(alarm_info, full_payload)
-        
-        # Actie 4: Voor alle alarms - verstuur altijd UDP naar Loxone
-        #device_list = [trigger.get('device', 'Unknown') for trigger in triggers]
-        #alarm_type = 'MOTION' if any('motion' in str(trigger.get('key', '')) for trigger in triggers) else 'ALARM'
-        
-        #loxone_message = f"{alarm_type}:{alarm_info.get('name', 'Unknown')}|DEVICES:{','.join(device_list)}|TIME:{datetime.now().strftime('%H:%M:%S')}"
-        #send_udp_to_loxone(loxone_message)
-        
-        start_sip_call(SIP_CONFIG["alarm_number"])
-        
-        # Actie 5: Webhook doorsturen naar andere services (optioneel)
-        # forward_to_other_service(alarm_info)
-        
+            for field in TRIGGER_RULE_FIELDS:
+                value = trigger_field(trigger, field)
+                if value is not None:
+                    lookups.append((field, str(value).lower()))
+        for key in lookups:
+            for rule in self.index.get(key, ()):
+                found[rule.position] = rule
+        return [found[position] for position in sorted(found)]
+
+class AlarmRuleEngine:
+    """
+    🧭 ALARM REGEL ENGINE
+
+    Leest de regels uit RULES_CONFIG["file"] (JSON), compileert ze tot een
+    CompiledRuleSet en bepaalt per alarm welke acties uitgevoerd worden.
+
+    Regels bestand:
+        {
+          "rules": [
+            {"name": "Nacht: oprit bellen",
+             "match": {"device": "28704E113F07", "trigger_key": ["person", "vehicle"],
+                       "time": "22:00-06:00"},
+             "actions": ["display", "disk", {"type": "sip", "number": "6200"}],
+             "stop": true},
+            {"name": "Kenteken naar Loxone",
+             "match": {"trigger_key": "licensePlate"},
+             "actions": [{"type": "loxone", "message": "PLATE:{group_name}"}]}
+          ]
+        }
+
+    Match velden (alle opgegeven velden moeten passen, waarden zijn een string
+    of lijst, * en ? zijn wildcards, hoofdletter ongevoelig):
+        alarm_name, device, trigger_key, group_name, time ("HH:MM-HH:MM")
+
+    Acties: display, email, sip, loxone, disk, mqtt. Dezelfde actie van meerdere
+    regels wordt één keer uitgevoerd; "stop": true slaat latere regels over.
+
+    Voorbeeld: alarm_rules.example.json (kopieer naar alarm_rules.json).
+
+    Hot reload: het bestand wordt bij gebruik hooguit elke
+    reload_check_interval seconden gecontroleerd (mtime). Een nieuwe set
+    wordt eerst volledig gecompileerd en dan in één toewijzing gewisseld;
+    bij een fout blijven de huidige regels actief.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.ruleset = None
+        self.source = None
+        self.mtime = None
+        self.next_check = 0.0
+        self.loaded_at = None
+        self.reloads = 0
+        self.errors = 0
+        self.last_error = None
+        self.matches = {}
+
+    def load(self):
+        """(Her)laad de regels; returns True als er een nieuwe set actief is"""
+        path = self.config["file"]
+        try:
+            if os.path.exists(path):
+                mtime = os.stat(path).st_mtime
+                with open(path, 'r', encoding='utf-8') as f:
+                    specs = json_loads(f.read()).get("rules", [])
+                source = path
+            else:
+                mtime = None
+                specs = list(DEFAULT_ALARM_RULES)
+                if current_config("pc_display")["send_all_alarms"]:
+                    specs.insert(0, {"name": "Alle alarms naar PC display", "actions": ["display"]})
+                if current_config("mqtt")["enabled"]:
+                    specs.append({"name": "Alle alarms naar MQTT", "actions": ["mqtt"]})
+                if current_config("notify")["enabled"]:
+                    specs.append({"name": "Alle alarms als notificatie", "actions": ["notify"]})
+                source = "standaard regels"
+            ruleset = CompiledRuleSet(specs)
+        except (OSError, ValueError, AttributeError, TypeError) as e:
+            with self.lock:
+                self.errors += 1
+                self.last_error = str(e)
+                # Niet elke check opnieuw proberen tot het bestand weer wijzigt
+                self.mtime = os.stat(path).st_mtime if os.path.exists(path) else None
+            logger.error(f"🧭 Regels niet geladen ({path}), huidige regels blijven actief: {e}")
+            return False
+
+        with self.lock:
+            if self.ruleset is not None:
+                self.reloads += 1
+            self.ruleset = ruleset
+            self.source = source
+            self.mtime = mtime
+            self.loaded_at = datetime.now().isoformat()
+            self.last_error = None
+        logger.info(f"🧭 {len(ruleset.rules)} alarm regels geladen uit {source} "
+                    f"({len(ruleset.index)} index sleutels, {len(ruleset.wildcard)} wildcard)")
+        return True
+
+    def maybe_reload(self):
+        now = time.monotonic()
+        if now < self.next_check:
+            return
+        self.next_check = now + self.config["reload_check_interval"]
+        path = self.config["file"]
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != self.mtime:
+            self.load()
+
+    def match(self, alarm_info, triggers):
+        """
+        Bepaal de acties voor een alarm
+
+        Returns:
+            list: Actie dicts ({"type": ..., <parameters>}) in regel volgorde,
+                  zonder dubbelen
+        """
+        self.maybe_reload()
+        ruleset = self.ruleset
+        alarm_name = alarm_info.get('name', '')
+        now = datetime.now()
+        minute_of_day = now.hour * 60 + now.minute
+
+        actions = []
+        seen = set()
+        for rule in ruleset.candidates(alarm_name, triggers):
+            if not rule.matches(alarm_name, triggers, minute_of_day):
+                continue
+            with self.lock:
+                self.matches[rule.name] = self.matches.get(rule.name, 0) + 1
+            for action in rule.actions:
+                key = json_dumps(action, sort_keys=True)
+                if key not in seen:
+                    seen.add(key)
+                    actions.append(action)
+            if rule.stop:
+                break
+        return actions
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "source": self.source,
+                "rules": len(self.ruleset.rules) if self.ruleset else 0,
+                "index_keys": len(self.ruleset.index) if self.ruleset else 0,
+                "wildcard_rules": len(self.ruleset.wildcard) if self.ruleset else 0,
+                "loaded_at": self.loaded_at,
+                "reloads": self.reloads,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "matches": dict(self.matches)
+            }
+
+
+alarm_rules = AlarmRuleEngine(RULES_CONFIG)
+alarm_rules.load()
+
+def on_rules_config_change(old, new):
+    """De standaard regels hangen af van pc_display.send_all_alarms"""
+    if old["send_all_alarms"] != new["send_all_alarms"] and alarm_rules.source == "standaard regels":
+        alarm_rules.load()
+
+config_manager.subscribe("pc_display", on_rules_config_change)
+
+def build_action_context(alarm_info, triggers, full_payload=None):
+    """
+    Gegevens die de acties delen, één keer per alarm bepaald
+
+    Returns:
+        dict: alarm_info, triggers, payload, alarm_name, is_motion,
+              trigger_name, devices, trigger_key, thumbnail (lazy)
+    """
+    alarm_name = alarm_info.get('name', '')
+    is_motion = ('motion' in alarm_name.lower()
+                 or any('motion' in str(trigger.get('key', '')) for trigger in triggers))
+    trigger_name = None
+    if triggers and 'group' in triggers[0] and 'name' in triggers[0]['group']:
+        trigger_name = triggers[0]['group']['name']
+    return {
+        "alarm_info": alarm_info,
+        "triggers": triggers,
+        "payload": full_payload,
+        "alarm_name": alarm_name,
+        "is_motion": is_motion,
+        "trigger_name": trigger_name,
+        "devices": [trigger.get('device', 'Unknown') for trigger in triggers],
+        "trigger_key": triggers[0].get('key') if triggers else None,
+    }
+
+def format_action_text(template, context):
+    """Vul {alarm_name}, {devices}, {trigger_key}, {group_name}, {alarm_type} en {time} in"""
+    return template.format(
+        alarm_name=context["alarm_name"],
+        devices=','.join(context["devices"]),
+        trigger_key=context["trigger_key"] or '',
+        group_name=context["trigger_name"] or '',
+        alarm_type='MOTION' if context["is_motion"] else 'ALARM',
+        time=datetime.now().strftime('%H:%M:%S')
+    )
+
+def alarm_message(context):
+    """Standaard notificatie tekst voor display/email"""
+    if context["is_motion"]:
+        return f"Beweging gedetecteerd: {context['alarm_name']}"
+    return f"Alarm geactiveerd: {context['alarm_name']}"
+
+def context_thumbnail(context):
+    """Thumbnail uit de payload, maximaal één keer gezocht per alarm"""
+    if "thumbnail" not in context:
+        with trace_span("thumbnail_extract"):
+            context["thumbnail"] = extract_thumbnail_from_payload(context["payload"])
+    return context["thumbnail"]
+
+def run_alarm_action(action, context):
+    """
+    Voer één routable actie uit (sync pad, zie async_webhook.py voor de async variant)
+
+    Returns:
+        bool/None: False als de actie mislukte, anders het resultaat van de actie
+    """
+    action_type = action["type"]
+    if action_type == "display":
+        if context["trigger_name"]:
+            logger.info(f"📝 Trigger naam gevonden: {context['trigger_name']}")
+        return send_photo_to_pc_display(context_thumbnail(context), detected_name=context["trigger_name"],
+                                        idempotency_key=action.get("idempotency_key"))
+    elif action_type == "email":
+        subject = format_action_text(action.get("subject", "{alarm_name}"), context)
+        return send_email_with_thumbnail(subject, alarm_message(context), context_thumbnail(context),
+                                         message_id=action.get("idempotency_key"))
+    elif action_type == "sip":
+        return start_sip_call(action.get("number", current_config("sip")["alarm_number"]), action.get("duration", 15))
+    elif action_type == "loxone":
+        message = format_action_text(action.get("message", "{alarm_type}:{alarm_name}|DEVICES:{devices}|TIME:{time}"), context)
+        return send_udp_to_loxone(message, action.get("ip"), action.get("port"))
+    elif action_type == "disk":
+        if context["payload"]:
+            return save_alarm_photo(context["alarm_info"], context["payload"])
+    elif action_type == "mqtt":
+        return publish_alarm_to_mqtt(context, action)
+    elif action_type == "notify":
+        return notify_alarm(context, action)
+    return None
+
+# =============================================================================
+# NETWERK STATUS - LAN-only modus als internet weg is
+# =============================================================================
+
+class NetworkState:
+    """
+    🌐 NETWERK STATUS
+
+    wifi_monitor.py test de verbinding en schrijft het resultaat naar
+    NETWORK_CONFIG["state_file"]:
+
+        {"wan": false, "lan": true, "since": 1700000000.0, "updated": 1700000030.0,
+         "targets": {"pc_receiver": {"up": true, "ewma_ms": 2.1, "failure_streak": 0}, ...}}
+
+    Zonder internet (maar met LAN) blijft deze service draaien: UniFi
+    Protect, Loxone, de SIP PBX en de pcReceiver staan op het LAN. Alleen
+    acties die internet nodig hebben (wan_actions: SMTP, cloud notifiers)
+    worden uitgesteld in de action outbox en uitgevoerd zodra WAN terug is.
+    Per target (pcReceiver, SMTP, SIP, zie action_targets) weet de monitor
+    ook of het bereikbaar is; acties naar een target dat down is wachten
+    dan niet eerst op hun eigen timeout.
+
+    Een bestand in plaats van een signaal: het geldt meteen voor alle
+    gunicorn workers (de master gebruikt HUP/USR1/USR2 zelf) en na een
+    herstart is de status direct bekend. Gelezen wordt alleen als de mtime
+    verandert, hooguit elke check_interval seconden; een watcher thread
+    merkt het herstel van WAN op, ook als er geen alarms binnenkomen.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.state = {"wan": True, "lan": True, "since": None, "updated": None, "targets": {}}
+        self.mtime = None
+        self.checked = 0.0
+        self.stale = False
+        self.listeners = []
+        self.transitions = 0
+        self.thread = None
+        self.pid = None
+        self.stop_event = threading.Event()
+
+    def _load(self):
+        """Status uit het bestand (alles bereikbaar als het ontbreekt, onleesbaar of verouderd is)"""
+        path = self.config["state_file"]
+        try:
+            mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self.mtime = None
+            return {"wan": True, "lan": True, "since": None, "updated": None, "targets": {}}
+        if mtime == self.mtime:
+            state = self.state
+        else:
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json_loads(f.read())
+                state = {"wan": bool(data.get("wan", True)), "lan": bool(data.get("lan", True)),
+                         "since": data.get("since"), "updated": data.get("updated", mtime),
+                         "targets": {name: bool(target.get("up", True))
+                                     for name, target in (data.get("targets") or {}).items()}}
+            except (OSError, ValueError, AttributeError) as e:
+                logger.warning(f"🌐 Netwerk status onleesbaar ({path}): {e}")
+                state = {"wan": True, "lan": True, "since": None, "updated": mtime, "targets": {}}
+            self.mtime = mtime
+        stale = time.time() - (state["updated"] or mtime) > self.config["max_age"]
+        if stale and not self.stale:
+            logger.warning(f"🌐 Netwerk status is ouder dan {self.config['max_age']}s - ga uit van internet")
+        self.stale = stale
+        return dict(state, wan=True, lan=True, targets={}) if stale else state
+
+    def refresh(self, force=False):
+        """Lees het status bestand opnieuw (max elke check_interval); meldt WAN/target wijzigingen"""
+        now = time.monotonic()
+        if not force and now - self.checked < self.config["check_interval"]:
+            return self.state
+        with self.lock:
+            self.checked = now
+            old = self.state
+            new = self._load()
+            self.state = new
+            if old["wan"] == new["wan"] and old["targets"] == new["targets"]:
+                return new
+            self.transitions += 1
+        if new["wan"] and not old["wan"]:
+            logger.info("🌐 Internet weer bereikbaar - uitgestelde acties worden verstuurd")
+        elif old["wan"] and not new["wan"]:
+            logger.warning(f"🌐 Internet weg - LAN-only modus: {', '.join(self.config['wan_actions'])} "
+                           f"worden uitgesteld")
+        for name, up in new["targets"].items():
+            if up != old["targets"].get(name, True):
+                logger.info(f"🌐 {name} {'weer bereikbaar' if up else 'onbereikbaar volgens wifi_monitor'}")
+        for callback in list(self.listeners):
+            try:
+                callback(old, new)
+            except Exception as e:
+                logger.error(f"🌐 Fout in netwerk status callback: {e}")
+        return new
+
+    def wan_up(self):
+        return self.refresh()["wan"]
+
+    def target_up(self, name):
+        """False alleen als wifi_monitor het target als down meldt (onbekend = bereikbaar)"""
+        return name is None or self.refresh()["targets"].get(name, True)
+
+    def subscribe(self, callback):
+        """callback(old, new) bij een WAN wijziging"""
+        self.listeners.append(callback)
+
+    def start(self):
+        """Watcher thread (per proces, opnieuw na een fork)"""
+        with self.lock:
+            if self.thread is not None and self.pid == os.getpid() and self.thread.is_alive():
+                return
+            self.stop_event = threading.Event()
+            self.pid = os.getpid()
+            self.thread = threading.Thread(target=self._run, args=(self.stop_event,), name="NetworkState", daemon=True)
+            self.thread.start()
+
+    def _run(self, stop_event):
+        while not stop_event.wait(self.config["check_interval"]):
+            self.refresh(force=True)
+
+    def stop(self):
+        self.stop_event.set()
+
+    def get_status(self):
+        state = self.refresh()
+        return {"mode": "normal" if state["wan"] else "lan-only", "wan": state["wan"], "lan": state["lan"],
+                "since": state["since"], "stale": self.stale, "transitions": self.transitions,
+                "targets_down": sorted(name for name, up in state["targets"].items() if not up),
+                "deferred_actions": list(self.config["wan_actions"])}
+
+network_state = NetworkState(NETWORK_CONFIG)
+atexit.register(network_state.stop)
+
+def on_network_change(old, new):
+    """WAN of een target terug: uitgestelde acties in een eigen thread uitvoeren"""
+    recovered = [name for name, up in new["targets"].items() if up and not old["targets"].get(name, True)]
+    if (new["wan"] and not old["wan"]) or recovered:
+        threading.Thread(target=replay_action_outbox, name="OutboxReplay", daemon=True).start()
+
+network_state.subscribe(on_network_change)
+
+# =============================================================================
+# ACTION OUTBOX - Alarm acties overleven een herstart (SQLite WAL)
+# =============================================================================
+
+# Acties die de foto nodig hebben: dan wordt hij mee opgeslagen voor een replay
+OUTBOX_IMAGE_ACTIONS = ("display", "email", "disk", "mqtt", "notify")
+
+def process_alive(pid):
+    """True als er (nog) een proces met deze pid draait"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class ActionOutbox:
+    """
+    📬 ACTION OUTBOX
+
+    Elke actie van een alarm wordt in een SQLite database (WAL) vastgelegd
+    voordat hij uitgevoerd wordt en daarna afgemeld:
+
+        pending → running → done / failed
+    pending → deferred (WAN weg, zie NetworkState) → pending zodra WAN terug is
+
+    Wordt het proces halverwege gestopt (wifi_monitor, systemd, stroom),
+    dan staan de acties van het lopende alarm er nog. Bij het starten
+    (replay) worden acties van processen die niet meer draaien opnieuw
+    uitgevoerd: pending en failed altijd, running alleen als het type niet
+    in no_replay_if_interrupted staat (een SIP gesprek dat al liep wordt
+    niet nog eens gestart). Te oude acties (max_replay_age) vervallen.
+
+    Idempotency: de sleutel van een actie is een hash van het alarm (id,
+    apparaten, trigger timestamps) en de actie zelf. Stuurt UniFi Protect
+    hetzelfde alarm na de dedup TTL nog eens (of met de dedup uit),
+    dan worden acties die al done zijn overgeslagen. De sleutel gaat ook
+    mee naar buiten (email Message-ID, Idempotency-Key header naar de
+    pcReceiver, MQTT/notify berichten) zodat een ontvanger een herhaling
+    van een afgebroken actie kan herkennen.
+
+    Eén verbinding per proces (na een fork een nieuwe); gunicorn workers
+    delen de database, BEGIN IMMEDIATE + owner pid voorkomen dat twee
+    workers dezelfde actie oppakken.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.last_cleanup = 0.0
+        self.recorded = 0
+        self.duplicates = 0
+        self.replayed = 0
+        self.expired = 0
+        self.errors = 0
+
+    def _connect(self):
+        if self.conn is None or self.pid != os.getpid():
+            conn = sqlite3.connect(self.config["db_path"], timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.config['synchronous']}")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS outbox_alarms (
+                    alarm_key TEXT PRIMARY KEY,
+                    created REAL NOT NULL,
+                    alarm TEXT NOT NULL,
+                    triggers TEXT NOT NULL,
+                    thumbnail TEXT
+                );
+                CREATE TABLE IF NOT EXISTS outbox_actions (
+                    action_key TEXT PRIMARY KEY,
+                    alarm_key TEXT NOT NULL,
+                    position INTEGER NOT NULL,
+                    created REAL NOT NULL,
+                    updated REAL NOT NULL,
+                    owner INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    action TEXT NOT NULL,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS outbox_actions_status ON outbox_actions (status, created);
+            """)
+            self.conn, self.pid = conn, os.getpid()
+        return self.conn
+
+    @staticmethod
+    def alarm_key(alarm_info, triggers):
+        """
+        Sleutel van een alarm: zelfde alarm + apparaten + trigger timestamps = zelfde sleutel
+
+        Zonder timestamps is een herhaling niet te herkennen; dan krijgt elk
+        alarm een eigen (willekeurige) sleutel.
+        """
+        stamps = [(str(t.get('device')), str(t.get('key')), str(t.get('timestamp'))) for t in triggers]
+        if not stamps or any(t.get('timestamp') is None for t in triggers):
+            return os.urandom(16).hex()
+        identity = json.dumps([AlarmDeduplicator.alarm_key(alarm_info), sorted(stamps)])
+        return hashlib.sha256(identity.encode('utf-8')).hexdigest()[:32]
+
+    def record(self, alarm_info, triggers, actions, context):
+        """
+        Leg de acties van een alarm vast vóór de uitvoering
+
+        Returns:
+            list: [(action_key, action)] om uit te voeren; acties die al done
+                  zijn of door een ander (levend) proces uitgevoerd worden,
+                  vallen eruit. Zonder outbox (uit of database fout) is de
+                  sleutel None en lopen alle acties gewoon.
+        """
+        if not self.config["enabled"] or not actions:
+            return [(None, action) for action in actions]
+
+        alarm_key = self.alarm_key(alarm_info, triggers)
+        thumbnail = None
+        if any(action["type"] in OUTBOX_IMAGE_ACTIONS for action in actions):
+            value = context_thumbnail(context)
+            thumbnail = image_text(value) if value else None
+        rows = []
+        for position, action in enumerate(actions):
+            spec = json.dumps(action, sort_keys=True)
+            rows.append((f"{alarm_key}-{hashlib.sha256(spec.encode('utf-8')).hexdigest()[:8]}", position, spec, action))
+
+        now = time.time()
+        pid = os.getpid()
+        run = []
+        try:
+            # De foto staat alleen in de thumbnail kolom, niet nog eens in de alarm JSON
+            alarm_row = (alarm_key, now, json_dumps(strip_images(alarm_info)),
+                         json_dumps(strip_images(triggers)), thumbnail)
+            with self.lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute("INSERT OR IGNORE INTO outbox_alarms VALUES (?, ?, ?, ?, ?)", alarm_row)
+                    for key, position, spec, action in rows:
+                        inserted = conn.execute(
+                            "INSERT OR IGNORE INTO outbox_actions (action_key, alarm_key, position, created, "
+                            "updated, owner, status, action) VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)",
+                            (key, alarm_key, position, now, now, pid, spec)).rowcount
+                        if inserted:
+                            run.append((key, action))
+                            continue
+                        status, owner, attempts = conn.execute(
+                            "SELECT status, owner, attempts FROM outbox_actions WHERE action_key = ?", (key,)).fetchone()
+                        if status == "failed":
+                            finished = attempts >= self.config["max_attempts"]
+                        else:
+                            # done/expired/interrupted, of nog bezig in een levend proces
+                            finished = status not in ("pending", "running") or owner == pid or process_alive(owner)
+                        if finished:
+                            self.duplicates += 1
+                            logger.info(f"📬 Actie '{action['type']}' voor dit alarm is al {status} - overgeslagen")
+                            continue
+                        conn.execute("UPDATE outbox_actions SET owner = ?, status = 'pending', updated = ? "
+                                     "WHERE action_key = ?", (pid, now, key))
+                        run.append((key, action))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                self.recorded += len(run)
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            # Liever de acties zonder outbox uitvoeren dan het alarm laten vallen
+            self.errors += 1
+            logger.error(f"📬 Outbox niet beschikbaar, acties lopen zonder: {e}")
+            return [(None, action) for action in actions]
+        return run
+
+    def defer(self, keys):
+        """Acties die internet nodig hebben bewaren tot WAN terug is"""
+        keys = [key for key in keys if key]
+        if keys:
+            self._execute_many("UPDATE outbox_actions SET status = 'deferred', updated = ? WHERE action_key = ?",
+                               [(time.time(), key) for key in keys])
+
+    def mark_running(self, keys):
+        """Acties starten nu (een crash vanaf hier = 'halverwege afgebroken')"""
+        keys = [key for key in keys if key]
+        if keys:
+            self._execute_many("UPDATE outbox_actions SET status = 'running', attempts = attempts + 1, updated = ? "
+                               "WHERE action_key = ?", [(time.time(), key) for key in keys])
+
+    def finish(self, results):
+        """results: [(action_key, ok, error)] → done of failed"""
+        rows = [(time.time(), "done" if ok else "failed", error, key) for key, ok, error in results if key]
+        if rows:
+            self._execute_many("UPDATE outbox_actions SET updated = ?, status = ?, error = ? WHERE action_key = ?", rows)
+
+    def _execute_many(self, sql, rows):
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(sql, rows)
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"📬 Outbox update mislukt: {e}")
+
+    def claim_replay(self):
+        """
+        Neem de onafgemaakte acties van gestopte processen over, plus alle
+        uitgestelde (deferred) acties - die voert niemand meer uit tot ze
+        opnieuw opgepakt worden
+
+        Returns:
+            list: [(alarm_info, triggers, thumbnail, [(action_key, action)])] in volgorde van binnenkomst
+        """
+        if not self.config["enabled"] or not os.path.exists(self.config["db_path"]):
+            return []
+        now = time.time()
+        pid = os.getpid()
+        claimed = OrderedDict()
+        alarms = []
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = conn.execute(
+                        "SELECT action_key, alarm_key, owner, status, attempts, created, action FROM outbox_actions "
+                        "WHERE status IN ('pending', 'running', 'failed', 'deferred') ORDER BY created, position").fetchall()
+                    alive = {}
+                    for key, alarm_key, owner, status, attempts, created, spec in rows:
+                        if owner not in alive:
+                            alive[owner] = owner == pid or process_alive(owner)
+                        if alive[owner] and status in ("pending", "running"):
+                            continue
+                        action = json_loads(spec)
+                        max_age = self.config["max_deferred_age" if status == "deferred" else "max_replay_age"]
+                        if now - created > max_age or attempts >= self.config["max_attempts"]:
+                            new_status = "expired"
+                            self.expired += 1
+                        elif status == "running" and action["type"] in self.config["no_replay_if_interrupted"]:
+                            new_status = "interrupted"
+                        else:
+                            claimed.setdefault(alarm_key, []).append((key, action))
+                            new_status = "pending"
+                        conn.execute("UPDATE outbox_actions SET owner = ?, status = ?, updated = ? WHERE action_key = ?",
+                                     (pid, new_status, now, key))
+                    for alarm_key, entries in claimed.items():
+                        row = conn.execute("SELECT alarm, triggers, thumbnail FROM outbox_alarms WHERE alarm_key = ?",
+                                           (alarm_key,)).fetchone()
+                        if row is not None:
+                            alarms.append((json_loads(row[0]), json_loads(row[1]), row[2], entries))
+                    self._cleanup(conn, now)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"📬 Outbox replay mislukt: {e}")
+            return []
+        self.replayed += sum(len(entries) for *_, entries in alarms)
+        return alarms
+
+    def _cleanup(self, conn, now):
+        """Afgeronde acties en hun alarms na retention_hours weggooien"""
+        cutoff = now - self.config["retention_hours"] * 3600
+        conn.execute("DELETE FROM outbox_actions WHERE status IN ('done', 'expired', 'interrupted', 'failed') "
+                     "AND updated < ?", (cutoff,))
+        conn.execute("DELETE FROM outbox_alarms WHERE created < ? AND alarm_key NOT IN "
+                     "(SELECT alarm_key FROM outbox_actions)", (cutoff,))
+        self.last_cleanup = now
+
+    def maybe_cleanup(self):
+        """Eens per uur opruimen (vanuit de replay thread of na een alarm)"""
+        if not self.config["enabled"] or time.time() - self.last_cleanup < 3600:
+            return
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                self._cleanup(conn, time.time())
+                conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            self.errors += 1
+            logger.error(f"📬 Outbox opruimen mislukt: {e}")
+
+    def get_status(self):
+        status = {"enabled": self.config["enabled"], "recorded": self.recorded, "duplicates": self.duplicates,
+                  "replayed": self.replayed, "expired": self.expired, "errors": self.errors, "open": 0, "deferred": 0}
+        if self.config["enabled"] and os.path.exists(self.config["db_path"]):
+            try:
+                with self.lock:
+                    counts = dict(self._connect().execute(
+                        "SELECT status, COUNT(*) FROM outbox_actions WHERE status IN ('pending', 'running', 'deferred') "
+                        "GROUP BY status").fetchall())
+                status["open"] = counts.get("pending", 0) + counts.get("running", 0)
+                status["deferred"] = counts.get("deferred", 0)
+            except sqlite3.Error:
+                pass
+        return status
+
+action_outbox = ActionOutbox(ACTION_OUTBOX_CONFIG)
+
+def with_idempotency_key(action, key):
+    """Actie met de outbox sleutel erbij, zodat de uitvoering hem kan doorgeven"""
+    return dict(action, idempotency_key=key) if key else action
+
+def unreachable_target(action):
+    """Target van deze actie als wifi_monitor het als down meldt, anders None"""
+    target = NETWORK_CONFIG["action_targets"].get(action["type"])
+    return None if network_state.target_up(target) else target
+
+def defer_wan_actions(entries):
+    """
+    Zonder internet (of met hun target down): acties uit wan_actions in de
+    outbox laten staan (deferred)
+
+    Alleen acties met een outbox sleutel kunnen wachten; zonder outbox
+    lopen ze gewoon (en mislukken ze waarschijnlijk).
+
+    Returns:
+        list: [(action_key, action)] die nu uitgevoerd moeten worden
+    """
+    wan_actions = NETWORK_CONFIG["wan_actions"]
+    candidates = [(key, action) for key, action in entries if key and action["type"] in wan_actions]
+    if not candidates:
+        return entries
+    wan_up = network_state.wan_up()
+    deferred = [entry for entry in candidates if not wan_up or unreachable_target(entry[1])]
+    if not deferred:
+        return entries
+    action_outbox.defer([key for key, _ in deferred])
+    metrics.inc("webhook_actions_deferred_total", amount=len(deferred))
+    logger.info(f"⏸️ {'Geen internet' if not wan_up else 'Target onbereikbaar'}: "
+                f"{', '.join(action['type'] for _, action in deferred)} uitgesteld")
+    return [entry for entry in entries if entry not in deferred]
+
+def run_recorded_actions(entries, context):
+    """Acties uit de outbox na elkaar uitvoeren en afmelden (sync pad en replay)"""
+    for key, action in defer_wan_actions(entries):
+        started = time.perf_counter()
+        action_outbox.mark_running([key])
+        error = None
+        try:
+            target = unreachable_target(action)
+            if target is not None:
+                # Niet op de timeout wachten; de outbox probeert het bij een replay opnieuw
+                ok = False
+                error = f"{target} onbereikbaar"
+                logger.warning(f"⏭️ Actie '{action['type']}' overgeslagen: {error} (wifi_monitor)")
+            else:
+                ok = run_alarm_action(with_idempotency_key(action, key), context) is not False
+        except Exception as e:
+            ok = False
+            error = str(e)
+            logger.error(f"Fout bij uitvoeren van alarm actie '{action['type']}': {e}")
+        action_outbox.finish([(key, ok, error)])
+        record_action(action["type"], started, ok)
+
+def replay_action_outbox():
+    """
+    🔁 OUTBOX REPLAY
+
+    Voer de acties uit die een vorig proces niet afgemaakt heeft (zie
+    ActionOutbox). Loopt één keer na het starten, in een eigen thread.
+    """
+    alarms = action_outbox.claim_replay()
+    if not alarms:
+        return
+    logger.info(f"📬 Outbox: {sum(len(entries) for *_, entries in alarms)} onafgemaakte acties "
+                f"van {len(alarms)} alarm(s) opnieuw uitvoeren")
+    for alarm_info, triggers, thumbnail, entries in alarms:
+        payload = {"alarm": alarm_info, "thumbnail": thumbnail} if thumbnail else {"alarm": alarm_info}
+        context = build_action_context(alarm_info, triggers, payload)
+        context["thumbnail"] = thumbnail
+        logger.info(f"📬 Replay: {context['alarm_name']} ({', '.join(action['type'] for _, action in entries)})")
+        run_recorded_actions(entries, context)
+
+# =============================================================================
+# ACTIE HANDLER - Custom Alarm Acties
+# =============================================================================
+
+def record_alarm_actions(alarm_info, triggers, full_payload=None):
+    """
+    Acties van een alarm in de outbox zetten zonder ze uit te voeren
+
+    Voor het coalescing venster: de webhook krijgt pas antwoord als zijn
+    acties vastliggen. Ze lopen bij het sluiten van het venster, of na een
+    herstart via replay_action_outbox.
+
+    Returns:
+        list: [(action_key, action)] zoals ActionOutbox.record
+    """
+    with trace_span("match_rules"):
+        actions = match_alarm_rules(alarm_info, triggers)
+    context = build_action_context(alarm_info, triggers, full_payload)
+    with trace_span("outbox_record"):
+        return action_outbox.record(alarm_info, triggers, actions, context)
+
+def merge_recorded_actions(recorded):
+    """
+    Vastgelegde acties van samengevoegde webhooks: elke actie één keer
+
+    Dezelfde actie van een volgende webhook (andere outbox sleutel) wordt
+    als done afgemeld in plaats van nog eens uitgevoerd.
+    """
+    entries = []
+    merged = []
+    seen = set()
+    for key, action in recorded:
+        spec = json_dumps(action, sort_keys=True)
+        if spec in seen:
+            merged.append((key, True, "samengevoegd"))
+            continue
+        seen.add(spec)
+        entries.append((key, action))
+    action_outbox.finish(merged)
+    return entries
+
+def handle_alarm_actions(alarm_info, triggers, full_payload=None, recorded=None):
+    """
+    ⚡ ACTIE HANDLER
+    
+    Voert de acties uit die de alarm regels (alarm_rules) voor dit alarm
+    opleveren. Welke acties bij welk alarm horen staat niet meer in de code
+    maar in RULES_CONFIG["file"] (zonder bestand: DEFAULT_ALARM_RULES).
+    
+    Args:
+        alarm_info (dict): Alarm informatie met naam, type, etc.
+        triggers (list): Lijst van triggers die het alarm activeerden
+                        Bevat: device ID, trigger type, zones, timestamps
+        full_payload (dict): Volledige originele payload inclusief foto's
+        recorded (list): Al vastgelegde outbox acties (coalescing venster, zie
+                         record_alarm_actions); de regels worden dan niet
+                         opnieuw gematcht
+    
+    Altijd:
+        ✅ Log apparaat activiteit per camera
+    
+    Routable acties (via de regels):
+        display: Verstuur foto naar PC Display
+        email:   Email met foto
+        sip:     Start SIP call
+        loxone:  UDP bericht naar Loxone
+        disk:    Sla alarm foto op naar disk
+    
+    Een fout in één actie stopt de andere acties niet. Elke actie staat in
+    de action_outbox voordat hij start; wat door een herstart niet afkwam
+    wordt bij het opstarten alsnog uitgevoerd (replay_action_outbox).
+    """
+    # Apparaat activiteit (alleen een queue put)
+    for trigger in triggers:
+        device_id = trigger.get('device')
+        if device_id:
+            log_device_activity(device_id, alarm_info, trigger.get('key'))
+    
+    try:
+        if recorded is None:
+            with trace_span("match_rules"):
+                actions = match_alarm_rules(alarm_info, triggers)
+        context = build_action_context(alarm_info, triggers, full_payload)
     except Exception as e:
         logger.error(f"Fout bij uitvoeren van alarm acties: {e}")
+        return
+    
+    # Eerst vastleggen (overleeft een kill/herstart), dan uitvoeren en afmelden
+    if recorded is None:
+        with trace_span("outbox_record"):
+            entries = action_outbox.record(alarm_info, triggers, actions, context)
+    else:
+        entries = merge_recorded_actions(recorded)
+    
+    if any(action["type"] in ("display", "email") for _, action in entries):
+        logger.info("🚨 Alarm gedetecteerd! Verstuur notificatie...")
+    
+    run_recorded_actions(entries, context)
+    action_outbox.maybe_cleanup()
+
+def match_alarm_rules(alarm_info, triggers):
+    """Acties voor dit alarm volgens de (hot reloaded) regels"""
+    return alarm_rules.match(alarm_info, triggers)
 
 # =============================================================================
 # FOTO/THUMBNAIL EXTRACTIE
@@ -313,7 +2290,8 @@ def extract_thumbnail_from_payload(payload):
         payload (dict): De volledige UniFi Protect webhook payload
         
     Returns:
-        str: Base64 encoded afbeelding (data:image/jpeg;base64,...)
+        str: Base64 encoded afbeelding (data:image/jpeg;base64,...),
+             een ImageSlice (lazy geparste payload, zie image_text/image_bytes)
              of None als geen afbeelding gevonden
              
     Zoekt naar velden:
@@ -330,6 +2308,8 @@ def extract_thumbnail_from_payload(payload):
             for k, v in obj.items():
                 key = k.lower()
                 if 'thumb' in key or 'thumbnail' in key or 'snapshot' in key:
+                    if isinstance(v, ImageSlice):
+                        return v
                     if isinstance(v, str) and (v.startswith('data:image') or len(v) > 100):
                         return v
                 # Recursief zoeken in geneste objecten
@@ -350,29 +2330,31 @@ def extract_thumbnail_from_payload(payload):
 # EMAIL NOTIFICATIES - Verstuur emails met foto's
 # =============================================================================
 
-def send_email_with_thumbnail(subject, message, thumbnail=None):
+def send_email_with_thumbnail(subject, message, thumbnail=None, message_id=None):
     """
     📧 EMAIL VERSTUREN MET THUMBNAIL
     
     Stuurt een email notificatie met optioneel een thumbnail bijlage.
-    Gebruikt SMTP configuratie uit EMAIL_CONFIG.
+    Gebruikt SMTP configuratie uit de "email" sectie (EMAIL_CONFIG + config bestand/env).
     
     Args:
         subject (str): Email onderwerp (wordt gecombineerd met subject_prefix uit config)
         message (str): Hoofdtekst van de email
         thumbnail (str, optional): Base64 encoded afbeelding data om als bijlage mee te sturen
+        message_id (str, optional): Vaste Message-ID (outbox sleutel), zodat een herhaalde
+                                    email door de mail client als dezelfde herkend wordt
     
     Returns:
         bool: True als email succesvol verstuurd, False bij fout of als email uitgeschakeld is
     
     Email Format:
-        Van: EMAIL_CONFIG["from_email"]
-        Naar: EMAIL_CONFIG["to_emails"] (lijst)
-        Onderwerp: [EMAIL_CONFIG["subject_prefix"]] {subject}
+        Van: config["from_email"]
+        Naar: config["to_emails"] (lijst)
+        Onderwerp: [config["subject_prefix"]] {subject}
         Body: Geformatteerd bericht met timestamp
         Bijlage: alarm_photo.jpg (als thumbnail beschikbaar)
     
-    Configuratie (in EMAIL_CONFIG):
+    Configuratie (sectie "email", standaard uit EMAIL_CONFIG):
         enabled: True/False - email functionaliteit aan/uit
         smtp_server: SMTP server adres
         smtp_port: SMTP poort (meestal 587 voor TLS)
@@ -396,79 +2378,98 @@ def send_email_with_thumbnail(subject, message, thumbnail=None):
         )
     
     Let op:
-        - SMTP wachtwoord staat hardcoded in EMAIL_CONFIG (beveiligingsrisico!)
+        - Zet het SMTP wachtwoord liever in WEBHOOK_EMAIL__PASSWORD dan in EMAIL_CONFIG
         - Gebruikt TLS voor veilige verbinding
         - Alle errors worden gelogd maar stoppen de applicatie niet
     """
-    if not EMAIL_CONFIG["enabled"]:
+    config = current_config("email")
+    if not config["enabled"]:
         logger.info("📧 Email is uitgeschakeld in configuratie")
         return False
     
-    try:
-        # Maak email bericht
-        msg = MIMEMultipart()
-        msg['From'] = EMAIL_CONFIG["from_email"]
-        msg['To'] = ", ".join(EMAIL_CONFIG["to_emails"])
-        msg['Subject'] = f"{EMAIL_CONFIG['subject_prefix']} {subject}"
-        
-        # Email body
-        body = f"""
-UniFi Protect Alarm Notificatie
-
-{message}
+    # Pas bij de eerste email laden (warm_up() doet dit al op de achtergrond)
+    import smtplib
 
-Tijdstip: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-        """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Voeg thumbnail toe als bijlage
-        if thumbnail:
-            try:
-                # Verwijder data:image prefix als aanwezig
-                if thumbnail.startswith('data:image'):
-                    # Split op komma: data:image/jpeg;base64,ACTUALDATA
-                    thumbnail_data = thumbnail.split(',', 1)[1]
-                else:
-                    thumbnail_data = thumbnail
-                
-                # Decodeer base64
-                img_data = base64.b64decode(thumbnail_data)
-                
-                # Maak image attachment
-                img_attachment = MIMEImage(img_data)
-                img_attachment.add_header(
-                    'Content-Disposition', 
-                    f'attachment; filename="alarm_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jpg"'
-                )
-                msg.attach(img_attachment)
-                
-                logger.info(f"📸 Foto toegevoegd als bijlage ({len(img_data)} bytes)")
-                
-            except Exception as e:
-                logger.error(f"Fout bij verwerken thumbnail voor email: {e}")
+    try:
+        msg = build_alarm_email(subject, message, thumbnail, config, message_id)
         
         # Verstuur email
-        server = smtplib.SMTP(EMAIL_CONFIG["smtp_server"], EMAIL_CONFIG["smtp_port"])
+        server = smtplib.SMTP(config["smtp_server"], config["smtp_port"])
         
-        if EMAIL_CONFIG["use_tls"]:
+        if config["use_tls"]:
             server.starttls()  # TLS encryptie
         
-        server.login(EMAIL_CONFIG["username"], EMAIL_CONFIG["password"])
+        server.login(config["username"], config["password"])
         
         # Verstuur naar alle ontvangers
-        for to_email in EMAIL_CONFIG["to_emails"]:
-            server.sendmail(EMAIL_CONFIG["from_email"], to_email, msg.as_string())
+        for to_email in config["to_emails"]:
+            server.sendmail(config["from_email"], to_email, msg.as_string())
         
         server.quit()
         
-        logger.info(f"📧 Email verstuurd naar: {', '.join(EMAIL_CONFIG['to_emails'])}")
+        logger.info(f"📧 Email verstuurd naar: {', '.join(config['to_emails'])}")
         return True
         
     except Exception as e:
         logger.error(f"Fout bij versturen email: {e}")
         return False
 
+def build_alarm_email(subject, message, thumbnail=None, config=None, message_id=None):
+    """
+    Bouw het alarm email bericht (gedeeld door de sync en async verzenders)
+
+    Args:
+        config (Mapping, optional): Email config snapshot (standaard de actieve)
+        message_id (str, optional): Idempotency sleutel voor de Message-ID header
+
+    Returns:
+        MIMEMultipart: Bericht met body en optioneel de thumbnail als bijlage
+    """
+    from email.mime.multipart import MIMEMultipart
+    from email.mime.text import MIMEText
+    from email.mime.image import MIMEImage
+
+    # Maak email bericht
+    config = config or current_config("email")
+    msg = MIMEMultipart()
+    msg['From'] = config["from_email"]
+    msg['To'] = ", ".join(config["to_emails"])
+    msg['Subject'] = f"{config['subject_prefix']} {subject}"
+    if message_id:
+        msg['Message-ID'] = f"<{message_id}@{config['from_email'].rpartition('@')[2] or 'unifi-webhook'}>"
+    
+    # Email body
+    body = f"""
+UniFi Protect Alarm Notificatie
+
+{message}
+
+Tijdstip: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+    """
+    
+    msg.attach(MIMEText(body, 'plain'))
+    
+    # Voeg thumbnail toe als bijlage
+    if thumbnail:
+        try:
+            # Decodeer base64 (zonder data:image prefix)
+            img_data = image_bytes(thumbnail)
+            
+            # Maak image attachment
+            img_attachment = MIMEImage(img_data)
+            img_attachment.add_header(
+                'Content-Disposition', 
+                f'attachment; filename="alarm_{datetime.now().strftime("%Y%m%d_%H%M%S")}.jpg"'
+            )
+            msg.attach(img_attachment)
+            
+            logger.info(f"📸 Foto toegevoegd als bijlage ({len(img_data)} bytes)")
+            
+        except Exception as e:
+            logger.error(f"Fout bij verwerken thumbnail voor email: {e}")
+    
+    return msg
+
 
 # =============================================================================
 # NOTIFICATIE AGGREGATIE - Verstuur via meerdere kanalen
@@ -524,11 +2525,52 @@ def send_notification_with_photo(message, thumbnail=None):
 # PC DISPLAY COMMUNICATIE
 # =============================================================================
 
-def send_photo_to_pc_display(thumbnail, message="UniFi Protect Alarm", detected_name=None):
+# Gedeelde keep-alive sessie naar pcReceiver (aangemaakt bij eerste gebruik)
+_display_session = None
+_display_session_lock = threading.Lock()
+
+def display_http_session():
+    """requests.Session met connection pool naar de pcReceiver"""
+    global _display_session
+    with _display_session_lock:
+        if _display_session is None:
+            import requests
+            _display_session = requests.Session()
+        return _display_session
+
+def on_pc_display_config_change(old, new):
     """
-    🖥️ PC DISPLAY SENDER
-    
-    Stuurt foto naar de PC Display Receiver applicatie via HTTP POST.
+    Pas een gewijzigde pc_display sectie toe zonder herstart
+
+    Alleen een andere receiver_url vraagt een nieuwe connection pool (de
+    oude keep-alive verbindingen wijzen naar het vorige adres); timeout en
+    enabled worden per request uit de snapshot gelezen.
+    """
+    global _display_session
+    if old["receiver_url"] != new["receiver_url"]:
+        with _display_session_lock:
+            session, _display_session = _display_session, None
+        if session is not None:
+            session.close()
+        logger.info(f"🖥️ PC display verbindingen vernieuwd voor {new['receiver_url']}")
+
+config_manager.subscribe("pc_display", on_pc_display_config_change)
+
+def display_headers(idempotency_key=None):
+    """Headers naar de pcReceiver: trace id (spans komen terug) en de outbox sleutel"""
+    headers = {}
+    trace = current_trace.get()
+    if trace is not None:
+        headers[TRACE_CONFIG["header"]] = trace.trace_id
+    if idempotency_key:
+        headers["Idempotency-Key"] = idempotency_key
+    return headers or None
+
+def send_photo_to_pc_display(thumbnail, message="UniFi Protect Alarm", detected_name=None, idempotency_key=None):
+    """
+    🖥️ PC DISPLAY SENDER
+    
+    Stuurt foto naar de PC Display Receiver applicatie via HTTP POST.
     De foto wordt getoond op een TV/monitor aangesloten op de PC.
     
     Args:
@@ -536,20 +2578,23 @@ def send_photo_to_pc_display(thumbnail, message="UniFi Protect Alarm", detected_
         message (str): Logbericht (momenteel niet getoond op scherm)
         detected_name (str, optional): Naam uit trigger (bijv. kenteken/persoonsnaam)
                                        Wordt getoond als overlay op foto
+        idempotency_key (str, optional): Outbox sleutel; de pcReceiver toont dezelfde
+                                         sleutel maar één keer
         
     Returns:
         bool: True als succesvol verstuurd, False bij fout
         
     Vereisten:
-        - PC_DISPLAY_CONFIG["enabled"] = True
+        - pc_display sectie: enabled = True
         - pcReceiver.py moet draaien op receiver_url
         - 'requests' library geïnstalleerd
         
-    Configuratie:
-        PC_DISPLAY_CONFIG["receiver_url"] = "http://192.168.0.246:5001/photo"
-        PC_DISPLAY_CONFIG["timeout"] = 10 (seconden)
+    Configuratie (sectie "pc_display", standaard uit PC_DISPLAY_CONFIG):
+        receiver_url = "http://192.168.0.246:5001/photo"
+        timeout = 10 (seconden)
     """
-    if not PC_DISPLAY_CONFIG["enabled"]:
+    config = current_config("pc_display")
+    if not config["enabled"]:
         logger.info("🖥️ PC Display is uitgeschakeld in configuratie")
         return False
     
@@ -558,7 +2603,9 @@ def send_photo_to_pc_display(thumbnail, message="UniFi Protect Alarm", detected_
         return False
     
     try:
-        import requests
+        session = display_http_session()
+        
+        thumbnail = image_text(thumbnail)
         
         # Prepareer payload
         payload = {
@@ -569,15 +2616,20 @@ def send_photo_to_pc_display(thumbnail, message="UniFi Protect Alarm", detected_
             "timestamp": datetime.now().isoformat()
         }
         
-        # Verstuur naar PC receiver
-        response = requests.post(
-            PC_DISPLAY_CONFIG["receiver_url"],
-            json=payload,
-            timeout=PC_DISPLAY_CONFIG["timeout"]
-        )
+        # Verstuur naar PC receiver (met trace id, pcReceiver logt hem en stuurt zijn spans terug)
+        headers = display_headers(idempotency_key)
+        with trace_span("display_post") as span:
+            response = session.post(
+                config["receiver_url"],
+                json=payload,
+                headers=headers,
+                timeout=config["timeout"]
+            )
+            span.attrs["status"] = response.status_code
         
         if response.status_code == 200:
             result = response.json()
+            add_remote_spans(current_trace.get(), "pc", span.started, result.get("trace"))
             logger.info(f"🖥️ Foto succesvol verstuurd naar PC display: {result.get('message', 'OK')}")
             return True
         else:
@@ -637,6 +2689,9 @@ def save_alarm_photo(alarm_info, full_payload):
         - Spaties in alarm naam worden vervangen door underscores
         - Bestaande bestanden worden overschreven (geen conflict detectie)
         - Geen limiet op disk gebruik (oude foto's niet automatisch verwijderd)
+    
+    Returns:
+        bool/None: True als opgeslagen, False bij fout, None zonder thumbnail
     """
     thumbnail = extract_thumbnail_from_payload(full_payload)
     if thumbnail:
@@ -654,18 +2709,70 @@ def save_alarm_photo(alarm_info, full_payload):
             filename = f"{timestamp}_{alarm_name}.jpg"
             filepath = os.path.join(photo_dir, filename)
             
-            # Verwijder data:image/jpeg;base64, prefix als die er is
-            if thumbnail.startswith('data:image'):
-                thumbnail = thumbnail.split(',', 1)[1]
-            
-            # Decodeer en sla op
+            # Decodeer (zonder data:image/jpeg;base64, prefix) en sla op
             with open(filepath, 'wb') as f:
-                f.write(base64.b64decode(thumbnail))
+                written = f.write(image_bytes(thumbnail))
+            metrics.inc("webhook_photo_bytes_written_total", ("alarm",), written)
             
             logger.info(f"📁 Foto opgeslagen: {filepath}")
+            return True
             
         except Exception as e:
             logger.error(f"Fout bij opslaan foto: {e}")
+            return False
+
+def save_stream_to_file(stream, filepath, max_size=None):
+    """
+    💾 STREAMEND OPSLAAN MET HASH
+
+    Schrijft een (upload) stream in chunks naar disk en berekent tegelijk de
+    SHA-256 hash. Er staat nooit meer dan één chunk van de data in het geheugen,
+    ongeacht hoe groot het bestand is.
+
+    Args:
+        stream: File-achtig object met read(n) (bijv. FileStorage.stream)
+        filepath (str): Doelpad van het bestand
+        max_size (int, optional): Max aantal bytes. Default: UPLOAD_CONFIG["max_content_length"]
+
+    Returns:
+        tuple: (aantal bytes geschreven, sha256 hex digest)
+
+    Raises:
+        RequestEntityTooLarge: Als de stream groter is dan max_size
+
+    Let op:
+        - Er wordt eerst naar '<filepath>.part' geschreven en daarna atomisch
+          hernoemd, zodat /photos nooit een half geschreven bestand toont
+        - Bij een fout wordt het .part bestand opgeruimd
+    """
+    max_size = max_size or UPLOAD_CONFIG["max_content_length"]
+    chunk_size = UPLOAD_CONFIG["chunk_size"]
+    digest = hashlib.sha256()
+    size = 0
+    tmp_path = filepath + ".part"
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise RequestEntityTooLarge()
+                digest.update(chunk)
+                f.write(chunk)
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return size, digest.hexdigest()
+
+# Pad van de laatst gevonden Python 2.7 (alleen succes wordt onthouden)
+python27_path_cache = None
+
 
 def find_python27():
     """
@@ -721,6 +2828,12 @@ def find_python27():
         "python27"
     ]
     
+    global python27_path_cache
+
+    # Eerder gevonden pad hergebruiken: zoeken start subprocessen
+    if python27_path_cache and os.path.isfile(python27_path_cache):
+        return python27_path_cache
+
     # Op Linux: probeer eerst 'which' command met volledige PATH
     if os.name != 'nt':  # Niet Windows
         try:
@@ -739,6 +2852,7 @@ def find_python27():
                 python_path = result.stdout.strip()
                 if python_path and os.path.isfile(python_path):
                     logger.info(f"Python 2.7 gevonden via 'which': {python_path}")
+                    python27_path_cache = python_path
                     return python_path
         except Exception as e:
             logger.debug(f"'which' command gefaald: {e}")
@@ -763,6 +2877,7 @@ def find_python27():
                 version_output = result.stderr + result.stdout  # Python 2.7 print version naar stderr
                 if "2.7" in version_output:
                     logger.info(f"Python 2.7 gevonden: {python_path}")
+                    python27_path_cache = shutil.which(python_path) or python_path
                     return python_path
                     
         except (subprocess.TimeoutExpired, subprocess.SubprocessError, FileNotFoundError, OSError):
@@ -775,6 +2890,134 @@ def find_python27():
 # SIP TELEFONIE - VoIP bel integratie
 # =============================================================================
 
+def build_sip_command(destination, duration=15):
+    """
+    Bepaal het SIP commando (gedeeld door start_sip_call en de async variant)
+
+    Returns:
+        list: Commando voor subprocess, of None als er geen bruikbaar SIP
+              script / Python 2.7 gevonden is
+    """
+    # Zoek naar beschikbare SIP scripts (probeer eerst sippy.py, dan sip.py)
+    sippy_script_path = os.path.join(os.path.dirname(__file__), "sippy.py")
+    sip_script_path = os.path.join(os.path.dirname(__file__), "sip.py")
+    
+    if os.path.exists(sippy_script_path):
+        sip_script_path = sippy_script_path
+        logger.info("Gebruik sippy.py (Python 2.7)")
+    elif os.path.exists(sip_script_path):
+        logger.info("Gebruik sip.py (Python 3)")
+    else:
+        logger.error("Geen SIP script gevonden (sip.py of sippy.py)")
+        return None
+    
+    # Check of we sippy.py gebruiken (Python 2.7) of sip.py (Python 3)
+    if "sippy.py" in sip_script_path:
+        # Voor sippy.py - gebruik Python 2.7 met andere argumenten
+        python27_path = find_python27()
+        if not python27_path:
+            logger.error("Python 2.7 niet gevonden voor sippy.py")
+            logger.error("Controleer of Python 2.7 geïnstalleerd is en toegankelijk is via crontab")
+            return None
+            
+        # Gebruik het volledige pad naar Python 2.7 en sippy.py
+        sippy_full_path = os.path.join(os.path.dirname(__file__), "sippy.py")
+        cmd = [python27_path, sippy_full_path]
+        
+        logger.info(f"Python 2.7 pad: {python27_path}")
+        logger.info(f"Sippy.py pad: {sippy_full_path}")
+        
+        # Controleer of sippy.py bestaat
+        if not os.path.exists(sippy_full_path):
+            logger.error(f"sippy.py niet gevonden op: {sippy_full_path}")
+            return None
+    else:
+        # Voor sip.py - gebruik Python 3 met pjsua2 argumenten  
+        sip = current_config("sip")
+        cmd = [
+            sys.executable,  # python executable
+            sip_script_path,
+            "--destination", str(destination),
+            "--duration", str(duration),
+            "--server", sip["server"],
+            "--user", sip["user"],  
+            "--password", sip["password"],
+            "--domain", sip["domain"]
+        ]
+    
+    return cmd
+
+def sip_environment(trace_id=None):
+    """
+    Omgeving voor het SIP proces: extended PATH en LD_LIBRARY_PATH voor crontab
+
+    Met trace_id krijgt de dialer WEBHOOK_TRACE_ID mee (sippy.py logt hem en
+    zet hem als X-Trace-Id header in de INVITE).
+    """
+    # Stel omgeving in voor crontab (extended PATH voor libraries)
+    env = os.environ.copy()
+    if trace_id:
+        env['WEBHOOK_TRACE_ID'] = trace_id
+    env['PATH'] = '/usr/local/bin:/usr/bin:/bin:/usr/local/sbin:/usr/sbin:/sbin:' + env.get('PATH', '')
+    
+    # Voor Python 2.7 libraries (pjsua)
+    if 'LD_LIBRARY_PATH' in env:
+        env['LD_LIBRARY_PATH'] = '/usr/local/lib:/usr/lib:' + env['LD_LIBRARY_PATH']
+    else:
+        env['LD_LIBRARY_PATH'] = '/usr/local/lib:/usr/lib'
+    return env
+
+def request_sip_dialer(address, destination, trace_id=None, timeout=2.0):
+    """
+    Vraag een call aan bij de langlopende SIP dialer (sippy.py --serve)
+
+    Eén UDP verzoek in plaats van een nieuw Python 2.7 proces plus een
+    nieuwe SIP registratie per alarm.
+
+    Args:
+        address (str): "host:poort" van de dialer
+        destination (str): Te bellen nummer (sippy.py: "extension")
+
+    Returns:
+        bool: Antwoord van de dialer, of None als die niet antwoordt
+    """
+    host, _, port = address.rpartition(":")
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect((host or "127.0.0.1", int(port)))
+            sock.send(json.dumps({"extension": destination, "trace_id": trace_id}).encode('utf-8'))
+            reply = json.loads(sock.recv(4096).decode('utf-8'))
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️ SIP dialer {address} antwoordt niet: {e}")
+        return None
+    if not reply.get("ok"):
+        logger.warning(f"⚠️ SIP dialer weigert call: {reply.get('error')}")
+    return bool(reply.get("ok"))
+
+def call_via_dialer(destination):
+    """
+    Call via de SIP dialer als sip.dialer ingesteld is
+
+    Returns:
+        bool: Resultaat van de dialer, of None (geen dialer ingesteld of
+              niet bereikbaar: dan start de aanroeper zelf een SIP proces)
+    """
+    dialer = current_config("sip")["dialer"]
+    if not dialer:
+        return None
+    trace = current_trace.get()
+    started = time.perf_counter()
+    result = request_sip_dialer(dialer, destination, trace.trace_id if trace is not None else None)
+    if result is None:
+        logger.warning(f"⚠️ SIP dialer niet bereikbaar, start los SIP proces naar: {destination}")
+        return None
+    if trace is not None:
+        trace.add_span("sip_dialer", started, ok=result)
+    if result:
+        logger.info(f"📞 SIP call via dialer {dialer} naar: {destination}")
+    return result
+
 def start_sip_call(destination, duration=15):
     """
     📞 SIP CALL STARTEN
@@ -803,10 +3046,10 @@ def start_sip_call(destination, duration=15):
         - pjsua2 library geïnstalleerd
         - Huidige Python 3 interpreter
     
-    SIP Configuratie (in SIP_CONFIG):
+    SIP Configuratie (sectie "sip", standaard uit SIP_CONFIG):
         server: SIP server adres
         user: SIP gebruikersnaam
-        password: SIP wachtwoord (⚠️ hardcoded!)
+        password: SIP wachtwoord (liever via WEBHOOK_SIP__PASSWORD)
         domain: SIP domein
     
     Logging:
@@ -837,75 +3080,33 @@ def start_sip_call(destination, duration=15):
         bool: True als proces succesvol gestart
     """
     try:
-        # Zoek naar beschikbare SIP scripts (probeer eerst sippy.py, dan sip.py)
-        sippy_script_path = os.path.join(os.path.dirname(__file__), "sippy.py")
-        sip_script_path = os.path.join(os.path.dirname(__file__), "sip.py")
-        
-        if os.path.exists(sippy_script_path):
-            sip_script_path = sippy_script_path
-            logger.info("Gebruik sippy.py (Python 2.7)")
-        elif os.path.exists(sip_script_path):
-            logger.info("Gebruik sip.py (Python 3)")
-        else:
-            logger.error("Geen SIP script gevonden (sip.py of sippy.py)")
+        result = call_via_dialer(destination)
+        if result is not None:
+            return result
+
+        cmd = build_sip_command(destination, duration)
+        if not cmd:
             return False
         
         # Maak SIP logfile pad
         sip_log_path = os.path.join(os.path.dirname(__file__), "sip_calls.log")
         
-        # Check of we sippy.py gebruiken (Python 2.7) of sip.py (Python 3)
-        if "sippy.py" in sip_script_path:
-            # Voor sippy.py - gebruik Python 2.7 met andere argumenten
-            python27_path = find_python27()
-            if not python27_path:
-                logger.error("Python 2.7 niet gevonden voor sippy.py")
-                logger.error("Controleer of Python 2.7 geïnstalleerd is en toegankelijk is via crontab")
-                return False
-                
-            # Gebruik het volledige pad naar Python 2.7 en sippy.py
-            sippy_full_path = os.path.join(os.path.dirname(__file__), "sippy.py")
-            cmd = [python27_path, sippy_full_path]
-            
-            logger.info(f"Python 2.7 pad: {python27_path}")
-            logger.info(f"Sippy.py pad: {sippy_full_path}")
-            
-            # Controleer of sippy.py bestaat
-            if not os.path.exists(sippy_full_path):
-                logger.error(f"sippy.py niet gevonden op: {sippy_full_path}")
-                return False
-        else:
-            # Voor sip.py - gebruik Python 3 met pjsua2 argumenten  
-            cmd = [
-                sys.executable,  # python executable
-                sip_script_path,
-                "--destination", str(destination),
-                "--duration", str(duration),
-                "--server", SIP_CONFIG["server"],
-                "--user", SIP_CONFIG["user"],  
-                "--password", SIP_CONFIG["password"],
-                "--domain", SIP_CONFIG["domain"]
-            ]
-        
         # Open logfile voor schrijven (append mode)
         with open(sip_log_path, 'a', encoding='utf-8') as sip_log:
             # Schrijf header naar logfile
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            sip_log.write(f"\n=== SIP Call gestart op {timestamp} ===\n")
+            trace = current_trace.get()
+            trace_id = trace.trace_id if trace is not None else None
+            sip_log.write(f"\n=== SIP Call gestart op {timestamp}"
+                          f"{f' (trace {trace_id})' if trace_id else ''} ===\n")
             sip_log.write(f"Commando: {' '.join(cmd)}\n")
             sip_log.flush()
             
-            # Stel omgeving in voor crontab (extended PATH voor libraries)
-            env = os.environ.copy()
-            env['PATH'] = '/usr/local/bin:/usr/bin:/bin:/usr/local/sbin:/usr/sbin:/sbin:' + env.get('PATH', '')
-            
-            # Voor Python 2.7 libraries (pjsua)
-            if 'LD_LIBRARY_PATH' in env:
-                env['LD_LIBRARY_PATH'] = '/usr/local/lib:/usr/lib:' + env['LD_LIBRARY_PATH']
-            else:
-                env['LD_LIBRARY_PATH'] = '/usr/local/lib:/usr/lib'
+            env = sip_environment(trace_id)
             
             # Start proces in de achtergrond met output naar logfile
             # Gebruik volledige omgeving voor crontab compatibiliteit
+            spawn_started = time.perf_counter()
             process = subprocess.Popen(
                 cmd,
                 stdout=sip_log,
@@ -914,6 +3115,8 @@ def start_sip_call(destination, duration=15):
                 env=env,  # Gebruik extended environment
                 cwd=os.path.dirname(__file__)  # Zet working directory naar script directory
             )
+            if trace is not None:
+                trace.add_span("sip_spawn", spawn_started, pid=process.pid)
         
         logger.info(f"📞 SIP call proces gestart (PID: {process.pid}) naar: {destination}")
         logger.info(f"📄 SIP output wordt geschreven naar: {sip_log_path}")
@@ -923,6 +3126,8 @@ def start_sip_call(destination, duration=15):
             try:
                 # Wacht tot proces klaar is
                 return_code = process.wait()
+                if trace is not None:
+                    trace.add_span("sip_call", spawn_started, exit_code=return_code)
                 
                 # Log resultaat
                 end_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -937,8 +3142,8 @@ def start_sip_call(destination, duration=15):
             except Exception as e:
                 logger.error(f"Fout bij monitoren SIP proces: {e}")
         
-        # Start monitoring thread
-        monitor_thread = threading.Thread(target=monitor_sip_process)
+        # Start monitoring thread (logt binnen dezelfde trace)
+        monitor_thread = threading.Thread(target=bind_trace(monitor_sip_process))
         monitor_thread.daemon = True
         monitor_thread.start()
         
@@ -953,6 +3158,237 @@ def start_sip_call(destination, duration=15):
 # LOXONE INTEGRATIE - Domotica communicatie via UDP
 # =============================================================================
 
+class LoxoneUDPSender:
+    """
+    📡 LOXONE UDP SENDER
+
+    Eén sender thread met een geconnecte UDP socket per Loxone adres, in
+    plaats van een nieuwe socket per bericht.
+
+    Samenvoegen: berichten die binnen coalesce_window na elkaar binnenkomen
+    gaan in één datagram, gescheiden door separator. Een Virtual UDP Input
+    commando herkent zijn patroon maar één keer per datagram, dus twee
+    berichten met hetzelfde commando (het deel vóór de eerste ":") komen
+    nooit in hetzelfde datagram; identieke berichten in het venster worden
+    maar één keer verstuurd.
+
+    Redundantie: met redundancy > 1 wordt elk datagram nog N-1 keer
+    herhaald na een willekeurige wachttijd uit redundancy_jitter. Loxone
+    reageert op de inhoud, niet op het aantal, dus dubbele ontvangst is
+    onschadelijk. Herhalingen houden nieuwe berichten niet op.
+
+    Een geconnecte socket krijgt ICMP "port unreachable" als fout bij een
+    volgende send terug; die telt mee als send_errors.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.queue = queue.Queue(maxsize=config["queue_size"])
+        self.thread = None
+        self.pid = None
+        self.lock = threading.Lock()
+        self.sockets = {}
+        self.messages = 0
+        self.datagrams = 0
+        self.coalesced = 0
+        self.repeats = 0
+        self.send_errors = 0
+        self.dropped = 0
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.pid != os.getpid():
+                # Na een fork: sockets en thread van de parent niet hergebruiken
+                self.sockets = {}
+                self.thread = None
+                self.pid = os.getpid()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="LoxoneUDPSender", daemon=True)
+                self.thread.start()
+
+    def send(self, message, ip, port):
+        """
+        Zet een bericht in de verzend-queue (non-blocking)
+
+        Returns:
+            bool: True als het bericht in de queue staat, False als de queue vol is
+        """
+        self._ensure_started()
+        try:
+            self.queue.put_nowait(((ip, int(port)), message))
+            return True
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            logger.warning(f"📡 Loxone UDP queue vol - bericht gedropt: {message}")
+            return False
+
+    def _socket(self, target):
+        sock = self.sockets.get(target)
+        if sock is None:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(target)
+            self.sockets[target] = sock
+        return sock
+
+    def reset_sockets(self):
+        """Sluit alle sockets (bijv. na een Loxone config wijziging); de thread maakt ze opnieuw"""
+        try:
+            self.queue.put_nowait(("reset", None))
+        except queue.Full:
+            pass  # Oude sockets blijven dan open; berichten gaan per adres toch naar het juiste doel
+
+    def _close_sockets(self):
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets = {}
+
+    def _datagrams(self, batch):
+        """
+        Verdeel de berichten uit één venster over datagrams per adres
+
+        Returns:
+            list: (target, payload bytes, aantal berichten)
+        """
+        separator = self.config["separator"].encode('utf-8')
+        max_size = self.config["max_datagram"]
+        per_target = {}
+        for target, message in batch:
+            per_target.setdefault(target, []).append(message)
+
+        result = []
+        for target, messages in per_target.items():
+            open_datagrams = []  # [commando's, berichten, grootte]
+            for message in dict.fromkeys(messages):
+                data = message.encode('utf-8')
+                command = message.split(":", 1)[0]
+                for datagram in open_datagrams:
+                    if command not in datagram[0] and datagram[2] + len(separator) + len(data) <= max_size:
+                        datagram[0].add(command)
+                        datagram[1].append(data)
+                        datagram[2] += len(separator) + len(data)
+                        break
+                else:
+                    open_datagrams.append([{command}, [data], len(data)])
+            for _, parts, _ in open_datagrams:
+                result.append((target, separator.join(parts), len(parts)))
+        return result
+
+    def _transmit(self, target, payload):
+        try:
+            self._socket(target).send(payload)
+            return True
+        except OSError as e:
+            # Socket opnieuw opbouwen bij de volgende send (bijv. netwerk was weg)
+            sock = self.sockets.pop(target, None)
+            if sock is not None:
+                sock.close()
+            with self.lock:
+                self.send_errors += 1
+            logger.error(f"Fout bij versturen UDP naar Loxone ({target[0]}:{target[1]}): {e}")
+            return False
+
+    def _run(self):
+        """Sender loop: verzamel een venster, verstuur, plan herhalingen in"""
+        repeats = []  # heap van (tijdstip, volgnummer, target, payload, resterend)
+        sequence = 0
+        while True:
+            timeout = max(0.0, repeats[0][0] - time.monotonic()) if repeats else None
+            try:
+                item = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            batch = []
+            stop = False
+            if item is not None:
+                if item[0] is None:
+                    stop = True
+                elif item[0] == "reset":
+                    self._close_sockets()
+                else:
+                    batch.append(item)
+                    deadline = time.monotonic() + self.config["coalesce_window"]
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            break
+                        try:
+                            item = self.queue.get(timeout=remaining)
+                        except queue.Empty:
+                            break
+                        if item[0] is None:
+                            stop = True
+                            break
+                        if item[0] == "reset":
+                            self._close_sockets()
+                            continue
+                        batch.append(item)
+
+            if batch:
+                datagrams = self._datagrams(batch)
+                with self.lock:
+                    self.messages += len(batch)
+                    self.coalesced += len(batch) - len(datagrams)
+                for target, payload, count in datagrams:
+                    if self._transmit(target, payload):
+                        with self.lock:
+                            self.datagrams += 1
+                        text = payload.decode('utf-8', 'replace').replace(self.config["separator"], " | ")
+                        logger.info(f"🔄 UDP bericht verzonden naar Loxone ({target[0]}:{target[1]}): {text}"
+                                    + (f" ({count} berichten samengevoegd)" if count > 1 else ""))
+                    if self.config["redundancy"] > 1:
+                        sequence += 1
+                        low, high = self.config["redundancy_jitter"]
+                        heapq.heappush(repeats, (time.monotonic() + random.uniform(low, high), sequence,
+                                                 target, payload, self.config["redundancy"] - 1))
+
+            # Herhalingen die aan de beurt zijn
+            now = time.monotonic()
+            while repeats and (repeats[0][0] <= now or stop):
+                _, _, target, payload, remaining = heapq.heappop(repeats)
+                if self._transmit(target, payload):
+                    with self.lock:
+                        self.repeats += 1
+                if remaining > 1 and not stop:
+                    sequence += 1
+                    low, high = self.config["redundancy_jitter"]
+                    heapq.heappush(repeats, (now + random.uniform(low, high), sequence,
+                                             target, payload, remaining - 1))
+
+            if stop:
+                self._close_sockets()
+                return
+
+    def stop(self, timeout=2):
+        """Verstuur wat nog in de queue staat en stop de thread"""
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            self.queue.put((None, None))
+            self.thread.join(timeout)
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "queue_depth": self.queue.qsize(),
+                "messages": self.messages,
+                "datagrams": self.datagrams,
+                "coalesced": self.coalesced,
+                "repeats": self.repeats,
+                "send_errors": self.send_errors,
+                "dropped": self.dropped,
+                "sockets": len(self.sockets)
+            }
+
+loxone_sender = LoxoneUDPSender(LOXONE_UDP_CONFIG)
+atexit.register(loxone_sender.stop)
+
+def on_loxone_config_change(old, new):
+    """Nieuw Loxone adres: oude sockets sluiten"""
+    if (old["ip"], old["port"]) != (new["ip"], new["port"]):
+        loxone_sender.reset_sockets()
+
+config_manager.subscribe("loxone", on_loxone_config_change)
+
 def send_udp_to_loxone(message, loxone_ip=None, loxone_port=None):
     """
     📡 UDP BERICHT NAAR LOXONE
@@ -962,8 +3398,14 @@ def send_udp_to_loxone(message, loxone_ip=None, loxone_port=None):
     
     Args:
         message (str): Het bericht om te versturen (bijv. "beweging_voordeur" of "alarm_actief")
-        loxone_ip (str, optional): IP adres van Loxone Miniserver. Default: LOXONE_IP uit config
-        loxone_port (int, optional): UDP poort nummer. Default: LOXONE_PORT uit config
+        loxone_ip (str, optional): IP adres van Loxone Miniserver. Default: loxone.ip uit config
+        loxone_port (int, optional): UDP poort nummer. Default: loxone.port uit config
+    
+    Returns:
+        bool: True als het bericht in de verzend-queue staat, False als die vol is
+    
+    Het versturen zelf (samenvoegen, herhalen) doet loxone_sender in zijn
+    eigen thread, zie LoxoneUDPSender en LOXONE_UDP_CONFIG.
     
     Loxone Setup:
         1. Maak Virtual Input (UDP) aan in Loxone Config
@@ -977,9 +3419,10 @@ def send_udp_to_loxone(message, loxone_ip=None, loxone_port=None):
         # Verstuur naar specifieke Loxone
         send_udp_to_loxone("alarm", loxone_ip="192.168.1.50", loxone_port=7777)
     
-    Configuratie (in script header):
-        LOXONE_IP = "192.168.1.100"
-        LOXONE_PORT = 1234
+    Configuratie (sectie "loxone", standaard LOXONE_IP / LOXONE_PORT in de header):
+        [loxone]
+        ip = "192.168.1.100"
+        port = 1234
     
     Let op:
         - UDP is connectionless (geen garantie dat bericht aankomt)
@@ -987,84 +3430,1412 @@ def send_udp_to_loxone(message, loxone_ip=None, loxone_port=None):
         - Firewall moet UDP poort toestaan
     """
     # Gebruik configuratie als geen specifieke waarden gegeven
-    ip = loxone_ip or LOXONE_IP
-    port = loxone_port or LOXONE_PORT
+    config = current_config("loxone")
+    ip = loxone_ip or config["ip"]
+    port = loxone_port or config["port"]
+    return loxone_sender.send(message, ip, port)
+
+
+# =============================================================================
+# MQTT - Alarms naar home automation (Home Assistant, Node-RED, ...)
+# =============================================================================
+
+class MQTTPublisher:
+    """
+    📨 MQTT PUBLISHER
+
+    Eén persistente verbinding met de broker (vaste client id, clean_session
+    uit) en een offline queue op disk:
+
+        publish() → outbox (SQLite, WAL) → broker → PUBACK → uit de outbox
+
+    Een bericht staat in de outbox tot de broker het bevestigd heeft (QoS 1).
+    Is de broker of de Wi-Fi weg, dan blijven de berichten staan en gaan ze
+    na de reconnect (of na een herstart) in volgorde alsnog de deur uit. QoS 1
+    is "minstens één keer": na een herstart kan een bericht dat net verstuurd
+    maar nog niet bevestigd was dubbel aankomen.
+
+    Alleen de eigen writer thread raakt de database aan; de paho netwerk
+    thread meldt connects en PUBACKs via de events queue. Elk proces (gunicorn
+    worker) verstuurt alleen zijn eigen rijen en neemt rijen van gestopte
+    processen over.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.events = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.pid = None
+        self.client = None
+        self.client_suffix = ""
+        self.connected = False
+        self.inflight = {}  # paho mid → outbox id
+        self.cursor = 0
+        self.pending = 0
+        self.published = 0
+        self.acked = 0
+        self.dropped = 0
+        self.errors = 0
+        self.connects = 0
+
+    def use_shard(self, shard_id):
+        """Eigen client id per worker proces (de broker verbreekt een dubbele client id)"""
+        self.client_suffix = f"-{shard_id}"
+
+    def _ensure_started(self):
+        load_mqtt()
+        with self.lock:
+            if self.pid != os.getpid():
+                self.thread = None
+                self.client = None
+                self.pid = os.getpid()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="MQTTPublisher", daemon=True)
+                self.thread.start()
+
+    def publish(self, topic, payload, qos=1, retain=False):
+        """
+        Zet een bericht in de outbox (non-blocking)
+
+        Returns:
+            bool: False als paho-mqtt ontbreekt
+        """
+        if not MQTT_AVAILABLE:
+            logger.warning("📨 MQTT niet beschikbaar - installeer paho-mqtt: pip install paho-mqtt")
+            return False
+        self._ensure_started()
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        self.events.put(("publish", topic, payload, qos, retain))
+        return True
+
+    def resume(self):
+        """Start de publisher als MQTT aan staat en er een outbox van een vorige run is"""
+        if MQTT_AVAILABLE and current_config("mqtt")["enabled"] and os.path.exists(self.config["db_path"]):
+            self._ensure_started()
+
+    def reconfigure(self):
+        """Nieuwe broker instellingen: verbinding opnieuw opbouwen (outbox blijft staan)"""
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            self.events.put(("reconfigure",))
+
+    def _connect_db(self):
+        conn = sqlite3.connect(self.config["db_path"], timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS mqtt_outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                owner INTEGER NOT NULL,
+                topic TEXT NOT NULL,
+                payload BLOB NOT NULL,
+                qos INTEGER NOT NULL,
+                retain INTEGER NOT NULL
+            )
+        """)
+        conn.commit()
+        return conn
+
+    def _adopt_orphans(self, conn):
+        """Neem berichten over van processen die niet meer draaien"""
+        pid = os.getpid()
+        for (owner,) in conn.execute("SELECT DISTINCT owner FROM mqtt_outbox WHERE owner != ?", (pid,)).fetchall():
+            if process_alive(owner):
+                continue
+            conn.execute("UPDATE mqtt_outbox SET owner = ? WHERE owner = ?", (pid, owner))
+        conn.commit()
+
+    def _new_client(self):
+        """paho client voor de huidige mqtt config (None als MQTT uit staat)"""
+        config = current_config("mqtt")
+        if not config["enabled"]:
+            return None
+        kwargs = {"client_id": config["client_id"] + self.client_suffix, "clean_session": False}
+        if hasattr(mqtt, "CallbackAPIVersion"):
+            kwargs["callback_api_version"] = mqtt.CallbackAPIVersion.VERSION2
+        client = mqtt.Client(**kwargs)
+        if config["username"]:
+            client.username_pw_set(config["username"], config["password"] or None)
+        client.max_inflight_messages_set(self.config["max_inflight"])
+        client.reconnect_delay_set(1, 30)
+
+        # Callbacks draaien in de paho thread: alleen doorgeven (v1 en v2 callback API)
+        def on_connect(client, userdata, flags, reason_code, *rest):
+            failed = getattr(reason_code, "is_failure", reason_code != 0)
+            self.events.put(("disconnected", str(reason_code)) if failed else ("connected",))
+
+        def on_disconnect(client, userdata, *args):
+            # v1: (rc), v2: (flags, reason_code, properties)
+            self.events.put(("disconnected", str(args[1] if len(args) > 1 else args[0])))
+
+        def on_publish(client, userdata, mid, *rest):
+            self.events.put(("ack", mid))
+
+        client.on_connect = on_connect
+        client.on_disconnect = on_disconnect
+        client.on_publish = on_publish
+        client.connect_async(config["host"], config["port"], config["keepalive"])
+        client.loop_start()
+        logger.info(f"📨 MQTT verbinden met {config['host']}:{config['port']} als {kwargs['client_id']}")
+        return client
+
+    def _close_client(self):
+        if self.client is not None:
+            try:
+                self.client.disconnect()
+                self.client.loop_stop()
+            except Exception as e:
+                logger.warning(f"📨 Fout bij sluiten MQTT verbinding: {e}")
+        self.client = None
+        self.connected = False
+        # Niet bevestigde berichten staan nog in de outbox en gaan opnieuw
+        self.inflight = {}
+        self.cursor = 0
+
+    def _handle(self, conn, event):
+        kind = event[0]
+        if kind == "publish":
+            _, topic, payload, qos, retain = event
+            conn.execute("INSERT INTO mqtt_outbox (ts, owner, topic, payload, qos, retain) VALUES (?, ?, ?, ?, ?, ?)",
+                         (time.time(), os.getpid(), topic, payload, qos, int(retain)))
+            self.pending += 1
+        elif kind == "ack":
+            outbox_id = self.inflight.pop(event[1], None)
+            if outbox_id is not None:
+                conn.execute("DELETE FROM mqtt_outbox WHERE id = ?", (outbox_id,))
+                self.pending -= 1
+                self.acked += 1
+        elif kind == "connected":
+            self.connected = True
+            self.connects += 1
+            logger.info(f"📨 MQTT verbonden ({self.pending} berichten in de outbox)")
+        elif kind == "disconnected":
+            if self.connected:
+                logger.warning(f"📨 MQTT verbinding verbroken ({event[1]}) - berichten blijven in de outbox")
+            self.connected = False
+        elif kind == "reconfigure":
+            self._close_client()
+            self.client = self._new_client()
+
+    def _trim(self, conn):
+        """Outbox begrenzen: de oudste berichten vallen weg"""
+        excess = self.pending - self.config["max_queued"]
+        if excess > 0:
+            conn.execute("DELETE FROM mqtt_outbox WHERE id IN "
+                         "(SELECT id FROM mqtt_outbox WHERE owner = ? ORDER BY id LIMIT ?)", (os.getpid(), excess))
+            self.pending -= excess
+            self.dropped += excess
+            logger.warning(f"📨 MQTT outbox vol - {excess} oudste berichten verwijderd")
+
+    def _pump(self, conn):
+        """Verstuur berichten uit de outbox zolang er inflight ruimte is"""
+        free = self.config["max_inflight"] - len(self.inflight)
+        if not self.connected or self.client is None or free <= 0:
+            return
+        rows = conn.execute("SELECT id, topic, payload, qos, retain FROM mqtt_outbox "
+                            "WHERE owner = ? AND id > ? ORDER BY id LIMIT ?",
+                            (os.getpid(), self.cursor, free)).fetchall()
+        for outbox_id, topic, payload, qos, retain in rows:
+            info = self.client.publish(topic, payload, qos=qos, retain=bool(retain))
+            if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                self.errors += 1
+                logger.warning(f"📨 MQTT publish mislukt ({mqtt.error_string(info.rc)}) - volgende poging na reconnect")
+                self.connected = False
+                break
+            self.inflight[info.mid] = outbox_id
+            self.cursor = outbox_id
+            self.published += 1
+
+    def _run(self):
+        """Writer loop: events verwerken (group commit) en de outbox leegpompen"""
+        conn = self._connect_db()
+        self._adopt_orphans(conn)
+        self.pending = conn.execute("SELECT COUNT(*) FROM mqtt_outbox WHERE owner = ?", (os.getpid(),)).fetchone()[0]
+        self.client = self._new_client()
+
+        while True:
+            try:
+                events = [self.events.get(timeout=1.0)]
+            except queue.Empty:
+                events = []
+            while True:
+                try:
+                    events.append(self.events.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            for event in events:
+                if event[0] is None:
+                    stop = True
+                    continue
+                self._handle(conn, event)
+            self._trim(conn)
+            conn.commit()
+            if stop:
+                self._close_client()
+                conn.close()
+                return
+            self._pump(conn)
+
+    def stop(self, timeout=5):
+        """Verbinding netjes sluiten; wat nog niet bevestigd is blijft in de outbox"""
+        if self.thread is not None and self.thread.is_alive() and self.pid == os.getpid():
+            self.events.put((None,))
+            self.thread.join(timeout)
+
+    def get_status(self):
+        return {
+            "available": MQTT_AVAILABLE,
+            "connected": self.connected,
+            "outbox": self.pending,
+            "inflight": len(self.inflight),
+            "published": self.published,
+            "acked": self.acked,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "connects": self.connects
+        }
+
+mqtt_publisher = MQTTPublisher(MQTT_OUTBOX_CONFIG)
+atexit.register(mqtt_publisher.stop)
+
+MQTT_CONNECTION_KEYS = ("enabled", "host", "port", "username", "password", "client_id", "keepalive")
+
+def on_mqtt_config_change(old, new):
+    """Andere broker/credentials of aan/uit: opnieuw verbinden; aan/uit wijzigt ook de standaard regels"""
+    if any(old[key] != new[key] for key in MQTT_CONNECTION_KEYS):
+        mqtt_publisher.reconfigure()
+    if old["enabled"] != new["enabled"] and alarm_rules.source == "standaard regels":
+        alarm_rules.load()
+
+config_manager.subscribe("mqtt", on_mqtt_config_change)
+
+MQTT_TOPIC_UNSAFE = re.compile(r"[\s/+#]+")
+
+def format_mqtt_topic(template, context, device):
+    """
+    Topic voor één apparaat: {device}, {alarm_name}, {trigger_key}, {group_name}, {alarm_type}
+
+    Waarden komen uit de payload en mogen geen extra topic niveaus of
+    wildcards toevoegen: spaties, / + en # worden _.
+    """
+    clean = lambda value: MQTT_TOPIC_UNSAFE.sub("_", str(value or "")).strip("_") or "unknown"
+    return template.format(
+        device=clean(device),
+        alarm_name=clean(context["alarm_name"]),
+        trigger_key=clean(context["trigger_key"]),
+        group_name=clean(context["trigger_name"]),
+        alarm_type='motion' if context["is_motion"] else 'alarm'
+    )
+
+def mqtt_image_reference(thumbnail, config):
+    """
+    Foto voor in een MQTT bericht
+
+    Kleine foto's gaan inline (base64). Grotere worden één keer op disk gezet
+    (naam = sha256, dus dezelfde foto voor meerdere apparaten/berichten maar
+    één keer) en als pad + URL meegestuurd; zo blijven de berichten klein
+    voor de broker en voor abonnees op een Pi of ESP.
+
+    Returns:
+        dict: {"inline": ...} of {"sha256", "bytes", "path", "url"}
+    """
+    data = image_bytes(thumbnail)
+    if len(data) <= config["inline_image_max_bytes"]:
+        return {"inline": base64.b64encode(data).decode('ascii'), "bytes": len(data)}
+
+    digest = hashlib.sha256(data).hexdigest()
+    image_dir = MQTT_OUTBOX_CONFIG["image_dir"]
+    filename = f"{digest[:16]}.jpg"
+    path = os.path.join(image_dir, filename)
+    if not os.path.exists(path):
+        os.makedirs(image_dir, exist_ok=True)
+        with open(path + ".part", 'wb') as f:
+            written = f.write(data)
+        os.replace(path + ".part", path)
+        metrics.inc("webhook_photo_bytes_written_total", ("mqtt",), written)
+    reference = {"sha256": digest, "bytes": len(data), "path": path}
+    if config["image_base_url"]:
+        reference["url"] = f"{config['image_base_url'].rstrip('/')}/photo/{image_dir}/{filename}"
+    return reference
+
+def publish_alarm_to_mqtt(context, action=None):
+    """
+    📨 ALARM NAAR MQTT
+
+    Eén bericht per betrokken apparaat op topic_template (of "topic" uit de
+    regel), JSON met alarm, trigger, apparaten, tijd, trace id en de foto
+    (inline of als referentie, zie mqtt_image_reference).
+
+    Regel voorbeeld:
+        {"type": "mqtt", "topic": "home/camera/{device}/{trigger_key}", "retain": true}
+
+    Returns:
+        bool: True als alle berichten in de outbox staan, False als MQTT uit staat of ontbreekt
+    """
+    config = current_config("mqtt")
+    if not config["enabled"]:
+        logger.info("📨 MQTT is uitgeschakeld")
+        return False
+    action = action or {}
+
+    thumbnail = context_thumbnail(context)
+    image = None
+    if thumbnail:
+        try:
+            image = mqtt_image_reference(thumbnail, config)
+        except (OSError, ValueError) as e:
+            logger.error(f"📨 Foto niet toegevoegd aan MQTT bericht: {e}")
+
+    qos = action.get("qos", config["qos"])
+    retain = action.get("retain", config["retain"])
+    ok = True
+    for device in dict.fromkeys(context["devices"] or ["unknown"]):
+        topic = format_mqtt_topic(action.get("topic", config["topic_template"]), context, device)
+        message = {
+            "alarm": context["alarm_name"],
+            "type": 'motion' if context["is_motion"] else 'alarm',
+            "trigger": context["trigger_key"],
+            "group_name": context["trigger_name"],
+            "device": device,
+            "devices": context["devices"],
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "trace_id": current_trace_id(),
+            "id": action.get("idempotency_key"),
+            "image": image
+        }
+        ok = mqtt_publisher.publish(topic, json_dumps(message), qos=qos, retain=retain) and ok
+    if ok:
+        logger.info(f"📨 Alarm naar MQTT outbox ({len(set(context['devices'] or ['unknown']))} berichten)")
+    return ok
+
+# =============================================================================
+# ALGEMENE NOTIFICATIES - Slack, Discord, Pushover, Telegram, webhook
+# =============================================================================
+
+notifier_hub = NotifierHub({})
+atexit.register(notifier_hub.stop)
+
+def configure_notifiers(config):
+    """Backends (her)bouwen uit de notify sectie; bij een fout blijven de vorige actief"""
     try:
-        # Maak UDP socket
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        
-        # Verstuur bericht
-        message_bytes = message.encode('utf-8')
-        sock.sendto(message_bytes, (ip, port))
-        sock.close()
-        
-        logger.info(f"🔄 UDP bericht verzonden naar Loxone ({ip}:{port}): {message}")
+        notifier_hub.configure(config)
+    except ValueError as e:
+        logger.error(f"🔔 Notify configuratie ongeldig: {e}")
+
+def on_notify_config_change(old, new):
+    """Nieuwe backends/limieten direct actief; aan/uit wijzigt ook de standaard regels"""
+    configure_notifiers(new)
+    if old["enabled"] != new["enabled"] and alarm_rules.source == "standaard regels":
+        alarm_rules.load()
+
+configure_notifiers(current_config("notify"))
+config_manager.subscribe("notify", on_notify_config_change)
+
+def send_notification(message, title=None, image=None, priority=0, backends=None, wait=False,
+                      idempotency_key=None):
+    """
+    🔔 ALGEMENE NOTIFICATIE
+
+    Verstuurt een bericht naar alle backends uit de notify config (of alleen
+    de genoemde), gelijktijdig via één gedeelde HTTP connection pool. Rate
+    limits, retries en het dead-letter bestand regelt de NotifierHub
+    (notifiers.py); deze functie wacht daar standaard niet op.
+
+    Args:
+        message (str): Notificatie bericht
+        title (str, optional): Titel (Pushover/Slack/Telegram)
+        image (bytes, optional): JPEG die meegestuurd wordt waar de backend dat kan
+        priority (int): Pushover prioriteit (-2 t/m 2)
+        backends (list, optional): Namen van backends, standaard allemaal
+        wait (bool): Wachten op de aflevering (incl. retries)
+        idempotency_key (str, optional): Outbox sleutel, gaat mee in het webhook bericht
+
+    Returns:
+        bool: True als de notificatie onderweg is (met wait: door alle backends afgeleverd)
+
+    Gebruik:
+        send_notification("Alarm geactiveerd bij voordeur", backends=["telefoon"])
+    """
+    logger.info(f"📧 NOTIFICATIE: {message}")
+    if not current_config("notify")["enabled"]:
+        return False
+
+    notification = Notification(message, title=title, priority=priority, image=image,
+                                extra={"trace_id": current_trace_id(), "idempotency_key": idempotency_key})
+    future = notifier_hub.submit(notification, backends=backends)
+    if future is None:
+        logger.warning("🔔 Geen notify backends geconfigureerd")
+        return False
+    if wait:
+        return all(future.result().values())
+    return True
+
+def notify_alarm(context, action=None):
+    """
+    Alarm als push notificatie (actie "notify")
+
+    Regel voorbeeld:
+        {"type": "notify", "backends": ["telefoon"], "title": "Deurbel",
+         "message": "{group_name} om {time}", "priority": 1, "image": true}
+
+    Uit de outbox (actie met idempotency_key) wacht deze functie tot alle
+    backends afgeleverd hebben, inclusief retries: de outbox meldt de actie
+    pas daarna als done, dus een herstart tijdens de aflevering verliest
+    de notificatie niet.
+    """
+    action = action or {}
+    message = (format_action_text(action["message"], context) if "message" in action
+               else alarm_message(context))
+    title = format_action_text(action.get("title", "UniFi Protect: {alarm_name}"), context)
+    image = None
+    if action.get("image", True):
+        thumbnail = context_thumbnail(context)
+        if thumbnail:
+            try:
+                image = image_bytes(thumbnail)
+            except ValueError as e:
+                logger.error(f"🔔 Foto niet toegevoegd aan notificatie: {e}")
+    return send_notification(message, title=title, image=image, priority=action.get("priority", 0),
+                             backends=action.get("backends"), wait=action.get("idempotency_key") is not None,
+                             idempotency_key=action.get("idempotency_key"))
+
+# =============================================================================
+# LOGGING & STORAGE FUNCTIES
+# =============================================================================
+
+class DeviceActivityStore:
+    """
+    🗄️ DEVICE ACTIVITY STORE
+
+    Eén append-only SQLite database (WAL modus) voor alle apparaat activiteit,
+    in plaats van een device_{id}.log bestand per camera dat bij elke trigger
+    geopend, aangevuld en gesloten wordt.
+
+    Schrijven gebeurt via een achtergrond thread met group commit: alle
+    records die binnen commit_interval binnenkomen (max commit_batch) gaan in
+    één transactie. Bij een alarm met 6 camera's is dat dus één commit in
+    plaats van 6x open/write/close.
+
+    Tabel:
+        device_activity(id, ts, device_id, alarm_name, trigger_key)
+        Index op (device_id, ts) voor tijdsbereik queries per apparaat
+
+    Lezen (query) gebruikt een eigen connectie; WAL laat lezers en de writer
+    naast elkaar werken.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.db_path = config["db_path"]
+        self.queue = queue.Queue(maxsize=config["queue_size"])
+        self.thread = None
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.committed = 0
+        self.commits = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _init_schema(self, conn):
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS device_activity (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                ts REAL NOT NULL,
+                device_id TEXT NOT NULL,
+                alarm_name TEXT,
+                trigger_key TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_device_activity_device_ts "
+                     "ON device_activity (device_id, ts)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_device_activity_ts ON device_activity (ts)")
+        conn.commit()
+
+    def _ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name="DeviceActivityStore", daemon=True)
+                self.thread.start()
+
+    def append(self, device_id, alarm_name, trigger_key=None, ts=None):
+        """
+        Voeg een activiteit record toe (non-blocking)
+
+        Returns:
+            bool: True als het record in de queue staat, False als de queue vol is
+        """
+        self._ensure_started()
+        try:
+            self.queue.put_nowait((ts or time.time(), str(device_id), alarm_name, trigger_key))
+            return True
+        except queue.Full:
+            with self.lock:
+                self.dropped += 1
+            logger.warning("🗄️ Device activity queue vol - record gedropt")
+            return False
+
+    def _run(self):
+        """Writer loop met group commit"""
+        conn = self._connect()
+        self._init_schema(conn)
+        batch_size = self.config["commit_batch"]
+        interval = self.config["commit_interval"]
+
+        while True:
+            rows = [self.queue.get()]
+            stop = rows[0] is None
+            deadline = time.time() + interval
+
+            # Verzamel alles wat binnen het commit venster binnenkomt
+            while not stop and len(rows) < batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self.queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is None:
+                    stop = True
+                    break
+                rows.append(row)
+
+            rows = [r for r in rows if r is not None]
+            if rows:
+                try:
+                    conn.executemany(
+                        "INSERT INTO device_activity (ts, device_id, alarm_name, trigger_key) VALUES (?, ?, ?, ?)",
+                        rows
+                    )
+                    conn.commit()
+                    with self.lock:
+                        self.committed += len(rows)
+                        self.commits += 1
+                except sqlite3.Error as e:
+                    logger.error(f"🗄️ Fout bij wegschrijven device activity ({len(rows)} records): {e}")
+
+            for _ in range(len(rows) + (1 if stop else 0)):
+                self.queue.task_done()
+
+            if stop:
+                conn.close()
+                return
+
+    def flush(self):
+        """Wacht tot alle records in de queue gecommit zijn"""
+        if self.thread and self.thread.is_alive():
+            self.queue.join()
+
+    def stop(self):
+        """Commit de resterende records en stop de writer thread"""
+        if self.thread and self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+
+    def query(self, device_id=None, since=None, until=None, limit=100):
+        """
+        Haal activiteit op, optioneel per apparaat en binnen een tijdsbereik
+
+        Args:
+            device_id (str, optional): Alleen dit apparaat
+            since (float, optional): Epoch timestamp ondergrens (inclusief)
+            until (float, optional): Epoch timestamp bovengrens (exclusief)
+            limit (int): Max aantal records (nieuwste eerst)
+
+        Returns:
+            list: Dicts met timestamp, device_id, alarm_name, trigger_key
+        """
+        if not os.path.exists(self.db_path):
+            return []
+
+        where, params = [], []
+        if device_id:
+            where.append("device_id = ?")
+            params.append(device_id)
+        if since is not None:
+            where.append("ts >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            params.append(until)
+
+        sql = "SELECT ts, device_id, alarm_name, trigger_key FROM device_activity"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        return [{
+            "timestamp": datetime.fromtimestamp(ts).isoformat(),
+            "device_id": dev,
+            "alarm_name": name,
+            "trigger_key": key
+        } for ts, dev, name, key in rows]
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "db_path": self.db_path,
+                "queue_depth": self.queue.qsize(),
+                "committed": self.committed,
+                "commits": self.commits,
+                "dropped": self.dropped
+            }
+
+
+device_activity_store = DeviceActivityStore(ACTIVITY_STORE_CONFIG)
+atexit.register(device_activity_store.stop)
+
+
+def log_device_activity(device_id, alarm_info, trigger_key=None):
+    """
+    📝 DEVICE LOGGER
+    
+    Logt activiteit per individueel apparaat (camera/sensor) naar de
+    DeviceActivityStore (SQLite, group commit in achtergrond thread).
+    Handig voor analyse en debugging van specifieke apparaten.
+    
+    Args:
+        device_id (str): Unieke ID van het UniFi apparaat (bijv. "8C3066FE7870")
+        alarm_info (dict): Alarm informatie met naam en details
+        trigger_key (str, optional): Trigger type (bijv. "motion")
         
-    except Exception as e:
-        logger.error(f"Fout bij versturen UDP naar Loxone: {e}")
+    Output:
+        Record in ACTIVITY_STORE_CONFIG["db_path"] (tabel device_activity)
+        Opvragen via: GET /devices/activity?device=8C3066FE7870
+    """
+    device_activity_store.append(device_id, alarm_info.get('name', 'Onbekend alarm'), trigger_key)
+
+# =============================================================================
+# STATISTIEKEN - Rolling window tellers per apparaat en alarm
+# =============================================================================
+
+class RollingCounter:
+    """
+    🔁 RING BUFFER TELLER
+
+    Telt events in een schuivend tijdvenster met een vaste ring van buckets.
+    Elke bucket dekt bucket_seconds; een bucket die "te oud" is wordt bij het
+    hergebruiken op 0 gezet. Een increment is dus altijd O(1), ongeacht het
+    aantal events; alleen het uitlezen loopt over de (kleine) ring.
+
+    Voorbeeld:
+        RollingCounter(60, 60)  # 1 uur venster, buckets van 1 minuut
+    """
+
+    def __init__(self, bucket_seconds, bucket_count):
+        self.bucket_seconds = bucket_seconds
+        self.bucket_count = bucket_count
+        self.counts = [0] * bucket_count
+        self.bucket_ids = [-1] * bucket_count
+
+    def add(self, now, amount=1):
+        bucket_id = int(now // self.bucket_seconds)
+        idx = bucket_id % self.bucket_count
+        if self.bucket_ids[idx] != bucket_id:
+            self.bucket_ids[idx] = bucket_id
+            self.counts[idx] = 0
+        self.counts[idx] += amount
+
+    def total(self, now):
+        oldest = int(now // self.bucket_seconds) - self.bucket_count + 1
+        return sum(c for c, b in zip(self.counts, self.bucket_ids) if b >= oldest)
+
+    def to_dict(self):
+        return {"counts": self.counts, "bucket_ids": self.bucket_ids}
+
+    def load(self, data):
+        if len(data.get("counts", [])) == self.bucket_count:
+            self.counts = list(data["counts"])
+            self.bucket_ids = list(data["bucket_ids"])
+
+
+class ActivityStats:
+    """
+    📊 ACTIVITY STATISTIEKEN
+
+    Houdt per apparaat en per alarm naam rolling tellers bij voor de vensters
+    uit STATS_CONFIG["windows"] (standaard 1m / 1h / 24h) plus een totaal en
+    het laatste tijdstip. Wordt gevoed vanuit process_alarm() en is
+    opvraagbaar via /stats/devices.
+
+    De state wordt elke persist_interval seconden (alleen bij wijzigingen)
+    atomisch naar STATS_CONFIG["state_file"] geschreven en bij het starten
+    weer ingeladen, zodat een herstart de tellers niet reset.
+
+    Onder gunicorn (meerdere worker processen) schrijft elke worker naar een
+    eigen shard (use_shard) en vouwt de master shards van gestopte workers
+    terug in het basis bestand (compact).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.groups = {"devices": {}, "alarms": {}}
+        self.dirty = False
+        self.persist_thread = None
+        self.shard_id = None
+
+    def _new_entry(self):
+        return {
+            "windows": {name: RollingCounter(bucket_seconds, bucket_count)
+                        for name, (bucket_seconds, bucket_count) in self.config["windows"].items()},
+            "total": 0,
+            "last_seen": None
+        }
+
+    def _add(self, group, key, now):
+        entry = self.groups[group].get(key)
+        if entry is None:
+            entry = self.groups[group][key] = self._new_entry()
+        for counter in entry["windows"].values():
+            counter.add(now)
+        entry["total"] += 1
+        entry["last_seen"] = now
+
+    def record(self, alarm_name, device_ids, now=None):
+        """
+        Registreer één alarm voor de alarm naam en elk (uniek) apparaat
+
+        Args:
+            alarm_name (str): Naam van het alarm
+            device_ids (iterable): Device ID's uit de triggers
+            now (float, optional): Epoch timestamp (default: nu)
+        """
+        now = now or time.time()
+        with self.lock:
+            self._add("alarms", alarm_name or 'Onbekend alarm', now)
+            for device_id in set(d for d in device_ids if d):
+                self._add("devices", str(device_id), now)
+            self.dirty = True
+        self._ensure_persisting()
+
+    def snapshot(self, sort_by="1h"):
+        """Huidige tellers als JSON-vriendelijke dict, gesorteerd op sort_by (aflopend)"""
+        now = time.time()
+        with self.lock:
+            if self.shard_id is None:
+                groups = self.groups
+            else:
+                # Multi-worker: eigen live tellers + basis + shards van andere workers
+                state = self._read_state(self.config["state_file"])
+                for path in self._shard_paths():
+                    if path != self._state_path():
+                        self._merge_state(state, self._read_state(path))
+                self._merge_state(state, self._state_from_groups())
+                groups = self._groups_from_state(state)
+
+            result = {}
+            for group, entries in groups.items():
+                rows = []
+                for key, entry in entries.items():
+                    row = {"id": key, "total": entry["total"],
+                           "last_seen": datetime.fromtimestamp(entry["last_seen"]).isoformat()
+                           if entry["last_seen"] else None}
+                    for name, counter in entry["windows"].items():
+                        row[name] = counter.total(now)
+                    rows.append(row)
+                rows.sort(key=lambda r: (r.get(sort_by, 0), r["total"]), reverse=True)
+                result[group] = rows
+        return result
+
+    # --- Serialisatie -------------------------------------------------------
+
+    def _state_from_groups(self):
+        return {group: {key: {"windows": {n: c.to_dict() for n, c in entry["windows"].items()},
+                              "total": entry["total"],
+                              "last_seen": entry["last_seen"]}
+                        for key, entry in entries.items()}
+                for group, entries in self.groups.items()}
+
+    def _groups_from_state(self, state):
+        groups = {group: {} for group in self.groups}
+        for group in groups:
+            for key, data in state.get(group, {}).items():
+                entry = self._new_entry()
+                for name, counter in entry["windows"].items():
+                    if name in data.get("windows", {}):
+                        counter.load(data["windows"][name])
+                entry["total"] = data.get("total", 0)
+                entry["last_seen"] = data.get("last_seen")
+                groups[group][key] = entry
+        return groups
+
+    @staticmethod
+    def _merge_state(target, source):
+        """Tel de tellers uit source op bij target (zelfde bucket = optellen, nieuwere bucket wint)"""
+        for group, entries in source.items():
+            target_group = target.setdefault(group, {})
+            for key, data in entries.items():
+                if key not in target_group:
+                    target_group[key] = json.loads(json.dumps(data))
+                    continue
+                current = target_group[key]
+                current["total"] = current.get("total", 0) + data.get("total", 0)
+                current["last_seen"] = max(current.get("last_seen") or 0, data.get("last_seen") or 0) or None
+                for name, window in data.get("windows", {}).items():
+                    mine = current.setdefault("windows", {}).get(name)
+                    if mine is None or len(mine["counts"]) != len(window["counts"]):
+                        current["windows"][name] = json.loads(json.dumps(window))
+                        continue
+                    for i, (count, bucket_id) in enumerate(zip(window["counts"], window["bucket_ids"])):
+                        if bucket_id == mine["bucket_ids"][i]:
+                            mine["counts"][i] += count
+                        elif bucket_id > mine["bucket_ids"][i]:
+                            mine["bucket_ids"][i] = bucket_id
+                            mine["counts"][i] = count
+
+    @staticmethod
+    def _read_state(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _write_state(path, state):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def _state_path(self):
+        if self.shard_id is None:
+            return self.config["state_file"]
+        return f"{self.config['state_file']}.{self.shard_id}"
+
+    def _shard_paths(self):
+        return glob.glob(glob.escape(self.config["state_file"]) + ".w*")
+
+    # --- Opslag -------------------------------------------------------------
+
+    def save(self):
+        """Schrijf de state atomisch weg (tmp bestand + rename)"""
+        with self.lock:
+            if not self.dirty:
+                return
+            state = self._state_from_groups()
+            path = self._state_path()
+            self.dirty = False
+
+        try:
+            self._write_state(path, state)
+        except OSError as e:
+            logger.error(f"📊 Fout bij opslaan statistieken: {e}")
+            with self.lock:
+                self.dirty = True
+
+    def load(self):
+        """Laad eerder opgeslagen state (ontbrekend of corrupt bestand = lege tellers)"""
+        path = self.config["state_file"]
+        if not os.path.exists(path):
+            return
+        state = self._read_state(path)
+        if not state:
+            logger.warning(f"📊 Kon statistieken niet laden uit {path}")
+            return
+        with self.lock:
+            self.groups = self._groups_from_state(state)
+        logger.info(f"📊 Statistieken geladen uit {path}")
+
+    # --- Multi-worker (gunicorn) -------------------------------------------
+
+    def use_shard(self, shard_id):
+        """
+        Schakel over naar een eigen shard bestand (per worker proces)
+
+        De worker begint met lege tellers en schrijft alleen zijn eigen
+        increments naar <state_file>.<shard_id>. snapshot() telt basis +
+        alle shards op, dus /stats/devices klopt ongeacht welke worker antwoordt.
+        """
+        with self.lock:
+            self.shard_id = shard_id
+            self.groups = {group: {} for group in self.groups}
+            self.dirty = False
+            self.persist_thread = None
+
+    def compact(self, shard_paths=None):
+        """Vouw shard bestanden (default: allemaal) in het basis bestand en verwijder ze"""
+        paths = self._shard_paths() if shard_paths is None else [p for p in shard_paths if os.path.exists(p)]
+        if not paths:
+            return
+        state = self._read_state(self.config["state_file"])
+        for path in paths:
+            self._merge_state(state, self._read_state(path))
+        try:
+            self._write_state(self.config["state_file"], state)
+            for path in paths:
+                os.remove(path)
+        except OSError as e:
+            logger.error(f"📊 Fout bij samenvoegen statistiek shards: {e}")
+
+    def _ensure_persisting(self):
+        if self.persist_thread is None:
+            with self.lock:
+                if self.persist_thread is None:
+                    self.persist_thread = threading.Thread(target=self._persist_loop,
+                                                           name="ActivityStatsPersist", daemon=True)
+                    self.persist_thread.start()
+
+    def _persist_loop(self):
+        while True:
+            time.sleep(self.config["persist_interval"])
+            self.save()
+
+
+activity_stats = ActivityStats(STATS_CONFIG)
+activity_stats.load()
+atexit.register(activity_stats.save)
+
+# =============================================================================
+# REQUEST CAPTURE - Webhooks opnemen voor offline replay
+# =============================================================================
+
+class RequestRecorder:
+    """
+    🎙️ REQUEST RECORDER
+
+    Neemt (opt-in via CAPTURE_CONFIG["enabled"]) elke binnenkomende webhook op
+    in een roterend JSONL bestand, zodat alarm-stormen uit productie offline
+    opnieuw afgespeeld kunnen worden met replay_captures.py.
+
+    Eén regel per request:
+        {"ts": 1731508225.123, "method": "POST", "path": "/webhook",
+         "query": {...}, "content_type": "application/json", "body": {...}}
+
+    Afbeeldingen (data:image strings en thumbnail/snapshot velden) worden niet
+    inline opgeslagen maar als ruwe bytes in blobs/<sha256>.<ext>, en in de
+    body vervangen door {"$blob": "<sha256>", "$prefix": "data:image/jpeg;base64,"}.
+    Dezelfde thumbnail in meerdere webhooks (retries, meerdere triggers) staat
+    dus maar één keer op disk.
+
+    Rotatie gebeurt via een RotatingFileHandler (max_bytes / backup_count).
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.capture_logger = None
+        self.blob_dir = os.path.join(config["dir"], "blobs")
+        self.file = config["file"]
+        self.captured = 0
+        self.blobs_written = 0
+        self.blobs_deduped = 0
+
+    def _get_logger(self):
+        if self.capture_logger is None:
+            with self.lock:
+                if self.capture_logger is None:
+                    from logging.handlers import RotatingFileHandler
+                    os.makedirs(self.blob_dir, exist_ok=True)
+                    handler = RotatingFileHandler(
+                        os.path.join(self.config["dir"], self.file),
+                        maxBytes=self.config["max_bytes"],
+                        backupCount=self.config["backup_count"],
+                        encoding='utf-8'
+                    )
+                    handler.setFormatter(logging.Formatter('%(message)s'))
+                    capture_logger = logging.getLogger(__name__ + '.capture')
+                    capture_logger.propagate = False
+                    capture_logger.setLevel(logging.INFO)
+                    capture_logger.addHandler(handler)
+                    self.capture_logger = capture_logger
+        return self.capture_logger
 
+    def _store_blob(self, value):
+        """Sla een base64 afbeelding op als blob, return de placeholder (of None bij geen base64)"""
+        prefix = ''
+        data = value
+        if value.startswith('data:'):
+            prefix, data = value.split(',', 1)
+            prefix += ','
+        try:
+            raw = base64.b64decode(data, validate=True)
+        except ValueError:
+            return None
+
+        digest = hashlib.sha256(raw).hexdigest()
+        ext = prefix[len('data:image/'):].split(';', 1)[0] if prefix.startswith('data:image/') else 'bin'
+        path = os.path.join(self.blob_dir, f"{digest}.{ext or 'bin'}")
+        if os.path.exists(path):
+            with self.lock:
+                self.blobs_deduped += 1
+        else:
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp_path, path)
+            with self.lock:
+                self.blobs_written += 1
+        return {"$blob": digest, "$ext": ext, "$prefix": prefix}
+
+    def _externalize(self, obj, image_key=False):
+        """Vervang afbeeldingen in de payload recursief door blob placeholders"""
+        if isinstance(obj, dict):
+            return {k: self._externalize(v, 'thumb' in k.lower() or 'snapshot' in k.lower())
+                    for k, v in obj.items()}
+        if isinstance(obj, list):
+            return [self._externalize(i, image_key) for i in obj]
+        if isinstance(obj, ImageSlice):
+            obj = obj.text()
+        if isinstance(obj, str) and len(obj) > 100 and (image_key or obj.startswith('data:image')):
+            placeholder = self._store_blob(obj)
+            if placeholder:
+                return placeholder
+        return obj
+
+    def capture(self, req, body=None):
+        """
+        Neem één request op (fouten worden gelogd maar breken de webhook nooit)
+
+        Args:
+            req: Flask request object
+            body: Geparste JSON body (None voor GET)
+        """
+        if not self.config["enabled"]:
+            return
+        self.capture_raw(req.method, req.path, req.args.to_dict(flat=True), req.content_type, body)
+
+    def capture_raw(self, method, path, query, content_type, body=None):
+        """Neem een request op uit losse velden (voor niet-Flask servers, zie async_webhook.py)"""
+        if not self.config["enabled"]:
+            return
+        try:
+            capture_logger = self._get_logger()
+            record = {
+                "ts": time.time(),
+                "method": method,
+                "path": path,
+                "query": query,
+                "content_type": content_type,
+                "body": self._externalize(body) if body is not None else None
+            }
+            capture_logger.info(json_dumps(record))
+            with self.lock:
+                self.captured += 1
+        except Exception as e:
+            logger.error(f"🎙️ Fout bij opnemen request: {e}")
+
+    def use_shard(self, shard_id):
+        """
+        Eigen capture bestand per worker proces (requests.<shard_id>.jsonl)
+
+        Een RotatingFileHandler mag niet door meerdere processen gedeeld
+        worden; replay_captures.py leest alle bestanden en sorteert op ts.
+        """
+        with self.lock:
+            name, ext = os.path.splitext(self.config["file"])
+            self.file = f"{name}.{shard_id}{ext}"
+            if self.capture_logger is not None:
+                for handler in list(self.capture_logger.handlers):
+                    self.capture_logger.removeHandler(handler)
+                    handler.close()
+                self.capture_logger = None
+
+    def get_status(self):
+        with self.lock:
+            return {
+                "enabled": self.config["enabled"],
+                "file": os.path.join(self.config["dir"], self.file),
+                "captured": self.captured,
+                "blobs_written": self.blobs_written,
+                "blobs_deduped": self.blobs_deduped
+            }
+
+
+request_recorder = RequestRecorder(CAPTURE_CONFIG)
 
 # =============================================================================
-# ALGEMENE NOTIFICATIES - Placeholder voor custom notificatie services
+# DEDUPLICATIE & COALESCING - Dubbele webhooks en alarm bursts samenvoegen
 # =============================================================================
 
-def send_notification(message):
+class AlarmDeduplicator:
     """
-    🔔 ALGEMENE NOTIFICATIE
-    
-    Placeholder functie voor custom notificatie services.
-    Momenteel: logt alleen naar console/logfile.
-    
-    Args:
-        message (str): Notificatie bericht
-    
-    Uitbreidingen (voorbeelden):
-        • Slack webhook: requests.post(SLACK_WEBHOOK, json={"text": message})
-        • Discord webhook: requests.post(DISCORD_WEBHOOK, json={"content": message})
-        • Pushover: requests.post(PUSHOVER_API, data={...})
-        • Telegram bot: bot.send_message(CHAT_ID, message)
-        • MQTT publish: client.publish("alarm/notification", message)
-    
-    Gebruik:
-        send_notification("Alarm geactiveerd bij voordeur")
+    🔁 ALARM DEDUPLICATIE
+
+    UniFi Protect stuurt voor hetzelfde event soms meerdere webhooks
+    (meerdere triggers, retries). Zonder dedup wordt dan elke keer een foto
+    opgeslagen, de TV aangestuurd en gebeld.
+
+    Dedup:
+        Elke trigger is een event (alarm id/naam, apparaat, timestamp). Ligt
+        de timestamp binnen timestamp_tolerance_ms van een event dat binnen
+        ttl_seconds al gezien is (zelfde alarm en apparaat), dan wordt de
+        trigger overgeslagen. Er wordt vergeleken met de gezien timestamps
+        zelf, niet met vaste buckets: een retry net over een bucket grens
+        glipt er dus niet meer door.
+
+        De events staan in een SQLite database (WAL), gedeeld door alle
+        processen op deze machine (gunicorn worker na een reload, de async
+        service) en over een herstart heen. Is de database niet bruikbaar,
+        dan wordt het alarm gewoon verwerkt.
+
+    Coalescing (coalesce_window > 0):
+        Het eerste alarm met een bepaalde id/naam opent een venster; triggers
+        van volgende webhooks binnen dat venster worden samengevoegd en de
+        acties lopen één keer, na afloop van het venster, met de payload
+        (en foto) van de eerste webhook. De caller legt de acties van elke
+        webhook vóór het antwoord vast in de action_outbox (zie
+        record_alarm_actions); het venster bewaart alleen hun sleutels.
     """
-    # Voorbeeld: Print naar console (vervang door echte notificatie service)
-    logger.info(f"📧 NOTIFICATIE: {message}")
-    
-    # Optioneel: Verstuur naar Slack, Discord, email, etc.
-    # Voeg hier je notificatie code toe
+
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+        self.pending = {}             # alarm sleutel -> samen te voegen event
+        self.received = 0
+        self.duplicate_triggers = 0
+        self.duplicate_webhooks = 0
+        self.merged_webhooks = 0
+        self.dispatched_events = 0
+        self.errors = 0
+
+    def _connect(self):
+        # Eén verbinding per proces (na een fork een nieuwe), zoals ActionOutbox
+        if self.conn is None or self.pid != os.getpid():
+            conn = sqlite3.connect(self.config["db_path"], timeout=10, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS dedup_events (
+                    alarm_key TEXT NOT NULL,
+                    device TEXT NOT NULL,
+                    timestamp INTEGER NOT NULL,
+                    expires REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS dedup_events_key ON dedup_events (alarm_key, device, timestamp);
+                CREATE INDEX IF NOT EXISTS dedup_events_expires ON dedup_events (expires);
+            """)
+            self.conn, self.pid = conn, os.getpid()
+        return self.conn
+
+    @staticmethod
+    def alarm_key(alarm_info):
+        return alarm_info.get('id') or alarm_info.get('name') or 'Onbekend alarm'
+
+    @staticmethod
+    def _timestamp(value):
+        """Event timestamp in ms; zonder (bruikbare) timestamp telt het tijdstip van ontvangst"""
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return int(time.time() * 1000)
+
+    def filter_triggers(self, alarm_info, triggers, webhook_timestamp=None):
+        """
+        Haal triggers eruit die binnen de TTL al verwerkt zijn
+
+        Args:
+            alarm_info (dict): Alarm informatie (id / name)
+            triggers (list): Triggers uit de webhook
+            webhook_timestamp: Timestamp (ms) van de webhook, fallback voor
+                               triggers zonder eigen timestamp
+
+        Returns:
+            tuple: (nieuwe triggers, True als de hele webhook een duplicaat is)
+        """
+        if not self.config["enabled"]:
+            return triggers, False
+
+        alarm_key = str(self.alarm_key(alarm_info))
+        tolerance = self.config["timestamp_tolerance_ms"]
+        # Zonder triggers is de webhook zelf het event
+        events = [(str(trigger.get('device') or ''), self._timestamp(trigger.get('timestamp', webhook_timestamp)))
+                  for trigger in triggers] or [('', self._timestamp(webhook_timestamp))]
+        now = time.time()
+        fresh = []
+        try:
+            with self.lock:
+                conn = self._connect()
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.execute("DELETE FROM dedup_events WHERE expires <= ?", (now,))
+                    for device, timestamp in events:
+                        seen = conn.execute(
+                            "SELECT 1 FROM dedup_events WHERE alarm_key = ? AND device = ? "
+                            "AND timestamp BETWEEN ? AND ? LIMIT 1",
+                            (alarm_key, device, timestamp - tolerance, timestamp + tolerance)).fetchone()
+                        fresh.append(seen is None)
+                        if seen is None:
+                            conn.execute("INSERT INTO dedup_events VALUES (?, ?, ?, ?)",
+                                         (alarm_key, device, timestamp, now + self.config["ttl_seconds"]))
+                    # Harde grens: de oudste rijen eerst weg
+                    conn.execute("DELETE FROM dedup_events WHERE rowid <= "
+                                 "(SELECT MAX(rowid) FROM dedup_events) - ?", (self.config["max_entries"],))
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                self.received += 1
+                if not triggers:
+                    duplicate = not fresh[0]
+                    self.duplicate_webhooks += duplicate
+                    return triggers, duplicate
+                unique = [trigger for trigger, new in zip(triggers, fresh) if new]
+                self.duplicate_triggers += len(triggers) - len(unique)
+                if not unique:
+                    self.duplicate_webhooks += 1
+                    return unique, True
+                return unique, False
+        except sqlite3.Error as e:
+            # Liever een alarm dubbel verwerken dan er een missen
+            self.errors += 1
+            logger.error(f"🔁 Dedup database niet beschikbaar, alarm wordt verwerkt: {e}")
+            return triggers, False
+
+    def coalescing(self):
+        """True als acties via het coalescing venster lopen"""
+        return self.config["enabled"] and self.config["coalesce_window"] > 0
+
+    def count_dispatched(self):
+        """Tel een direct uitgevoerd event (voor callers die zelf de acties starten)"""
+        with self.lock:
+            self.dispatched_events += 1
+
+    def dispatch(self, alarm_info, triggers, full_payload, handler, recorded=None):
+        """
+        Voer handler(alarm_info, triggers, full_payload) uit, direct of na
+        het coalescing venster
+
+        Args:
+            recorded (list): Bij coalescing de al vastgelegde outbox acties
+                             van deze webhook (zie record_alarm_actions);
+                             de handler krijgt na het venster die van alle
+                             samengevoegde webhooks als recorded=...
+
+        Returns:
+            str: "dispatched" (direct uitgevoerd), "pending" (nieuw venster
+                 geopend) of "merged" (samengevoegd met een open venster)
+        """
+        if not self.coalescing():
+            self.count_dispatched()
+            handler(alarm_info, triggers, full_payload)
+            return "dispatched"
+
+        alarm_key = self.alarm_key(alarm_info)
+        with self.lock:
+            event = self.pending.get(alarm_key)
+            if event is not None:
+                event["triggers"].extend(triggers)
+                event["recorded"].extend(recorded or [])
+                event["merged"] += 1
+                self.merged_webhooks += 1
+                return "merged"
+
+            event = {
+                "alarm_info": alarm_info,
+                "triggers": list(triggers),
+                "payload": full_payload,
+                "handler": handler,
+                "recorded": list(recorded or []),
+                "merged": 0
+            }
+            self.pending[alarm_key] = event
+
+        timer = threading.Timer(self.config["coalesce_window"], self._flush, args=(alarm_key,))
+        timer.daemon = True
+        timer.start()
+        return "pending"
+
+    def _flush(self, alarm_key):
+        with self.lock:
+            event = self.pending.pop(alarm_key, None)
+            if event is None:
+                return
+            self.dispatched_events += 1
+        if event["merged"]:
+            logger.info(f"🔗 {event['merged'] + 1} webhooks samengevoegd tot één alarm "
+                        f"({len(event['triggers'])} triggers): {alarm_key}")
+        try:
+            event["handler"](event["alarm_info"], event["triggers"], event["payload"], recorded=event["recorded"])
+        except Exception as e:
+            logger.error(f"Fout bij uitvoeren samengevoegd alarm: {e}")
+
+    def get_status(self):
+        entries = 0
+        if self.config["enabled"] and os.path.exists(self.config["db_path"]):
+            try:
+                with self.lock:
+                    entries = self._connect().execute(
+                        "SELECT COUNT(*) FROM dedup_events WHERE expires > ?", (time.time(),)).fetchone()[0]
+            except sqlite3.Error:
+                pass
+        with self.lock:
+            return {
+                "enabled": self.config["enabled"],
+                "ttl_seconds": self.config["ttl_seconds"],
+                "coalesce_window": self.config["coalesce_window"],
+                "cache_entries": entries,
+                "errors": self.errors,
+                "pending_events": len(self.pending),
+                "received": self.received,
+                "duplicate_triggers": self.duplicate_triggers,
+                "duplicate_webhooks": self.duplicate_webhooks,
+                "merged_webhooks": self.merged_webhooks,
+                "dispatched_events": self.dispatched_events
+            }
+
+
+alarm_deduplicator = AlarmDeduplicator(DEDUP_CONFIG)
 
 # =============================================================================
-# LOGGING & STORAGE FUNCTIES
+# FLASK ROUTES - Webhook Endpoints
 # =============================================================================
 
-def log_device_activity(device_id, alarm_info):
+@app.before_request
+def reject_oversized_request():
     """
-    📝 DEVICE LOGGER
-    
-    Logt activiteit per individueel apparaat (camera/sensor) naar een apart bestand.
-    Handig voor analyse en debugging van specifieke apparaten.
-    
-    Args:
-        device_id (str): Unieke ID van het UniFi apparaat (bijv. "8C3066FE7870")
-        alarm_info (dict): Alarm informatie met naam en details
-        
-    Output:
-        Maakt bestand aan: device_{device_id}.log
-        Format: ISO timestamp - Alarm naam
-        
-    Voorbeeld log entry:
-        2025-11-13T14:30:25.123456 - Vehicle of interest
+    🚧 VROEGE 413 CHECK
+
+    Weigert requests waarvan de Content-Length groter is dan
+    UPLOAD_CONFIG["max_content_length"] nog voordat er ook maar één byte van
+    de body gelezen wordt. Requests zonder Content-Length (chunked) worden
+    tijdens het streamen begrensd door Werkzeug / save_stream_to_file().
     """
-    log_file = f"device_{device_id}.log"
-    timestamp = datetime.now().isoformat()
-    
-    with open(log_file, 'a', encoding='utf-8') as f:
-        f.write(f"{timestamp} - {alarm_info.get('name', 'Onbekend alarm')}\n")
+    max_size = app.config.get('MAX_CONTENT_LENGTH')
+    if max_size and request.content_length and request.content_length > max_size:
+        logger.warning(f"🚧 Request te groot geweigerd: {request.content_length} bytes "
+                       f"(max {max_size}) op {request.path}")
+        return jsonify({"status": "error", "message": "Request te groot",
+                        "max_content_length": max_size}), 413
 
-# =============================================================================
-# FLASK ROUTES - Webhook Endpoints
-# =============================================================================
+@app.errorhandler(413)
+def request_too_large(e):
+    """JSON antwoord wanneer een (chunked) body tijdens het lezen te groot blijkt"""
+    return jsonify({"status": "error", "message": "Request te groot",
+                    "max_content_length": app.config.get('MAX_CONTENT_LENGTH')}), 413
+
+@app.before_request
+def start_request_timer():
+    request.environ["webhook.started"] = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    """Request teller en latency per route (route template, niet het pad: begrensde labels)"""
+    started = request.environ.get("webhook.started")
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.inc("webhook_http_requests_total", (request.method, endpoint, str(response.status_code)))
+    if started is not None:
+        metrics.observe("webhook_http_request_duration_seconds", time.perf_counter() - started, (endpoint,))
+    return response
 
 @app.route('/webhook', methods=['GET', 'POST'])
 def webhook():
@@ -1087,21 +4858,41 @@ def webhook():
     Returns:
         - 200 OK: Alarm succesvol verwerkt
         - 400 Bad Request: Ongeldige data
+        - 413 Payload Too Large: Body groter dan UPLOAD_CONFIG["max_content_length"]
+        - 415 Unsupported Media Type: POST zonder JSON content type
         - 500 Server Error: Verwerkingsfout
         
     Voorbeelden:
         POST: https://jouw-server.com/webhook
         GET:  https://jouw-server.com/webhook?alarm=motion&camera=front
+    
+    Tracing:
+        Elke webhook krijgt een trace id (of neemt een geldige X-Trace-Id
+        header over), die in de response header, de logs, de PC display POST
+        en de SIP dialer terugkomt. Timings per stap: /traces/recent
     """
+    trace = tracer.start("webhook", request.headers.get(TRACE_CONFIG["header"]))
+    token = current_trace.set(trace)
+    if trace is not None:
+        request.environ["webhook.trace_id"] = trace.trace_id
+        trace.attrs["method"] = request.method
     try:
         if request.method == 'POST':
             # Verwerk POST request met JSON data
-            alarm_data = request.get_json()
+            try:
+                alarm_data = parse_webhook_body(request)
+            except UnsupportedMediaType:
+                return jsonify({"status": "error", "message": "Content-Type moet application/json zijn"}), 415
+            except BadRequest:
+                return jsonify({"status": "error", "message": "Ongeldige JSON"}), 400
+            request_recorder.capture(request, alarm_data)
             if alarm_data:
                 # Maak gesaniteerde versie voor logging (zonder foto's)
-                sanitized_for_logging = sanitize_payload(alarm_data)
+                with trace_span("sanitize"):
+                    sanitized_for_logging = sanitize_payload(alarm_data)
                 # Gebruik originele data voor verwerking (inclusief foto's)
-                process_alarm(alarm_data, "POST", sanitized_for_logging)
+                with trace_span("process_alarm"):
+                    process_alarm(alarm_data, "POST", sanitized_for_logging)
                 return jsonify({"status": "success", "message": "Alarm verwerkt"}), 200
             else:
                 logger.warning("POST request ontvangen zonder JSON data")
@@ -1109,12 +4900,105 @@ def webhook():
         
         elif request.method == 'GET':
             # Verwerk GET request
-            process_alarm(request.args, "GET")
+            request_recorder.capture(request)
+            process_alarm(request.args.to_dict(flat=True), "GET")
             return "Webhook ontvangen", 200
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Fout bij verwerken webhook: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
+    finally:
+        current_trace.reset(token)
+
+@app.after_request
+def add_trace_header(response):
+    trace_id = request.environ.get("webhook.trace_id")
+    if trace_id:
+        response.headers[TRACE_CONFIG["header"]] = trace_id
+    return response
+
+@app.route('/traces/recent', methods=['GET'])
+def recent_traces():
+    """
+    🔍 RECENTE TRACES
+
+    De laatste alarms met hun spans (parse, sanitize, thumbnail_extract,
+    match_rules, action.*, display_post, pc.* van de pcReceiver, sip_spawn,
+    sip_call), nieuwste eerst. Tijden in ms t.o.v. de start van de webhook.
+
+    Query parameters:
+        limit: Max aantal traces (standaard 20)
+        trace_id: Alleen deze trace
+        min_ms: Alleen traces die minstens zo lang duurden
+
+    Test:
+        curl "http://localhost:5000/traces/recent?min_ms=500"
+    """
+    try:
+        limit = int(request.args.get('limit', 20))
+        min_ms = float(request.args['min_ms']) if 'min_ms' in request.args else None
+    except ValueError:
+        return jsonify({"status": "error", "message": "limit/min_ms moeten getallen zijn"}), 400
+    return jsonify({
+        "enabled": TRACE_CONFIG["enabled"],
+        "buffered": len(tracer.traces),
+        "started": tracer.started,
+        "traces": tracer.recent(limit, request.args.get('trace_id'), min_ms)
+    }), 200
+
+@app.route('/admin/profile', methods=['GET'])
+def profile_endpoint():
+    """
+    🔬 CPU PROFIEL
+
+    Sample alle threads van deze worker gedurende ?seconds= (max
+    PROFILER_CONFIG["max_request_seconds"]) en geef een collapsed-stack
+    bestand terug voor flamegraph.pl / speedscope. Met ?format=json komt er
+    een samenvatting met de functies die de meeste samples hadden.
+
+    Voor langere metingen: POST /admin/profile/start?seconds=120 en later
+    POST /admin/profile/stop.
+
+    Test:
+        curl -o burst.folded "http://localhost:5000/admin/profile?seconds=15"
+    """
+    try:
+        seconds, interval = profile_request_args(request.args, PROFILER_CONFIG["max_request_seconds"])
+    except ValueError:
+        return jsonify({"status": "error", "message": "seconds/interval_ms moeten getallen zijn"}), 400
+    if not profiler.start(duration=seconds, interval=interval):
+        return jsonify({"status": "error", "message": "Er loopt al een profiel", **profiler.get_status()}), 409
+    time.sleep(seconds)
+    body, content_type, headers = profile_output(profiler.stop(), request.args.get('format'))
+    return app.response_class(body, content_type=content_type, headers=headers)
+
+@app.route('/admin/profile/start', methods=['POST'])
+def profile_start():
+    """Start een profiel op de achtergrond (?seconds=, standaard tot /admin/profile/stop)"""
+    try:
+        seconds, interval = profile_request_args(request.args)
+    except ValueError:
+        return jsonify({"status": "error", "message": "seconds/interval_ms moeten getallen zijn"}), 400
+    if 'seconds' not in request.args:
+        seconds = None
+    if not profiler.start(duration=seconds, interval=interval):
+        return jsonify({"status": "error", "message": "Er loopt al een profiel", **profiler.get_status()}), 409
+    return jsonify({"status": "started", **profiler.get_status()}), 202
+
+@app.route('/admin/profile/stop', methods=['POST'])
+def profile_stop():
+    """Stop het lopende profiel en geef het (of het laatste afgelopen profiel) terug"""
+    profile = profiler.stop()
+    if profile is None:
+        return jsonify({"status": "error", "message": "Nog geen profiel opgenomen"}), 404
+    body, content_type, headers = profile_output(profile, request.args.get('format'))
+    return app.response_class(body, content_type=content_type, headers=headers)
+
+@app.route('/admin/profile/status', methods=['GET'])
+def profile_status():
+    return jsonify(profiler.get_status()), 200
 
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -1125,7 +5009,7 @@ def health_check():
     Gebruikt door monitoring tools en load balancers.
     
     Returns:
-        JSON met status "healthy" en timestamp
+        JSON met status "healthy", netwerk modus (normal / lan-only) en timestamp
         
     Test:
         curl http://localhost:5000/health
@@ -1133,9 +5017,83 @@ def health_check():
     return jsonify({
         "status": "healthy",
         "service": "UniFi Protect Webhook",
+        "network": network_state.get_status(),
         "timestamp": datetime.now().isoformat()
     }), 200
 
+def service_metrics():
+    """Queue dieptes en tellers van de achtergrond componenten (bij elke scrape bepaald)"""
+    store = device_activity_store.get_status()
+    dedup = alarm_deduplicator.get_status()
+    loxone = loxone_sender.get_status()
+    mqtt_status = mqtt_publisher.get_status()
+    notify = notifier_hub.get_status()["backends"]
+    outbox = action_outbox.get_status()
+    per_backend = lambda key: {(("backend", name),): stats[key] for name, stats in notify.items()}
+    return [
+        ("webhook_queue_depth", "gauge", "Items in interne wachtrijen",
+         {(("queue", "device_activity"),): store["queue_depth"],
+          (("queue", "coalescing"),): dedup["pending_events"],
+          (("queue", "loxone_udp"),): loxone["queue_depth"],
+          (("queue", "mqtt_outbox"),): mqtt_status["outbox"],
+          (("queue", "action_outbox"),): outbox["open"],
+          (("queue", "action_outbox_deferred"),): outbox["deferred"]}),
+        ("webhook_wan_up", "gauge", "1 als internet bereikbaar is (0 = LAN-only modus)",
+         {(): int(network_state.wan_up())}),
+        ("webhook_action_outbox_replayed_total", "counter", "Alarm acties opnieuw uitgevoerd na een herstart",
+         {(): outbox["replayed"]}),
+        ("webhook_action_outbox_duplicates_total", "counter", "Alarm acties overgeslagen omdat ze al uitgevoerd zijn",
+         {(): outbox["duplicates"]}),
+        ("webhook_action_outbox_expired_total", "counter", "Alarm acties te oud of te vaak mislukt voor een replay",
+         {(): outbox["expired"]}),
+        ("webhook_device_activity_committed_total", "counter", "Device activity records gecommit naar SQLite",
+         {(): store["committed"]}),
+        ("webhook_device_activity_dropped_total", "counter", "Device activity records verloren (queue vol)",
+         {(): store["dropped"]}),
+        ("webhook_dedup_cache_entries", "gauge", "Sleutels in de dedup cache", {(): dedup["cache_entries"]}),
+        ("webhook_loxone_messages_total", "counter", "Loxone UDP berichten verstuurd", {(): loxone["messages"]}),
+        ("webhook_loxone_datagrams_total", "counter", "Loxone UDP datagrams verstuurd (zonder herhalingen)",
+         {(): loxone["datagrams"]}),
+        ("webhook_loxone_coalesced_total", "counter", "Loxone berichten samengevoegd in een ander datagram of als dubbel overgeslagen",
+         {(): loxone["coalesced"]}),
+        ("webhook_loxone_repeats_total", "counter", "Redundante herhalingen van Loxone datagrams",
+         {(): loxone["repeats"]}),
+        ("webhook_loxone_send_errors_total", "counter", "Mislukte Loxone UDP sends", {(): loxone["send_errors"]}),
+        ("webhook_loxone_dropped_total", "counter", "Loxone berichten verloren (queue vol)",
+         {(): loxone["dropped"]}),
+        ("webhook_mqtt_connected", "gauge", "1 als de MQTT broker verbonden is", {(): int(mqtt_status["connected"])}),
+        ("webhook_mqtt_published_total", "counter", "MQTT publishes (incl. herhalingen na reconnect)",
+         {(): mqtt_status["published"]}),
+        ("webhook_mqtt_acked_total", "counter", "Door de broker bevestigde MQTT berichten", {(): mqtt_status["acked"]}),
+        ("webhook_mqtt_dropped_total", "counter", "MQTT berichten verloren (outbox vol)",
+         {(): mqtt_status["dropped"]}),
+        ("webhook_notify_sent_total", "counter", "Afgeleverde notificaties per backend", per_backend("sent")),
+        ("webhook_notify_failed_total", "counter", "Definitief mislukte notificaties per backend (dead-letter)",
+         per_backend("failed")),
+        ("webhook_notify_retries_total", "counter", "Nieuwe pogingen per notify backend", per_backend("retries")),
+        ("webhook_notify_rate_limited_seconds_total", "counter", "Wachttijd door de rate limit per notify backend",
+         per_backend("rate_limited_seconds")),
+        ("webhook_config_reloads_total", "counter", "Geslaagde config reloads",
+         {(): config_manager.reloads}),
+        ("webhook_config_errors_total", "counter", "Mislukte config reloads", {(): config_manager.errors}),
+    ]
+
+metrics.collector(service_metrics)
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    📈 PROMETHEUS METRICS
+
+    Tellers en histogrammen in Prometheus text formaat: ontvangen alarms per
+    type/apparaat, parse tijd, latency en fouten per actie, queue dieptes,
+    geschreven foto bytes en proces RSS/CPU.
+
+    Test:
+        curl http://localhost:5000/metrics
+    """
+    return app.response_class(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.route('/logs', methods=['GET'])
 def view_logs():
     """
@@ -1199,6 +5157,131 @@ def view_sip_logs():
     except Exception as e:
         return {"error": str(e)}, 500
 
+def parse_time_param(value):
+    """Zet een query parameter (epoch seconden of ISO datum/tijd) om naar epoch, None als leeg"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+@app.route('/devices/activity', methods=['GET'])
+def device_activity():
+    """
+    📈 DEVICE ACTIVITY QUERY
+
+    Vraagt apparaat activiteit op uit de DeviceActivityStore.
+
+    Query parameters (allemaal optioneel):
+        device: Apparaat ID (bijv. 8C3066FE7870), zonder = alle apparaten
+        since:  Vanaf tijdstip (ISO "2025-11-13T14:00:00" of epoch seconden)
+        until:  Tot tijdstip (exclusief, zelfde formaat)
+        limit:  Max aantal records, nieuwste eerst (default 100, max 10000)
+
+    Returns:
+        JSON met activity array en count
+
+    Test:
+        curl "http://localhost:5000/devices/activity?device=8C3066FE7870&since=2025-11-13T00:00:00"
+    """
+    try:
+        since = parse_time_param(request.args.get('since'))
+        until = parse_time_param(request.args.get('until'))
+        limit = max(1, min(int(request.args.get('limit', 100)), 10000))
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Ongeldige parameter: {e}"}), 400
+
+    try:
+        activity = device_activity_store.query(
+            device_id=request.args.get('device'),
+            since=since,
+            until=until,
+            limit=limit
+        )
+        return jsonify({
+            "activity": activity,
+            "count": len(activity),
+            "store": device_activity_store.get_status()
+        }), 200
+    except Exception as e:
+        logger.error(f"Fout bij ophalen device activity: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/stats/devices', methods=['GET'])
+def device_stats():
+    """
+    📊 DEVICE STATISTIEKEN
+
+    Rolling window tellers per apparaat en per alarm naam: aantal alarms in
+    de laatste minuut, uur en 24 uur, plus totaal en laatste tijdstip.
+
+    Query parameters:
+        sort: Venster om op te sorteren (1m, 1h, 24h of total, default 1h)
+
+    Returns:
+        JSON met "devices" en "alarms" arrays (drukste eerst) en de
+        dedup/coalescing tellers onder "dedup"
+
+    Test:
+        curl "http://localhost:5000/stats/devices?sort=24h"
+    """
+    sort_by = request.args.get('sort', '1h')
+    if sort_by != 'total' and sort_by not in STATS_CONFIG["windows"]:
+        return jsonify({"status": "error", "message": f"Onbekend venster: {sort_by}"}), 400
+
+    stats = activity_stats.snapshot(sort_by=sort_by)
+    stats["windows"] = list(STATS_CONFIG["windows"])
+    stats["dedup"] = alarm_deduplicator.get_status()
+    stats["timestamp"] = datetime.now().isoformat()
+    return jsonify(stats), 200
+
+@app.route('/rules', methods=['GET'])
+def rules_status():
+    """
+    🧭 ALARM REGELS STATUS
+
+    Toont welke regels actief zijn (bestand of standaard regels), wanneer ze
+    geladen zijn, reload/fout tellers en hoe vaak elke regel gematcht heeft.
+    Met ?reload=1 wordt het regels bestand direct opnieuw geladen.
+
+    Test:
+        curl "http://localhost:5000/rules?reload=1"
+    """
+    if request.args.get('reload') == '1':
+        alarm_rules.load()
+    return jsonify(alarm_rules.get_status()), 200
+
+# Config sleutels die niet leesbaar op /config komen (Slack/Discord webhook URLs zijn ook een geheim)
+SECRET_CONFIG_KEYS = ("password", "token", "user", "url")
+
+def mask_config_secrets(section, secret_keys=("password",)):
+    """Kopie van een config sectie met geheimen als ***, ook in geneste secties (notify.backends)"""
+    masked = {}
+    for key, value in section.items():
+        if hasattr(value, "items"):
+            masked[key] = mask_config_secrets(value, SECRET_CONFIG_KEYS)
+        else:
+            masked[key] = "***" if key in secret_keys and value else value
+    return masked
+
+@app.route('/config', methods=['GET'])
+def config_status():
+    """
+    ⚙️ CONFIGURATIE STATUS
+
+    Toont de actieve configuratie (wachtwoorden gemaskeerd), uit welke
+    bronnen ze samengesteld is, de versie en reload/fout tellers.
+    Met ?reload=1 wordt het config bestand direct opnieuw geladen.
+
+    Test:
+        curl "http://localhost:5000/config?reload=1"
+    """
+    if request.args.get('reload') == '1':
+        config_manager.load()
+    sections = {name: mask_config_secrets(section) for name, section in config_manager.snapshot.items()}
+    return jsonify({**config_manager.get_status(), "sections": sections}), 200
+
 @app.route('/test-email', methods=['POST'])
 def test_email():
     """
@@ -1501,7 +5584,7 @@ def serve_photo(directory, filename):
     """
     try:
         # Veiligheidscheck - alleen toegestane directories
-        if directory not in ['alarm_photos', 'uploaded_photos']:
+        if directory not in ['alarm_photos', 'uploaded_photos', MQTT_OUTBOX_CONFIG["image_dir"]]:
             return "Niet toegestane directory", 403
         
         photo_dir = directory
@@ -1515,6 +5598,29 @@ def serve_photo(directory, filename):
         logger.error(f"Fout bij serveren foto {directory}/{filename}: {e}")
         return "Foto niet gevonden", 404
 
+UPLOAD_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
+
+def is_allowed_upload(filename):
+    """Controleer of de bestandsnaam een toegestane afbeelding extensie heeft"""
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in UPLOAD_EXTENSIONS
+
+def upload_target_path(original_filename):
+    """
+    Doelpad voor een upload: uploaded_photos/YYYYMMDD_HHMMSS_originele_naam.ext
+
+    Returns:
+        tuple: (nieuwe bestandsnaam, volledig pad)
+    """
+    # Maak upload directory
+    upload_dir = "uploaded_photos"
+    os.makedirs(upload_dir, exist_ok=True)
+    
+    # Genereer unieke bestandsnaam met timestamp
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    name, ext = os.path.splitext(original_filename)
+    new_filename = f"{timestamp}_{name}{ext}"
+    return new_filename, os.path.join(upload_dir, new_filename)
+
 @app.route('/upload', methods=['POST'])
 def upload_photo():
     """
@@ -1531,6 +5637,7 @@ def upload_photo():
     Returns:
         200 OK: Upload succesvol + bestandsinfo
         400 Bad Request: Geen bestand, lege naam, of ongeldig type
+        413 Payload Too Large: Bestand groter dan UPLOAD_CONFIG["max_content_length"]
         500 Error: Upload gefaald
     
     Toegestane formaten:
@@ -1548,6 +5655,7 @@ def upload_photo():
             "filename": "20241125_143022_detected_face.jpg",
             "original_filename": "detected_face.jpg",
             "size": 245678,
+            "sha256": "9f86d081884c7d65...",
             "view_url": "/photo/uploaded_photos/20241125_143022_detected_face.jpg"
         }
     """
@@ -1561,31 +5669,20 @@ def upload_photo():
             return jsonify({'error': 'Geen bestandsnaam'}), 400
         
         # Controleer bestandstype
-        allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
-        if not ('.' in file.filename and file.filename.rsplit('.', 1)[1].lower() in allowed_extensions):
+        if not is_allowed_upload(file.filename):
             return jsonify({'error': 'Ongeldig bestandstype'}), 400
         
-        # Maak upload directory
-        upload_dir = "uploaded_photos"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # Genereer unieke bestandsnaam met timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         original_filename = file.filename
-        name, ext = os.path.splitext(original_filename)
+        new_filename, filepath = upload_target_path(original_filename)
         
-        new_filename = f"{timestamp}_{name}{ext}"
-        filepath = os.path.join(upload_dir, new_filename)
-        
-        # Sla bestand op
-        file.save(filepath)
+        # Sla bestand streamend op (in chunks, met SHA-256 hash)
+        file_size, sha256 = save_stream_to_file(file.stream, filepath)
+        metrics.inc("webhook_photo_bytes_written_total", ("upload",), file_size)
         
         logger.info(f"📸 Foto geupload van Raspberry Pi: {new_filename}")
         logger.info(f"   Originele naam: {original_filename}")
         logger.info(f"   Pad: {filepath}")
-        
-        # Krijg bestandsinfo
-        file_size = os.path.getsize(filepath)
+        logger.info(f"   Grootte: {file_size} bytes, SHA-256: {sha256}")
         
         return jsonify({
             'success': True,
@@ -1593,14 +5690,64 @@ def upload_photo():
             'filename': new_filename,
             'original_filename': original_filename,
             'size': file_size,
+            'sha256': sha256,
             'path': filepath,
             'view_url': f'/photo/uploaded_photos/{new_filename}'
         }), 200
         
+    except HTTPException:
+        # 413 e.d. doorgeven aan de Flask error handlers
+        raise
     except Exception as e:
         logger.error(f"Fout bij uploaden foto: {e}")
         return jsonify({'error': f'Server fout: {str(e)}'}), 500
 
+def collect_photos_info():
+    """
+    Verzamel metadata van alle alarm en geüploade foto's (nieuwste eerst)
+
+    Gedeeld door /photos/api en de async variant (async_webhook.py), die
+    deze directory scan in een thread uitvoert.
+    """
+    photos_info = {
+        'alarm_photos': [],
+        'uploaded_photos': []
+    }
+    
+    # Alarm foto's
+    alarm_photo_dir = "alarm_photos"
+    if os.path.exists(alarm_photo_dir):
+        for ext in ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']:
+            for photo in glob.glob(os.path.join(alarm_photo_dir, ext)):
+                filename = os.path.basename(photo)
+                file_stats = os.stat(photo)
+                photos_info['alarm_photos'].append({
+                    'filename': filename,
+                    'size': file_stats.st_size,
+                    'modified': datetime.fromtimestamp(file_stats.st_mtime).isoformat(),
+                    'url': f'/photo/alarm_photos/{filename}'
+                })
+    
+    # Uploaded foto's
+    uploaded_photo_dir = "uploaded_photos"
+    if os.path.exists(uploaded_photo_dir):
+        for ext in ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']:
+            for photo in glob.glob(os.path.join(uploaded_photo_dir, ext)):
+                filename = os.path.basename(photo)
+                file_stats = os.stat(photo)
+                photos_info['uploaded_photos'].append({
+                    'filename': filename,
+                    'size': file_stats.st_size,
+                    'modified': datetime.fromtimestamp(file_stats.st_mtime).isoformat(),
+                    'url': f'/photo/uploaded_photos/{filename}'
+                })
+    
+    # Sorteer op datum (nieuwste eerst)
+    photos_info['alarm_photos'].sort(key=lambda x: x['modified'], reverse=True)
+    photos_info['uploaded_photos'].sort(key=lambda x: x['modified'], reverse=True)
+    
+    return photos_info
+
 @app.route('/photos/api')
 def photos_api():
     """
@@ -1635,42 +5782,7 @@ def photos_api():
         curl http://localhost:5000/photos/api
     """
     try:
-        photos_info = {
-            'alarm_photos': [],
-            'uploaded_photos': []
-        }
-        
-        # Alarm foto's
-        alarm_photo_dir = "alarm_photos"
-        if os.path.exists(alarm_photo_dir):
-            for ext in ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']:
-                for photo in glob.glob(os.path.join(alarm_photo_dir, ext)):
-                    filename = os.path.basename(photo)
-                    file_stats = os.stat(photo)
-                    photos_info['alarm_photos'].append({
-                        'filename': filename,
-                        'size': file_stats.st_size,
-                        'modified': datetime.fromtimestamp(file_stats.st_mtime).isoformat(),
-                        'url': f'/photo/alarm_photos/{filename}'
-                    })
-        
-        # Uploaded foto's
-        uploaded_photo_dir = "uploaded_photos"
-        if os.path.exists(uploaded_photo_dir):
-            for ext in ['*.jpg', '*.jpeg', '*.png', '*.gif', '*.bmp']:
-                for photo in glob.glob(os.path.join(uploaded_photo_dir, ext)):
-                    filename = os.path.basename(photo)
-                    file_stats = os.stat(photo)
-                    photos_info['uploaded_photos'].append({
-                        'filename': filename,
-                        'size': file_stats.st_size,
-                        'modified': datetime.fromtimestamp(file_stats.st_mtime).isoformat(),
-                        'url': f'/photo/uploaded_photos/{filename}'
-                    })
-        
-        # Sorteer op datum (nieuwste eerst)
-        photos_info['alarm_photos'].sort(key=lambda x: x['modified'], reverse=True)
-        photos_info['uploaded_photos'].sort(key=lambda x: x['modified'], reverse=True)
+        photos_info = collect_photos_info()
         
         return jsonify(photos_info)
         
@@ -1679,17 +5791,261 @@ def photos_api():
         return jsonify({"error": str(e)}), 500
 
 
+# =============================================================================
+# PRODUCTIE SERVER - WSGI server factory
+# =============================================================================
+
+def warm_up(display_session=True):
+    """
+    Laad op de achtergrond wat het eerste alarm nodig heeft
+
+    requests en de email modules worden niet bij het importeren van dit
+    script geladen (dat vertraagt de start tot de eerste /webhook 200); deze
+    thread laadt ze direct na het opstarten, zodat ook het eerste alarm er
+    niet op wacht. find_python27() start subprocessen en onthoudt het pad,
+    dus die zoektocht gebeurt hier en niet tijdens de eerste SIP call.
+    """
+    started = time.perf_counter()
+    try:
+        if display_session and current_config("pc_display")["enabled"]:
+            display_http_session()
+        if current_config("email")["enabled"]:
+            import smtplib
+            from email.mime import multipart, text, image
+        if not current_config("sip")["dialer"]:
+            find_python27()
+    except Exception as e:
+        logger.warning(f"⚠️ Warm-up fout: {e}")
+        return
+    logger.debug(f"🔥 Warm-up klaar in {(time.perf_counter() - started) * 1000:.0f}ms")
+
+def start_background_services(display_session=True):
+    """
+    Achtergrond taken die bij het starten van de service (per proces) lopen
+
+    Config bestand en netwerk status (LAN-only modus) bewaken, berichten
+    die nog in de MQTT outbox staan (vorige run, broker was weg) meteen
+    versturen in plaats van bij het eerstvolgende alarm, alarm acties
+    die een vorig proces niet afgemaakt heeft na replay_delay alsnog
+    uitvoeren, en de modules voor het eerste alarm vooraf laden (warm_up).
+
+    Args:
+        display_session (bool): requests sessie naar de pcReceiver opwarmen
+                                (False voor de async service, die aiohttp gebruikt)
+    """
+    config_manager.start_watching()
+    network_state.start()
+    mqtt_publisher.resume()
+    if ACTION_OUTBOX_CONFIG["enabled"]:
+        replay = threading.Timer(ACTION_OUTBOX_CONFIG["replay_delay"], replay_action_outbox)
+        replay.name = "OutboxReplay"
+        replay.daemon = True
+        replay.start()
+    threading.Thread(target=warm_up, args=(display_session,), name="WarmUp", daemon=True).start()
+
+def worker_post_fork(worker_id):
+    """
+    Per-worker initialisatie na een fork (gunicorn)
+
+    Gedeelde state die alleen in het geheugen leeft krijgt een eigen shard
+    per worker; de SQLite stores zijn al multi-process veilig (WAL) en hun
+    writer threads starten pas bij het eerste gebruik in de worker.
+    """
+    shard_id = f"w{worker_id}"
+    activity_stats.use_shard(shard_id)
+    request_recorder.use_shard(shard_id)
+    mqtt_publisher.use_shard(shard_id)
+    start_background_services()
+    logger.info(f"👷 Worker {worker_id} gestart (shard {shard_id})")
+
+def create_gunicorn_server(config):
+    """
+    🦄 GUNICORN SERVER
+
+    Embedded gunicorn applicatie met één gthread worker:
+        - threads gelijktijdige requests
+        - timeout: worker die langer dan zoveel seconden niet reageert wordt herstart
+        - graceful reload: kill -HUP <master pid> start een nieuwe worker voordat
+          de oude (na graceful_timeout) stopt - geen gemiste alarms
+
+    Beperking: de response caches, het coalescing venster, rate limits,
+    MQTT queue en metrics leven in het geheugen van het proces. Met meerdere
+    workers zou elke worker die state apart bijhouden (dubbele acties,
+    tellers die verspringen), dus workers wordt altijd op 1 gezet. Meer
+    gelijktijdigheid gaat via SERVER_CONFIG["threads"].
+
+    De worker importeert script.py zelf opnieuw van disk (load), zodat een
+    reload via SIGHUP ook gewijzigde code oppikt in plaats van het app
+    object dat de master bij het starten geladen had.
+    """
+    import importlib
+    from gunicorn.app.base import BaseApplication
+
+    if config["workers"] > 1:
+        logger.warning(f"⚠️  Gunicorn draait met 1 worker i.p.v. {config['workers']} "
+                       f"(caches en metrics zijn per proces) - verhoog threads")
+
+    def on_starting(server):
+        # Shards van een vorige run terugvouwen voordat er workers zijn
+        activity_stats.compact()
+
+    def child_exit(server, worker):
+        # Tellers van een gestopte worker bewaren in het basis bestand
+        activity_stats.compact([f"{STATS_CONFIG['state_file']}.w{worker.pid}"])
+
+    class WebhookApplication(BaseApplication):
+        def load_config(self):
+            options = {
+                "bind": f"{config['host']}:{config['port']}",
+                "workers": 1,
+                "worker_class": "gthread",
+                "threads": config["threads"],
+                "timeout": config["timeout"],
+                "graceful_timeout": config["graceful_timeout"],
+                "keepalive": config["keepalive"],
+                "on_starting": on_starting,
+                "child_exit": child_exit,
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Draait in de worker (ook na kill -HUP): verse import van script.py
+            sys.modules.pop("script", None)
+            module = importlib.import_module("script")
+            module.worker_post_fork(os.getpid())
+            return module.app
+
+    return WebhookApplication()
+
+def serve_waitress(config):
+    """🍽️ Waitress: één proces met een thread pool (ook op Windows bruikbaar)"""
+    from waitress import serve
+    if config["workers"] > 1:
+        logger.warning("⚠️  Waitress ondersteunt geen meerdere workers - gebruikt 1 proces")
+    serve(app, host=config["host"], port=config["port"], threads=config["threads"],
+          channel_timeout=config["timeout"])
+
+def serve_werkzeug(config):
+    """
+    🧰 WERKZEUG FALLBACK
+
+    Threaded Werkzeug server zonder debugger en reloader, voor als gunicorn en
+    waitress niet geïnstalleerd zijn. Requests krijgen een socket timeout;
+    SIGHUP doet een graceful reload (in-flight requests afronden, stores
+    flushen, proces opnieuw starten), SIGTERM een graceful stop.
+    """
+    from werkzeug.serving import make_server, WSGIRequestHandler
+
+    class TimeoutRequestHandler(WSGIRequestHandler):
+        timeout = config["timeout"]
+
+    if config["workers"] > 1:
+        logger.warning("⚠️  Werkzeug fallback ondersteunt geen meerdere workers - gebruikt 1 proces")
+
+    server = make_server(config["host"], config["port"], app, threaded=True,
+                         request_handler=TimeoutRequestHandler)
+    reload_requested = threading.Event()
+
+    def handle_signal(signum, frame):
+        if signum == signal.SIGHUP:
+            reload_requested.set()
+        # shutdown() wacht op serve_forever, dus vanuit een andere thread aanroepen
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    if hasattr(signal, 'SIGHUP'):
+        signal.signal(signal.SIGHUP, handle_signal)
+
+    server.serve_forever()
+    server.server_close()
+
+    # Achtergrond writers leegmaken voordat het proces eindigt of herstart
+    device_activity_store.stop()
+    activity_stats.save()
+
+    if reload_requested.is_set():
+        logger.info("🔄 Graceful reload - proces wordt opnieuw gestart")
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+    logger.info("🛑 Server netjes gestopt")
+
+def serve_production(config=None):
+    """
+    🚀 PRODUCTIE SERVER
+
+    Start script.py met een echte WSGI server in plaats van de Flask
+    development server (debugger + reloader).
+
+    Backend keuze (SERVER_CONFIG["backend"]):
+        auto:     gunicorn → waitress → werkzeug (eerste die beschikbaar is)
+        gunicorn: één worker, graceful reload via SIGHUP (Linux)
+        waitress: thread pool in één proces
+        werkzeug: threaded fallback zonder extra dependencies
+
+    Args:
+        config (dict, optional): Overrides voor SERVER_CONFIG
+    """
+    config = dict(SERVER_CONFIG, **(config or {}))
+    backend = config["backend"]
+
+    if backend == "auto":
+        for candidate in ("gunicorn", "waitress"):
+            try:
+                __import__(candidate)
+                backend = candidate
+                break
+            except ImportError:
+                continue
+        else:
+            backend = "werkzeug"
+
+    logger.info(f"🚀 Productie server: {backend} op {config['host']}:{config['port']} "
+                f"(workers={config['workers']}, threads={config['threads']}, timeout={config['timeout']}s)")
+
+    if backend == "gunicorn":
+        # Elke worker bewaakt het config bestand zelf (zie worker_post_fork)
+        create_gunicorn_server(config).run()
+    elif backend == "waitress":
+        start_background_services()
+        serve_waitress(config)
+    else:
+        start_background_services()
+        serve_werkzeug(config)
+
+
 # =============================================================================
 # MAIN - Script Entry Point
 # =============================================================================
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="UniFi Protect Webhook Service")
+    parser.add_argument("--dev", action="store_true",
+                        help="Flask development server (debugger + reloader) i.p.v. productie server")
+    parser.add_argument("--backend", choices=["auto", "gunicorn", "waitress", "werkzeug"],
+                        default=SERVER_CONFIG["backend"], help="Productie server backend")
+    parser.add_argument("--host", default=SERVER_CONFIG["host"])
+    parser.add_argument("--port", type=int, default=SERVER_CONFIG["port"])
+    parser.add_argument("--workers", type=int, default=SERVER_CONFIG["workers"],
+                        help="Genegeerd boven 1: state is per proces, gebruik --threads")
+    parser.add_argument("--threads", type=int, default=SERVER_CONFIG["threads"])
+    parser.add_argument("--timeout", type=int, default=SERVER_CONFIG["timeout"])
+    args = parser.parse_args()
+    
     print("🚀 UniFi Protect Webhook Service wordt gestart...")
     print("📡 Endpoints:")
     print("   - Webhook: http://localhost:5000/webhook")
     print("   - Gezondheid: http://localhost:5000/health")
     print("   - Logs: http://localhost:5000/logs")
     print("   - SIP Logs: http://localhost:5000/sip-logs")
+    print("   - Device Activity: http://localhost:5000/devices/activity")
+    print("   - Device Stats: http://localhost:5000/stats/devices")
+    print("   - Alarm Regels: http://localhost:5000/rules")
+    print("   - Configuratie: http://localhost:5000/config")
+    print("   - Metrics: http://localhost:5000/metrics")
+    print("   - Traces: http://localhost:5000/traces/recent")
+    print("   - CPU profiel: http://localhost:5000/admin/profile?seconds=10")
     print("   - Test Email: http://localhost:5000/test-email (POST)")
     print("📸 Foto Endpoints:")
     print("   - Foto Galerij: http://localhost:5000/photos")
@@ -1697,8 +6053,9 @@ if __name__ == '__main__':
     print("   - Foto API: http://localhost:5000/photos/api")
     
     # Toon email configuratie status
-    if EMAIL_CONFIG["enabled"]:
-        print(f"📧 Email notificaties ingeschakeld naar: {', '.join(EMAIL_CONFIG['to_emails'])}")
+    email_config = current_config("email")
+    if email_config["enabled"]:
+        print(f"📧 Email notificaties ingeschakeld naar: {', '.join(email_config['to_emails'])}")
     else:
         print("📧 Email notificaties uitgeschakeld")
     
@@ -1706,25 +6063,35 @@ if __name__ == '__main__':
     sip_py_path = os.path.join(os.path.dirname(__file__), "sip.py")
     sippy_py_path = os.path.join(os.path.dirname(__file__), "sippy.py")
     
-    if os.path.exists(sippy_py_path):
-        python27_path = find_python27()
-        if python27_path:
-            print(f"📞 SIP calls beschikbaar via sippy.py (Python 2.7)")
-            print(f"   Python 2.7: {python27_path}")
-            print(f"   Alarm calls naar: {SIP_CONFIG['alarm_number']}")
-        else:
-            print("⚠️  sippy.py gevonden maar Python 2.7 niet geïnstalleerd")
+    if current_config("sip")["dialer"]:
+        print(f"📞 SIP calls via dialer op {current_config('sip')['dialer']}")
+        print(f"   Alarm calls naar: {current_config('sip')['alarm_number']}")
+    elif os.path.exists(sippy_py_path):
+        # Python 2.7 zoeken start subprocessen: dat doet warm_up() na het opstarten
+        print(f"📞 SIP calls via sippy.py (Python 2.7 wordt op de achtergrond gezocht)")
+        print(f"   Alarm calls naar: {current_config('sip')['alarm_number']}")
     elif os.path.exists(sip_py_path):
         print(f"📞 SIP calls beschikbaar via sip.py (Python 3 + pjsua2)")
-        print(f"   Alarm calls naar: {SIP_CONFIG['alarm_number']}")
+        print(f"   Alarm calls naar: {current_config('sip')['alarm_number']}")
     else:
         print("📞 Geen SIP scripts gevonden (sip.py of sippy.py moet in dezelfde map staan)")
     
     print("💡 Gebruik Ctrl+C om te stoppen")
     
-    # Start de Flask server
-    app.run(
-        host='0.0.0.0',  # Luister op alle interfaces
-        port=5000,       # Standaard poort
-        debug=True       # Debug modus voor ontwikkeling
-    )
\ No newline at end of file
+    if args.dev:
+        # Flask development server - alleen voor ontwikkeling
+        start_background_services()
+        app.run(
+            host=args.host,  # Luister op alle interfaces
+            port=args.port,  # Standaard poort
+            debug=True       # Debug modus voor ontwikkeling
+        )
+    else:
+        serve_production({
+            "backend": args.backend,
+            "host": args.host,
+            "port": args.port,
+            "workers": args.workers,
+            "threads": args.threads,
+            "timeout": args.timeout
+        })
\ No newline at end of file
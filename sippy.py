@@ -13,6 +13,7 @@ import os
 import sys
 import socket
 import logging
+import json
 
 # Debug functie - zet dit op True voor uitgebreide logs
 debug = True
@@ -24,6 +25,20 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Trace id van de webhook service (script.py zet WEBHOOK_TRACE_ID) - komt in
+# elke log regel en als X-Trace-Id header in de INVITE
+trace_id = os.environ.get("WEBHOOK_TRACE_ID") or None
+
+class TraceLogFilter(logging.Filter):
+    """Zet [trace_id] voor elke log regel"""
+
+    def filter(self, record):
+        if trace_id:
+            record.msg = "[%s] %s" % (trace_id, record.msg)
+        return True
+
+logger.addFilter(TraceLogFilter())
+
 # =============================================================================
 # CONFIGURATIE - Pas deze waarden aan naar jouw setup
 # =============================================================================
@@ -38,10 +53,17 @@ auto_call_on_start = True     # Maak automatisch call bij opstarten
 call_duration = 15            # Hoe lang de call moet duren (seconden)
 call_delay_on_start = 0.5       # Wacht tijd voor eerste call (seconden)
 
+# Dialer modus (--serve host:poort): blijft geregistreerd en belt op verzoek
+# van script.py in plaats van na één call af te sluiten
+serve_address = None
+max_call_seconds = 60         # Langer "actief" = call als vastgelopen beschouwen
+
 # Globale variabelen
 call_active = False
 lib = None
 acc = None
+call_started = None
+current_call = None
 
 
 # Callback om inkomende oproepen te behandelen
@@ -73,19 +95,20 @@ class MyCallCallback(pj.CallCallback):
         if debug:
             logger.debug("Call is %s, last code = %s (%s)", self.call.info().state_text, self.call.info().last_code, self.call.info().last_reason)
         
+        if call_started is not None and self.call.info().state in (pj.CallState.EARLY, pj.CallState.CONFIRMED):
+            logger.info("INVITE -> %s na %.0f ms", self.call.info().state_text, (time.time() - call_started) * 1000)
+        
         # Check voor geweigerde call (486 Busy Here)
         if self.call.info().last_code == 486:
             logger.info("Call werd geweigerd (486 Busy Here)")
             self.hangup_call()
-            time.sleep(1)
-            os._exit(0)
+            call_finished()
         
         # Check voor normale disconnection
         if self.call.info().state == pj.CallState.DISCONNECTED:
             logger.info("Call beëindigd - status: %s", self.call.info().last_reason)
             call_active = False
-            time.sleep(1)
-            os._exit(0)
+            call_finished()
 
     def on_media_state(self):
         if self.call.info().media_state == pj.MediaState.ACTIVE:
@@ -100,8 +123,7 @@ class MyCallCallback(pj.CallCallback):
             
             # Hang de oproep direct op
             self.hangup_call()
-            time.sleep(1)
-            os._exit(0)
+            call_finished()
 
     def hangup_call(self):
         if self.call:
@@ -112,6 +134,17 @@ class MyCallCallback(pj.CallCallback):
 
 
 
+def call_finished():
+    """
+    Call klaar: los proces stopt, de dialer wacht op het volgende verzoek
+    """
+    global call_active, current_call
+    time.sleep(1)
+    if serve_address is None:
+        os._exit(0)
+    call_active = False
+    current_call = None
+
 def make_call(extension=None):
     """
     Maak een SIP call naar het opgegeven extension
@@ -119,7 +152,7 @@ def make_call(extension=None):
     Args:
         extension: Telefoonnummer om te bellen (gebruikt selected_extension als None)
     """
-    global call_active, acc
+    global call_active, acc, call_started, current_call
     
     if call_active:
         logger.warning("Call al actief, kan geen nieuwe call starten")
@@ -134,7 +167,9 @@ def make_call(extension=None):
     
     try:
         logger.info("Bel naar: %s", uri)
-        call = acc.make_call(uri, MyCallCallback())
+        call_started = time.time()
+        hdr_list = [("X-Trace-Id", trace_id)] if trace_id else None
+        current_call = acc.make_call(uri, MyCallCallback(), hdr_list=hdr_list)
         call_active = True
         logger.info("Call gestart naar %s", target_extension)
         return True
@@ -144,6 +179,58 @@ def make_call(extension=None):
         call_active = False
         return False
 
+def serve(address):
+    """
+    Dialer modus: wacht op call verzoeken van script.py
+
+    Elk verzoek is een JSON datagram op address ("host:poort"), bijv.
+    {"trace_id": "..."} of {"ping": true}; het antwoord gaat terug naar de
+    afzender: {"ok": true} of {"ok": false, "error": "..."}.
+    """
+    global trace_id, call_active, current_call
+
+    host, _, port = address.rpartition(":")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host or "127.0.0.1", int(port)))
+    sock.settimeout(1.0)
+    logger.info("SIP dialer luistert op %s", address)
+
+    while True:
+        # Een call zonder DISCONNECTED callback mag de dialer niet blokkeren
+        if call_active and call_started is not None and time.time() - call_started > max_call_seconds:
+            logger.warning("Call langer dan %d seconden actief, vrijgeven", max_call_seconds)
+            try:
+                if current_call is not None:
+                    current_call.hangup()
+            except pj.Error:
+                pass
+            call_active = False
+            current_call = None
+
+        try:
+            data, sender = sock.recvfrom(4096)
+        except socket.timeout:
+            continue
+
+        try:
+            request = json.loads(data.decode("utf-8")) if data.strip() else {}
+        except ValueError:
+            request = None
+        if not isinstance(request, dict):
+            reply = {"ok": False, "error": "ongeldig verzoek"}
+        elif request.get("ping"):
+            reply = {"ok": acc is not None and acc.info().reg_status == 200, "call_active": call_active}
+        else:
+            trace_id = request.get("trace_id") or None
+            if make_call(request.get("extension")):
+                reply = {"ok": True}
+            else:
+                reply = {"ok": False, "error": "call al actief" if call_active else "call mislukt"}
+        try:
+            sock.sendto(json.dumps(reply).encode("utf-8"), sender)
+        except socket.error as e:
+            logger.warning("Antwoord naar %s mislukt: %s", sender, e)
+
 def run():
     """
     Hoofdfunctie die de SIP service opstart
@@ -180,10 +267,13 @@ def run():
 
         # Wacht op registratie
         logger.info("Wacht op SIP registratie...")
-        time.sleep(2)
+        register_started = time.time()
+        while acc.info().reg_status != 200 and time.time() - register_started < 2:
+            time.sleep(0.05)
 
         if acc.info().reg_status == 200:
-            logger.info("SIP registratie succesvol: %s (%s)", acc.info().reg_status, acc.info().reg_reason)
+            logger.info("SIP registratie succesvol: %s (%s) na %.0f ms", acc.info().reg_status, acc.info().reg_reason,
+                        (time.time() - register_started) * 1000)
             
             # Maak automatisch een call bij opstarten als ingeschakeld
             if auto_call_on_start:
@@ -199,6 +289,8 @@ def run():
         # Houd de hoofdthread actief
         logger.info("SIP service actief. Gebruik Ctrl+C om te stoppen.")
         try:
+            if serve_address is not None:
+                serve(serve_address)
             while True:
                 time.sleep(1)
         except KeyboardInterrupt:
@@ -233,11 +325,17 @@ def main():
     parser.add_argument('--duration', type=int, help='Call duur in seconden (overschrijft default)')
     parser.add_argument('--no-auto-call', action='store_true', help='Geen automatische call bij start')
     parser.add_argument('--delay', type=int, help='Wacht tijd voor eerste call in seconden')
+    parser.add_argument('--trace-id', help='Trace id voor logs en X-Trace-Id header (default: WEBHOOK_TRACE_ID)')
+    parser.add_argument('--serve', metavar='HOST:POORT',
+                        help='Dialer modus: geregistreerd blijven en bellen op verzoek (supervisor.py)')
     
     args = parser.parse_args()
     
     # Overschrijf configuratie met command-line argumenten
-    global selected_extension, call_duration, auto_call_on_start, call_delay_on_start
+    global selected_extension, call_duration, auto_call_on_start, call_delay_on_start, trace_id, serve_address
+    
+    if args.trace_id:
+        trace_id = args.trace_id
     
     if args.extension:
         selected_extension = args.extension
@@ -247,6 +345,11 @@ def main():
         call_duration = args.duration
         logger.info("Call duur overschreven via command-line: %d seconden", call_duration)
         
+    if args.serve:
+        serve_address = args.serve
+        auto_call_on_start = False
+        logger.info("Dialer modus op %s", serve_address)
+        
     if args.no_auto_call:
         auto_call_on_start = False
         logger.info("Automatische call uitgeschakeld via command-line")
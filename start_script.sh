@@ -39,9 +39,14 @@ if [ ! -f "script.py" ]; then
     exit 1
 fi
 
-# Start script.py met logging
-echo "Starting script.py with python3..." >> startup.log
-python3 script.py >> script_output.log 2>&1 &
+# Start script.py met logging (productie WSGI server, zie SERVER_CONFIG)
+# Graceful reload: kill -HUP $(cat script.pid)
+# SERVER_WORKERS blijft 1: caches en metrics zijn per proces (meer via SERVER_THREADS)
+SERVER_BACKEND="${SERVER_BACKEND:-auto}"
+SERVER_WORKERS="${SERVER_WORKERS:-1}"
+SERVER_THREADS="${SERVER_THREADS:-8}"
+echo "Starting script.py with python3 (backend=$SERVER_BACKEND, workers=$SERVER_WORKERS, threads=$SERVER_THREADS)..." >> startup.log
+python3 script.py --backend "$SERVER_BACKEND" --workers "$SERVER_WORKERS" --threads "$SERVER_THREADS" >> script_output.log 2>&1 &
 
 # Log de PID
 echo "Script.py started with PID: $!" >> startup.log
@@ -0,0 +1,638 @@
+#!/usr/bin/env python3
+"""
+Supervisor
+
+Eén proces dat script.py, pcReceiver.py en de SIP dialer (sippy.py --serve)
+als langlopende child processen beheert, in plaats van de keten
+systemd → wifi_monitor.py → start_script.sh → python3 script.py & (PID in
+een bestand) en een nieuw Python 2.7 proces per alarm:
+
+    • Herstart met exponentiële backoff (initial × multiplier^n, max
+      max_delay); een child die langer dan reset_after draaide begint
+      weer bij initial
+    • Crash-loop detectie: max_restarts starts binnen window seconden →
+      status "crash_loop", hold_off seconden wachten en dan opnieuw
+    • stdout/stderr van elke child regel voor regel naar een eigen roterend
+      logbestand (<log_dir>/<naam>.log), met tijd en stream ervoor
+    • CPU% en RSS per child, inclusief zijn eigen child processen
+      (gunicorn workers), uit /proc - geen ps of psutil nodig
+    • Control socket (één regel per verzoek, JSON antwoord):
+        python3 supervisor.py ctl status
+        python3 supervisor.py ctl restart script
+        python3 supervisor.py ctl stop sip_dialer
+        python3 supervisor.py ctl start sip_dialer
+
+Configuratie: supervisor.toml naast dit script (of $SUPERVISOR_CONFIG) en
+SUPERVISOR_<SECTIE>__<SLEUTEL> env variabelen, zie supervisor.example.toml.
+Wijzigingen in [children] worden zonder herstart toegepast.
+"""
+
+import json
+import logging
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+
+try:
+    from socketserver import ThreadingUnixStreamServer
+except ImportError:
+    ThreadingUnixStreamServer = None  # Windows: alleen "host:poort"
+
+# Systemd watchdog support
+try:
+    from systemd import daemon
+    SYSTEMD_AVAILABLE = True
+except ImportError:
+    SYSTEMD_AVAILABLE = False
+
+# Externe configuratie (config_loader.py naast dit script)
+try:
+    from config_loader import ConfigManager
+except ImportError:
+    ConfigManager = None
+
+logger = logging.getLogger("supervisor")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CONFIG_FILE = os.environ.get("SUPERVISOR_CONFIG", os.path.join(BASE_DIR, "supervisor.toml"))
+
+SUPERVISOR_DEFAULTS = {
+    "supervisor": {
+        # "unix:/pad/socket" of "host:poort"
+        "control": (f"unix:{os.path.join(BASE_DIR, 'supervisor.sock')}" if os.name != 'nt'
+                    else "127.0.0.1:8732"),
+        "log_dir": os.path.join(BASE_DIR, "logs"),
+        "log_max_bytes": 5 * 1024 * 1024,
+        "log_backups": 3,
+        "sample_interval": 5.0,       # CPU/RSS meting uit /proc (s)
+        "stop_timeout": 10.0          # SIGTERM → SIGKILL na zoveel seconden
+    },
+    "backoff": {
+        "initial": 1.0,
+        "multiplier": 2.0,
+        "max_delay": 60.0,
+        "reset_after": 60.0           # Zo lang gedraaid = geen crash, backoff opnieuw vanaf initial
+    },
+    "crash_loop": {
+        "max_restarts": 5,            # Zoveel starts ...
+        "window": 120.0,              # ... binnen dit venster (s) = crash loop
+        "hold_off": 300.0             # Daarna zo lang (s) niet meer starten
+    },
+    # naam → child; extra children mogen erbij (zie CHILD_DEFAULTS)
+    "children": {
+        "script": {
+            "enabled": True,
+            "command": ["python3", "script.py", "--backend", "auto"]
+        },
+        "sip_dialer": {
+            # Eén SIP registratie voor alle calls; zet in script.py sip.dialer = "127.0.0.1:5071"
+            "enabled": False,
+            "command": ["python2.7", "sippy.py", "--serve", "127.0.0.1:5071"],
+            "env": {"LD_LIBRARY_PATH": "/usr/local/lib:/usr/lib"}
+        },
+        "pc_receiver": {
+            # Draait normaal op de PC zelf: daar de supervisor met alleen deze child starten
+            "enabled": False,
+            "command": ["python3", "pcReceiver.py"]
+        }
+    }
+}
+
+CHILD_DEFAULTS = {
+    "enabled": True,
+    "command": [],
+    "cwd": "",                        # Leeg = map van dit script
+    "env": {}                         # Extra environment variabelen
+}
+
+if ConfigManager is not None:
+    config_manager = ConfigManager(SUPERVISOR_DEFAULTS, path=CONFIG_FILE, env_prefix="SUPERVISOR")
+else:
+    config_manager = None
+
+def supervisor_config(section):
+    """Actieve config sectie"""
+    if config_manager is None:
+        return SUPERVISOR_DEFAULTS[section]
+    return config_manager.section(section)
+
+def child_specs():
+    """naam → volledige child spec (CHILD_DEFAULTS aangevuld met de config)"""
+    return {name: dict(CHILD_DEFAULTS, **spec) for name, spec in supervisor_config("children").items()}
+
+# /proc (Linux) ------------------------------------------------------------
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def read_proc_stat(pid):
+    """
+    (ppid, utime+stime in ticks, rss in bytes) uit /proc/<pid>/stat, of None
+
+    De procesnaam staat tussen haakjes en mag spaties bevatten, dus er wordt
+    vanaf de laatste ")" gesplitst.
+    """
+    try:
+        with open(f"/proc/{pid}/stat", "rb") as f:
+            data = f.read().decode("ascii", "replace")
+    except OSError:
+        return None
+    fields = data[data.rfind(")") + 2:].split()
+    try:
+        return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21]) * PAGE_SIZE
+    except (IndexError, ValueError):
+        return None
+
+def process_tree_usage(pid):
+    """
+    CPU ticks en RSS van een proces plus al zijn nakomelingen
+
+    Returns:
+        tuple: (ticks, rss_bytes, aantal processen), of None zonder /proc
+    """
+    if not os.path.isdir("/proc"):
+        return None
+    stats = {}
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            stat = read_proc_stat(entry)
+            if stat is not None:
+                stats[int(entry)] = stat
+    if pid not in stats:
+        return None
+    children = {}
+    for child_pid, (ppid, _, _) in stats.items():
+        children.setdefault(ppid, []).append(child_pid)
+    ticks = rss = count = 0
+    todo = [pid]
+    while todo:
+        current = todo.pop()
+        _, current_ticks, current_rss = stats[current]
+        ticks += current_ticks
+        rss += current_rss
+        count += 1
+        todo.extend(children.get(current, ()))
+    return ticks, rss, count
+
+# Children -----------------------------------------------------------------
+
+class Child:
+    """
+    Eén beheerd proces
+
+    state: stopped, running, backoff (wacht op herstart), crash_loop
+    (hold_off na te veel herstarts) of stopping.
+    """
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.spec = spec
+        self.process = None
+        self.state = "stopped"
+        self.wanted = False
+        self.started_at = None
+        self.next_start = 0.0
+        self.starts = 0
+        self.restarts = 0
+        self.failures = 0
+        self.recent_starts = deque()
+        self.crash_loops = 0
+        self.last_exit = None
+        self.last_exit_at = None
+        self.last_error = None
+        self.cpu_percent = None
+        self.rss_bytes = None
+        self.processes = None
+        self._cpu_sample = None
+        self.log = self._make_logger()
+
+    def _make_logger(self):
+        settings = supervisor_config("supervisor")
+        os.makedirs(settings["log_dir"], exist_ok=True)
+        child_logger = logging.getLogger(f"supervisor.child.{self.name}")
+        child_logger.propagate = False
+        child_logger.setLevel(logging.INFO)
+        for handler in list(child_logger.handlers):
+            child_logger.removeHandler(handler)
+            handler.close()
+        handler = RotatingFileHandler(os.path.join(settings["log_dir"], f"{self.name}.log"),
+                                      maxBytes=settings["log_max_bytes"],
+                                      backupCount=settings["log_backups"], encoding="utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s [%(stream)s] %(message)s"))
+        child_logger.addHandler(handler)
+        return child_logger
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def spawn(self):
+        """Start het proces; stdout/stderr gaan via pump threads naar het logbestand"""
+        cwd = self.spec["cwd"] or BASE_DIR
+        env = dict(os.environ, **{key: str(value) for key, value in self.spec["env"].items()})
+        env["PYTHONUNBUFFERED"] = "1"  # Regels direct in het log, niet pas bij een volle buffer
+        now = time.monotonic()
+        self.starts += 1
+        self.recent_starts.append(now)
+        try:
+            self.process = subprocess.Popen(
+                list(self.spec["command"]), cwd=cwd, env=env,
+                stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                start_new_session=True  # Eigen proces groep: stop() raakt ook de kleinkinderen
+            )
+        except OSError as e:
+            self.process = None
+            self.started_at = None
+            self.last_error = str(e)
+            logger.error(f"❌ {self.name} niet gestart: {e}")
+            self.log.error(f"start mislukt: {e}", extra={"stream": "supervisor"})
+            return False
+        self.state = "running"
+        self.started_at = now
+        self.last_error = None
+        self._cpu_sample = None
+        self.log.info(f"gestart: {' '.join(self.spec['command'])} (pid {self.process.pid})",
+                      extra={"stream": "supervisor"})
+        for stream, pipe in (("stdout", self.process.stdout), ("stderr", self.process.stderr)):
+            threading.Thread(target=self._pump, args=(stream, pipe),
+                             name=f"log-{self.name}-{stream}", daemon=True).start()
+        logger.info(f"🚀 {self.name} gestart (pid {self.process.pid})")
+        return True
+
+    def _pump(self, stream, pipe):
+        with pipe:
+            for line in iter(pipe.readline, b""):
+                self.log.info(line.decode("utf-8", "replace").rstrip("\r\n"), extra={"stream": stream})
+
+    def signal_group(self, signum):
+        if self.process is None:
+            return
+        try:
+            if os.name == 'nt':
+                self.process.kill()
+            else:
+                os.killpg(self.process.pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def stop(self, timeout):
+        """SIGTERM naar de proces groep, na timeout SIGKILL"""
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.state = "stopping"
+        self.signal_group(signal.SIGTERM)
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"⚠️  {self.name} reageert niet op SIGTERM, SIGKILL")
+            self.signal_group(signal.SIGKILL)
+            self.process.wait()
+        self.log.info(f"gestopt (exit {self.process.returncode})", extra={"stream": "supervisor"})
+
+    def schedule_restart(self, now):
+        """Na een exit: backoff of crash_loop bepalen"""
+        backoff = supervisor_config("backoff")
+        crash_loop = supervisor_config("crash_loop")
+        if self.started_at is not None and now - self.started_at >= backoff["reset_after"]:
+            self.failures = 0
+        self.failures += 1
+        while self.recent_starts and now - self.recent_starts[0] > crash_loop["window"]:
+            self.recent_starts.popleft()
+        if len(self.recent_starts) >= crash_loop["max_restarts"]:
+            self.state = "crash_loop"
+            self.crash_loops += 1
+            self.next_start = now + crash_loop["hold_off"]
+            self.recent_starts.clear()
+            logger.critical(f"🔥 {self.name}: {crash_loop['max_restarts']} starts binnen "
+                            f"{crash_loop['window']:.0f}s - crash loop, volgende poging over "
+                            f"{crash_loop['hold_off']:.0f}s")
+        else:
+            delay = min(backoff["initial"] * backoff["multiplier"] ** (self.failures - 1), backoff["max_delay"])
+            self.state = "backoff"
+            self.next_start = now + delay
+            logger.warning(f"⚠️  {self.name} gestopt (exit {self.last_exit}), herstart over {delay:.1f}s")
+
+    def sample(self, now):
+        """CPU% sinds de vorige meting en RSS, uit /proc"""
+        if self.state != "running" or self.pid is None:
+            self.cpu_percent = self.rss_bytes = self.processes = None
+            return
+        usage = process_tree_usage(self.pid)
+        if usage is None:
+            return
+        ticks, self.rss_bytes, self.processes = usage
+        if self._cpu_sample is not None:
+            previous_ticks, previous_time = self._cpu_sample
+            elapsed = now - previous_time
+            if elapsed > 0:
+                self.cpu_percent = max(0.0, (ticks - previous_ticks) / CLOCK_TICKS / elapsed * 100)
+        self._cpu_sample = (ticks, now)
+
+    def get_status(self, now):
+        return {
+            "state": self.state,
+            "wanted": self.wanted,
+            "pid": self.pid if self.state in ("running", "stopping") else None,
+            "command": list(self.spec["command"]),
+            "uptime_seconds": round(now - self.started_at, 1) if self.state == "running" else None,
+            "starts": self.starts,
+            "restarts": self.restarts,
+            "consecutive_failures": self.failures,
+            "crash_loops": self.crash_loops,
+            "next_start_in": (round(max(self.next_start - now, 0), 1)
+                              if self.state in ("backoff", "crash_loop") else None),
+            "last_exit": self.last_exit,
+            "last_exit_at": self.last_exit_at,
+            "last_error": self.last_error,
+            "cpu_percent": None if self.cpu_percent is None else round(self.cpu_percent, 1),
+            "rss_bytes": self.rss_bytes,
+            "processes": self.processes
+        }
+
+class Supervisor:
+    """
+    Beheert alle children vanuit één thread (tick elke 0.5s); de control
+    socket en config reloads passen alleen de gewenste toestand aan onder
+    de lock, of stoppen een child direct.
+    """
+
+    TICK = 0.5
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.children = {}
+        self.started = time.time()
+        self.stop_event = threading.Event()
+        self.control_server = None
+        self._last_sample = 0.0
+
+    def reconcile(self):
+        """
+        Children in lijn brengen met de config (nieuw, verwijderd, gewijzigd)
+
+        Alleen een child waarvan de eigen spec wijzigde (of die ingeschakeld
+        werd) wordt (her)gestart: een child die met "ctl stop" of door
+        wifi_monitor gestopt is blijft gestopt bij een wijziging van een
+        andere child.
+        """
+        specs = child_specs()
+        with self.lock:
+            for name in list(self.children):
+                child = self.children[name]
+                spec = specs.get(name)
+                if spec is None or not spec["enabled"]:
+                    if child.wanted:
+                        logger.info(f"🛑 {name} uit de config gehaald of uitgeschakeld")
+                        self._stop_child(child)
+                    if spec is None:
+                        del self.children[name]
+                    else:
+                        child.spec = spec
+                elif spec != child.spec:
+                    logger.info(f"🔄 Config van {name} gewijzigd, herstart" if child.spec["enabled"]
+                                else f"▶️  {name} ingeschakeld")
+                    self._stop_child(child)
+                    child.spec = spec
+                    child.wanted = True
+                    child.next_start = 0.0
+            for name, spec in specs.items():
+                if name not in self.children:
+                    child = self.children[name] = Child(name, spec)
+                    child.wanted = spec["enabled"]
+
+    def _stop_child(self, child):
+        child.wanted = False
+        child.stop(supervisor_config("supervisor")["stop_timeout"])
+        child.state = "stopped"
+
+    def tick(self):
+        now = time.monotonic()
+        with self.lock:
+            for child in self.children.values():
+                if child.state == "running" and child.process.poll() is not None:
+                    child.last_exit = child.process.returncode
+                    child.last_exit_at = time.time()
+                    child.log.info(f"beëindigd (exit {child.last_exit})", extra={"stream": "supervisor"})
+                    if child.wanted:
+                        child.schedule_restart(now)
+                    else:
+                        child.state = "stopped"
+                if child.wanted and child.state in ("stopped", "backoff", "crash_loop") and now >= child.next_start:
+                    if child.state != "stopped":
+                        child.restarts += 1
+                    if not child.spawn():
+                        child.last_exit = None
+                        child.schedule_restart(now)
+            if now - self._last_sample >= supervisor_config("supervisor")["sample_interval"]:
+                self._last_sample = now
+                for child in self.children.values():
+                    child.sample(now)
+
+    def run(self):
+        """Hoofd lus tot stop_event gezet is; daarna alle children stoppen"""
+        self.reconcile()
+        while not self.stop_event.wait(self.TICK):
+            self.tick()
+            if SYSTEMD_AVAILABLE:
+                daemon.notify('WATCHDOG=1')
+        self.shutdown()
+
+    def shutdown(self):
+        logger.info("🛑 Supervisor stopt alle children...")
+        with self.lock:
+            for child in self.children.values():
+                self._stop_child(child)
+        if self.control_server is not None:
+            self.control_server.shutdown()
+            self.control_server.server_close()
+            control = supervisor_config("supervisor")["control"]
+            if control.startswith("unix:") and os.path.exists(control[len("unix:"):]):
+                os.remove(control[len("unix:"):])
+
+    # Control commando's ---------------------------------------------------
+
+    def command(self, line):
+        """
+        Voer één control commando uit
+
+        Returns:
+            dict: Antwoord (altijd met "ok")
+        """
+        parts = line.split()
+        if not parts:
+            return {"ok": False, "error": "leeg commando"}
+        action, names = parts[0].lower(), parts[1:]
+        if action == "status":
+            return dict(self.get_status(), ok=True)
+        if action not in ("start", "stop", "restart"):
+            return {"ok": False, "error": f"onbekend commando '{action}' (status, start, stop, restart)"}
+        with self.lock:
+            if not names or names == ["all"]:
+                names = list(self.children)
+            unknown = [name for name in names if name not in self.children]
+            if unknown:
+                return {"ok": False, "error": f"onbekende child: {', '.join(unknown)}"}
+            for name in names:
+                child = self.children[name]
+                logger.info(f"🎛️  Control: {action} {name}")
+                if action in ("stop", "restart"):
+                    self._stop_child(child)
+                if action in ("start", "restart"):
+                    # Handmatig (her)starten heft backoff en crash loop op
+                    child.wanted = True
+                    child.state = "stopped"
+                    child.next_start = 0.0
+                    child.failures = 0
+                    child.recent_starts.clear()
+        self.tick()
+        return {"ok": True, "children": {name: self.children[name].get_status(time.monotonic())
+                                         for name in names}}
+
+    def get_status(self):
+        now = time.monotonic()
+        with self.lock:
+            return {
+                "pid": os.getpid(),
+                "uptime_seconds": round(time.time() - self.started, 1),
+                "children": {name: child.get_status(now) for name, child in self.children.items()}
+            }
+
+supervisor = Supervisor()
+
+class ControlRequestHandler(StreamRequestHandler):
+    """Eén regel commando in, één regel JSON uit"""
+
+    def handle(self):
+        line = self.rfile.readline(4096).decode("utf-8", "replace").strip()
+        try:
+            reply = supervisor.command(line)
+        except Exception as e:
+            logger.error(f"❌ Control commando '{line}' fout: {e}")
+            reply = {"ok": False, "error": str(e)}
+        self.wfile.write(json.dumps(reply).encode("utf-8") + b"\n")
+
+class ThreadingControlTCPServer(ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+if ThreadingUnixStreamServer is not None:
+    class ThreadingControlUnixServer(ThreadingUnixStreamServer):
+        daemon_threads = True
+
+def split_address(address, default_port=8732):
+    """"host:poort" → (host, poort)"""
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, default_port
+    return host, int(port)
+
+def start_control_server(control):
+    """Start de control socket in een achtergrond thread"""
+    if control.startswith("unix:"):
+        path = control[len("unix:"):]
+        if os.path.exists(path):
+            os.remove(path)
+        server = ThreadingControlUnixServer(path, ControlRequestHandler)
+        os.chmod(path, 0o660)  # Alleen eigenaar en groep mogen children stoppen
+    else:
+        server = ThreadingControlTCPServer(split_address(control), ControlRequestHandler)
+    threading.Thread(target=server.serve_forever, name="SupervisorControl", daemon=True).start()
+    logger.info(f"🎛️  Control socket op {control}")
+    return server
+
+def control_request(command, control=None, timeout=15.0):
+    """
+    Stuur één commando naar een draaiende supervisor
+
+    Returns:
+        dict: Antwoord van de supervisor
+
+    Raises:
+        OSError: Supervisor niet bereikbaar
+    """
+    control = supervisor_config("supervisor")["control"] if control is None else control
+    if control.startswith("unix:"):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        sock.connect(control[len("unix:"):])
+    else:
+        sock = socket.create_connection(split_address(control), timeout=timeout)
+    with sock:
+        sock.sendall(command.encode("utf-8") + b"\n")
+        with sock.makefile("rb") as reply:
+            return json.loads(reply.readline().decode("utf-8"))
+
+def setup_logging():
+    settings = supervisor_config("supervisor")
+    os.makedirs(settings["log_dir"], exist_ok=True)
+    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+    file_handler = RotatingFileHandler(os.path.join(settings["log_dir"], "supervisor.log"),
+                                       maxBytes=settings["log_max_bytes"],
+                                       backupCount=settings["log_backups"], encoding="utf-8")
+    stream_handler = logging.StreamHandler()  # journalctl -u ...
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+def on_children_config_change(old, new):
+    supervisor.reconcile()
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Supervisor voor script.py, pcReceiver.py en de SIP dialer")
+    parser.add_argument("ctl", nargs="*", metavar="ctl COMMANDO",
+                        help="Control commando naar een draaiende supervisor, bijv. 'ctl status'")
+    args = parser.parse_args()
+
+    if config_manager is not None:
+        config_manager.load()
+
+    if args.ctl:
+        if args.ctl[0] != "ctl" or len(args.ctl) < 2:
+            parser.error("gebruik: supervisor.py ctl status|start|stop|restart [naam ...]")
+        try:
+            reply = control_request(" ".join(args.ctl[1:]))
+        except OSError as e:
+            print(f"Supervisor niet bereikbaar: {e}", file=sys.stderr)
+            sys.exit(2)
+        print(json.dumps(reply, indent=2))
+        sys.exit(0 if reply.get("ok") else 1)
+
+    setup_logging()
+
+    def handle_signal(signum, frame):
+        logger.info(f"🛑 {'SIGTERM' if signum == signal.SIGTERM else 'SIGINT'} ontvangen")
+        supervisor.stop_event.set()
+
+    signal.signal(signal.SIGTERM, handle_signal)
+    signal.signal(signal.SIGINT, handle_signal)
+
+    logger.info(f"✅ Supervisor gestart (pid {os.getpid()})")
+    if config_manager is not None:
+        config_manager.subscribe("children", on_children_config_change)
+        config_manager.start_watching()
+    try:
+        supervisor.control_server = start_control_server(supervisor_config("supervisor")["control"])
+    except OSError as e:
+        logger.error(f"❌ Control socket niet gestart: {e}")
+    if SYSTEMD_AVAILABLE:
+        daemon.notify('READY=1')
+    supervisor.run()
+    if config_manager is not None:
+        config_manager.stop_watching()
+    if SYSTEMD_AVAILABLE:
+        daemon.notify('STOPPING=1')
+    logger.info("✅ Supervisor netjes afgesloten")
+
+if __name__ == "__main__":
+    main()
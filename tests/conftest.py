@@ -0,0 +1,29 @@
+"""
+Gedeelde test setup
+
+script.py, pcReceiver.py en wifi_monitor.py maken bij het importeren al
+bestanden aan in de working directory (webhook.log, databases,
+received_photos). De tests draaien daarom in een eigen temp map, met alle
+externe acties (email, PC display, MQTT, notificaties) uitgeschakeld via de
+env overrides van config_loader.
+"""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="webhook_tests_")
+
+sys.path.insert(0, ROOT)
+os.chdir(WORKDIR)
+os.environ.update({
+    "WEBHOOK_CONFIG": os.path.join(WORKDIR, "webhook_config.toml"),
+    "WEBHOOK_EMAIL__ENABLED": "false",
+    "WEBHOOK_PC_DISPLAY__ENABLED": "false",
+    "WEBHOOK_MQTT__ENABLED": "false",
+    "WEBHOOK_NOTIFY__ENABLED": "false",
+    "WEBHOOK_LOXONE__IP": "127.0.0.1",
+    "WIFI_MONITOR_CONFIG": os.path.join(WORKDIR, "wifi_monitor.toml"),
+    "WIFI_MONITOR_PATHS__LOG_FILE": os.path.join(WORKDIR, "wifi_monitor.log"),
+})
@@ -0,0 +1,155 @@
+"""Action outbox met echte UniFi Protect payloads (inclusief thumbnail)"""
+
+import asyncio
+import base64
+import concurrent.futures
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+from PIL import Image
+
+import async_webhook
+import script
+
+run_alarm_action = script.run_alarm_action
+
+
+def make_thumbnail():
+    image = Image.frombytes('RGB', (320, 180), os.urandom(320 * 180 * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+THUMBNAIL = make_thumbnail()
+
+
+def unifi_payload(event_id):
+    return {
+        "alarm": {
+            "name": "Beweging oprit",
+            "sources": [{"device": "28704E113F33", "type": "include"}],
+            "conditions": [{"condition": {"type": "is", "source": "motion"}}],
+            "triggers": [{"key": "motion", "device": "28704E113F33", "eventId": event_id,
+                          "timestamp": 1729512345678}],
+            "thumbnail": THUMBNAIL,
+        },
+        "timestamp": 1729512345901,
+    }
+
+
+@pytest.fixture
+def outbox(monkeypatch, tmp_path):
+    """Eigen outbox database; uitgevoerde acties komen in de lijst (type, thumbnail)"""
+    executed = []
+
+    def run_action(action, context):
+        executed.append((action["type"], script.image_text(script.context_thumbnail(context))))
+        return True
+
+    monkeypatch.setitem(script.ACTION_OUTBOX_CONFIG, "db_path", str(tmp_path / "action_outbox.db"))
+    monkeypatch.setattr(script.action_outbox, "conn", None)
+    monkeypatch.setitem(script.DEDUP_CONFIG, "enabled", False)
+    monkeypatch.setattr(script, "run_alarm_action", run_action)
+    monkeypatch.setattr(async_webhook, "run_alarm_action_async", lambda app, action, context:
+                        run_action(action, context))
+    monkeypatch.setattr(script, "unreachable_target", lambda action: None)
+    return executed
+
+
+def outbox_rows():
+    conn = sqlite3.connect(script.ACTION_OUTBOX_CONFIG["db_path"])
+    try:
+        alarms = conn.execute("SELECT alarm, triggers, thumbnail FROM outbox_alarms").fetchall()
+        statuses = [row[0] for row in conn.execute("SELECT status FROM outbox_actions")]
+    finally:
+        conn.close()
+    return alarms, statuses
+
+
+def test_flask_webhook_with_thumbnail_records_actions(outbox):
+    response = script.app.test_client().post('/webhook', json=unifi_payload("flask"))
+
+    assert response.status_code == 200
+    assert script.action_outbox.errors == 0
+    assert ("display", THUMBNAIL) in outbox
+    alarms, statuses = outbox_rows()
+    assert len(alarms) == 1
+    alarm, triggers, thumbnail = alarms[0]
+    # Foto alleen in de thumbnail kolom
+    assert thumbnail == THUMBNAIL
+    assert "data:image" not in alarm and "thumbnail" not in json.loads(alarm)
+    assert json.loads(alarm)["name"] == "Beweging oprit"
+    assert json.loads(triggers)[0]["eventId"] == "flask"
+    assert statuses and set(statuses) == {"done"}
+
+
+def test_async_webhook_with_thumbnail_records_actions(outbox):
+    async def post():
+        client = TestClient(TestServer(async_webhook.create_app()))
+        await client.start_server()
+        try:
+            async with client.post('/webhook', json=unifi_payload("async")) as response:
+                return response.status
+        finally:
+            await client.close()
+
+    assert asyncio.run(post()) == 200
+    alarms, statuses = outbox_rows()
+    assert len(alarms) == 1 and alarms[0][2] == THUMBNAIL
+    assert "data:image" not in alarms[0][0]
+    assert set(statuses) == {"done"}
+    assert ("display", THUMBNAIL) in outbox
+
+
+def test_replay_gets_the_thumbnail_from_its_own_column(outbox):
+    alarm_data = script.parse_alarm_body(json.dumps(unifi_payload("replay")).encode())
+    alarm_info = alarm_data["alarm"]
+    triggers = alarm_info["triggers"]
+    actions = [{"type": "display"}, {"type": "disk"}]
+    context = script.build_action_context(alarm_info, triggers, alarm_data)
+    assert isinstance(script.context_thumbnail(context), script.ImageSlice)
+
+    entries = script.action_outbox.record(alarm_info, triggers, actions, context)
+    assert [key is not None for key, _ in entries] == [True, True]
+
+    # Proces gestopt voordat de acties liepen
+    conn = sqlite3.connect(script.ACTION_OUTBOX_CONFIG["db_path"])
+    with conn:
+        conn.execute("UPDATE outbox_actions SET owner = 999999999")
+    conn.close()
+
+    script.replay_action_outbox()
+    assert outbox == [("display", THUMBNAIL), ("disk", THUMBNAIL)]
+    assert set(outbox_rows()[1]) == {"done"}
+
+
+@pytest.mark.parametrize("delivered, status", [(True, "done"), (False, "failed")])
+def test_notify_is_done_only_after_delivery(outbox, monkeypatch, delivered, status):
+    notify_config = dict(script.current_config("notify"), enabled=True)
+    current_config = script.current_config
+    monkeypatch.setattr(script, "current_config",
+                        lambda section: notify_config if section == "notify" else current_config(section))
+    future = concurrent.futures.Future()
+    monkeypatch.setattr(script.notifier_hub, "submit", lambda notification, backends=None: future)
+    monkeypatch.setattr(script, "run_alarm_action", run_alarm_action)
+
+    alarm_info = {"name": "Deurbel", "triggers": [{"key": "ring", "device": "28704E113F33"}]}
+    context = script.build_action_context(alarm_info, alarm_info["triggers"])
+    entries = script.action_outbox.record(alarm_info, alarm_info["triggers"], [{"type": "notify"}], context)
+    worker = threading.Thread(target=script.run_recorded_actions, args=(entries, context))
+    worker.start()
+
+    # Nog onderweg (backend retries): een herstart nu speelt de notificatie opnieuw af
+    time.sleep(0.2)
+    assert outbox_rows()[1] == ["running"]
+
+    future.set_result({"telefoon": delivered})
+    worker.join(5)
+    assert outbox_rows()[1] == [status]
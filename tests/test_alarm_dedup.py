@@ -0,0 +1,93 @@
+"""Alarm deduplicatie (gedeelde SQLite database) en het coalescing venster"""
+
+import sqlite3
+import time
+
+import pytest
+
+import script
+
+
+@pytest.fixture
+def dedup_config(tmp_path):
+    return dict(script.DEDUP_CONFIG, enabled=True, db_path=str(tmp_path / "alarm_dedup.db"))
+
+
+def trigger(timestamp, device="28704E113F33"):
+    return {"key": "motion", "device": device, "timestamp": timestamp}
+
+
+ALARM = {"name": "Beweging oprit"}
+
+
+def test_retry_across_a_bucket_boundary_is_a_duplicate(dedup_config):
+    deduplicator = script.AlarmDeduplicator(dedup_config)
+
+    assert deduplicator.filter_triggers(ALARM, [trigger(1729512345999)]) == ([trigger(1729512345999)], False)
+    # Vroeger: 1729512345999 // 2000 != 1729512346001 // 2000
+    assert deduplicator.filter_triggers(ALARM, [trigger(1729512346001)]) == ([], True)
+
+
+def test_events_further_apart_than_the_tolerance_are_kept(dedup_config):
+    deduplicator = script.AlarmDeduplicator(dedup_config)
+
+    assert deduplicator.filter_triggers(ALARM, [trigger(1000000)])[1] is False
+    assert deduplicator.filter_triggers(ALARM, [trigger(1005000)])[1] is False
+    # Retry van het eerste event na het tweede
+    assert deduplicator.filter_triggers(ALARM, [trigger(1000500)])[1] is True
+    # Ander apparaat, zelfde tijd
+    new, duplicate = deduplicator.filter_triggers(ALARM, [trigger(1000000), trigger(1000000, "F4E2C6A1B2C3")])
+    assert new == [trigger(1000000, "F4E2C6A1B2C3")] and not duplicate
+    assert deduplicator.get_status()["duplicate_triggers"] == 2
+
+
+def test_processes_share_the_dedup_database(dedup_config):
+    # Twee instanties = twee processen (gunicorn workers, async service)
+    first = script.AlarmDeduplicator(dedup_config)
+    second = script.AlarmDeduplicator(dedup_config)
+
+    assert first.filter_triggers(ALARM, [trigger(2000000)])[1] is False
+    assert second.filter_triggers(ALARM, [trigger(2000000)])[1] is True
+    assert second.get_status()["cache_entries"] == 1
+
+
+def test_events_expire_after_the_ttl(dedup_config):
+    deduplicator = script.AlarmDeduplicator(dict(dedup_config, ttl_seconds=0))
+
+    assert deduplicator.filter_triggers(ALARM, [trigger(3000000)])[1] is False
+    assert deduplicator.filter_triggers(ALARM, [trigger(3000000)])[1] is False
+
+
+def test_coalesced_alarm_is_recorded_before_the_response(monkeypatch, tmp_path, dedup_config):
+    executed = []
+    monkeypatch.setitem(script.ACTION_OUTBOX_CONFIG, "db_path", str(tmp_path / "action_outbox.db"))
+    monkeypatch.setattr(script.action_outbox, "conn", None)
+    monkeypatch.setattr(script, "alarm_deduplicator",
+                        script.AlarmDeduplicator(dict(dedup_config, coalesce_window=0.3)))
+    monkeypatch.setattr(script, "run_alarm_action", lambda action, context: executed.append(
+        (action["type"], sorted(context["devices"]))))
+    monkeypatch.setattr(script, "unreachable_target", lambda action: None)
+
+    def statuses():
+        conn = sqlite3.connect(script.ACTION_OUTBOX_CONFIG["db_path"])
+        try:
+            return sorted(conn.execute("SELECT status, action FROM outbox_actions").fetchall())
+        finally:
+            conn.close()
+
+    client = script.app.test_client()
+    for device in ("28704E113F33", "F4E2C6A1B2C3"):
+        payload = {"alarm": {"name": "Beweging oprit", "triggers": [trigger(4000000, device)]}}
+        assert client.post('/webhook', json=payload).status_code == 200
+        # Het venster is nog open, maar de acties staan al in de outbox
+        assert statuses() and {status for status, _ in statuses()} == {"pending"}
+        assert executed == []
+
+    deadline = time.monotonic() + 5
+    while {status for status, _ in statuses()} != {"done"} and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    # Eén keer per actie, met de triggers van beide webhooks
+    devices = ["28704E113F33", "F4E2C6A1B2C3"]
+    assert executed == [("display", devices), ("disk", devices), ("sip", devices)]
+    assert [status for status, _ in statuses()] == ["done"] * 6
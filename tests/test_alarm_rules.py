@@ -0,0 +1,124 @@
+"""Alarm regel engine: index vs wildcard, tijd vensters, hot reload en de standaard regels"""
+
+import json
+import os
+import time
+
+import pytest
+
+import script
+
+MOTION = {"key": "motion", "device": "28704E113F33"}
+PERSON_OPRIT = {"key": "person", "device": "28704E113F07", "group": {"name": "Oprit"}}
+
+
+@pytest.fixture
+def rules_file(tmp_path):
+    path = tmp_path / "alarm_rules.json"
+
+    def write(rules):
+        path.write_text(json.dumps({"rules": rules}) if not isinstance(rules, str) else rules)
+        # Andere mtime, ook als de test binnen dezelfde tik schrijft
+        stamp = time.time() + len(os.listdir(tmp_path))
+        os.utime(path, (stamp, stamp))
+        return path
+
+    return write
+
+
+def make_engine(path, **config):
+    return script.AlarmRuleEngine(dict(script.RULES_CONFIG, file=str(path), reload_check_interval=0, **config))
+
+
+def action_types(actions):
+    return [action["type"] for action in actions]
+
+
+def test_exact_values_are_indexed_and_patterns_are_wildcards():
+    ruleset = script.CompiledRuleSet([
+        {"name": "oprit", "match": {"device": "28704E113F07"}, "actions": ["sip"]},
+        {"name": "kentekens", "match": {"trigger_key": ["licensePlate", "vehicle"]}, "actions": ["loxone"]},
+        {"name": "beweging", "match": {"trigger_key": "*motion*"}, "actions": ["display"]},
+        {"name": "altijd", "actions": ["disk"]},
+    ])
+
+    assert ruleset.index.keys() == {("device", "28704e113f07"), ("trigger_key", "licenseplate"),
+                                    ("trigger_key", "vehicle")}
+    assert [rule.name for rule in ruleset.wildcard] == ["beweging", "altijd"]
+    # Alleen de index regels van dít alarm plus de wildcards, in regel volgorde
+    assert [rule.name for rule in ruleset.candidates("Oprit", [PERSON_OPRIT])] == ["oprit", "beweging", "altijd"]
+    assert [rule.name for rule in ruleset.candidates("Kenteken", [{"key": "licensePlate"}])] == [
+        "kentekens", "beweging", "altijd"]
+
+
+def test_all_trigger_fields_must_match_the_same_trigger(rules_file):
+    engine = make_engine(rules_file([
+        {"match": {"device": "28704E113F07", "trigger_key": "person"}, "actions": ["sip"]},
+    ]))
+    engine.load()
+
+    assert action_types(engine.match({"name": "Oprit"}, [PERSON_OPRIT])) == ["sip"]
+    assert engine.match({"name": "Oprit"}, [{"key": "motion", "device": "28704E113F07"},
+                                            {"key": "person", "device": "28704E113F33"}]) == []
+
+
+@pytest.mark.parametrize("minute_of_day, expected", [
+    (21 * 60 + 59, False), (22 * 60, True), (23 * 60 + 30, True), (0, True), (5 * 60 + 59, True),
+    (6 * 60, False), (12 * 60, False),
+])
+def test_time_range_over_midnight(minute_of_day, expected):
+    rule = script.CompiledRule(0, {"match": {"time": "22:00-06:00"}, "actions": ["sip"]})
+    assert rule.time_ranges == [(22 * 60, 6 * 60)]
+    assert rule.matches("Oprit", [PERSON_OPRIT], minute_of_day) is expected
+
+
+@pytest.mark.parametrize("value", ["22-06", "22:00", "25:00-06:00", "22:00-06:60", "22:00-6", 2200])
+def test_invalid_time_range_is_a_value_error(value):
+    with pytest.raises(ValueError):
+        script.parse_time_range(value)
+
+
+@pytest.mark.parametrize("bad_rules", [
+    [{"match": {"time": "22-06"}, "actions": ["sip"]}],
+    [{"actions": ["bellen"]}],
+    [{"actions": [5]}],
+    "{niet json",
+])
+def test_bad_rules_file_keeps_the_current_rules(rules_file, bad_rules):
+    engine = make_engine(rules_file([{"name": "oprit", "match": {"device": "28704E113F07"}, "actions": ["sip"]}]))
+    assert engine.load()
+    ruleset = engine.ruleset
+
+    rules_file(bad_rules)
+    assert engine.match({"name": "Oprit"}, [PERSON_OPRIT]) == [{"type": "sip"}]
+    assert engine.ruleset is ruleset
+    status = engine.get_status()
+    assert status["errors"] == 1 and status["last_error"] and status["reloads"] == 0
+
+    # Hersteld bestand wordt weer opgepakt
+    rules_file([{"actions": ["disk"]}])
+    assert action_types(engine.match({"name": "Oprit"}, [PERSON_OPRIT])) == ["disk"]
+    assert engine.get_status()["reloads"] == 1
+
+
+@pytest.mark.parametrize("send_all_alarms, alarm_name, triggers, expected", [
+    (True, "Beweging oprit", [MOTION], ["display", "disk", "sip"]),
+    (True, "Deur open", [{"key": "door", "device": "28704E113F33"}], ["display", "disk", "sip"]),
+    (False, "Beweging oprit", [MOTION], ["display", "disk", "sip"]),
+    (False, "Motion voordeur", [], ["display", "disk", "sip"]),
+    (False, "Deur open", [{"key": "door", "device": "28704E113F33"}], ["disk", "sip"]),
+])
+def test_default_rules_match_the_original_actions(monkeypatch, tmp_path, send_all_alarms, alarm_name, triggers,
+                                                   expected):
+    pc_display = dict(script.current_config("pc_display"), send_all_alarms=send_all_alarms)
+    current_config = script.current_config
+    monkeypatch.setattr(script, "current_config",
+                        lambda section: pc_display if section == "pc_display" else current_config(section))
+    engine = make_engine(tmp_path / "ontbreekt.json")
+    engine.load()
+
+    assert engine.source == "standaard regels"
+    actions = engine.match({"name": alarm_name}, triggers)
+    assert action_types(actions) == expected
+    # SIP belt het standaard alarm nummer
+    assert "number" not in actions[-1]
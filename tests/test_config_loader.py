@@ -0,0 +1,160 @@
+"""config_loader.py: env overrides, type checks, deep_merge en subscribers per gewijzigde sectie"""
+
+import json
+from types import MappingProxyType
+
+import pytest
+
+from config_loader import ConfigManager, check_types, deep_merge, env_overrides, parse_env_value
+
+DEFAULTS = {
+    "email": {"enabled": True, "smtp_port": 587, "timeout": 10.0, "to_emails": ["a@x.be"], "server": "smtp.x.be"},
+    "loxone": {"ip": "192.168.1.10", "port": 7000, "extra": None},
+}
+
+
+@pytest.mark.parametrize("text, default, expected", [
+    ("true", False, True), ("JA", False, True), ("on", False, True), ("0", True, False), ("nee", True, False),
+    ("", True, False), ("465", 587, 465), ("2.5", 10.0, 2.5), ("007", "x", "007"),
+    ("a@x.be, b@x.be", ["a@x.be"], ["a@x.be", "b@x.be"]), ('["a@x.be"]', ["b@x.be"], ["a@x.be"]),
+    ('{"a": 1}', None, {"a": 1}), ("465", None, 465), ("gewoon tekst", None, "gewoon tekst"),
+])
+def test_parse_env_value_follows_the_default_type(text, default, expected):
+    assert parse_env_value(text, default) == expected
+
+
+@pytest.mark.parametrize("text, default", [("misschien", True), ("abc", 587), ("x", 1.0)])
+def test_parse_env_value_rejects_invalid_values(text, default):
+    with pytest.raises(ValueError):
+        parse_env_value(text, default)
+
+
+def test_env_overrides_only_for_known_sections():
+    environ = {
+        "WEBHOOK_EMAIL__SMTP_PORT": "465",
+        "webhook_email__enabled": "false",
+        "WEBHOOK_EMAIL__TO_EMAILS": "a@x.be,b@x.be",
+        "WEBHOOK_LOXONE__EXTRA__LEVEL": '{"x": 1}',
+        "WEBHOOK_CONFIG": "/etc/webhook.toml",
+        "WEBHOOK_ONBEKEND__X": "1",
+        "OTHER_EMAIL__SMTP_PORT": "25",
+    }
+    assert env_overrides("WEBHOOK", DEFAULTS, environ) == {
+        "email": {"smtp_port": 465, "enabled": False, "to_emails": ["a@x.be", "b@x.be"]},
+        "loxone": {"extra": {"level": {"x": 1}}},
+    }
+
+
+def test_deep_merge_merges_dicts_and_replaces_the_rest():
+    base = {"email": {"smtp_port": 587, "to_emails": ["a@x.be", "b@x.be"]}, "loxone": {"port": 7000}}
+    override = MappingProxyType({"email": MappingProxyType({"to_emails": ("c@x.be",)}), "nieuw": {"a": 1}})
+
+    merged = deep_merge(base, override)
+    assert merged == {"email": {"smtp_port": 587, "to_emails": ["c@x.be"]}, "loxone": {"port": 7000},
+                      "nieuw": {"a": 1}}
+    # Geen van beide aangepast, resultaat is een gewone (aanpasbare) kopie
+    assert base["email"]["to_emails"] == ["a@x.be", "b@x.be"]
+    merged["loxone"]["port"] = 1
+    assert base["loxone"]["port"] == 7000
+
+
+@pytest.mark.parametrize("config, message", [
+    ({"email": {"enabled": "yes"}}, "email.enabled: bool verwacht"),
+    ({"email": {"smtp_port": 587.5}}, "email.smtp_port: geheel getal verwacht"),
+    ({"email": {"smtp_port": True}}, "email.smtp_port: getal verwacht"),
+    ({"email": {"to_emails": "a@x.be"}}, "email.to_emails: lijst verwacht"),
+    ({"email": {"server": 25}}, "email.server: str verwacht"),
+    ({"email": "uit"}, "email: sectie verwacht"),
+])
+def test_check_types_rejects_the_wrong_type(config, message):
+    with pytest.raises(ValueError, match=message):
+        check_types(DEFAULTS, config)
+
+
+def test_check_types_allows_int_for_float_and_unknown_keys():
+    check_types(DEFAULTS, {"email": {"timeout": 5, "nieuw": "x"}, "loxone": {"extra": [1]}})
+
+
+def write_json(path, data):
+    path.write_text(json.dumps(data))
+
+
+def test_bad_reload_keeps_the_previous_snapshot(tmp_path):
+    path = tmp_path / "config.json"
+    write_json(path, {"email": {"smtp_port": 465}})
+    manager = ConfigManager(DEFAULTS, path=str(path), environ={})
+    assert manager.load()
+    snapshot = manager.snapshot
+    assert snapshot["email"]["smtp_port"] == 465 and snapshot["email"]["server"] == "smtp.x.be"
+
+    write_json(path, {"email": {"smtp_port": "vijf"}})
+    assert not manager.load()
+    assert manager.snapshot is snapshot
+    path.write_text("{kapot")
+    assert not manager.load()
+    assert manager.snapshot is snapshot
+    status = manager.get_status()
+    assert status["errors"] == 2 and status["version"] == 1 and status["last_error"]
+
+    write_json(path, {"email": {"smtp_port": 25}})
+    assert manager.load()
+    assert manager.section("email")["smtp_port"] == 25
+    assert manager.get_status()["last_error"] is None
+
+
+def test_snapshot_is_immutable():
+    manager = ConfigManager(DEFAULTS, environ={})
+    manager.load()
+    email = manager.section("email")
+    with pytest.raises(TypeError):
+        email["smtp_port"] = 1
+    assert email["to_emails"] == ("a@x.be",)
+
+
+def test_env_overrides_the_file(tmp_path):
+    path = tmp_path / "config.json"
+    write_json(path, {"email": {"smtp_port": 465, "server": "mail.x.be"}})
+    manager = ConfigManager(DEFAULTS, path=str(path), env_prefix="WEBHOOK",
+                            environ={"WEBHOOK_EMAIL__SMTP_PORT": "2525"})
+    manager.load()
+    assert manager.section("email")["smtp_port"] == 2525
+    assert manager.section("email")["server"] == "mail.x.be"
+    assert manager.get_status()["sources"] == ["defaults", str(path), "env WEBHOOK_*"]
+
+
+def test_subscribers_only_fire_for_changed_sections(tmp_path):
+    path = tmp_path / "config.json"
+    write_json(path, {"email": {"smtp_port": 465}})
+    manager = ConfigManager(DEFAULTS, path=str(path), environ={})
+    calls = []
+    manager.subscribe("email", lambda old, new: calls.append(("email", old["smtp_port"], new["smtp_port"])))
+    manager.subscribe("loxone", lambda old, new: calls.append(("loxone", old["port"], new["port"])))
+    manager.load()
+    assert calls == [("email", 587, 465)]
+
+    calls.clear()
+    write_json(path, {"email": {"smtp_port": 465}, "loxone": {"port": 7001}})
+    manager.load()
+    assert calls == [("loxone", 7000, 7001)]
+
+    calls.clear()
+    manager.load()
+    assert calls == []
+
+
+def test_failing_subscriber_does_not_block_the_others():
+    manager = ConfigManager(DEFAULTS, environ={})
+    calls = []
+
+    def broken(old, new):
+        raise RuntimeError("kapot")
+
+    manager.subscribe("email", broken)
+    manager.subscribe("email", lambda old, new: calls.append(new["smtp_port"]))
+    assert manager.override({"email": {"smtp_port": 2525}})
+    assert calls == [2525]
+
+    # Ongeldige override wordt teruggedraaid
+    assert not manager.override({"email": {"smtp_port": "x"}})
+    assert manager.section("email")["smtp_port"] == 2525
+    assert manager.overrides == {"email": {"smtp_port": 2525}}
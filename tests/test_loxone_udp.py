@@ -0,0 +1,136 @@
+"""LoxoneUDPSender: samenvoegen per venster, redundante kopieën en tellers (lokale UDP socket als Miniserver)"""
+
+import socket
+import time
+
+import pytest
+
+import script
+
+
+@pytest.fixture
+def miniserver():
+    """Lokale UDP socket; receive() geeft de datagrams die binnen timeout binnenkomen"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+
+    def receive(count, timeout=2.0):
+        datagrams = []
+        deadline = time.monotonic() + timeout
+        while len(datagrams) < count and time.monotonic() < deadline:
+            sock.settimeout(max(0.01, deadline - time.monotonic()))
+            try:
+                datagrams.append(sock.recv(4096).decode("utf-8"))
+            except socket.timeout:
+                break
+        return datagrams
+
+    receive.port = sock.getsockname()[1]
+    yield receive
+    sock.close()
+
+
+@pytest.fixture
+def make_sender():
+    senders = []
+
+    def make(**config):
+        sender = script.LoxoneUDPSender(dict(script.LOXONE_UDP_CONFIG, **config))
+        senders.append(sender)
+        return sender
+
+    yield make
+    for sender in senders:
+        sender.stop()
+
+
+def wait_for(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timeout")
+        time.sleep(0.01)
+
+
+def test_messages_in_one_window_arrive_as_one_datagram(miniserver, make_sender):
+    sender = make_sender(coalesce_window=0.2)
+    for message in ("MOTION:Voordeur", "PLATE:1ABC123", "DOORBELL:1", "MOTION:Voordeur"):
+        assert sender.send(message, "127.0.0.1", miniserver.port)
+
+    assert miniserver(2, timeout=1.0) == ["MOTION:Voordeur\nPLATE:1ABC123\nDOORBELL:1"]
+    status = sender.get_status()
+    assert (status["messages"], status["datagrams"], status["coalesced"]) == (4, 1, 3)
+    assert status["sockets"] == 1
+
+
+def test_same_command_goes_into_separate_datagrams(miniserver, make_sender):
+    sender = make_sender(coalesce_window=0.2)
+    for message in ("MOTION:Voordeur", "MOTION:Oprit", "PLATE:1ABC123"):
+        sender.send(message, "127.0.0.1", miniserver.port)
+
+    # Een Virtual UDP Input herkent zijn patroon maar één keer per datagram
+    assert sorted(miniserver(2)) == ["MOTION:Oprit", "MOTION:Voordeur\nPLATE:1ABC123"]
+
+
+def test_datagrams_stay_under_max_datagram(miniserver, make_sender):
+    sender = make_sender(coalesce_window=0.2, max_datagram=20)
+    for message in ("A:0123456789", "B:0123456789", "C:01234"):
+        sender.send(message, "127.0.0.1", miniserver.port)
+
+    assert sorted(miniserver(2)) == ["A:0123456789\nC:01234", "B:0123456789"]
+
+
+def test_messages_outside_the_window_are_sent_separately(miniserver, make_sender):
+    sender = make_sender(coalesce_window=0.01)
+    sender.send("MOTION:Voordeur", "127.0.0.1", miniserver.port)
+    assert miniserver(1) == ["MOTION:Voordeur"]
+    sender.send("PLATE:1ABC123", "127.0.0.1", miniserver.port)
+    assert miniserver(1) == ["PLATE:1ABC123"]
+    assert sender.get_status()["coalesced"] == 0
+
+
+def test_redundant_copies_are_sent_with_jitter(miniserver, make_sender):
+    sender = make_sender(redundancy=3, redundancy_jitter=(0.05, 0.1))
+    started = time.monotonic()
+    sender.send("MOTION:Voordeur", "127.0.0.1", miniserver.port)
+
+    assert miniserver(3) == ["MOTION:Voordeur"] * 3
+    # Twee herhalingen, elk na 0.05-0.1s
+    assert time.monotonic() - started >= 0.1
+    wait_for(lambda: sender.get_status()["repeats"] == 2)
+    assert miniserver(1, timeout=0.3) == []
+    status = sender.get_status()
+    assert (status["datagrams"], status["repeats"], status["send_errors"]) == (1, 2, 0)
+
+
+def test_repeats_do_not_hold_up_new_messages(miniserver, make_sender):
+    sender = make_sender(redundancy=2, redundancy_jitter=(0.5, 0.5))
+    sender.send("MOTION:Voordeur", "127.0.0.1", miniserver.port)
+    assert miniserver(1) == ["MOTION:Voordeur"]
+
+    sender.send("PLATE:1ABC123", "127.0.0.1", miniserver.port)
+    started = time.monotonic()
+    assert miniserver(1) == ["PLATE:1ABC123"]
+    assert time.monotonic() - started < 0.3
+
+
+def test_port_unreachable_counts_as_send_error(make_sender):
+    closed = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    closed.bind(("127.0.0.1", 0))
+    port = closed.getsockname()[1]
+    closed.close()
+
+    # Het ICMP antwoord op de eerste send komt terug als fout bij een volgende send
+    sender = make_sender(redundancy=3, redundancy_jitter=(0.02, 0.05))
+    sender.send("MOTION:Voordeur", "127.0.0.1", port)
+    wait_for(lambda: sender.get_status()["send_errors"] >= 1)
+    assert sender.get_status()["datagrams"] == 1
+
+
+def test_full_queue_drops_the_message(make_sender, monkeypatch):
+    sender = make_sender(queue_size=1)
+    monkeypatch.setattr(sender, "_ensure_started", lambda: None)  # Geen thread die de queue leegt
+
+    assert sender.send("MOTION:Voordeur", "127.0.0.1", 7000)
+    assert not sender.send("PLATE:1ABC123", "127.0.0.1", 7000)
+    assert sender.get_status()["dropped"] == 1
@@ -0,0 +1,219 @@
+"""MQTT outbox: persistentie, replay na een reconnect en QoS 1 bevestigingen (nep paho client)"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import script
+
+mqtt = pytest.importorskip("paho.mqtt.client")
+
+
+class FakeClient:
+    """Genoeg van paho.mqtt.client.Client voor MQTTPublisher; de test speelt broker"""
+
+    instances = []
+
+    def __init__(self, client_id=None, clean_session=None, **kwargs):
+        self.client_id = client_id
+        self.clean_session = clean_session
+        self.published = []
+        self.next_mid = 0
+        self.fail_publish = False
+        FakeClient.instances.append(self)
+
+    def username_pw_set(self, username, password=None):
+        pass
+
+    def max_inflight_messages_set(self, inflight):
+        pass
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        pass
+
+    def connect_async(self, host, port, keepalive):
+        self.address = (host, port)
+
+    def loop_start(self):
+        pass
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if self.fail_publish:
+            return SimpleNamespace(rc=mqtt.MQTT_ERR_NO_CONN, mid=None)
+        self.next_mid += 1
+        self.published.append((self.next_mid, topic, payload, qos))
+        return SimpleNamespace(rc=mqtt.MQTT_ERR_SUCCESS, mid=self.next_mid)
+
+    # Broker kant
+    def connack(self):
+        self.on_connect(self, None, {}, 0)
+
+    def puback(self, mid):
+        self.on_publish(self, None, mid)
+
+    def drop(self):
+        self.on_disconnect(self, None, 1)
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timeout")
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def make_publisher(monkeypatch, tmp_path):
+    """Nieuwe MQTTPublisher op dezelfde outbox database (elke aanroep = nieuwe start)"""
+    config = dict(script.MQTT_OUTBOX_CONFIG, db_path=str(tmp_path / "mqtt_outbox.db"), max_inflight=20)
+    mqtt_config = dict(script.current_config("mqtt"), enabled=True, host="broker.lan", qos=1)
+    current_config = script.current_config
+    monkeypatch.setattr(script, "current_config",
+                        lambda section: mqtt_config if section == "mqtt" else current_config(section))
+    monkeypatch.setattr(mqtt, "Client", FakeClient)
+    FakeClient.instances = []
+    publishers = []
+
+    def make(**overrides):
+        publisher = script.MQTTPublisher(dict(config, **overrides))
+        publishers.append(publisher)
+        return publisher
+
+    yield make
+    for publisher in publishers:
+        publisher.stop()
+
+
+def outbox_topics(publisher):
+    conn = sqlite3.connect(publisher.config["db_path"])
+    try:
+        return [row[0] for row in conn.execute("SELECT topic FROM mqtt_outbox ORDER BY id")]
+    finally:
+        conn.close()
+
+
+def test_messages_stay_in_the_outbox_until_the_broker_acknowledges(make_publisher):
+    publisher = make_publisher()
+    publisher.publish("unifi/alarm/a/motion", '{"n": 1}')
+    publisher.publish("unifi/alarm/b/motion", '{"n": 2}')
+    wait_for(lambda: FakeClient.instances and publisher.pending == 2)
+    client = FakeClient.instances[0]
+    assert client.clean_session is False
+    assert client.published == []
+
+    client.connack()
+    wait_for(lambda: len(client.published) == 2)
+    assert [(topic, qos) for _, topic, _, qos in client.published] == [
+        ("unifi/alarm/a/motion", 1), ("unifi/alarm/b/motion", 1)]
+    assert outbox_topics(publisher) == ["unifi/alarm/a/motion", "unifi/alarm/b/motion"]
+
+    client.puback(2)
+    client.puback(99)  # Onbekende mid: genegeerd
+    wait_for(lambda: publisher.acked == 1)
+    assert outbox_topics(publisher) == ["unifi/alarm/a/motion"]
+    assert publisher.get_status()["inflight"] == 1
+
+    client.puback(1)
+    wait_for(lambda: publisher.acked == 2)
+    assert outbox_topics(publisher) == []
+    assert publisher.get_status()["outbox"] == 0
+
+
+def test_outbox_survives_a_restart(make_publisher):
+    first = make_publisher()
+    first.publish("unifi/alarm/a/motion", b"offline")
+    wait_for(lambda: first.pending == 1)
+    first.stop()
+    assert outbox_topics(first) == ["unifi/alarm/a/motion"]
+
+    second = make_publisher()
+    second.resume()
+    wait_for(lambda: len(FakeClient.instances) == 2)
+    client = FakeClient.instances[1]
+    client.connack()
+    wait_for(lambda: client.published)
+    assert client.published[0][1:3] == ("unifi/alarm/a/motion", b"offline")
+    client.puback(client.published[0][0])
+    wait_for(lambda: outbox_topics(second) == [])
+
+
+def test_messages_of_a_stopped_process_are_adopted(make_publisher):
+    publisher = make_publisher()
+    conn = publisher._connect_db()
+    conn.execute("INSERT INTO mqtt_outbox (ts, owner, topic, payload, qos, retain) VALUES (?, ?, ?, ?, 1, 0)",
+                 (time.time(), 999999999, "unifi/alarm/old/motion", b"{}"))
+    conn.commit()
+    conn.close()
+
+    publisher.publish("unifi/alarm/new/motion", b"{}")
+    wait_for(lambda: FakeClient.instances and publisher.pending == 2)
+    FakeClient.instances[0].connack()
+    wait_for(lambda: len(FakeClient.instances[0].published) == 2)
+    assert [topic for _, topic, _, _ in FakeClient.instances[0].published] == [
+        "unifi/alarm/old/motion", "unifi/alarm/new/motion"]
+
+
+def test_queued_messages_are_sent_after_a_reconnect(make_publisher):
+    publisher = make_publisher()
+    publisher.publish("unifi/alarm/a/motion", b"1")
+    wait_for(lambda: FakeClient.instances)
+    client = FakeClient.instances[0]
+    client.connack()
+    wait_for(lambda: len(client.published) == 1)
+
+    # Wi-Fi weg: niet bevestigd bericht en nieuwe berichten blijven staan
+    client.drop()
+    wait_for(lambda: not publisher.connected)
+    publisher.publish("unifi/alarm/b/motion", b"2")
+    wait_for(lambda: publisher.pending == 2)
+    time.sleep(0.05)
+    assert len(client.published) == 1
+    assert outbox_topics(publisher) == ["unifi/alarm/a/motion", "unifi/alarm/b/motion"]
+
+    # paho levert het onbevestigde bericht zelf opnieuw af (clean_session uit) en meldt de PUBACK
+    client.connack()
+    wait_for(lambda: len(client.published) == 2)
+    assert client.published[1][1] == "unifi/alarm/b/motion"
+    client.puback(1)
+    client.puback(2)
+    wait_for(lambda: outbox_topics(publisher) == [])
+    assert publisher.get_status()["connects"] == 2
+
+
+def test_failed_publish_is_retried_after_reconnect(make_publisher):
+    publisher = make_publisher()
+    publisher.publish("unifi/alarm/a/motion", b"1")
+    wait_for(lambda: FakeClient.instances)
+    client = FakeClient.instances[0]
+    client.fail_publish = True
+    client.connack()
+    wait_for(lambda: publisher.errors == 1)
+    assert not publisher.connected
+    assert outbox_topics(publisher) == ["unifi/alarm/a/motion"]
+
+    client.fail_publish = False
+    client.connack()
+    wait_for(lambda: client.published)
+    client.puback(client.published[0][0])
+    wait_for(lambda: outbox_topics(publisher) == [])
+
+
+def test_paho_is_only_imported_when_the_publisher_starts(tmp_path):
+    code = ("import sys, script; loaded = 'paho.mqtt.client' in sys.modules; "
+            "script.mqtt_publisher._ensure_started(); print(loaded, 'paho.mqtt.client' in sys.modules)")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, capture_output=True, text=True, timeout=60,
+                            env=dict(os.environ, PYTHONPATH=root))
+    assert result.stdout.split() == ["False", "True"], result.stderr
@@ -0,0 +1,99 @@
+"""LAN-only modus: wifi_monitor.py schrijft de netwerk status, script.py stelt WAN acties uit"""
+
+import json
+import os
+import sqlite3
+import time
+
+import pytest
+
+import script
+import wifi_monitor
+
+
+@pytest.fixture
+def state_file(monkeypatch, tmp_path):
+    """Status bestand dat wifi_monitor schrijft en een NetworkState van script.py die het leest"""
+    path = str(tmp_path / "network_state.json")
+    monkeypatch.setattr(wifi_monitor, "network_state_path", lambda: path)
+    monkeypatch.setattr(wifi_monitor, "netwerk_status", None)
+    state = script.NetworkState(dict(script.NETWORK_CONFIG, state_file=path))
+    monkeypatch.setattr(script, "network_state", state)
+    monkeypatch.setitem(script.ACTION_OUTBOX_CONFIG, "db_path", str(tmp_path / "action_outbox.db"))
+    monkeypatch.setattr(script.action_outbox, "conn", None)
+    return state
+
+
+def publish(wan, lan, **targets):
+    health = {}
+    for name, up in targets.items():
+        target = wifi_monitor.TargetHealth(name, f"{name}:53")
+        target.update(up, 1.0 if up else None, None if up else "timeout", 0.3, 1)
+        health[name] = target
+    wifi_monitor.publish_network_state(wan, lan, health)
+
+
+def test_status_file_round_trip(state_file):
+    publish(False, True, internet=False, pc_receiver=True, smtp=False)
+
+    state = state_file.refresh(force=True)
+    assert (state["wan"], state["lan"]) == (False, True)
+    assert state["targets"] == {"internet": False, "pc_receiver": True, "smtp": False}
+    status = state_file.get_status()
+    assert status["mode"] == "lan-only"
+    assert status["targets_down"] == ["internet", "smtp"]
+
+
+def test_missing_or_stale_status_means_internet(state_file):
+    assert state_file.refresh(force=True)["wan"] is True
+
+    publish(False, True)
+    path = state_file.config["state_file"]
+    with open(path) as f:
+        data = json.load(f)
+    data["updated"] = time.time() - state_file.config["max_age"] - 1
+    with open(path, "w") as f:
+        json.dump(data, f)
+    os.utime(path, (time.time() + 1, time.time() + 1))
+
+    assert state_file.refresh(force=True)["wan"] is True
+    assert state_file.stale
+
+
+def test_wan_actions_are_deferred_and_replayed_when_internet_returns(state_file, monkeypatch):
+    executed = []
+    monkeypatch.setattr(script, "run_alarm_action", lambda action, context: executed.append(action["type"]))
+    publish(False, True)
+
+    alarm_info = {"name": "Beweging oprit", "triggers": [{"key": "motion", "device": "28704E113F33",
+                                                          "timestamp": 1729512345678}]}
+    context = script.build_action_context(alarm_info, alarm_info["triggers"])
+    entries = script.action_outbox.record(alarm_info, alarm_info["triggers"],
+                                          [{"type": "email"}, {"type": "display"}, {"type": "notify"}], context)
+    script.run_recorded_actions(entries, context)
+
+    # LAN acties lopen door, email en notify wachten op internet
+    assert executed == ["display"]
+    conn = sqlite3.connect(script.ACTION_OUTBOX_CONFIG["db_path"])
+    statuses = dict(conn.execute("SELECT json_extract(action, '$.type'), status FROM outbox_actions"))
+    conn.close()
+    assert statuses == {"email": "deferred", "display": "done", "notify": "deferred"}
+
+    changes = []
+    state_file.subscribe(lambda old, new: changes.append((old["wan"], new["wan"])))
+    publish(True, True)
+    os.utime(state_file.config["state_file"], (time.time() + 2, time.time() + 2))
+    state_file.refresh(force=True)
+    assert changes == [(False, True)]
+
+    script.replay_action_outbox()
+    assert executed == ["display", "email", "notify"]
+
+
+def test_action_to_a_target_that_is_down_is_skipped(state_file):
+    publish(True, True, pc_receiver=False, sip=True)
+    state_file.refresh(force=True)
+
+    assert script.unreachable_target({"type": "display"}) == "pc_receiver"
+    assert script.unreachable_target({"type": "sip"}) is None
+    assert script.unreachable_target({"type": "disk"}) is None
@@ -0,0 +1,184 @@
+"""notifiers.py: retries met backoff, Retry-After, dead-letter en gelijktijdige fan-out (lokale aiohttp server)"""
+
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from aiohttp import web
+
+import notifiers
+
+
+class StandIn:
+    """
+    Lokale backend op een eigen loop thread
+
+    responses[pad]: lijst van (status, headers, vertraging) die één voor één
+    gebruikt worden (de laatste blijft staan); requests[pad]: ontvangen tijden + JSON.
+    """
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = {}
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.runner = asyncio.run_coroutine_threadsafe(self._start(), self.loop).result(5)
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post("/{name}", self._handle)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = runner.addresses[0][1]
+        return runner
+
+    async def _handle(self, request):
+        name = request.match_info["name"]
+        self.requests.setdefault(name, []).append((time.monotonic(), await request.json()))
+        responses = self.responses.get(name, [(200, {}, 0)])
+        status, headers, delay = responses.pop(0) if len(responses) > 1 else responses[0]
+        await asyncio.sleep(delay)
+        return web.Response(status=status, headers=headers, text="ok" if status < 300 else "fout")
+
+    def url(self, name):
+        return f"http://127.0.0.1:{self.port}/{name}"
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+
+
+@pytest.fixture
+def server():
+    server = StandIn()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_hub(server, tmp_path):
+    """NotifierHub met webhook backends naar de stand-in, korte backoff en een eigen dead-letter bestand"""
+    hubs = []
+
+    def make(names, **config):
+        config = dict({"backends": {name: {"type": "webhook", "url": server.url(name), "rate_per_minute": 600}
+                                    for name in names},
+                       "max_retries": 3, "backoff_base": 0.05, "backoff_max": 1.0, "timeout": 5,
+                       "dead_letter_file": str(tmp_path / "dead_letter.jsonl")}, **config)
+        hub = notifiers.NotifierHub(config)
+        hubs.append(hub)
+        return hub
+
+    yield make
+    for hub in hubs:
+        hub.stop()
+
+
+def deliver(hub, message="Beweging bij voordeur", timeout=10):
+    return hub.submit(notifiers.Notification(message, title="UniFi Protect")).result(timeout)
+
+
+def dead_letters(tmp_path):
+    path = tmp_path / "dead_letter.jsonl"
+    return [json.loads(line) for line in path.read_text().splitlines()] if path.exists() else []
+
+
+def gaps(requests):
+    return [later - earlier for (earlier, _), (later, _) in zip(requests, requests[1:])]
+
+
+def test_server_errors_are_retried_with_backoff(server, make_hub, tmp_path):
+    server.responses["huis"] = [(500, {}, 0), (503, {}, 0), (200, {}, 0)]
+    hub = make_hub(["huis"])
+
+    assert deliver(hub) == {"huis": True}
+    requests = server.requests["huis"]
+    assert len(requests) == 3
+    assert requests[0][1]["message"] == "Beweging bij voordeur"
+    # Backoff 0.05 × 2^n met jitter 0.5-1.0
+    first, second = gaps(requests)
+    assert first >= 0.025 and second >= 0.05
+    stats = hub.get_status()["backends"]["huis"]
+    assert (stats["sent"], stats["retries"], stats["failed"]) == (1, 2, 0)
+    assert dead_letters(tmp_path) == []
+
+
+def test_retry_after_of_a_429_is_respected(server, make_hub):
+    server.responses["telefoon"] = [(429, {"Retry-After": "0.4"}, 0), (200, {}, 0)]
+    hub = make_hub(["telefoon"])
+
+    assert deliver(hub) == {"telefoon": True}
+    assert gaps(server.requests["telefoon"])[0] >= 0.4
+
+
+def test_gives_up_after_max_retries_and_dead_letters(server, make_hub, tmp_path):
+    server.responses["huis"] = [(500, {}, 0)]
+    hub = make_hub(["huis"], max_retries=2)
+
+    assert deliver(hub) == {"huis": False}
+    assert len(server.requests["huis"]) == 3
+    [record] = dead_letters(tmp_path)
+    assert (record["backend"], record["type"], record["attempts"]) == ("huis", "webhook", 3)
+    assert record["error"].startswith("HTTP 500")
+    assert record["notification"]["message"] == "Beweging bij voordeur"
+    assert hub.get_status()["backends"]["huis"]["dead_lettered"] == 1
+
+
+def test_client_errors_are_not_retried(server, make_hub, tmp_path):
+    server.responses["huis"] = [(400, {}, 0)]
+    hub = make_hub(["huis"])
+
+    assert deliver(hub) == {"huis": False}
+    assert len(server.requests["huis"]) == 1
+    assert dead_letters(tmp_path)[0]["attempts"] == 1
+
+
+def test_fan_out_takes_as_long_as_the_slowest_backend(server, make_hub):
+    delays = {"snel": 0.1, "middel": 0.2, "traag": 0.4}
+    for name, delay in delays.items():
+        server.responses[name] = [(200, {}, delay)]
+    hub = make_hub(list(delays))
+    deliver(hub, "opwarmen")  # Loop thread en connection pool starten
+
+    started = time.perf_counter()
+    assert deliver(hub) == {"snel": True, "middel": True, "traag": True}
+    elapsed = time.perf_counter() - started
+
+    # Na elkaar zou 0.7s zijn
+    assert 0.4 <= elapsed < 0.65
+
+
+def test_one_failing_backend_does_not_hold_up_the_others(server, make_hub):
+    server.responses["kapot"] = [(500, {}, 0)]
+    hub = make_hub(["huis", "kapot"], max_retries=1)
+
+    assert deliver(hub) == {"huis": True, "kapot": False}
+    assert len(server.requests["huis"]) == 1 and len(server.requests["kapot"]) == 2
+
+
+def test_rate_limiter_allows_a_burst_then_waits():
+    async def run():
+        limiter = notifiers.RateLimiter(rate_per_minute=600, burst=2)  # 10 per seconde
+        waits = [await limiter.acquire() for _ in range(4)]
+        return waits
+
+    waits = asyncio.run(run())
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(0.1, abs=0.02) and waits[3] == pytest.approx(0.1, abs=0.02)
+
+
+def test_rate_limited_backend_counts_the_wait(server, make_hub):
+    hub = make_hub(["huis"])
+    hub.configure(dict(hub.config, backends={"huis": {"type": "webhook", "url": server.url("huis"),
+                                                      "rate_per_minute": 300, "burst": 1}}))
+
+    assert deliver(hub) == {"huis": True}
+    assert deliver(hub) == {"huis": True}
+    assert gaps(server.requests["huis"])[0] >= 0.15
+    assert hub.get_status()["backends"]["huis"]["rate_limited_seconds"] > 0
@@ -0,0 +1,95 @@
+"""Streaming ontvangst van foto's op pcReceiver /photo"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+import tracemalloc
+
+import pytest
+from PIL import Image
+
+import pcReceiver
+
+
+@pytest.fixture
+def client():
+    pcReceiver.auto_display = False
+    pcReceiver.AUDIO_CONFIG["enabled"] = False
+    return pcReceiver.app.test_client()
+
+
+def make_png(width=1200, height=900):
+    image = Image.frombytes('RGB', (width, height), os.urandom(width * height * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def saved_photo(sha256):
+    assert pcReceiver.photo_writer.flush(5)
+    for name in os.listdir(pcReceiver.photos_dir):
+        if sha256[:8] in name:
+            with open(os.path.join(pcReceiver.photos_dir, name), 'rb') as f:
+                return f.read()
+    return None
+
+
+def test_json_body_is_decoded_without_copying_the_image(client):
+    raw = make_png()
+    body = json.dumps({"image": "data:image/png;base64," + base64.b64encode(raw).decode(),
+                       "detected_name": "Voordeur"}).encode()
+
+    tracemalloc.start()
+    try:
+        response = client.post('/photo', data=body, content_type='application/json')
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert response.status_code == 200
+    assert response.json["size"] == len(raw)
+    assert response.json["sha256"] == hashlib.sha256(raw).hexdigest()
+    # Body (~4,3 MB) en afbeelding (~3,2 MB) worden nooit in één keer in het geheugen gezet
+    assert peak < len(raw) // 2
+    assert saved_photo(response.json["sha256"]) == raw
+
+
+@pytest.mark.parametrize("kind", ["raw", "data_uri", "multipart"])
+def test_other_content_types_stream_to_the_writer(client, kind):
+    raw = make_png(200, 150)
+    if kind == "raw":
+        response = client.post('/photo', data=raw, content_type='image/png')
+    elif kind == "data_uri":
+        response = client.post('/photo', data=b"data:image/png;base64," + base64.b64encode(raw),
+                               content_type='text/plain')
+    else:
+        response = client.post('/photo', data={'file': (io.BytesIO(raw), 'foto.png')},
+                               content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert response.json["size"] == len(raw)
+    assert saved_photo(response.json["sha256"]) == raw
+
+
+def test_nested_thumbnail_is_found(client):
+    raw = make_png(20, 20)
+    response = client.post('/photo', json={"alarm": {"snapshot": base64.b64encode(raw).decode()}})
+    assert response.status_code == 200
+    assert response.json["size"] == len(raw)
+
+
+def test_text_is_not_mistaken_for_an_image():
+    bmp = io.BytesIO()
+    Image.new('RGB', (4, 4)).save(bmp, 'BMP')
+
+    assert pcReceiver.looks_like_base64_image(base64.b64encode(bmp.getvalue()).decode())
+    assert not pcReceiver.looks_like_base64_image("Qk is ook het begin van gewone tekst")
+    assert not pcReceiver.looks_like_base64_image(base64.b64encode(b"BMW i3 laadt op de oprit").decode())
+
+
+def test_invalid_bodies_are_rejected(client):
+    assert client.post('/photo', data=b'{kapot', content_type='application/json').status_code == 400
+    assert client.post('/photo', json={"image": "geen base64!"}).status_code == 400
+    assert client.post('/photo', json={"message": "zonder foto"}).status_code == 400
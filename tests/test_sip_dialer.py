@@ -0,0 +1,52 @@
+"""SIP calls via de langlopende dialer (sippy.py --serve): nep dialer op een lokale UDP socket"""
+
+import json
+import socket
+import threading
+
+import pytest
+
+import script
+
+
+@pytest.fixture
+def dialer(monkeypatch):
+    """Nep dialer: ontvangen verzoeken komen in de lijst, antwoord {"ok": true}"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    sock.settimeout(0.2)
+    requests = []
+    stopping = threading.Event()
+
+    def serve():
+        while not stopping.is_set():
+            try:
+                data, sender = sock.recvfrom(4096)
+            except socket.timeout:
+                continue
+            requests.append(json.loads(data.decode("utf-8")))
+            sock.sendto(json.dumps({"ok": True}).encode("utf-8"), sender)
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    sip_config = dict(script.current_config("sip"), dialer=f"127.0.0.1:{sock.getsockname()[1]}",
+                      alarm_number="6200")
+    current_config = script.current_config
+    monkeypatch.setattr(script, "current_config",
+                        lambda section: sip_config if section == "sip" else current_config(section))
+    monkeypatch.setattr(script, "build_sip_command", lambda destination, duration: pytest.fail(
+        "dialer antwoordt, er mag geen los SIP proces starten"))
+    yield requests
+    stopping.set()
+    thread.join()
+    sock.close()
+
+
+def test_rule_number_is_sent_to_the_dialer(dialer):
+    assert script.run_alarm_action({"type": "sip", "number": "0612345678"}, {}) is True
+    assert [request["extension"] for request in dialer] == ["0612345678"]
+
+
+def test_alarm_number_is_the_default_destination(dialer):
+    assert script.run_alarm_action({"type": "sip"}, {}) is True
+    assert dialer == [{"extension": "6200", "trace_id": None}]
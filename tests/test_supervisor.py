@@ -0,0 +1,224 @@
+"""supervisor.py: backoff, crash loop, control commando's, config reconcile en /proc (korte sys.executable children)"""
+
+import os
+import sys
+import time
+
+import pytest
+
+import supervisor
+
+SLEEPER = [sys.executable, "-c", "import time; time.sleep(60)"]
+CRASHER = [sys.executable, "-c", "import sys; print('kapot'); sys.exit(3)"]
+
+
+def wait_for(predicate, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise AssertionError("timeout")
+        time.sleep(0.02)
+
+
+@pytest.fixture
+def settings(monkeypatch, tmp_path):
+    """Eigen config (logs in tmp_path, korte backoff); children per test in settings["children"]"""
+    settings = {
+        "supervisor": dict(supervisor.SUPERVISOR_DEFAULTS["supervisor"], log_dir=str(tmp_path / "logs"),
+                           control=f"unix:{tmp_path / 'supervisor.sock'}", stop_timeout=2.0, sample_interval=0.0),
+        "backoff": {"initial": 1.0, "multiplier": 2.0, "max_delay": 10.0, "reset_after": 60.0},
+        "crash_loop": {"max_restarts": 5, "window": 120.0, "hold_off": 300.0},
+        "children": {},
+    }
+    monkeypatch.setattr(supervisor, "supervisor_config", lambda section: settings[section])
+    return settings
+
+
+@pytest.fixture
+def manager(settings):
+    manager = supervisor.Supervisor()
+    yield manager
+    manager.shutdown()
+
+
+def make_child(settings, command=SLEEPER):
+    return supervisor.Child("test", dict(supervisor.CHILD_DEFAULTS, command=command))
+
+
+def test_backoff_grows_until_max_delay_and_resets_after_a_long_run(settings):
+    child = make_child(settings)
+    delays = []
+    now = 1000.0
+    for _ in range(6):
+        child.started_at = now
+        now += 1.0
+        child.schedule_restart(now)
+        delays.append(child.next_start - now)
+        child.recent_starts.clear()
+    assert delays == [1.0, 2.0, 4.0, 8.0, 10.0, 10.0]
+    assert child.state == "backoff"
+
+    # Langer dan reset_after gedraaid: geen crash reeks meer, weer vanaf initial
+    child.started_at = now
+    now += 60.0
+    child.schedule_restart(now)
+    assert child.next_start - now == 1.0 and child.failures == 1
+
+
+def test_too_many_starts_in_the_window_is_a_crash_loop(settings):
+    child = make_child(settings)
+    child.recent_starts.extend([0.0, 10.0, 200.0, 210.0, 220.0, 230.0])
+    child.schedule_restart(240.0)
+    # Starts van voor het venster tellen niet mee: 4 < 5
+    assert child.state == "backoff"
+
+    child.recent_starts.append(240.0)
+    child.schedule_restart(250.0)
+    assert child.state == "crash_loop" and child.crash_loops == 1
+    assert child.next_start == 250.0 + 300.0
+    assert not child.recent_starts
+
+
+def test_crashing_child_is_restarted_with_backoff(manager, settings):
+    settings["backoff"].update(initial=0.1, max_delay=0.2)
+    settings["crash_loop"].update(max_restarts=3)
+    settings["children"]["crasher"] = {"command": CRASHER}
+    manager.reconcile()
+    child = manager.children["crasher"]
+
+    wait_for(lambda: manager.tick() or child.state == "crash_loop")
+    assert child.starts == 3 and child.restarts == 2 and child.last_exit == 3
+    status = manager.get_status()["children"]["crasher"]
+    assert status["state"] == "crash_loop" and status["next_start_in"] > 200
+
+    # stdout van de child staat in zijn eigen logbestand
+    log_path = os.path.join(settings["supervisor"]["log_dir"], "crasher.log")
+
+    def log_text():
+        with open(log_path, encoding="utf-8") as f:
+            return f.read()
+
+    wait_for(lambda: "[stdout] kapot" in log_text())
+    assert "beëindigd (exit 3)" in log_text()
+
+
+def test_control_commands(manager, settings):
+    settings["children"]["sleeper"] = {"command": SLEEPER}
+    manager.reconcile()
+    manager.tick()
+    child = manager.children["sleeper"]
+    first_pid = child.pid
+    assert child.state == "running"
+
+    reply = manager.command("stop sleeper")
+    assert reply["ok"] and reply["children"]["sleeper"]["state"] == "stopped"
+    assert child.process.poll() is not None and not child.wanted
+    manager.tick()
+    assert child.state == "stopped"
+
+    reply = manager.command("start sleeper")
+    assert reply["children"]["sleeper"]["state"] == "running"
+
+    pid = child.pid
+    assert manager.command("restart all")["children"]["sleeper"]["pid"] not in (None, pid, first_pid)
+
+    assert manager.command("status")["children"]["sleeper"]["state"] == "running"
+    assert manager.command("stop onbekend") == {"ok": False, "error": "onbekende child: onbekend"}
+    assert not manager.command("herstart sleeper")["ok"]
+    assert not manager.command("")["ok"]
+
+
+@pytest.mark.skipif(not hasattr(supervisor, "ThreadingControlUnixServer"), reason="geen unix sockets")
+def test_control_socket_round_trip(manager, settings, monkeypatch):
+    settings["children"]["sleeper"] = {"command": SLEEPER}
+    manager.reconcile()
+    monkeypatch.setattr(supervisor, "supervisor", manager)
+    manager.control_server = supervisor.start_control_server(settings["supervisor"]["control"])
+
+    reply = supervisor.control_request("start sleeper")
+    assert reply["ok"] and reply["children"]["sleeper"]["state"] == "running"
+    assert supervisor.control_request("status")["children"]["sleeper"]["pid"] == manager.children["sleeper"].pid
+
+
+def test_config_change_leaves_a_stopped_child_stopped(manager, settings):
+    settings["children"] = {"sleeper": {"command": SLEEPER}, "other": {"command": SLEEPER}}
+    manager.reconcile()
+    manager.tick()
+    manager.command("stop sleeper")
+    other_pid = manager.children["other"].pid
+
+    # Wijziging van een andere child: sleeper blijft gestopt, other herstart
+    settings["children"]["other"] = {"command": SLEEPER, "env": {"X": "1"}}
+    manager.reconcile()
+    manager.tick()
+    assert manager.children["sleeper"].state == "stopped" and not manager.children["sleeper"].wanted
+    assert manager.children["other"].state == "running" and manager.children["other"].pid != other_pid
+
+    # Eigen spec gewijzigd: wel weer gestart
+    settings["children"]["sleeper"] = {"command": SLEEPER, "env": {"X": "1"}}
+    manager.reconcile()
+    manager.tick()
+    assert manager.children["sleeper"].state == "running"
+
+
+def test_disabled_child_starts_when_enabled(manager, settings):
+    settings["children"] = {"sleeper": {"command": SLEEPER, "enabled": False}}
+    manager.reconcile()
+    manager.tick()
+    assert manager.children["sleeper"].state == "stopped"
+
+    settings["children"]["sleeper"] = {"command": SLEEPER, "enabled": True}
+    manager.reconcile()
+    manager.tick()
+    assert manager.children["sleeper"].state == "running"
+
+    settings["children"]["sleeper"] = {"command": SLEEPER, "enabled": False}
+    manager.reconcile()
+    assert manager.children["sleeper"].state == "stopped"
+
+    del settings["children"]["sleeper"]
+    manager.reconcile()
+    assert manager.children == {}
+
+
+def test_proc_stat_name_with_spaces_and_parentheses(monkeypatch):
+    fields = ["S", "4242"] + ["0"] * 9 + ["150", "50"] + ["0"] * 8 + ["300"]
+    stat = f"1234 (python3 (gunicorn) worker) {' '.join(fields)}\n".encode()
+
+    class FakeFile:
+        def __init__(self, path, mode):
+            assert path == "/proc/1234/stat"
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def read(self):
+            return stat
+
+    monkeypatch.setattr(supervisor, "open", FakeFile, raising=False)
+    assert supervisor.read_proc_stat(1234) == (4242, 200, 300 * supervisor.PAGE_SIZE)
+
+
+@pytest.mark.skipif(not os.path.isdir("/proc"), reason="geen /proc")
+def test_process_tree_usage_counts_the_children(manager, settings):
+    assert supervisor.read_proc_stat(os.getpid())[0] == os.getppid()
+    assert supervisor.read_proc_stat(999999999) is None
+
+    settings["children"]["tree"] = {"command": [sys.executable, "-c",
+                                                "import subprocess, sys, time; "
+                                                "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)']); "
+                                                "time.sleep(60)"]}
+    manager.reconcile()
+    manager.tick()
+    child = manager.children["tree"]
+    wait_for(lambda: (supervisor.process_tree_usage(child.pid) or (0, 0, 0))[2] == 2)
+
+    ticks, rss, count = supervisor.process_tree_usage(child.pid)
+    assert rss > 0
+    manager.tick()
+    manager.tick()
+    status = manager.get_status()["children"]["tree"]
+    assert status["processes"] == 2 and status["rss_bytes"] > 0 and status["cpu_percent"] is not None
@@ -0,0 +1,93 @@
+"""script.py (Flask) en async_webhook.py (aiohttp) gedragen zich hetzelfde op /webhook"""
+
+import asyncio
+import json
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import async_webhook
+import script
+
+PAYLOAD = {
+    "alarm": {
+        "name": "Beweging voordeur",
+        "sources": [{"device": "28704E113F33", "type": "include"}],
+        "conditions": [{"condition": {"type": "is", "source": "motion"}}],
+        "triggers": [{"key": "motion", "device": "28704E113F33", "eventId": "6718ab"}],
+    },
+    "timestamp": 1729512345678,
+}
+
+REQUESTS = [
+    ("POST", "/webhook", json.dumps(PAYLOAD).encode(), "application/json"),
+    ("POST", "/webhook", b"", "application/json"),
+    ("POST", "/webhook", b"{kapot", "application/json"),
+    ("POST", "/webhook", b"alarm=motion", "text/plain"),
+    ("GET", "/webhook?alarm=motion&camera=front", None, None),
+    ("GET", "/webhook", None, None),
+]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Wat elke service met een request doet: process_alarm (GET) en de uitgevoerde acties"""
+    calls = []
+    monkeypatch.setitem(script.DEDUP_CONFIG, "enabled", False)
+    process_alarm = script.process_alarm
+
+    def recording_process_alarm(alarm_data, request_type="GET", sanitized_for_logging=None):
+        if request_type == "GET":
+            calls.append(("process_alarm", dict(alarm_data)))
+        return process_alarm(alarm_data, request_type, sanitized_for_logging)
+
+    def recording_action(action, context):
+        calls.append(("action", action["type"], context["alarm_name"]))
+        return True
+
+    monkeypatch.setattr(script, "process_alarm", recording_process_alarm)
+    monkeypatch.setattr(script, "run_alarm_action", recording_action)
+    monkeypatch.setattr(async_webhook, "run_alarm_action_async", lambda app, action, context:
+                        recording_action(action, context))
+    monkeypatch.setattr(script, "unreachable_target", lambda action: None)
+    return calls
+
+
+def response_body(content_type, data):
+    return json.loads(data) if content_type == "application/json" else data.decode()
+
+
+def flask_responses():
+    client = script.app.test_client()
+    responses = []
+    for method, path, body, content_type in REQUESTS:
+        response = client.open(path, method=method, data=body, content_type=content_type)
+        responses.append((response.status_code, response_body(response.mimetype, response.data)))
+    return responses
+
+
+async def aiohttp_responses():
+    client = TestClient(TestServer(async_webhook.create_app()))
+    await client.start_server()
+    responses = []
+    try:
+        for method, path, body, content_type in REQUESTS:
+            headers = {"Content-Type": content_type} if content_type else {}
+            async with client.request(method, path, data=body, headers=headers) as response:
+                responses.append((response.status, response_body(response.content_type, await response.read())))
+    finally:
+        await client.close()
+    return responses
+
+
+def test_flask_and_async_webhook_respond_the_same(calls):
+    flask = flask_responses()
+    flask_calls = list(calls)
+    calls.clear()
+    async_ = asyncio.run(aiohttp_responses())
+
+    assert flask == async_
+    assert [status for status, _ in flask] == [200, 400, 400, 415, 200, 200]
+    assert flask_calls == calls
+    assert ("process_alarm", {"alarm": "motion", "camera": "front"}) in calls
+    assert ("action", "display", "Beweging voordeur") in calls
@@ -0,0 +1,218 @@
+"""wifi_monitor.py: herstel ladder (nep klok, runner en check) en gelijktijdig proben"""
+
+import asyncio
+import copy
+import time
+
+import pytest
+
+import wifi_monitor
+
+
+class FakeClock:
+    """clock() en sleep() in één: slapen zet de klok vooruit"""
+
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+        return True
+
+
+class FakeNetwork:
+    """Runner + check: de verbinding komt terug na de stap recovers_after (None = nooit)"""
+
+    def __init__(self, clock, recovers_after=None, active_service="NetworkManager"):
+        self.clock = clock
+        self.recovers_after = recovers_after
+        self.active_service = active_service
+        self.commands = []
+        self.checks = []
+        self.restarts = 0
+        self.reboots = []
+        self.recovered = False
+
+    def runner(self, args, timeout):
+        args = [arg for arg in args if arg not in ('sudo', '-n')]
+        self.commands.append(' '.join(args))
+        if args[:2] == ['systemctl', 'is-active']:
+            return (0 if args[-1] == self.active_service else 3), ""
+        if args[:2] == ['systemctl', 'restart'] and self.recovers_after == "restart_network":
+            self.recovered = True
+        if args[-1] == 'up' and self.recovers_after == "bounce_wifi":
+            self.recovered = True
+        return 0, ""
+
+    def check(self):
+        self.checks.append(self.clock())
+        return self.recovered
+
+    def restart_script(self):
+        self.restarts += 1
+        if self.recovers_after == "restart_script":
+            self.recovered = True
+        return True
+
+    def reboot(self):
+        self.reboots.append(self.clock())
+
+
+def make_ladder(network, clock, **config):
+    recovery = copy.deepcopy(wifi_monitor.MONITOR_DEFAULTS["recovery"])
+    recovery.update(config)
+    return wifi_monitor.RecoveryLadder(runner=network.runner, check=network.check, sleep=clock.sleep,
+                                       clock=clock, restart_script=network.restart_script,
+                                       reboot=network.reboot, config=recovery)
+
+
+@pytest.mark.parametrize("recovers_after", ["bounce_wifi", "restart_network", "restart_script"])
+def test_ladder_escalates_in_order_until_a_step_recovers(recovers_after):
+    clock = FakeClock()
+    network = FakeNetwork(clock, recovers_after)
+    ladder = make_ladder(network, clock)
+
+    assert ladder.run(clock()) == recovers_after
+
+    steps = [step["step"] for step in ladder.get_status()["last_run"]["steps"]]
+    assert steps == list(wifi_monitor.RecoveryLadder.STEPS[:steps.index(recovers_after) + 1])
+    assert network.reboots == []
+    assert network.commands[:2] == ['ip link set wlan0 down', 'ip link set wlan0 up']
+    if recovers_after != "bounce_wifi":
+        assert network.commands[2:] == ['systemctl is-active --quiet NetworkManager',
+                                        'systemctl restart NetworkManager']
+    assert network.restarts == (1 if recovers_after == "restart_script" else 0)
+
+
+def test_reprobe_uses_the_backoff_and_stops_at_the_step_timeout():
+    clock = FakeClock()
+    network = FakeNetwork(clock, "restart_network")
+    ladder = make_ladder(network, clock, reprobe_backoff=[5, 10, 20, 40], timeouts=dict(
+        wifi_monitor.MONITOR_DEFAULTS["recovery"]["timeouts"], reprobe=50))
+
+    ladder.run(clock())
+
+    # 5 + 10 + 20 = 35, de laatste wacht wordt afgekapt op de 50s van de stap
+    assert clock.sleeps[:4] == [5, 10, 20, 15]
+    assert network.checks[:4] == [1005.0, 1015.0, 1035.0, 1050.0]
+    assert ladder.get_status()["steps"]["reprobe"]["seconds_total"] == 50.0
+
+
+def test_later_steps_probe_at_the_check_interval():
+    clock = FakeClock()
+    network = FakeNetwork(clock, None)
+    ladder = make_ladder(network, clock, steps=["bounce_wifi"], check_interval=5,
+                         timeouts=dict(wifi_monitor.MONITOR_DEFAULTS["recovery"]["timeouts"], bounce_wifi=20))
+
+    assert ladder.run(clock()) is None
+
+    # 2s tussen down en up, daarna elke 5s proben tot de 20s om zijn
+    assert clock.sleeps == [2, 5, 5, 5, 5]
+    assert ladder.get_status()["exhausted"] == 1
+
+
+def test_reboot_only_after_the_timeout_limit():
+    clock = FakeClock()
+    network = FakeNetwork(clock, None)
+    ladder = make_ladder(network, clock)
+    outage_started = clock()
+
+    assert ladder.run(outage_started) is None
+
+    limit = wifi_monitor.monitor_config("monitor")["timeout_limit_seconds"]
+    assert len(network.reboots) == 1
+    assert network.reboots[0] >= outage_started + limit
+    assert [step["step"] for step in ladder.get_status()["last_run"]["steps"]] == list(
+        wifi_monitor.RecoveryLadder.STEPS)
+
+
+def test_ladder_starts_at_the_bottom_again_after_a_recovery():
+    clock = FakeClock()
+    network = FakeNetwork(clock, "restart_network")
+    ladder = make_ladder(network, clock)
+    assert ladder.run(clock()) == "restart_network"
+
+    # Volgende storing: een korte hapering, de eerste reprobe lukt
+    network.recovered = False
+    network.recovers_after = None
+    network.check = lambda: True
+    ladder.check = network.check
+    assert ladder.run(clock()) == "reprobe"
+
+    status = ladder.get_status()
+    assert status["runs"] == 2 and status["recoveries"] == 2
+    assert status["steps"]["reprobe"] == {"attempts": 2, "successes": 1, "seconds_total": 40.0}
+    assert status["steps"]["bounce_wifi"]["attempts"] == 1
+    assert status["current_step"] is None
+    assert status["last_run"]["steps"] == [{"step": "reprobe", "recovered": True, "seconds": 5.0}]
+
+
+def test_shutdown_stops_the_ladder_without_reboot():
+    clock = FakeClock()
+    network = FakeNetwork(clock, None)
+    ladder = make_ladder(network, clock)
+    ladder.sleep = lambda seconds: False
+
+    assert ladder.run(clock()) is None
+    assert network.reboots == []
+    assert len(ladder.get_status()["last_run"]["steps"]) == 1
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    """Nep probes: adres → (vertraging in s, ok); round_timeout 0.3s"""
+    behaviour = {}
+
+    async def fake_probe(address):
+        delay, ok = behaviour[address]
+        await asyncio.sleep(delay)
+        return (True, delay * 1000, None) if ok else (False, None, "unreachable")
+
+    monitor_config = wifi_monitor.monitor_config
+    probe_config = dict(monitor_config("probe"), round_timeout=0.3, down_after=2, ewma_alpha=0.5)
+    monkeypatch.setattr(wifi_monitor, "probe_target", fake_probe)
+    monkeypatch.setattr(wifi_monitor, "monitor_config",
+                        lambda section: probe_config if section == "probe" else monitor_config(section))
+    return behaviour
+
+
+def test_targets_are_probed_concurrently_within_one_deadline(probe):
+    probe.update({"internet": (0.1, True), "lan": (0.1, True), "nvr": (0.2, True), "smtp": (5.0, True)})
+    monitor = wifi_monitor.ReachabilityMonitor()
+    monitor.configured_targets = lambda: {"internet": "internet", "lan:nvr": "nvr", "gateway": "lan",
+                                          "smtp": "smtp"}
+
+    started = time.perf_counter()
+    health = monitor.run_round()
+    elapsed = time.perf_counter() - started
+
+    # Na elkaar zou het 5,4s duren; samen en met de deadline hooguit ~0,3s
+    assert elapsed < 1.0
+    assert health["internet"].ok and health["lan:nvr"].ok and health["gateway"].ok
+    assert health["smtp"].ok is False and health["smtp"].last_error == "timeout (0.3s)"
+    assert health["smtp"].up  # Eén misser is nog geen "down"
+    assert monitor.lan_reachable()
+
+
+def test_target_goes_down_after_a_failure_streak_and_tracks_latency(probe):
+    probe.update({"internet": (0.01, True), "nvr": (0.02, True)})
+    monitor = wifi_monitor.ReachabilityMonitor()
+    monitor.configured_targets = lambda: {"internet": "internet", "lan:nvr": "nvr"}
+
+    monitor.run_round()
+    probe["internet"] = (0.03, True)
+    health = monitor.run_round()
+    assert health["internet"].latency_ms == pytest.approx(30)
+    assert health["internet"].ewma_ms == pytest.approx(20)
+
+    probe["nvr"] = (0.0, False)
+    assert monitor.run_round()["lan:nvr"].up
+    health = monitor.run_round()
+    assert not health["lan:nvr"].up and health["lan:nvr"].failure_streak == 2
+    assert not monitor.lan_reachable()
+    assert monitor.snapshot()["rounds"] == 4
@@ -5,6 +5,11 @@ import logging
 import sys
 import os
 import signal
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
 
 # Systemd watchdog support
 try:
@@ -14,6 +19,13 @@ except ImportError:
     SYSTEMD_AVAILABLE = False
     print("⚠️  systemd library niet beschikbaar - watchdog uitgeschakeld")
 
+# Externe configuratie (config_loader.py naast dit script kopiëren)
+try:
+    from config_loader import ConfigManager
+except ImportError:
+    ConfigManager = None
+    print("⚠️  config_loader.py niet gevonden - ingebouwde configuratie zonder hot reload")
+
 # Global flag voor graceful shutdown
 shutdown_requested = False
 
@@ -27,48 +39,424 @@ RELIABLE_HOST = "8.8.8.8"
 # Script paths
 #SCRIPT_DIR = '/home/arduino/face'  # Directory waar script.py en start_script.sh staan
 SCRIPT_DIR = '/home/pi/face'  # Directory waar script.py en start_script.sh staan
-START_SCRIPT = os.path.join(SCRIPT_DIR, 'start_script.sh')
 #SCRIPT_PID_FILE = '/home/arduino/face/script.pid'  # PID file om script.py proces te tracken
 SCRIPT_PID_FILE = '/home/pi/face/script.pid'  # PID file om script.py proces te tracken
 
+# Bovenstaande waarden zijn standaarden: wifi_monitor.toml naast dit script
+# (of $WIFI_MONITOR_CONFIG) en WIFI_MONITOR_<SECTIE>__<SLEUTEL> env variabelen
+# overschrijven ze, wijzigingen in het bestand worden zonder herstart opgepikt.
+CONFIG_FILE = os.environ.get(
+    "WIFI_MONITOR_CONFIG",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "wifi_monitor.toml")
+)
+MONITOR_DEFAULTS = {
+    "monitor": {
+        "check_interval_seconds": CHECK_INTERVAL_SECONDS,
+        "timeout_limit_seconds": TIMEOUT_LIMIT_SECONDS,
+        "reliable_host": RELIABLE_HOST,
+        "lan_hosts": [],              # "host:poort" op het LAN (NVR, Loxone); leeg = default gateway
+        "stop_script_on_wan_loss": False  # True = oud gedrag: script.py stoppen zodra internet weg is
+    },
+    "paths": {
+        "log_file": LOG_FILE,
+        "script_dir": SCRIPT_DIR,
+        "start_script": "",           # Leeg = <script_dir>/start_script.sh
+        "pid_file": SCRIPT_PID_FILE,
+        "network_state_file": "",     # Leeg = <script_dir>/network_state.json (gelezen door script.py)
+        "supervisor_control": ""      # "unix:/pad/supervisor.sock": script.py via supervisor.py starten/stoppen
+    },
+    "probe": {
+        "round_timeout": 3.0,         # Eén deadline (s) voor alle probes van een ronde samen
+        "ewma_alpha": 0.3,            # Gewicht van de nieuwste latency in het gemiddelde
+        "down_after": 2,              # Zoveel mislukte probes op rij = "down"
+        "listen": "127.0.0.1:8731"    # Status endpoint: "host:poort", "unix:/pad/socket" of "" (uit)
+    },
+    # Afhankelijkheden van script.py, naam → "host:poort" (namen zoals in script.py NETWORK_CONFIG)
+    "targets": {},
+    # Herstel ladder: goedkope stappen eerst, reboot pas als laatste (zie RecoveryLadder)
+    "recovery": {
+        "enabled": True,              # False = oud gedrag: reboot na timeout_limit_seconds
+        "steps": ["reprobe", "bounce_wifi", "restart_network", "restart_script", "reboot"],
+        "interface": "wlan0",
+        "network_services": ["NetworkManager", "wpa_supplicant"],  # De eerste die actief is wordt herstart
+        "reprobe_backoff": [5, 10, 20],
+        "check_interval": 5,          # Na een stap: zo vaak (s) opnieuw proben tot de timeout
+        "command_timeout": 20,        # Max duur (s) van één commando (ip, systemctl)
+        "timeouts": {                 # Per stap: zo lang (s) wachten op herstel
+            "reprobe": 60,
+            "bounce_wifi": 45,
+            "restart_network": 60,
+            "restart_script": 30
+        }
+    }
+}
+
+if ConfigManager is not None:
+    config_manager = ConfigManager(MONITOR_DEFAULTS, path=CONFIG_FILE, env_prefix="WIFI_MONITOR")
+    config_manager.load()
+else:
+    config_manager = None
+
+def monitor_config(section):
+    """Actieve config sectie ("monitor" of "paths")"""
+    if config_manager is None:
+        return MONITOR_DEFAULTS[section]
+    return config_manager.section(section)
+
+def script_paths():
+    """
+    Paden van script.py
+
+    Returns:
+        tuple: (script_dir, start_script, pid_file)
+    """
+    paths = monitor_config("paths")
+    start_script_path = paths["start_script"] or os.path.join(paths["script_dir"], 'start_script.sh')
+    return paths["script_dir"], start_script_path, paths["pid_file"]
+
 # Configureer de logging om naar het bestand te schrijven
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
-    filename=LOG_FILE,      # Schrijf naar dit bestand
+    filename=monitor_config("paths")["log_file"],  # Schrijf naar dit bestand
     filemode='a'            # Voeg toe aan het bestand (append)
 )
 logger = logging.getLogger(__name__)
 
+def on_paths_config_change(old, new):
+    """Ander logbestand: alleen de file handler vervangen, de monitor loopt door"""
+    if old["log_file"] == new["log_file"]:
+        return
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.FileHandler):
+            root.removeHandler(handler)
+            handler.close()
+    handler = logging.FileHandler(new["log_file"], mode='a')
+    handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    root.addHandler(handler)
+    logger.info(f"📝 Logbestand gewijzigd van {old['log_file']} naar {new['log_file']}")
+
+if config_manager is not None:
+    config_manager.subscribe("paths", on_paths_config_change)
+
 # --- Variabelen ---
 verbindingsfout_starttijd = None
 script_is_running = False
+netwerk_status = None  # Laatst gepubliceerde (wan, lan)
+netwerk_status_sinds = None
 
-def check_internet_connection(host=RELIABLE_HOST):
-    """Controleert of een externe host bereikbaar is."""
+def default_gateway():
+    """IP van de default gateway uit /proc/net/route (Linux), of None"""
     try:
-        socket.create_connection((host, 53), timeout=5)
-        return True
-    except OSError:
-        return False
-    except Exception as e:
-        logger.warning(f"Onverwachte fout bij verbindingstest: {e}")
-        return False
+        with open('/proc/net/route', 'r') as f:
+            for line in f.readlines()[1:]:
+                fields = line.split()
+                if len(fields) > 2 and fields[1] == '00000000' and int(fields[3], 16) & 2:
+                    return socket.inet_ntoa(bytes.fromhex(fields[2])[::-1])
+    except (OSError, ValueError):
+        pass
+    return None
+
+class TargetHealth:
+    """Bereikbaarheid van één afhankelijkheid over de rondes heen"""
+
+    def __init__(self, name, address):
+        self.name = name
+        self.address = address
+        self.ok = None                # Resultaat van de laatste probe
+        self.up = True                # False na down_after mislukte probes op rij
+        self.latency_ms = None
+        self.ewma_ms = None
+        self.failure_streak = 0
+        self.success_streak = 0
+        self.probes = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_ok = None
+        self.changed_at = time.time()
+
+    def update(self, ok, latency_ms, error, alpha, down_after):
+        self.probes += 1
+        self.ok = ok
+        self.last_error = error
+        if ok:
+            self.latency_ms = latency_ms
+            self.ewma_ms = latency_ms if self.ewma_ms is None else alpha * latency_ms + (1 - alpha) * self.ewma_ms
+            self.failure_streak = 0
+            self.success_streak += 1
+            self.last_ok = time.time()
+        else:
+            self.failures += 1
+            self.failure_streak += 1
+            self.success_streak = 0
+        up = self.failure_streak < down_after
+        if up != self.up:
+            self.up = up
+            self.changed_at = time.time()
+            if up:
+                logger.info(f"✅ {self.name} ({self.address}) weer bereikbaar")
+            else:
+                logger.warning(f"❌ {self.name} ({self.address}) onbereikbaar: {error}")
+
+    def to_dict(self):
+        return {
+            "address": self.address,
+            "up": self.up,
+            "ok": self.ok,
+            "latency_ms": None if self.latency_ms is None else round(self.latency_ms, 1),
+            "ewma_ms": None if self.ewma_ms is None else round(self.ewma_ms, 1),
+            "failure_streak": self.failure_streak,
+            "success_streak": self.success_streak,
+            "probes": self.probes,
+            "failures": self.failures,
+            "last_error": self.last_error,
+            "last_ok": self.last_ok,
+            "changed_at": self.changed_at
+        }
+
+def split_address(address, default_port=53):
+    """"host:poort" → (host, poort)"""
+    host, _, port = address.rpartition(':')
+    if not host:
+        return address, default_port
+    return host.strip('[]'), int(port)
+
+async def probe_target(address):
+    """
+    TCP connect naar host:poort
+
+    Een geweigerde verbinding telt als bereikbaar: de host heeft geantwoord
+    (handig voor SIP/Loxone die op UDP luisteren).
+
+    Returns:
+        tuple: (ok, latency in ms, fout of None)
+    """
+    started = time.perf_counter()
+    try:
+        host, port = split_address(address)
+        _, writer = await asyncio.open_connection(host, port)
+        writer.close()
+        return True, (time.perf_counter() - started) * 1000, None
+    except ConnectionRefusedError:
+        return True, (time.perf_counter() - started) * 1000, "refused"
+    except (OSError, ValueError) as e:
+        return False, None, str(e) or type(e).__name__
+
+class ReachabilityMonitor:
+    """
+    📡 BEREIKBAARHEID PER AFHANKELIJKHEID
+
+    Elke ronde worden alle targets tegelijk getest (asyncio), met één
+    deadline voor de hele ronde: een hangende host vertraagt de rest niet
+    en een ronde duurt nooit langer dan round_timeout. Per target wordt de
+    latency (laatste + EWMA), de failure streak en up/down bijgehouden.
+
+    Vaste targets:
+        internet  reliable_host:53 (WAN)
+        lan:...   monitor.lan_hosts, of "gateway" (default gateway) als die leeg is
+    Plus alles uit de [targets] sectie (NVR, pcReceiver, SIP, SMTP, Loxone).
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.targets = {}
+        self.rounds = 0
+        self.last_round = None
+        self.last_round_ms = None
+
+    def configured_targets(self):
+        """naam → adres voor de huidige config"""
+        settings = monitor_config("monitor")
+        targets = {"internet": f"{settings['reliable_host']}:53"}
+        if settings["lan_hosts"]:
+            targets.update({f"lan:{host}": host for host in settings["lan_hosts"]})
+        else:
+            gateway = default_gateway()
+            if gateway is not None:
+                targets["gateway"] = f"{gateway}:53"
+        targets.update(monitor_config("targets"))
+        return targets
+
+    async def _round(self, targets, timeout):
+        tasks = {asyncio.ensure_future(probe_target(address)): name for name, address in targets.items()}
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        results = {tasks[task]: task.result() for task in done}
+        for task in pending:
+            results[tasks[task]] = (False, None, f"timeout ({timeout}s)")
+        return results
+
+    def run_round(self):
+        """
+        Eén probe ronde over alle targets
+
+        Returns:
+            dict: naam → TargetHealth
+        """
+        probe = monitor_config("probe")
+        targets = self.configured_targets()
+        started = time.perf_counter()
+        results = asyncio.run(self._round(targets, probe["round_timeout"]))
+        with self.lock:
+            health = {}
+            for name, address in targets.items():
+                target = self.targets.get(name)
+                if target is None or target.address != address:
+                    target = TargetHealth(name, address)
+                ok, latency_ms, error = results[name]
+                target.update(ok, latency_ms, error, probe["ewma_alpha"], probe["down_after"])
+                health[name] = target
+            self.targets = health
+            self.rounds += 1
+            self.last_round = time.time()
+            self.last_round_ms = (time.perf_counter() - started) * 1000
+        return health
+
+    def lan_reachable(self):
+        """True als een LAN target (lan:... of gateway) de laatste ronde antwoordde"""
+        with self.lock:
+            return any(target.ok for name, target in self.targets.items()
+                       if name.startswith("lan:") or name == "gateway")
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "rounds": self.rounds,
+                "last_round": self.last_round,
+                "last_round_ms": None if self.last_round_ms is None else round(self.last_round_ms, 1),
+                "targets": {name: target.to_dict() for name, target in self.targets.items()}
+            }
+
+reachability = ReachabilityMonitor()
+
+class StatusRequestHandler(BaseHTTPRequestHandler):
+    """GET / of /targets → JSON met de bereikbaarheid per target, /recovery → herstel ladder"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/targets', '/health', '/recovery'):
+            self.send_error(404)
+            return
+        if self.path.split('?')[0] == '/recovery':
+            body = json.dumps(recovery_ladder.get_status()).encode('utf-8')
+        else:
+            body = json.dumps(dict(reachability.snapshot(), recovery=recovery_ladder.get_status())).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients hebben geen (host, poort)
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        logger.debug("status endpoint: " + format % args)
+
+class ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+def start_status_server(listen=None):
+    """
+    Start het status endpoint in een achtergrond thread
+
+    Returns:
+        server of None (uitgeschakeld of poort/socket niet beschikbaar)
+    """
+    listen = monitor_config("probe")["listen"] if listen is None else listen
+    if not listen:
+        return None
+    try:
+        if listen.startswith("unix:"):
+            path = listen[len("unix:"):]
+            if os.path.exists(path):
+                os.remove(path)
+            server = ThreadingUnixHTTPServer(path, StatusRequestHandler)
+        else:
+            server = ThreadingHTTPServer(split_address(listen, 8731), StatusRequestHandler)
+            server.daemon_threads = True
+    except OSError as e:
+        logger.error(f"❌ Status endpoint {listen} niet gestart: {e}")
+        return None
+    threading.Thread(target=server.serve_forever, name="StatusServer", daemon=True).start()
+    logger.info(f"📡 Status endpoint op {listen}")
+    return server
+
+def network_state_path():
+    """Pad van het netwerk status bestand dat script.py leest"""
+    paths = monitor_config("paths")
+    return paths["network_state_file"] or os.path.join(paths["script_dir"], 'network_state.json')
+
+def publish_network_state(wan, lan, targets=None):
+    """
+    Schrijf de WAN/LAN status (en per target up/down) voor script.py (atomisch via rename)
+
+    Elke ronde opnieuw, zodat script.py aan "updated" ziet dat de monitor
+    nog draait; "since" verandert alleen bij een wijziging.
+    """
+    global netwerk_status, netwerk_status_sinds
+    now = time.time()
+    if netwerk_status != (wan, lan):
+        netwerk_status = (wan, lan)
+        netwerk_status_sinds = now
+    path = network_state_path()
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump({"wan": wan, "lan": lan, "since": netwerk_status_sinds, "updated": now,
+                       "targets": {name: {"up": target.up,
+                                          "ewma_ms": None if target.ewma_ms is None else round(target.ewma_ms, 1),
+                                          "failure_streak": target.failure_streak}
+                                   for name, target in (targets or {}).items()}}, f)
+        os.replace(path + '.tmp', path)
+    except OSError as e:
+        logger.warning(f"Kon netwerk status niet schrijven ({path}): {e}")
+
+def supervisor_request(command, timeout=15):
+    """
+    Eén control commando naar supervisor.py (paths.supervisor_control)
+
+    Returns:
+        dict: Antwoord van de supervisor, of None als die niet bereikbaar is
+    """
+    control = monitor_config("paths")["supervisor_control"]
+    try:
+        if control.startswith("unix:"):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(timeout)
+            sock.connect(control[len("unix:"):])
+        else:
+            sock = socket.create_connection(split_address(control, 8732), timeout=timeout)
+        with sock:
+            sock.sendall(command.encode('utf-8') + b"\n")
+            with sock.makefile('rb') as reply:
+                return json.loads(reply.readline().decode('utf-8'))
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️  Supervisor {control} niet bereikbaar: {e}")
+        return None
 
 def is_script_running():
-    """Check of script.py draait via PID file of process check."""
+    """Check of script.py draait via de supervisor, PID file of process check."""
+    if monitor_config("paths")["supervisor_control"]:
+        # Een child in backoff of crash loop wordt door de supervisor zelf herstart
+        reply = supervisor_request("status")
+        if reply is not None:
+            child = reply.get("children", {}).get("script")
+            return child is not None and child["wanted"]
+    _, _, pid_file = script_paths()
     # Methode 1: Check PID file
-    if os.path.exists(SCRIPT_PID_FILE):
+    if os.path.exists(pid_file):
         try:
-            with open(SCRIPT_PID_FILE, 'r') as f:
+            with open(pid_file, 'r') as f:
                 pid = int(f.read().strip())
             # Check of proces met deze PID bestaat
             os.kill(pid, 0)  # Signal 0 = check alleen of proces bestaat
             return True
         except (OSError, ValueError):
             # PID bestaat niet meer of invalid PID file
-            if os.path.exists(SCRIPT_PID_FILE):
-                os.remove(SCRIPT_PID_FILE)
+            if os.path.exists(pid_file):
+                os.remove(pid_file)
             return False
     
     # Methode 2: Check via pgrep
@@ -85,6 +473,14 @@ def is_script_running():
 
 def stop_script():
     """Stop ALLE script.py processen netjes."""
+    if monitor_config("paths")["supervisor_control"]:
+        reply = supervisor_request("stop script")
+        if reply is None or not reply.get("ok"):
+            logger.error(f"❌ Supervisor kon script.py niet stoppen: {(reply or {}).get('error')}")
+            return False
+        logger.info("✅ script.py gestopt via de supervisor")
+        return True
+    _, _, pid_file = script_paths()
     try:
         stopped_any = False
         
@@ -134,8 +530,8 @@ def stop_script():
                 time.sleep(1)
         
         # Cleanup PID file
-        if os.path.exists(SCRIPT_PID_FILE):
-            os.remove(SCRIPT_PID_FILE)
+        if os.path.exists(pid_file):
+            os.remove(pid_file)
             logger.info("   PID file verwijderd")
         
         # Finale verificatie
@@ -161,11 +557,19 @@ def stop_script():
         return False
 
 def start_script():
-    """Start script.py via start_script.sh."""
+    """Start script.py via start_script.sh (of de supervisor)."""
+    if monitor_config("paths")["supervisor_control"]:
+        reply = supervisor_request("start script")
+        if reply is None or not reply.get("ok"):
+            logger.error(f"❌ Supervisor kon script.py niet starten: {(reply or {}).get('error')}")
+            return False
+        logger.info("✅ script.py gestart via de supervisor")
+        return True
+    script_dir, start_script_path, _ = script_paths()
     try:
         # Check of start script bestaat
-        if not os.path.exists(START_SCRIPT):
-            logger.error(f"❌ Start script niet gevonden: {START_SCRIPT}")
+        if not os.path.exists(start_script_path):
+            logger.error(f"❌ Start script niet gevonden: {start_script_path}")
             return False
         
         # Check of al draait
@@ -173,12 +577,12 @@ def start_script():
             logger.info("ℹ️  Script.py draait al, skip start")
             return True
         
-        logger.info(f"🚀 Start script.py via {START_SCRIPT}...")
+        logger.info(f"🚀 Start script.py via {start_script_path}...")
         
         # Start het script via bash
         subprocess.Popen(
-            ['bash', START_SCRIPT],
-            cwd=SCRIPT_DIR,
+            ['bash', start_script_path],
+            cwd=script_dir,
             stdout=subprocess.DEVNULL,
             stderr=subprocess.DEVNULL,
             start_new_session=True  # Detach van parent proces
@@ -199,7 +603,8 @@ def start_script():
 
 def reboot_uno_q():
     """Voert de herstart opdracht uit."""
-    logger.critical("🚨 De verbinding is langer dan 5 minuten weg. Herstarten nu...")
+    limit = monitor_config("monitor")["timeout_limit_seconds"]
+    logger.critical(f"🚨 De verbinding is langer dan {limit} seconden weg. Herstarten nu...")
 
     # Zorg ervoor dat de logbuffer geleegd wordt voordat we herstarten!
     logging.shutdown()
@@ -211,6 +616,268 @@ def reboot_uno_q():
         logger.error(f"Fout bij het uitvoeren van reboot: {e}. Kon niet herstarten.")
         sys.exit(1)
 
+def interruptible_sleep(seconds):
+    """
+    Slaap in stappen van max 1s en stuur elke 20 seconden een watchdog heartbeat
+
+    Returns:
+        bool: False als er tijdens het slapen een shutdown gevraagd is
+    """
+    deadline = time.monotonic() + seconds
+    last_heartbeat = time.monotonic()
+    while not shutdown_requested:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        if SYSTEMD_AVAILABLE and time.monotonic() - last_heartbeat >= 20:
+            daemon.notify('WATCHDOG=1')
+            last_heartbeat = time.monotonic()
+            logger.debug("💓 Extra watchdog heartbeat tijdens sleep")
+        time.sleep(min(1.0, remaining))
+    return False
+
+def run_command(args, timeout):
+    """
+    Standaard command runner van de herstel ladder
+
+    Returns:
+        tuple: (returncode, output); -1 als het commando niet kon starten of te lang duurde
+    """
+    try:
+        result = subprocess.run(args, capture_output=True, text=True, timeout=timeout)
+        return result.returncode, (result.stdout + result.stderr).strip()
+    except (OSError, subprocess.TimeoutExpired) as e:
+        return -1, str(e)
+
+def privileged(args):
+    """Commando met sudo ervoor, tenzij de monitor al als root draait"""
+    if hasattr(os, "geteuid") and os.geteuid() == 0:
+        return list(args)
+    return ['sudo', '-n'] + list(args)
+
+def connectivity_restored():
+    """
+    Standaard succes check: nieuwe probe ronde (ook gepubliceerd voor script.py)
+
+    Met stop_script_on_wan_loss telt alleen internet, anders is LAN genoeg.
+    """
+    health = reachability.run_round()
+    wan_ok = bool(health["internet"].ok)
+    lan_ok = wan_ok or reachability.lan_reachable()
+    publish_network_state(wan_ok, lan_ok, health)
+    return wan_ok if monitor_config("monitor")["stop_script_on_wan_loss"] else lan_ok
+
+def restart_script():
+    """Stop en start script.py"""
+    return stop_script() and start_script()
+
+class RecoveryLadder:
+    """
+    🪜 HERSTEL LADDER
+
+    Een reboot kost minuten aan gemiste alarms (en SD-kaart slijtage), dus bij
+    een storing worden eerst de goedkope stappen geprobeerd, in de volgorde
+    van recovery.steps:
+
+        reprobe          opnieuw proben met backoff (korte hapering)
+        bounce_wifi      ip link <interface> down/up
+        restart_network  NetworkManager of wpa_supplicant herstarten
+        restart_script   script.py stoppen en starten
+        reboot           reboot_uno_q(), niet eerder dan timeout_limit_seconds na de start van de storing
+
+    Na elke stap wordt tot de timeout van die stap om de check_interval
+    seconden gekeken of de verbinding terug is; zo ja dan stopt de ladder.
+    Per stap worden pogingen, successen en duur bijgehouden, plus de
+    hersteltijden (start storing → herstel) voor het status endpoint.
+
+    Alles wat de buitenwereld raakt is injecteerbaar, zodat de ladder met een
+    nep runner/check/klok te testen is zonder iets aan het netwerk te doen:
+        runner(args, timeout) → (returncode, output)
+        check() → bool, sleep(seconds) → False bij shutdown, clock() → seconden
+        restart_script() → bool, reboot() → herstart (keert normaal niet terug)
+    """
+
+    STEPS = ("reprobe", "bounce_wifi", "restart_network", "restart_script", "reboot")
+    MAX_HISTORY = 20
+
+    def __init__(self, runner=run_command, check=connectivity_restored, sleep=interruptible_sleep,
+                 clock=time.time, restart_script=restart_script, reboot=reboot_uno_q, config=None):
+        self.runner = runner
+        self.check = check
+        self.sleep = sleep
+        self.clock = clock
+        self.restart_script = restart_script
+        self.reboot = reboot
+        self._config = config
+        self.lock = threading.Lock()
+        self.stats = {name: {"attempts": 0, "successes": 0, "seconds_total": 0.0} for name in self.STEPS}
+        self.runs = 0
+        self.recoveries = 0
+        self.exhausted = 0
+        self.current_step = None
+        self.history = []
+
+    def config(self):
+        return self._config if self._config is not None else monitor_config("recovery")
+
+    def _wait_for_recovery(self, timeout, config):
+        """
+        Probe om de check_interval tot de verbinding terug is of de timeout verstrijkt
+
+        Returns:
+            True (hersteld), False (timeout) of None (shutdown gevraagd)
+        """
+        deadline = self.clock() + timeout
+        while True:
+            remaining = deadline - self.clock()
+            if remaining <= 0:
+                return False
+            if not self.sleep(min(config["check_interval"], remaining)):
+                return None
+            if self.check():
+                return True
+
+    def _run_command(self, args, config):
+        returncode, output = self.runner(privileged(args), config["command_timeout"])
+        if returncode != 0:
+            logger.warning(f"   ⚠️  {' '.join(args)} mislukt ({returncode}): {output}")
+        return returncode == 0
+
+    def step_reprobe(self, config):
+        deadline = self.clock() + config["timeouts"]["reprobe"]
+        for delay in config["reprobe_backoff"]:
+            delay = min(delay, deadline - self.clock())
+            if delay <= 0:
+                break
+            if not self.sleep(delay):
+                return None
+            if self.check():
+                return True
+        return False
+
+    def step_bounce_wifi(self, config):
+        interface = config["interface"]
+        logger.warning(f"   📶 Interface {interface} down/up")
+        self._run_command(['ip', 'link', 'set', interface, 'down'], config)
+        if not self.sleep(2):
+            return None
+        if not self._run_command(['ip', 'link', 'set', interface, 'up'], config):
+            return False
+        return self._wait_for_recovery(config["timeouts"]["bounce_wifi"], config)
+
+    def step_restart_network(self, config):
+        for service in config["network_services"]:
+            returncode, _ = self.runner(['systemctl', 'is-active', '--quiet', service], config["command_timeout"])
+            if returncode == 0:
+                logger.warning(f"   🔄 Herstart {service}")
+                if not self._run_command(['systemctl', 'restart', service], config):
+                    return False
+                return self._wait_for_recovery(config["timeouts"]["restart_network"], config)
+        logger.warning(f"   ⚠️  Geen actieve netwerk service ({', '.join(config['network_services'])})")
+        return False
+
+    def step_restart_script(self, config):
+        if monitor_config("monitor")["stop_script_on_wan_loss"]:
+            logger.info("   ℹ️  script.py is bewust gestopt (stop_script_on_wan_loss), stap overgeslagen")
+            return False
+        logger.warning("   🔄 Herstart script.py")
+        if not self.restart_script():
+            return False
+        return self._wait_for_recovery(config["timeouts"]["restart_script"], config)
+
+    def step_reboot(self, outage_started, config):
+        # Nooit eerder rebooten dan vroeger: tot timeout_limit_seconds blijven proben
+        limit = monitor_config("monitor")["timeout_limit_seconds"]
+        remaining = outage_started + limit - self.clock()
+        if remaining > 0:
+            logger.warning(f"   ⏳ Reboot over {int(remaining)} seconden als de verbinding niet terugkomt")
+            recovered = self._wait_for_recovery(remaining, config)
+            if recovered is not False:
+                return recovered
+        self.reboot()
+        return False
+
+    def run(self, outage_started):
+        """
+        Doorloop de ladder tot de verbinding terug is
+
+        Args:
+            outage_started: clock() waarde van de start van de storing
+
+        Returns:
+            str: Naam van de stap die het herstel bracht, of None (uitgeput of shutdown)
+        """
+        config = self.config()
+        steps = [name for name in config["steps"] if name in self.STEPS]
+        for name in config["steps"]:
+            if name not in self.STEPS:
+                logger.error(f"❌ Onbekende herstel stap '{name}' overgeslagen")
+        with self.lock:
+            self.runs += 1
+        result = {"started": outage_started, "steps": [], "recovered_by": None, "recovery_seconds": None}
+
+        for index, name in enumerate(steps, 1):
+            logger.warning(f"🪜 Herstel stap {index}/{len(steps)}: {name}")
+            with self.lock:
+                self.current_step = name
+                self.stats[name]["attempts"] += 1
+            step_started = self.clock()
+            try:
+                if name == "reboot":
+                    recovered = self.step_reboot(outage_started, config)
+                else:
+                    recovered = getattr(self, f"step_{name}")(config)
+            except Exception as e:
+                logger.error(f"❌ Herstel stap {name} fout: {e}")
+                recovered = False
+            seconds = self.clock() - step_started
+            result["steps"].append({"step": name, "recovered": bool(recovered), "seconds": round(seconds, 1)})
+            with self.lock:
+                self.stats[name]["seconds_total"] += seconds
+                if recovered:
+                    self.stats[name]["successes"] += 1
+            if recovered is None:
+                logger.info("🛑 Herstel ladder afgebroken (shutdown)")
+                break
+            if recovered:
+                result["recovered_by"] = name
+                result["recovery_seconds"] = round(self.clock() - outage_started, 1)
+                logger.info(f"✅ Verbinding hersteld door stap {name} na {result['recovery_seconds']}s storing")
+                break
+        else:
+            logger.error("❌ Herstel ladder uitgeput zonder herstel")
+
+        with self.lock:
+            self.current_step = None
+            if result["recovered_by"] is not None:
+                self.recoveries += 1
+            elif len(result["steps"]) == len(steps):
+                self.exhausted += 1
+            self.history = (self.history + [result])[-self.MAX_HISTORY:]
+        return result["recovered_by"]
+
+    def get_status(self):
+        with self.lock:
+            times = [run["recovery_seconds"] for run in self.history if run["recovery_seconds"] is not None]
+            return {
+                "enabled": self.config()["enabled"],
+                "runs": self.runs,
+                "recoveries": self.recoveries,
+                "exhausted": self.exhausted,
+                "current_step": self.current_step,
+                "steps": {name: {"attempts": stats["attempts"], "successes": stats["successes"],
+                                 "seconds_total": round(stats["seconds_total"], 1)}
+                          for name, stats in self.stats.items()},
+                "recovery_seconds": {
+                    "last": times[-1] if times else None,
+                    "avg": round(sum(times) / len(times), 1) if times else None,
+                    "max": max(times) if times else None
+                },
+                "last_run": self.history[-1] if self.history else None
+            }
+
+recovery_ladder = RecoveryLadder()
+
 def signal_handler(signum, frame):
     """Handler voor SIGTERM en SIGINT signalen van systemd."""
     global shutdown_requested
@@ -225,7 +892,10 @@ def main_loop():
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
     
-    logger.info("✅ Wi-Fi Monitor gestart. Logging naar bestand: " + LOG_FILE)
+    logger.info("✅ Wi-Fi Monitor gestart. Logging naar bestand: " + monitor_config("paths")["log_file"])
+    if config_manager is not None:
+        config_manager.start_watching()
+    status_server = start_status_server()
     
     # Notify systemd dat we klaar zijn om te starten
     if SYSTEMD_AVAILABLE:
@@ -246,11 +916,23 @@ def main_loop():
             if watchdog_counter % 10 == 0:  # Log elke 10e keer (elke 5 minuten bij 30s checks)
                 logger.debug(f"💓 Watchdog heartbeat #{watchdog_counter} verstuurd")
         
-        if check_internet_connection():
+        # Eén snapshot per ronde: een reload halverwege verandert de ronde niet
+        settings = monitor_config("monitor")
+
+        # Alle afhankelijkheden tegelijk, binnen één deadline
+        health = reachability.run_round()
+        wan_ok = bool(health["internet"].ok)
+        lan_ok = wan_ok or reachability.lan_reachable()
+        vorige_status = netwerk_status
+        publish_network_state(wan_ok, lan_ok, health)
+
+        if wan_ok:
             # Wi-Fi is OK
             if verbindingsfout_starttijd is not None:
                 logger.info("✅ Wi-Fi hersteld. Timer gereset.")
                 verbindingsfout_starttijd = None
+            elif vorige_status is not None and not vorige_status[0]:
+                logger.info("✅ Internet hersteld - script.py verstuurt de uitgestelde acties")
             
             # Als WiFi OK is, zorg dat script.py draait
             if not is_script_running():
@@ -260,44 +942,62 @@ def main_loop():
                 else:
                     logger.error("❌ Kon script.py niet starten")
             
+        elif lan_ok and not settings["stop_script_on_wan_loss"]:
+            # Alleen internet weg: UniFi Protect, Loxone, SIP en pcReceiver staan op het LAN.
+            # script.py blijft draaien en stelt email/notificaties uit (LAN-only modus);
+            # een reboot lost een storing bij de provider niet op, dus geen reboot timer.
+            if vorige_status != (False, True):
+                logger.warning("🌐 Internet weg, LAN bereikbaar - script.py blijft draaien in LAN-only modus")
+            if verbindingsfout_starttijd is not None:
+                logger.info("✅ LAN weer bereikbaar. Reboot timer gereset.")
+                verbindingsfout_starttijd = None
+            if not is_script_running():
+                logger.warning("⚠️  Script.py draait niet - start het op (LAN-only modus)...")
+                if start_script():
+                    script_is_running = True
+                else:
+                    logger.error("❌ Kon script.py niet starten")
+
         else:
             # Wi-Fi is DOWN
             
-            # Stop script.py direct bij eerste WiFi verlies
-            if script_is_running or is_script_running():
+            # Oud gedrag (stop_script_on_wan_loss): script.py stoppen. Anders blijft
+            # het draaien; alarms die toch binnenkomen staan in de action outbox.
+            if settings["stop_script_on_wan_loss"] and (script_is_running or is_script_running()):
                 logger.warning("❌ Wi-Fi uitgevallen - stop script.py...")
                 if stop_script():
                     script_is_running = False
                     logger.info("✅ Script.py gestopt vanwege WiFi verlies")
             
-            # Start/reset timer voor reboot
+            # Start timer; met de herstel ladder gaat een reboot pas als de goedkopere stappen niets opleveren
             if verbindingsfout_starttijd is None:
                 verbindingsfout_starttijd = time.time()
-                logger.warning("❌ Wi-Fi uitgevallen. Timer gestart voor reboot...")
+                logger.warning("❌ Wi-Fi uitgevallen. Herstel ladder gestart..."
+                               if monitor_config("recovery")["enabled"] else
+                               "❌ Wi-Fi uitgevallen. Timer gestart voor reboot...")
+            if monitor_config("recovery")["enabled"]:
+                if recovery_ladder.run(verbindingsfout_starttijd) is not None:
+                    verbindingsfout_starttijd = None
+                    continue
             else:
                 tijd_verlopen = time.time() - verbindingsfout_starttijd
 
-                if tijd_verlopen >= TIMEOUT_LIMIT_SECONDS:
+                if tijd_verlopen >= settings["timeout_limit_seconds"]:
                     reboot_uno_q()
                 else:
-                    resterende_tijd = int(TIMEOUT_LIMIT_SECONDS - tijd_verlopen)
+                    resterende_tijd = int(settings["timeout_limit_seconds"] - tijd_verlopen)
                     logger.warning(f"❌ Wi-Fi nog steeds weg. Nog {resterende_tijd} seconden tot herstart.")
 
-        # Interruptible sleep - check elke seconde of shutdown gevraagd is
-        # EN stuur elke 20 seconden een watchdog heartbeat
-        for i in range(CHECK_INTERVAL_SECONDS):
-            if shutdown_requested:
-                break
-            
-            # Stuur extra watchdog heartbeat tijdens sleep (elke 20 sec)
-            if SYSTEMD_AVAILABLE and i > 0 and i % 20 == 0:
-                daemon.notify('WATCHDOG=1')
-                logger.debug(f"💓 Extra watchdog heartbeat tijdens sleep (sec {i})")
-            
-            time.sleep(1)
+        # Interruptible sleep - stopt direct bij een shutdown en stuurt
+        # elke 20 seconden een watchdog heartbeat
+        interruptible_sleep(settings["check_interval_seconds"])
     
     # Graceful shutdown na signal
     logger.info("🔄 Graceful shutdown gestart...")
+    if status_server is not None:
+        status_server.shutdown()
+    if config_manager is not None:
+        config_manager.stop_watching()
     if SYSTEMD_AVAILABLE:
         daemon.notify('STOPPING=1')
     logging.shutdown()